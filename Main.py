@@ -21,6 +21,7 @@ from Source import PACKAGE_DIR as CODE_HOME
 from Source.MainConfig import MainConfig
 from Source.Controller import Controller
 from Source.ConfigFile import ConfigFile
+from Source.BatchContext import BatchContext
 from Source.ConfigWindow import ConfigWindow
 from Source.GetAnc_credentials import GetAnc_credentials
 from Source.SeaBASSHeader import SeaBASSHeader
@@ -704,7 +705,12 @@ class Command:
         # Now make it a list as it is expected to be
         # inputFile = [inputFile]
 
-        ConfigFile.loadConfig(self.configFilename)
+        context = BatchContext.current
+        if context is not None and context.configFP == os.path.abspath(configFP):
+            # Parsed once for the batch (e.g., run_Sample_Data.py workers)
+            context.restoreConfig()
+        else:
+            ConfigFile.loadConfig(self.configFilename)
 
         # No GUI used: error message are display in prompt and not in graphical window
         MainConfig.settings["popQuery"] = 1 # 1 suppresses popup
@@ -0,0 +1,237 @@
+"""
+    Headless anomaly analysis (deglitching) of L1AQC files, behind the AnomalyDetection GUI
+
+    The dark and light radiometry of each sensor is read from the file once, as a (records, bands)
+    array. The moving-window passes of Utilities.deglitchBand are computed for all bands at once and
+    cached per (sensor, frame, window, sigma), so only the thresholds are recomputed when those change.
+
+    Batch mode sweeps window/sigma parameter sets across files and writes per-band flag fractions to CSV:
+
+        python -m Source.AnomalyAnalysis -f Data/L1AQC/*_L1AQC.hdf -o anoms_sweep.csv -w 5 11 13 -s 2.3 3.2
+
+    The L1AQC files should be processed without deglitching, as the AnomalyDetection GUI does when a
+    L1A file is loaded.
+"""
+
+import os
+import csv
+import argparse
+import warnings
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from Source.ConfigFile import ConfigFile
+from Source.HDFRoot import HDFRoot
+from Source.Utilities import Utilities
+
+
+class AnomalyAnalysis:
+    ''' Dark and light radiometry of a L1AQC root and its deglitching flags '''
+
+    SENSORS = ['ES', 'LI', 'LT']
+    FRAMES = {'ShutterDark': 'Dark', 'ShutterLight': 'Light'}
+    CSV_HEADER = ['filename', 'sensor', 'frame', 'window', 'sigma', 'band', 'records',
+                  'firstPass', 'secondPass', 'threshold', 'flagged']
+
+    def __init__(self, root, fileName=None):
+        self.fileName = fileName
+        # (sensor, 'Dark' or 'Light'): field names, wavebands, (records, bands) radiometry, datetimes
+        self.frames = {}
+        # (sensor, 'Dark' or 'Light', window, sigma): moving averages and first and second pass flags
+        self._passes = {}
+        for gp in root.groups:
+            lightDark = AnomalyAnalysis.FRAMES.get(gp.attributes.get('FrameType'))
+            if lightDark is None:
+                continue
+            for sensor in AnomalyAnalysis.SENSORS:
+                if sensor not in gp.datasets:
+                    continue
+                ds = gp.getDataset(sensor)
+                names = list(ds.data.dtype.names)
+                data = np.column_stack([ds.data[name] for name in names]).astype(np.float64)
+                data.setflags(write=False)
+                bands = np.array([float(name) for name in names])
+                self.frames[(sensor, lightDark)] = (names, bands, data, Utilities.getDateTime(gp))
+
+    @staticmethod
+    def fromFile(inFilePath):
+        ''' Read a L1AQC file. Returns None if it is not one. '''
+        root = HDFRoot.readHDF5(inFilePath)
+        if root.attributes.get('PROCESSING_LEVEL') != '1aqc':
+            print(f'AnomalyAnalysis: {inFilePath} is not a Level 1AQC file')
+            return None
+        return AnomalyAnalysis(root, os.path.basename(os.path.splitext(inFilePath)[0]))
+
+    @staticmethod
+    def movingAverage(data, window):
+        ''' Utilities.movingAverage of each column of data: NaN-tolerant mean over a centred window,
+            truncated at the ends of the record '''
+        if window % 2 == 0:
+            raise ValueError('Deglitching windows must be odd integers.')
+        half = window//2
+        mask = np.isnan(data)
+        padding = [(half, half)] + [(0, 0)]*(data.ndim - 1)
+        total = sliding_window_view(np.pad(np.where(mask, 0, data), padding), window, axis=0).sum(axis=-1)
+        count = sliding_window_view(np.pad(~mask, padding), window, axis=0).sum(axis=-1)
+        return total/np.where(count != 0, count, 1)
+
+    @staticmethod
+    def rollingStd(residual, window):
+        ''' Trailing rolling standard deviation of each column (pandas rolling(window).std()), with the
+            missing values replaced by the first full window and rounded to 3 decimals '''
+        std = np.full(residual.shape, np.nan)
+        if len(residual) >= window:
+            std[window - 1:] = sliding_window_view(residual, window, axis=0).std(axis=-1, ddof=1)
+            std = np.where(np.isnan(std), std[window - 1], std)
+        return np.round(std, 3)
+
+    @staticmethod
+    def convolution(data, avg, std, sigma):
+        ''' Utilities.darkConvolution/lightConvolution: records beyond sigma std of the moving average.
+            The first and last records are always flagged, NaN records never. '''
+        badIndex = (data > avg + sigma*std) | (data < avg - sigma*std)
+        badIndex[0] = True
+        badIndex[-1] = True
+        return badIndex
+
+    @staticmethod
+    def deglitchPasses(data, window, sigma, lightDark):
+        ''' First and second moving-window passes of Utilities.deglitchBand on each column of data.
+            Returns the moving average of the first pass and the two (records, bands) flag arrays. '''
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', r'All-NaN (slice|axis) encountered')
+            warnings.filterwarnings('ignore', r'Degrees of freedom <= 0', RuntimeWarning)
+            avg = AnomalyAnalysis.movingAverage(data, window)
+            residual = data - avg
+            if lightDark == 'Dark':
+                # Standard deviation of the residual over the whole file
+                badIndex = AnomalyAnalysis.convolution(data, avg, np.std(residual, axis=0), sigma)
+            else:
+                # Rolling standard deviation of the residual; it tends to blow up for extreme outliers
+                std = AnomalyAnalysis.rollingStd(residual, window)
+                median = np.median(std, axis=0)
+                std = np.where(std > median + 3*np.std(std, axis=0), median, std)
+                badIndex = AnomalyAnalysis.convolution(data, avg, std, sigma)
+
+            # Second pass without the first pass anomalies
+            data2 = np.where(badIndex, np.nan, data)
+            avg2 = AnomalyAnalysis.movingAverage(data2, window)
+            residual2 = data2 - avg2
+            if lightDark == 'Dark':
+                badIndex2 = AnomalyAnalysis.convolution(data2, avg2, np.nanstd(residual2, axis=0), sigma)
+            else:
+                std = AnomalyAnalysis.rollingStd(residual2, window)
+                std = np.where(np.isnan(std), np.nanmedian(std, axis=0), std)
+                median = np.nanmedian(std, axis=0)
+                std = np.where(std > median + 3*np.nanstd(std, axis=0), median, std)
+                badIndex2 = AnomalyAnalysis.convolution(data2, avg2, std, sigma)
+        return avg, badIndex, badIndex2
+
+    @staticmethod
+    def thresholds(bands, data, minRad, maxRad, minMaxBand, threshold):
+        ''' Utilities.deglitchThresholds: records of the minMaxBand column outside [minRad, maxRad] '''
+        badIndex = np.zeros(data.shape, dtype=bool)
+        if threshold:
+            columns = bands == minMaxBand
+            if minRad is not None:
+                badIndex[:, columns] |= data[:, columns] < minRad
+            if maxRad is not None:
+                badIndex[:, columns] |= data[:, columns] > maxRad
+        return badIndex
+
+    def passes(self, sensor, lightDark, window, sigma):
+        ''' (moving average, first pass, second pass) arrays of a frame, computed once per setting '''
+        key = (sensor, lightDark, int(window), float(sigma))
+        if key not in self._passes:
+            _, _, data, _ = self.frames[(sensor, lightDark)]
+            result = AnomalyAnalysis.deglitchPasses(data, key[2], key[3], lightDark)
+            for array in result:
+                array.setflags(write=False)
+            self._passes[key] = result
+        return self._passes[key]
+
+    def flags(self, sensor, lightDark, window, sigma, minRad=None, maxRad=None, minMaxBand=None, threshold=0):
+        ''' First pass, second pass and threshold (records, bands) flags of a frame, as from
+            Utilities.deglitchBand for each band '''
+        _, bands, data, _ = self.frames[(sensor, lightDark)]
+        _, badIndex, badIndex2 = self.passes(sensor, lightDark, window, sigma)
+        badIndex3 = AnomalyAnalysis.thresholds(bands, data, minRad, maxRad, minMaxBand, threshold)
+        return badIndex, badIndex2, badIndex3
+
+    def deglitchBands(self, sensor, lightDark):
+        ''' Mask of the columns of a frame that are deglitched '''
+        _, bands, _, _ = self.frames[(sensor, lightDark)]
+        return (bands > ConfigFile.minDeglitchBand) & (bands < ConfigFile.maxDeglitchBand)
+
+    def badRecords(self, sensor, lightDark, *args, **kwargs):
+        ''' Records flagged in any deglitched band by any pass, as removed by ProcessL1aqc_deglitch.
+            Arguments as for flags(). '''
+        columns = self.deglitchBands(sensor, lightDark)
+        return np.any([badIndex[:, columns].any(axis=1) for badIndex in self.flags(sensor, lightDark, *args, **kwargs)], 0)
+
+    def sweep(self, parameterSets):
+        ''' Rows of flag fractions per band for each parameter set, then one over the records flagged in
+            any deglitched band (band 'all'). A parameter set is a dict with sensor, lightDark, window and
+            sigma, and optionally minRad, maxRad, minMaxBand and threshold. Missing frames are skipped. '''
+        rows = []
+        for params in parameterSets:
+            params = dict(params)
+            sensor, lightDark = params.pop('sensor'), params.pop('lightDark')
+            if (sensor, lightDark) not in self.frames:
+                continue
+            names, _, data, _ = self.frames[(sensor, lightDark)]
+            badIndexes = self.flags(sensor, lightDark, **params)
+            fractions = [badIndex.mean(axis=0) for badIndex in badIndexes]
+            fractions.append(np.any(badIndexes, 0).mean(axis=0))
+            prefix = [self.fileName, sensor, lightDark, params['window'], params['sigma']]
+            for i, name in enumerate(names):
+                rows.append(prefix + [name, len(data)] + [float(fraction[i]) for fraction in fractions])
+            records = self.badRecords(sensor, lightDark, **params)
+            rows.append(prefix + ['all', len(data), '', '', '', float(records.mean())])
+        return rows
+
+    @staticmethod
+    def parameterGrid(windows, sigmas, sensors=None, frames=None):
+        ''' Parameter sets of every combination of sensors, frames, windows and sigmas, without thresholds '''
+        return [{'sensor': sensor, 'lightDark': lightDark, 'window': window, 'sigma': sigma}
+                for sensor in sensors or AnomalyAnalysis.SENSORS
+                for lightDark in frames or AnomalyAnalysis.FRAMES.values()
+                for window in windows for sigma in sigmas]
+
+    @staticmethod
+    def sweepFiles(inFilePaths, parameterSets, csvPath):
+        ''' Sweep the parameter sets across L1AQC files, reading each file once, and write the flag
+            fractions to csvPath. Returns the number of files analysed. '''
+        nFiles = 0
+        with open(csvPath, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(AnomalyAnalysis.CSV_HEADER)
+            for inFilePath in inFilePaths:
+                print(f'AnomalyAnalysis: {inFilePath}')
+                analysis = AnomalyAnalysis.fromFile(inFilePath)
+                if analysis is None:
+                    continue
+                writer.writerows(analysis.sweep(parameterSets))
+                nFiles += 1
+        return nFiles
+
+
+def setupParser():
+    parser = argparse.ArgumentParser(description='Sweep deglitching parameters across L1AQC files')
+
+    parser.add_argument('-f', '--files', required=True, nargs='+', help='L1AQC HDF files processed without deglitching')
+    parser.add_argument('-o', '--output', required=True, help='CSV file of the flag fractions')
+    parser.add_argument('-w', '--windows', required=True, nargs='+', type=int, help='Window sizes (odd)')
+    parser.add_argument('-s', '--sigmas', required=True, nargs='+', type=float, help='Sigma factors')
+    parser.add_argument('--sensors', nargs='+', choices=AnomalyAnalysis.SENSORS, help='Sensors (default all)')
+    parser.add_argument('--frames', nargs='+', choices=list(AnomalyAnalysis.FRAMES.values()), help='Frames (default both)')
+
+    return parser
+
+
+if __name__ == '__main__':
+
+    args = setupParser().parse_args()
+
+    AnomalyAnalysis.sweepFiles(args.files, AnomalyAnalysis.parameterGrid(args.windows, args.sigmas, args.sensors, args.frames),
+                               args.output)
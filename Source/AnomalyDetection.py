@@ -13,6 +13,8 @@ from Source.MainConfig import MainConfig
 from Source.ConfigFile import ConfigFile
 from Source.HDFRoot import HDFRoot
 from Source.Utilities import Utilities
+from Source.AnomalyAnalysis import AnomalyAnalysis
+from Source.PlotJobs import PlotJobs
 from Source.FieldPhotos import FieldPhotos
 from Source.CalibrationFileReader import CalibrationFileReader
 
@@ -29,6 +31,7 @@ class AnomAnalWindow(QtWidgets.QDialog):
         self.sliderWave=525
         self.fileName = None
         self.root = None
+        self.analysis = None
         self.start = None
         self.end = None
         self.photoList = None
@@ -491,6 +494,8 @@ class AnomAnalWindow(QtWidgets.QDialog):
         self.fileName = fileName.replace(".hdf",'')
         self.setWindowTitle(self.fileName)
         self.root = root # Undeglitched L1AQC
+        # Radiometry read once, deglitching passes cached per window and sigma
+        self.analysis = AnomalyAnalysis(root, self.fileName)
 
         # If a parameterization has been saved in the AnomAnalFile, set the properties in the local object
         # for all sensors
@@ -694,7 +699,7 @@ class AnomAnalWindow(QtWidgets.QDialog):
         ConfigFile.saveConfig(ConfigFile.filename)
 
         # Test for root
-        if not hasattr(self, 'root'):
+        if self.analysis is None:
             note = QtWidgets.QMessageBox()
             note.setText('You must load L1A file before plotting')
             note.exec_()
@@ -721,47 +726,22 @@ class AnomAnalWindow(QtWidgets.QDialog):
         x = None if self.MaxLightLineEdit.text()=='None' else float(self.MaxLightLineEdit.text())
         setattr(self,f'{self.sensor}MaxLight', x )
 
-        darkData = None
-        lightData = None
-        darkDateTime = None
-        lightDateTime = None
-        # Extract Light & Dark datasets from the sensor group
-        for gp in self.root.groups:
-            if "FrameType" not in gp.attributes:
-                continue
-            if gp.attributes["FrameType"] == "ShutterDark" and sensorType in gp.datasets:
-                darkData = gp.getDataset(sensorType)
-                darkDateTime = Utilities.getDateTime(gp)
-            if gp.attributes["FrameType"] == "ShutterLight" and sensorType in gp.datasets:
-                lightData = gp.getDataset(sensorType)
-                lightDateTime = Utilities.getDateTime(gp)
-
         # Deglitch and plot Dark from selected band
-        if darkData is None:
+        if (sensorType, 'Dark') not in self.analysis.frames:
             print("Error: No dark data to deglitch")
         else:
             print("Dark data anomaly analysis")
-            lightDark = 'Dark'
-            darkData.datasetToColumns()
-            dark2D = darkData.columns
 
             # Same for Dark and Light... here taking from Dark
-            waveBands = []
-            waveBandStrings = []
-            for key in dark2D.keys():
-                waveBands.append(float(key))
-                waveBandStrings.append(key)
-            self.waveBands = waveBands
+            _, waveBands, _, _ = self.analysis.frames[(sensorType, 'Dark')]
+            self.waveBands = waveBands.tolist()
             if not self.sliderWave:
                 self.sliderWave = float(self.slider.value())
             whr = Utilities.find_nearest(self.waveBands, self.sliderWave)
             self.waveBand = self.waveBands[whr]
             # print(self.waveBand)
 
-            radiometry1D = dark2D[f'{self.waveBand:03.2f}']
-
-            # self.realTimePlot(self, radiometry1D, darkDateTime, sensorType,lightDark)
-            AnomAnalWindow.realTimePlot(self, radiometry1D, darkDateTime, sensorType,lightDark)
+            AnomAnalWindow.realTimePlot(self, sensorType, 'Dark')
 
         # Update the slider
         self.sLabel.setText(f'Deglitching only performed from 350-850 nm: {self.waveBand}')
@@ -778,73 +758,23 @@ class AnomAnalWindow(QtWidgets.QDialog):
         # self.ThresholdCheckBoxUpdate()
 
         # Deglitch and plot Light from selected band
-        if lightData is None:
+        if (sensorType, 'Light') not in self.analysis.frames:
             print("Error: No light data to deglitch")
         else:
             print("Light data anomaly analysis")
-            lightDark = 'Light'
-            lightData.datasetToColumns()
-            light2D = lightData.columns
-            radiometry1D = light2D[f'{self.waveBand:03.2f}']
-            # print(self.waveBand)
-
-            # self.realTimePlot(self, radiometry1D, lightDateTime, sensorType, lightDark)
-            AnomAnalWindow.realTimePlot(self, radiometry1D, lightDateTime, sensorType, lightDark)
+            AnomAnalWindow.realTimePlot(self, sensorType, 'Light')
 
         # Now run the deglitcher for all wavebands light and dark to calculate the % loss to the data from this sensor
-        # Darks
-        columns = darkData.columns
-        globalBadIndex = []
-        for dark1D in columns.items():
-            band = float(dark1D[0])
-            if band > self.minBand and band < self.maxBand:
-                radiometry1D = dark1D[1]
-                window = int(self.WindowDarkLineEdit.text())
-                sigma = float(self.SigmaDarkLineEdit.text())
-                minDark = None if self.MinDarkLineEdit.text()=='None' else float(self.MinDarkLineEdit.text())
-                maxDark = None if self.MaxDarkLineEdit.text()=='None' else float(self.MaxDarkLineEdit.text())
-                MinMaxDarkBand = getattr(self,f'{self.sensor}MinMaxBandDark')
-                lightDark = 'Dark'
-                badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, window, sigma, lightDark, minDark, maxDark,MinMaxDarkBand)
-                globalBadIndex.append(badIndex)
-                globalBadIndex.append(badIndex2)
-                globalBadIndex.append(badIndex3)
-
-        # Collapse the badIndexes from all wavebands into one timeseries
         # Must be done seperately for dark and light as they are different length time series
-        # Convert to an array and test along the columns (i.e. each timestamp)
-        gIndex = np.any(np.array(globalBadIndex), 0)
-        percentLoss = 100*(sum(gIndex)/len(gIndex))
-        pLabel = f'Data reduced by {sum(gIndex)} ({percentLoss:.1f}%)'
-        print(pLabel)
-        # self.plotWidgetLight.TextItem(pLabel,anchor=(0.2,0.2))
-        self.pLossDarkLineEdit.setText(f'{percentLoss:.1f}')
-
-        # Lights
-        columns = lightData.columns
-        globalBadIndex = []
-        for light1D in columns.items():
-            band = float(light1D[0])
-            if band > self.minBand and band < self.maxBand:
-                radiometry1D = light1D[1]
-                window = int(self.WindowLightLineEdit.text())
-                sigma = float(self.SigmaLightLineEdit.text())
-                minLight = None if self.MinLightLineEdit.text()=='None' else float(self.MinLightLineEdit.text())
-                maxLight = None if self.MaxLightLineEdit.text()=='None' else float(self.MaxLightLineEdit.text())
-                MinMaxLightBand = getattr(self,f'{self.sensor}MinMaxBandLight')
-                lightDark = 'Light'
-                badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, window, sigma, lightDark, minLight, maxLight,MinMaxLightBand)
-                globalBadIndex.append(badIndex)
-                globalBadIndex.append(badIndex2)
-                globalBadIndex.append(badIndex3)
-
-        # Collapse the badIndexes from all wavebands into one timeseries
-        # Convert to an array and test along the columns (i.e. each timestamp)
-        gIndex = np.any(np.array(globalBadIndex), 0)
-        percentLoss = 100*(sum(gIndex)/len(gIndex))
-        pLabel = f'Data reduced by {sum(gIndex)} ({percentLoss:.1f}%)'
-        print(pLabel)
-        self.pLossLightLineEdit.setText(f'{percentLoss:.1f}')
+        for lightDark, pLossLineEdit in [('Dark', self.pLossDarkLineEdit), ('Light', self.pLossLightLineEdit)]:
+            if (sensorType, lightDark) not in self.analysis.frames:
+                continue
+            # Collapse the badIndexes from all wavebands into one timeseries
+            gIndex = self.analysis.badRecords(sensorType, lightDark, **self.deglitchParams(sensorType, lightDark))
+            percentLoss = 100*(sum(gIndex)/len(gIndex))
+            pLabel = f'Data reduced by {sum(gIndex)} ({percentLoss:.1f}%)'
+            print(pLabel)
+            pLossLineEdit.setText(f'{percentLoss:.1f}')
 
         self.photoUpdate()
 
@@ -917,122 +847,30 @@ class AnomAnalWindow(QtWidgets.QDialog):
 
         for sensorType in sensorTypes:
             print(sensorType)
-            darkData = None
-            lightData = None
-            darkDateTime = None
-            lightDateTime = None
-            globBad = None
-            globBad2 = None
-            globBad3 = None
-            for gp in self.root.groups:
-                if "FrameType" not in gp.attributes:
+            for lightDark in ['Dark', 'Light']:
+                if (sensorType, lightDark) not in self.analysis.frames:
+                    print(f"Error: No {lightDark.lower()} data to deglitch")
                     continue
-                if gp.attributes["FrameType"] == "ShutterDark" and sensorType in gp.datasets:
-                    darkData = gp.getDataset(sensorType)
-                    darkDateTime = Utilities.getDateTime(gp)
-                    # print(type(darkData))
-                    # print(type(darkData.data))
-                if gp.attributes["FrameType"] == "ShutterLight" and sensorType in gp.datasets:
-                    lightData = gp.getDataset(sensorType)
-                    lightDateTime = Utilities.getDateTime(gp)
-
-            if darkData is None:
-                print("Error: No dark data to deglitch")
-            else:
-                print("Dark data anomaly analysis")
-                lightDark = 'Dark'
-                darkData.datasetToColumns()
-                columns = darkData.columns
-                dateTime = darkDateTime
-                window = getattr(self,f'{sensorType}WindowDark')
-                sigma = getattr(self,f'{sensorType}SigmaDark')
-                minDark = getattr(self,f'{sensorType}MinDark')
-                maxDark = getattr(self,f'{sensorType}MaxDark')
-                minMaxDarkBand = getattr(self,f'{sensorType}MinMaxBandDark')
-
-                index = 0
-                # Loop over bands to populate globBads
-                for timeSeries in columns.items():
-                    if index==0:
-                        # Initialize boolean lists for capturing global badIndex conditions across all wavebands
-                        globBad = [False]*len(timeSeries[1])
-                        globBad2 = [False]*len(timeSeries[1])
-                        globBad3 = [False]*len(timeSeries[1])
-                    band = float(timeSeries[0])
-                    if band > self.minBand and band < self.maxBand:
-                        # if index % step == 0:
-                        radiometry1D = timeSeries[1]
-                        badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, window, sigma, lightDark, minDark, maxDark,minMaxDarkBand)
-                        globBad[:] = (True if val2 else val1 for (val1,val2) in zip(globBad,badIndex))
-                        globBad2[:] = (True if val2 else val1 for (val1,val2) in zip(globBad2,badIndex2))
-                        globBad3[:] = (True if val2 else val1 for (val1,val2) in zip(globBad3,badIndex3))
-                            ##It would be good to use an aggregated badIndex on these plots for all bands combined...
-                            # self.savePlots(self.fileName,plotdir,timeSeries,sensorType,lightDark,window,sigma,badIndex,badIndex2,badIndex3)
-                    index +=1
-                # Now plot a selection of these USING UNIVERSALLY EXCLUDED INDEXES
-                index =0
-                for timeSeries in columns.items():
-                    band = float(timeSeries[0])
-                    if band > self.minBand and band < self.maxBand:
-                        if index % step == 0:
-                            Utilities.saveDeglitchPlots(self.fileName,timeSeries,dateTime,sensorType,lightDark,window,sigma,globBad,globBad2,globBad3)
-                    index +=1
-
-            if lightData is None:
-                print("Error: No light data to deglitch")
-            else:
-                print("Light data anomaly analysis")
-                lightDark = 'Light'
-                lightData.datasetToColumns()
-                columns = lightData.columns
-                dateTime = lightDateTime
-                window = getattr(self,f'{sensorType}WindowLight')
-                sigma = getattr(self,f'{sensorType}SigmaLight')
-                minLight = getattr(self,f'{sensorType}MinLight')
-                maxLight = getattr(self,f'{sensorType}MaxLight')
-                minMaxLightBand = getattr(self,f'{sensorType}MinMaxBandLight')
-
-                globalBadIndex = []
-
-                index = 0
-                for timeSeries in columns.items():
-                    if index==0:
-                        # Initialize boolean lists for capturing global badIndex conditions across all wavebands
-                        globBad = [False]*len(timeSeries[1])
-                        globBad2 = [False]*len(timeSeries[1])
-                        globBad3 = [False]*len(timeSeries[1])
-                    band = float(timeSeries[0])
-                    if band > self.minBand and band < self.maxBand:
-                        radiometry1D = timeSeries[1]
-                        badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, window, sigma, lightDark, minLight, maxLight,minMaxLightBand)
-
-                        # For plotting:
-                        globBad[:] = (True if val2 else val1 for (val1,val2) in zip(globBad,badIndex))
-                        globBad2[:] = (True if val2 else val1 for (val1,val2) in zip(globBad2,badIndex2))
-                        globBad3[:] = (True if val2 else val1 for (val1,val2) in zip(globBad3,badIndex3))
-
-                        # For deletion:
-                        globalBadIndex.append(badIndex)
-                        globalBadIndex.append(badIndex2)
-                        globalBadIndex.append(badIndex3)
-                    index += 1
-
-                # Collapse the badIndexes from all wavebands into one timeseries
-                # Convert to an array and test along the columns (i.e. each timestamp)
-                # gIndex = np.any(np.array(globalBadIndex), 0)
+                print(f"{lightDark} data anomaly analysis")
+                names, _, data, dateTime = self.analysis.frames[(sensorType, lightDark)]
+                params = self.deglitchParams(sensorType, lightDark)
+                columns = self.analysis.deglitchBands(sensorType, lightDark)
+
+                # Global badIndex conditions across all wavebands
                 # NOTE: if you similarly collapse globBads 1-3, you should get the same result as gIndex
+                globBad, globBad2, globBad3 = [badIndex[:, columns].any(axis=1)
+                                               for badIndex in self.analysis.flags(sensorType, lightDark, **params)]
 
                 # Now plot a selection of these USING UNIVERSALLY EXCLUDED INDEXES
-                index =0
-                for timeSeries in columns.items():
-                    band = float(timeSeries[0])
-                    if band > self.minBand and band < self.maxBand:
-                        if index % step == 0:
-                            # self.savePlots(self.fileName,plotdir,timeSeries,sensorType,lightDark,window,sigma,globBad,globBad2,globBad3)
-                            Utilities.saveDeglitchPlots(self.fileName,timeSeries,dateTime,sensorType,lightDark,window,sigma,globBad,globBad2,globBad3)
-                    index +=1
+                for index, name in enumerate(names):
+                    if columns[index] and index % step == 0:
+                        Utilities.saveDeglitchPlots(self.fileName,(name, data[:, index]),dateTime,sensorType,lightDark,
+                                                    params['window'],params['sigma'],globBad,globBad2,globBad3)
 
-                print('Complete')
+            print('Complete')
+
+        # Draw the plots of all sensors together
+        PlotJobs.render()
 
     def processButtonPressed(self):
         # Run L1AQC processing for this file
@@ -1061,6 +899,7 @@ class AnomAnalWindow(QtWidgets.QDialog):
 
         if root is None and ConfigFile.settings["bL2WriteReport"] == 1:
             Controller.writeReport(fileBaseName, pathOut, outFilePath, 'L1AQC', inFilePath)
+        PlotJobs.render()
         print('Process L1AQC complete')
 
     def closeButtonPressed(self):
@@ -1096,7 +935,7 @@ class AnomAnalWindow(QtWidgets.QDialog):
     def MinMaxDarkButtonPressed(self):
         print('Updating waveband for Dark thresholds')
         # Test for root
-        if not hasattr(self, 'root'):
+        if self.analysis is None:
             note = QtWidgets.QMessageBox()
             note.setText('You must load L1A file before continuing')
             note.exec_()
@@ -1128,10 +967,25 @@ class AnomAnalWindow(QtWidgets.QDialog):
         # self.MinMaxLightLabel.setText(str(self.waveBand) +'nm' )
 
 
+    def deglitchParams(self, sensorType, lightDark):
+        # Deglitching parameters of a sensor's darks or lights in the local object, as arguments of AnomalyAnalysis.flags
+        minRad = getattr(self,f'{sensorType}Min{lightDark}')
+        maxRad = getattr(self,f'{sensorType}Max{lightDark}')
+        return {'window': int(getattr(self,f'{sensorType}Window{lightDark}')),
+                'sigma': float(getattr(self,f'{sensorType}Sigma{lightDark}')),
+                'minRad': None if minRad == 'None' else minRad,
+                'maxRad': None if maxRad == 'None' else maxRad,
+                'minMaxBand': getattr(self,f'{sensorType}MinMaxBand{lightDark}'),
+                'threshold': getattr(self,'Threshold')}
+
+
     # @staticmethod
-    def realTimePlot(self, radiometry1D, dateTime, sensorType,lightDark):
+    def realTimePlot(self, sensorType, lightDark):
         # Radiometry at this point is 1D 'column' from the appropriate group/dataset/waveband
         #   in time (radiometry1D)
+        _, bands, data, dateTime = self.analysis.frames[(sensorType, lightDark)]
+        column = int(np.flatnonzero(bands == self.waveBand)[0])
+        radiometry1D = data[:, column]
 
         styles = {'font-size': '18px'}
         # text_xlabel="Time Series"
@@ -1145,9 +999,6 @@ class AnomAnalWindow(QtWidgets.QDialog):
             ph3rd = self.ph3rdDark
             window = getattr(self,f'{sensorType}WindowDark')
             sigma = getattr(self,f'{sensorType}SigmaDark')
-            minRad = getattr(self,f'{sensorType}MinDark')
-            maxRad = getattr(self,f'{sensorType}MaxDark')
-            minMaxBand = getattr(self,f'{sensorType}MinMaxBandDark')
             # Round/truncate waveband and add units
             if sensorType == 'ES':
                 radUnits = self.root.attributes['ES_UNITS']
@@ -1173,9 +1024,6 @@ class AnomAnalWindow(QtWidgets.QDialog):
             ph3rd = self.ph3rdLight
             window = getattr(self,f'{sensorType}WindowLight')
             sigma = getattr(self,f'{sensorType}SigmaLight')
-            minRad = getattr(self,f'{sensorType}MinLight')
-            maxRad = getattr(self,f'{sensorType}MaxLight')
-            minMaxBand = getattr(self,f'{sensorType}MinMaxBandLight')
             # Round/truncate waveband and add units
             if sensorType == 'ES':
                 radUnits = self.root.attributes['ES_UNITS']
@@ -1192,8 +1040,9 @@ class AnomAnalWindow(QtWidgets.QDialog):
             self.plotWidgetLight.showGrid(x=True, y=True)
             # self.plotWidgetLight.addLegend()
 
-        badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(self.waveBand,radiometry1D, window, sigma, lightDark, minRad, maxRad,minMaxBand)
-        avg = Utilities.movingAverage(radiometry1D, window).tolist()
+        params = self.deglitchParams(sensorType, lightDark)
+        badIndex, badIndex2, badIndex3 = [badIndex[:, column] for badIndex in self.analysis.flags(sensorType, lightDark, **params)]
+        avg = self.analysis.passes(sensorType, lightDark, window, sigma)[0][:, column]
 
         # Convert to timestamp
         x = np.array([x.timestamp() for x in dateTime])
@@ -0,0 +1,126 @@
+''' Precomputed sparse band-convolution operators for satellite RSR weighting '''
+import os
+import hashlib
+import logging
+
+import numpy as np
+from scipy import sparse
+from scipy.interpolate import InterpolatedUnivariateSpline
+
+from Source import PATH_TO_DATA
+
+
+class BandConvolution:
+    ''' Builds, caches and applies (bands x hyperspectral wavelengths) convolution matrices.
+
+        Rows hold the sensor RSRs interpolated to the hyperspectral grid and normalized to
+        unit sum, so that convolving a dataset is a single matrix product. Operators are
+        kept in memory per (sensor, grid) and persisted to Data/RSR_Operators.
+    '''
+    # sensor: (RSR file, header rows, band centres, replace missing values with 0)
+    SENSORS = {
+        'MODISA': ('HMODISA_RSRs.txt', 7, [412,443,469,488,531,551,555,645,667,
+                678,748,859,869,1240,1640,2130], False),
+        'MODIST': ('HMODIST_RSRs.txt', 7, [412,443,469,488,531,551,555,645,667,
+                678,748,859,869,1240,1640,2130], False),
+        'VIIRSN': ('VIIRSN_IDPSv3_RSRs.txt', 5, [412,445,488,555,672,746,865, 1240,1610,2250], False),
+        'VIIRSJ': ('VIIRS1_RSRs.txt', 5, [412,445,488,555,672,746,865, 1240,1610,2250], False),
+        'Sentinel3A': ('OLCIA_RSRs.txt', 10, [400.0,412.5,442.5,490.0,510.0,560.0,620.0,665.0,673.75,
+                681.25,708.75,753.75,761.25,764.38,767.5,778.78,865.0,
+                885.0,900.0,940.0,1020.0], True),
+        'Sentinel3B': ('OLCIB_RSRs.txt', 10, [400.0,412.5,442.5,490.0,510.0,560.0,620.0,665.0,673.75,
+                681.25,708.75,753.75,761.25,764.38,767.5,778.78,865.0,
+                885.0,900.0,940.0,1020.0], True),
+    }
+    cacheDir = os.path.join(PATH_TO_DATA, 'RSR_Operators')
+    _operators = {}
+    _rsrTables = {}
+
+    @staticmethod
+    def readRSR(sensor):
+        ''' Read a sensor RSR table once per process '''
+        if sensor not in BandConvolution._rsrTables:
+            fileName, skiprows, _, _ = BandConvolution.SENSORS[sensor]
+            BandConvolution._rsrTables[sensor] = np.loadtxt(os.path.join(PATH_TO_DATA, fileName), skiprows=skiprows)
+        return BandConvolution._rsrTables[sensor]
+
+    @staticmethod
+    def _normalize(rsrInterp):
+        ''' Convert (wavelengths x bands) interpolated RSRs into a row-normalized sparse matrix '''
+        rsrSum = rsrInterp.sum(axis=0)
+        # Satellite bands (like 1240 nm) with all 0 RSR across the hyperspectral grid convolve to 0
+        norm = np.divide(1.0, rsrSum, out=np.zeros_like(rsrSum), where=rsrSum != 0)
+        return sparse.csr_matrix(rsrInterp.T * norm[:, None])
+
+    @staticmethod
+    def _gudBands(sensor, wavelengths):
+        # Only use bands that intersect hyperspectral data
+        fields = BandConvolution.SENSORS[sensor][2]
+        return [min(wavelengths) <= field <= max(wavelengths) for field in fields]
+
+    @staticmethod
+    def _build(sensor, wavelengths):
+        fixMissing = BandConvolution.SENSORS[sensor][3]
+        data = BandConvolution.readRSR(sensor)
+
+        gudBands = BandConvolution._gudBands(sensor, wavelengths)
+        rsr = data[:, [False] + gudBands]
+        if fixMissing:
+            rsr = np.where(rsr == -999.0, 0, rsr)
+
+        # Interpolate the response functions to the wavebands of the OCR
+        rsrInterp = np.empty([len(wavelengths), rsr.shape[1]])
+        for i in range(rsr.shape[1]):
+            fn = InterpolatedUnivariateSpline(data[:, 0], rsr[:, i], k=1)
+            rsrInterp[:, i] = fn(wavelengths)
+
+        return BandConvolution._normalize(rsrInterp)
+
+    @staticmethod
+    def _cachePath(sensor, wavelengths):
+        fileName = BandConvolution.SENSORS[sensor][0]
+        stat = os.stat(os.path.join(PATH_TO_DATA, fileName))
+        digest = hashlib.sha1(np.asarray(wavelengths, dtype=np.float64).tobytes())
+        digest.update(f'{stat.st_size}_{stat.st_mtime_ns}'.encode())
+        return os.path.join(BandConvolution.cacheDir, f'{sensor}_{digest.hexdigest()[:16]}.npz')
+
+    @staticmethod
+    def getOperator(sensor, wavelengths):
+        ''' Return (band centres, sparse bands x wavelengths operator) for a sensor and hyperspectral grid '''
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        memKey = (sensor, wavelengths.tobytes())
+        if memKey in BandConvolution._operators:
+            return BandConvolution._operators[memKey]
+
+        fields = BandConvolution.SENSORS[sensor][2]
+        bands = [field for field, gud in zip(fields, BandConvolution._gudBands(sensor, wavelengths)) if gud]
+
+        cachePath = BandConvolution._cachePath(sensor, wavelengths)
+        op = None
+        if os.path.isfile(cachePath):
+            try:
+                with np.load(cachePath) as npz:
+                    op = sparse.csr_matrix((npz['data'], npz['indices'], npz['indptr']), shape=tuple(npz['shape']))
+            except (OSError, KeyError, ValueError) as err:
+                logging.warning(f'BandConvolution: unable to read {cachePath}: {err}')
+
+        if op is None:
+            op = BandConvolution._build(sensor, wavelengths)
+            try:
+                os.makedirs(BandConvolution.cacheDir, exist_ok=True)
+                tmpPath = f'{cachePath}.{os.getpid()}.tmp.npz'
+                np.savez(tmpPath, data=op.data, indices=op.indices, indptr=op.indptr, shape=np.array(op.shape))
+                os.replace(tmpPath, cachePath)
+            except OSError as err:
+                logging.warning(f'BandConvolution: unable to write {cachePath}: {err}')
+
+        BandConvolution._operators[memKey] = (bands, op)
+        return bands, op
+
+    @staticmethod
+    def convolve(sensor, wavelengths, data):
+        ''' Convolve data (... x wavelengths) to sensor bands. Returns (band centres, ... x bands) '''
+        bands, op = BandConvolution.getOperator(sensor, wavelengths)
+        data = np.asarray(data, dtype=float)
+        return bands, (op @ data.reshape(-1, data.shape[-1]).T).T.reshape(data.shape[:-1] + (len(bands),))
+
@@ -0,0 +1,251 @@
+''' Configuration and reference data read once per batch and shared with worker processes '''
+import os
+import copy
+import logging
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Source import PATH_TO_DATA, ZhangRho
+from Source.ConfigFile import ConfigFile
+from Source.HDFRoot import HDFRoot
+from Source.FidRadDB import FidRadDB
+from Source.BandConvolution import BandConvolution
+from Source.CalibrationFileReader import CalibrationFileReader
+
+
+class BatchContext:
+    ''' Parsed configuration and read-only reference arrays for the files of a batch.
+
+        A context is built once per batch (e.g., in run_Sample_Data.py before the worker pool is
+        started) and made current in each process with install(). The reference arrays are the
+        TSIS-1 F0 spectrum, the M99 rho table, the Zhang et al. 2017 database, the satellite RSR
+        tables and the class-based and FidRadDB characterizations. share() moves them to shared
+        memory. The context then pickles to the names of its memory blocks, so spawned workers
+        attach to the same pages, and forked workers inherit the mappings.
+
+        Outside of a batch, reference() reads each reference once per process.
+    '''
+    current = None
+    # Reference name: {array name: array}, read outside of a batch context
+    _loaded = {}
+
+    ZHANG_GROUPS = ['db', 'quads', 'sdb', 'vdb']
+    ZHANG_ARRAYS = ['skyrad0', 'sunrad0', 'rad_boa_sca', 'rad_boa_vec']
+    # Levels reading the calibration map: the raw files (L1A), the L1AQC deglitching, the FRM and
+    # DALEC calibrations (L1B) and the instrument uncertainties (L2)
+    CALIBRATION_LEVELS = ['L1A', 'L1AQC', 'L1B', 'L2']
+
+    def __init__(self):
+        self.configFP = None
+        self.configFile = ''
+        self.settings = None
+        self.products = None
+        # Archive hash: calibrationMap, see CalibrationFileReader
+        self.models = {}
+        # Reference name: {array name: read-only array}
+        self.references = {}
+        # SHA1: (group attributes, [(dataset name, attributes)]), data in references['Characterizations']
+        self.characterizations = {}
+        # Folder: FidRadDB index
+        self.indexes = {}
+        # (reference name, array name): shared memory block
+        self._blocks = {}
+        self._owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def readTSIS1():
+        ''' TSIS-1 hybrid solar reference spectrum as read in Utilities.TSIS_1 [uW cm^-2 nm^-1] '''
+        F0_hybrid = HDFRoot.readHDF5(os.path.join(PATH_TO_DATA, 'hybrid_reference_spectrum_p1nm_resolution_c2020-09-21_with_unc.nc'))
+        arrays = {}
+        for ds in F0_hybrid.datasets:
+            if ds.id == 'SSI':
+                arrays['F0_raw'] = ds.data*100
+            if ds.id == 'SSI_UNC':
+                arrays['F0_unc_raw'] = ds.data*100
+            if ds.id == 'Vacuum Wavelength':
+                arrays['wv_raw'] = ds.data
+        return arrays
+
+    @staticmethod
+    def readM99():
+        ''' Mobley 1999 rho table as a 2D array (wind, sza, theta, phi, phiView, rho) '''
+        lut = HDFRoot.readHDF5(os.path.join(PATH_TO_DATA, 'rhoTable_AO1999.hdf'))
+        return {'LUT': np.array(lut.groups[0].datasets['LUT'].data.tolist())}
+
+    @staticmethod
+    def readZhang17():
+        ''' Zhang et al. 2017 database, flattened to group/name arrays. ZhangRho is left as found. '''
+        loaded = ZhangRho.db is not None
+        if not loaded:
+            ZhangRho.load()
+        arrays = {name: getattr(ZhangRho, name) for name in BatchContext.ZHANG_ARRAYS}
+        for group in BatchContext.ZHANG_GROUPS:
+            arrays.update({f'{group}/{k}': v for k, v in getattr(ZhangRho, group).items()})
+        if not loaded:
+            ZhangRho.clear_memory()
+        return arrays
+
+    @staticmethod
+    def readRSR():
+        return {sensor: BandConvolution.readRSR(sensor) for sensor, (fileName, _, _, _) in BandConvolution.SENSORS.items()
+                if os.path.isfile(os.path.join(PATH_TO_DATA, fileName))}
+
+    @staticmethod
+    def reference(name):
+        ''' {array name: array} of a reference ('TSIS-1', 'M99'), from the current batch context
+            or else read once per process. The arrays must not be modified. '''
+        context = BatchContext.current
+        if context is not None and name in context.references:
+            return context.references[name]
+        if name not in BatchContext._loaded:
+            reader = {'TSIS-1': BatchContext.readTSIS1, 'M99': BatchContext.readM99}[name]
+            arrays = reader()
+            for array in arrays.values():
+                array.setflags(write=False)
+            BatchContext._loaded[name] = arrays
+        return BatchContext._loaded[name]
+
+    @staticmethod
+    def characterizationFolders():
+        ''' Folders of the class-based and FidRadDB characterizations of the configured sensor '''
+        sensorType = ConfigFile.settings['SensorType']
+        classBased = 'TriOS' if sensorType.lower() == 'sorad' else sensorType
+        folders = [os.path.join(PATH_TO_DATA, 'Class_Based_Characterizations', f'{classBased}_initial'),
+                   os.path.join(PATH_TO_DATA, 'FidRadDB', sensorType)]
+        return [folder for folder in folders if os.path.isdir(folder)]
+
+    @staticmethod
+    def build(configFP, levels=('L1A', 'L1AQC', 'L1B', 'L1BQC', 'L2')):
+        ''' Load the configuration file configFP and read what processing to levels needs '''
+        context = BatchContext()
+        ConfigFile.loadConfig(configFP)
+        context.configFP = os.path.abspath(configFP)
+        context.configFile = ConfigFile.filename
+        context.settings = copy.deepcopy(ConfigFile.settings)
+        context.products = copy.deepcopy(ConfigFile.products)
+
+        calibrationDir = ConfigFile.getCalibrationDirectory()
+        if any(level in levels for level in BatchContext.CALIBRATION_LEVELS) and os.path.isdir(calibrationDir):
+            CalibrationFileReader.read(calibrationDir)
+            digest = CalibrationFileReader.archiveHash(calibrationDir)
+            context.models[digest] = CalibrationFileReader._models[digest]
+
+        if 'L1B' in levels:
+            chars = {}
+            for folder in BatchContext.characterizationFolders():
+                _, digests = FidRadDB.index(folder)
+                context.indexes[folder] = FidRadDB._indexes[folder]
+                for name, digest in digests.items():
+                    parsed = FidRadDB._parse(os.path.join(folder, name), digest)
+                    if parsed is None:
+                        continue
+                    attributes, datasets = parsed
+                    context.characterizations[digest] = (attributes, [(dsName, dsAttributes) for dsName, dsAttributes, _ in datasets])
+                    chars.update({f'{digest}/{i}': data for i, (_, _, data) in enumerate(datasets)})
+            context.references['Characterizations'] = chars
+
+        if 'L2' in levels:
+            context.references['TSIS-1'] = BatchContext.readTSIS1()
+            context.references['M99'] = BatchContext.readM99()
+            context.references['RSR'] = BatchContext.readRSR()
+            if int(ConfigFile.settings['bL2ZhangRho']) == 1:
+                try:
+                    context.references['Zhang17'] = BatchContext.readZhang17()
+                except (OSError, KeyError, ValueError) as err:
+                    logging.warning(f'BatchContext: Zhang et al. 2017 database not loaded: {err}')
+
+        for arrays in context.references.values():
+            for array in arrays.values():
+                array.setflags(write=False)
+        return context
+
+    def share(self):
+        ''' Move the reference arrays to shared memory blocks owned by this context. Returns self. '''
+        for name, arrays in self.references.items():
+            for key, array in arrays.items():
+                if array.nbytes == 0 or array.dtype.hasobject:
+                    continue
+                try:
+                    block = shared_memory.SharedMemory(create=True, size=array.nbytes)
+                except OSError as err:
+                    logging.warning(f'BatchContext: {name} {key} not shared: {err}')
+                    continue
+                shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+                shared[...] = array
+                shared.setflags(write=False)
+                arrays[key] = shared
+                self._blocks[(name, key)] = block
+        self._owner = True
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Arrays in shared memory are sent as the name of their block
+        state['references'] = {name: {key: (self._blocks[(name, key)].name, array.shape, array.dtype)
+                                      if (name, key) in self._blocks else array
+                                      for key, array in arrays.items()}
+                               for name, arrays in self.references.items()}
+        state.update(_blocks={}, _owner=False)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name, arrays in self.references.items():
+            for key, value in arrays.items():
+                if isinstance(value, tuple):
+                    blockName, shape, dtype = value
+                    block = shared_memory.SharedMemory(name=blockName)
+                    arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+                    self._blocks[(name, key)] = block
+                arrays[key].setflags(write=False)
+
+    def install(self):
+        ''' Make this the current context of the process and fill the per-process caches from it '''
+        BatchContext.current = self
+        CalibrationFileReader._models.update(self.models)
+        FidRadDB._indexes.update(self.indexes)
+        chars = self.references.get('Characterizations', {})
+        for digest, (attributes, datasets) in self.characterizations.items():
+            FidRadDB._parsed[digest] = (attributes, [(dsName, dsAttributes, chars[f'{digest}/{i}'])
+                                                     for i, (dsName, dsAttributes) in enumerate(datasets)])
+        BandConvolution._rsrTables.update(self.references.get('RSR', {}))
+        if 'Zhang17' in self.references:
+            arrays = self.references['Zhang17']
+            DB = {name: arrays[name] for name in BatchContext.ZHANG_ARRAYS}
+            for group in BatchContext.ZHANG_GROUPS:
+                DB[group] = {key.split('/', 1)[1]: array for key, array in arrays.items() if key.startswith(f'{group}/')}
+            ZhangRho.assign(DB)
+
+    def restoreConfig(self):
+        ''' Set ConfigFile to the configuration parsed for the batch '''
+        ConfigFile.filename = self.configFile
+        ConfigFile.settings = copy.deepcopy(self.settings)
+        ConfigFile.products = copy.deepcopy(self.products)
+
+    def close(self):
+        ''' Leave the process caches and release the shared memory (freed once every process has closed it) '''
+        if BatchContext.current is self:
+            BatchContext.current = None
+            for digest in self.characterizations:
+                FidRadDB._parsed.pop(digest, None)
+            for sensor in self.references.get('RSR', {}):
+                BandConvolution._rsrTables.pop(sensor, None)
+            if 'Zhang17' in self.references:
+                ZhangRho.clear_memory()
+        self.references = {}
+        for block in self._blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                # Arrays still in use elsewhere keep the mapping until the process ends
+                logging.warning(f'BatchContext: shared memory {block.name} still in use')
+            if self._owner:
+                block.unlink()
+        self._blocks = {}
@@ -46,6 +46,13 @@ class CalibrationData:
     def readCoefficients(self, line):
         self.coefficients = line.split()
 
+    # Coefficient i as a float, NaN where missing or not a number
+    def floatCoefficient(self, i):
+        try:
+            return float(self.coefficients[i])
+        except (IndexError, ValueError):
+            return float('nan')
+
 
     # Duplicates functionality of Python 3, int.from_bytes() for use in Python 2
     def intFromBytes(self, data, byteorder='big', signed=False):
@@ -1,9 +1,9 @@
 ''' Interpret raw SeaBird-style data files
     Reads raw files line by line and parses the data 
 '''
-import binascii
 import os
-import sys
+
+import numpy as np
 
 from Source.CalibrationData import CalibrationData
 from Source.Utilities import Utilities
@@ -13,10 +13,20 @@ class CalibrationFile:
     '''CalibrationFile class stores information about an instrument
         obtained from reading a calibration file'''
 
+    # Fit types carried through uncalibrated
+    passFitTypes = ['COUNT', 'NONE', 'THERMAL_RESP']
+    # Sensor definition types whose ids are stored as group attributes
+    idTypes = ('INSTRUMENT', 'VLF_INSTRUMENT', 'SN', 'VLF_SN')
+    # Instruments whose frames are followed by DATETAG and TIMETAG2
+    timeTagInstruments = ("SATHED", "SATHLD", "SATHSE", "SATHSL", "SATPYR", "SATNAV", "$GPRMC", "SATTHS", "UMTWR")
+
     def __init__(self):
         self.id = ""
         self.name = ""
         self.data = []
+        # Calibration grouped by fit type and message frame layout, see compile()
+        self.compiled = None
+        self.frame = None
 
         self.instrumentType = ""
         self.media = ""
@@ -57,7 +67,7 @@ class CalibrationFile:
 
             # Determines the frame synchronization string by appending
             # ids from INSTRUMENT and SN lines
-            if cdtype in ('INSTRUMENT', 'VLF_INSTRUMENT', 'SN', 'VLF_SN'):
+            if cdtype in CalibrationFile.idTypes:
                 self.id += cd.id
 
             # Read in coefficients
@@ -88,40 +98,7 @@ class CalibrationFile:
     # Verify raw data message can be read successfully
     def verifyRaw(self, msg):
         try:
-            nRead = 0
-            for i, cd in enumerate(self.data):
-                v = 0 # for debugging; ignore
-                # cd = self.data[i]
-
-                # Read variable length message frames (field length == -1)
-                if cd.fieldLength == -1:
-                    delimiter = self.data[i+1].units
-                    delimiter = delimiter.encode("utf-8").decode("unicode_escape").encode("utf-8")
-                    #print("delimiter:", delimiter)
-
-                    end = msg[nRead:].find(delimiter)
-                    # print("read:", nRead, end)
-                    if end == 0:
-                        v = 0.0
-                    else:
-                        b = msg[nRead:nRead+end]
-                        v = cd.convertRaw(b)
-
-                    nRead += end
-
-                # Read fixed length message frames
-                else:
-                    if cd.fitType.upper() != "DELIMITER":
-                        if cd.fieldLength != 0:
-                            b = msg[nRead:nRead+cd.fieldLength]
-                            # print(nRead, cd.fieldLength, b)
-                            v = cd.convertRaw(b)
-                    nRead  += cd.fieldLength
-
-                # Passed EndOfFile
-                #if nRead > len(msg):
-                #    return False
-
+            self.decodeRaw(msg)
             return True
 
         except KeyError:
@@ -132,104 +109,135 @@ class CalibrationFile:
 
         return False
 
-
-    # Reads a message frame from the raw file and generates hdf groups/datasets
-    # Returns nRead (number of bytes read) or -1 on error
-    def convertRaw(self, msg, gp):
-        nRead = 0
+    # Groups the sensor definitions by dataset and fit type, with their coefficients gathered into arrays
+    # Used to calibrate raw data (convert from L1a to L1b)
+    # Reference: "SAT-DN-00134_Instrument File Format.pdf"
+    def compileCalibration(self):
+        '''
+        Group the sensor definitions of a calibration file by dataset and fit type, with their
+        coefficients gathered into arrays so that each group is calibrated in one expression.
+        Returns {dataset type: [group, ...]}. Each group is a dict holding type, fitType, ids (the dataset
+        columns) and the coefficient arrays used by its fit type. POLYU and POLYF groups also share a
+        number of coefficients, held in an (nIds, nCoefficients) matrix.
+        '''
+        byKey = {}
+        for cd in self.data:
+            if cd.fitType in CalibrationFile.passFitTypes:
+                continue
+            nCoef = len(cd.coefficients) if cd.fitType in ['POLYU', 'POLYF'] else 0
+            byKey.setdefault((cd.type, cd.fitType, nCoef), []).append(cd)
+
+        compiled = {}
+        for (dsType, fitType, nCoef), cds in byKey.items():
+            group = {'type': dsType, 'fitType': fitType, 'ids': [cd.id for cd in cds]}
+            if fitType in ['POLYU', 'POLYF']:
+                group['coefficients'] = np.array([[cd.floatCoefficient(i) for i in range(nCoef)]
+                                                  for cd in cds]).reshape(len(cds), nCoef)
+            else:
+                for i, name in enumerate(['a0', 'a1', 'im', 'cint']):
+                    group[name] = np.array([cd.floatCoefficient(i) for cd in cds])
+            compiled.setdefault(dsType, []).append(group)
+        return compiled
+
+    # Lays out the message frame of the sensor definitions
+    def compileFrame(self):
+        '''
+        Message frame layout: one (definition, field length, delimiter, dataset, attribute) entry per
+        sensor definition. Variable length fields (field length -1) end at the delimiter given by the
+        units of the next definition; fixed length fields with no value to decode have a field length
+        but no definition. Values go to the dataset of the definition type, or its id to a group
+        attribute. Also whether frames are followed by DATETAG and TIMETAG2 bytes.
+        '''
+        frame = []
         instrumentId = ""
+        for i, cd in enumerate(self.data):
+            cdtype = cd.type.upper()
+            fitType = cd.fitType.upper()
+            delimiter = None
+            if cd.fieldLength == -1 and i+1 < len(self.data):
+                delimiter = self.data[i+1].units.encode("utf-8").decode("unicode_escape").encode("utf-8")
 
-        #for i in range(0, len(self.data)):
-        #    self.data[i].printd()
-        #print("file:", msg)
+            # Stores the instrument id to check for DATETAG/TIMETAG2
+            if cdtype in ('INSTRUMENT', 'VLF_INSTRUMENT'):
+                instrumentId = cd.id
 
-        if self.verifyRaw(msg) is False:
-            print("Message not read successfully:\n" + str(msg))
-            self.verifyRaw(msg)
-            return -1
+            dataset, attribute = None, None
+            if fitType not in ('NONE', 'DELIMITER'):
+                # Stores raw data into hdf datasets according to type
+                if cdtype not in CalibrationFile.idTypes:
+                    dataset = cd.type
+                else:
+                    attribute = cdtype
+            elif fitType == "NONE" and cdtype in ('SN', 'DATARATE', 'RATE'):
+                # None types are stored as attributes
+                attribute = cdtype
 
-        for i, cd in enumerate(self.data):
-            v = 0
-            # cd = self.data[i]
+            decoded = cd if cd.fieldLength == -1 or (fitType != "DELIMITER" and cd.fieldLength != 0) else None
+            frame.append((decoded, cd.fieldLength, delimiter, dataset, attribute, cd))
 
-            # Get value from message frame
+        # Some instruments produce additional bytes for
+        # DATETAG (3 bytes), and TIMETAG2 (4 bytes)
+        #       apparently SATMSG does not .... comes out jibberish
+        #       $GPGGA also does not work and timetags will be added later from NMEA strings
+        timeTags = instrumentId.startswith(CalibrationFile.timeTagInstruments)
+        return frame, timeTags
 
-            # Read variable length message frames (field length == -1)
-            if cd.fieldLength == -1:
-                delimiter = self.data[i+1].units
-                delimiter = delimiter.encode("utf-8").decode("unicode_escape").encode("utf-8")
-                #print("delimiter:", delimiter)
+    # Compiles the frame layout and calibration of the sensor definitions
+    def compile(self):
+        self.frame = self.compileFrame()
+        self.compiled = self.compileCalibration()
 
+    # Reads the values of a raw message frame. Returns (values, nRead)
+    def decodeRaw(self, msg):
+        if self.frame is None:
+            self.frame = self.compileFrame()
+
+        values = []
+        nRead = 0
+        for cd, fieldLength, delimiter, _, _, definition in self.frame[0]:
+            v = 0
+            # Read variable length message frames (field length == -1)
+            if fieldLength == -1:
+                if delimiter is None:
+                    raise IndexError(f'No delimiter after variable length field {definition.type} {definition.id}')
                 end = msg[nRead:].find(delimiter)
-                #print("read:", nRead, end)
-                b = msg[nRead:nRead+end]
-                v = cd.convertRaw(b)
+                v = cd.convertRaw(msg[nRead:nRead+end])
                 nRead += end
 
             # Read fixed length message frames
             else:
-                if cd.fitType.upper() != "DELIMITER":
-                    if cd.fieldLength != 0:
-                        b = msg[nRead:nRead+cd.fieldLength]
-                        # print(nRead, cd.fieldLength, b)
-                        v = cd.convertRaw(b)
-                nRead  += cd.fieldLength
-
+                if cd is not None:
+                    v = cd.convertRaw(msg[nRead:nRead+fieldLength])
+                nRead += fieldLength
+            values.append(v)
+        return values, nRead
 
-            # Stores the instrument id to check for DATETAG/TIMETAG2
-            if cd.type.upper() == "INSTRUMENT" or cd.type.upper() == "VLF_INSTRUMENT":
-                instrumentId = cd.id
+    # Reads a message frame from the raw file and generates hdf groups/datasets
+    # Returns nRead (number of bytes read) or -1 on error
+    def convertRaw(self, msg, gp):
+        # Values of the whole frame are read before any is stored
+        try:
+            values, nRead = self.decodeRaw(msg)
+        except KeyError:
+            pmsg = "Message not read successfully:\n" + str(msg)
+            print(pmsg)
+            Utilities.writeLogFile(pmsg)
+            return -1
 
+        for (_, _, _, dataset, attribute, cd), v in zip(self.frame[0], values):
             # Stores value in dataset or attribute depending on type
-
-            # Stores raw data into hdf datasets according to type
-            if cd.fitType.upper() != "NONE" and cd.fitType.upper() != "DELIMITER":
-                cdtype = cd.type.upper()
-                if cdtype not in ('INSTRUMENT', 'VLF_INSTRUMENT', 'SN', 'VLF_SN'):
-                    ds = gp.getDataset(cd.type)
-                    if ds is None:
-                        ds = gp.addDataset(cd.type)
-                    #print(cd.id)
-                    #ds.temp.append(v)
-                    #ds.addColumn(cd.id)
-                    ds.appendColumn(cd.id, v)
-                else:
-                    if sys.version_info[0] < 3: # Python3
-                        gp.attributes[cdtype.encode('utf-8')] = cd.id
-                    else: # Python2
-                        gp.attributes[cdtype] = cd.id
-
-            # None types are stored as attributes
-            if cd.fitType.upper() == "NONE":
-                cdtype = cd.type.upper()
-                if cdtype == "SN" or cdtype == "DATARATE" or cdtype == "RATE":
-                    if sys.version_info[0] < 3:
-                        gp.attributes[cdtype.encode('utf-8')] = cd.id
-                    else:
-                        gp.attributes[cdtype] = cd.id
-
-
-        # Some instruments produce additional bytes for
-        # DATETAG (3 bytes), and TIMETAG2 (4 bytes)        
-        #       apparently SATMSG does not .... comes out jibberish
-        #       $GPGGA also does not work and timetags will be added later from NMEA strings 
-        if instrumentId.startswith("SATHED") or \
-            instrumentId.startswith("SATHLD") or \
-            instrumentId.startswith("SATHSE") or \
-            instrumentId.startswith("SATHSL") or \
-            instrumentId.startswith("SATPYR") or \
-            instrumentId.startswith("SATNAV") or \
-            instrumentId.startswith("$GPRMC") or \
-            instrumentId.startswith("SATTHS") or \
-            instrumentId.startswith("UMTWR"):
-            #    instrumentId.startswith("SATMSG") or \
-            #print("not gps")
+            if dataset is not None:
+                ds = gp.getDataset(dataset)
+                if ds is None:
+                    ds = gp.addDataset(dataset)
+                ds.appendColumn(cd.id, v)
+            elif attribute is not None:
+                gp.attributes[attribute] = cd.id
+
+        if self.frame[1]:
             # Read DATETAG
             b = msg[nRead:nRead+3]
-            if sys.version_info[0] < 3:
-                v = int(binascii.hexlify(b), 16)
-            else:
-                v = int.from_bytes(b, byteorder='big', signed=False)
+            v = int.from_bytes(b, byteorder='big', signed=False)
             nRead += 3
             #print("Date:",v)
             ds1 = gp.getDataset("DATETAG")
@@ -238,10 +246,7 @@ class CalibrationFile:
             ds1.appendColumn("NONE", v)
             # Read TIMETAG2
             b = msg[nRead:nRead+4]
-            if sys.version_info[0] < 3:
-                v = int(binascii.hexlify(b), 16)
-            else:
-                v = int.from_bytes(b, byteorder='big', signed=False)
+            v = int.from_bytes(b, byteorder='big', signed=False)
             nRead += 4
             #print("Time:",v)
             ds1 = gp.getDataset("TIMETAG2")
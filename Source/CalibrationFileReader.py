@@ -1,17 +1,53 @@
 '''Read in calibration and telemetry definition files'''
 import collections
+import hashlib
+import logging
 import os.path
+import pickle
 import shutil
 import zipfile
 
+from Source import PATH_TO_DATA
 from Source.CalibrationFile import CalibrationFile
 
 
 class CalibrationFileReader:
-    '''Read in calibration and telemetry definition files. Return the calibrationMap.'''
-    # reads calibration files stored in directory
+    '''Read in calibration and telemetry definition files. Return the calibrationMap.
+
+    The calibration files of a directory are parsed and compiled (frame layouts, fit types and
+    coefficient arrays, see CalibrationFile.compile) once per calibration archive. The compiled
+    model is kept in memory and pickled in cacheDir, keyed by the hash of the archive.
+
+    NOTE: read() unpickles any <archive hash>.pkl found in cacheDir (Data/Calibration_Cache by
+    default), and unpickling can run arbitrary code. cacheDir must only be writable by trusted users;
+    point it elsewhere, or delete it, if the HyperCP tree is shared.'''
+
+    cacheDir = os.path.join(PATH_TO_DATA, 'Calibration_Cache')
+    # Bump when the compiled CalibrationFile layout changes
+    modelVersion = 1
+    # Archive hash: calibrationMap
+    _models = {}
+
     @staticmethod
-    def read(fp):
+    def isCalibrationFile(name):
+        return name.lower().startswith("dalec") or os.path.splitext(name)[1].lower() in (".cal", ".tdf")
+
+    # hash of the calibration files stored in directory
+    @staticmethod
+    def archiveHash(fp):
+        digest = hashlib.sha1(f'{CalibrationFileReader.modelVersion} {os.path.abspath(fp)}'.encode())
+        for (dirpath, dirnames, filenames) in os.walk(fp):
+            for name in sorted(filenames):
+                if CalibrationFileReader.isCalibrationFile(name):
+                    digest.update(name.encode())
+                    with open(os.path.join(dirpath, name), 'rb') as f:
+                        digest.update(hashlib.sha1(f.read()).digest())
+            break
+        return digest.hexdigest()
+
+    # parses calibration files stored in directory
+    @staticmethod
+    def parse(fp):
         calibrationMap = collections.OrderedDict()
 
         for (dirpath, dirnames, filenames) in os.walk(fp):
@@ -28,12 +64,42 @@ class CalibrationFileReader:
                     with open(os.path.join(dirpath, name), 'rb') as f:
                         cf = CalibrationFile()
                         cf.read(f)
+                        cf.compile()
                         #print("id:", cf.id)
                         calibrationMap[name] = cf
             break
 
         return calibrationMap
 
+    # reads calibration files stored in directory, from the compiled model when available
+    @staticmethod
+    def read(fp):
+        digest = CalibrationFileReader.archiveHash(fp)
+        model = CalibrationFileReader._models.get(digest)
+
+        cachePath = os.path.join(CalibrationFileReader.cacheDir, f'{digest}.pkl')
+        if model is None and os.path.isfile(cachePath):
+            try:
+                with open(cachePath, 'rb') as f:
+                    model = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as err:
+                logging.warning(f'CalibrationFileReader: unable to read {cachePath}: {err}')
+
+        if model is None:
+            model = CalibrationFileReader.parse(fp)
+            try:
+                os.makedirs(CalibrationFileReader.cacheDir, exist_ok=True)
+                tmpPath = f'{cachePath}.{os.getpid()}.tmp'
+                with open(tmpPath, 'wb') as f:
+                    pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmpPath, cachePath)
+            except OSError as err:
+                logging.warning(f'CalibrationFileReader: unable to write {cachePath}: {err}')
+        CalibrationFileReader._models[digest] = model
+
+        # The calibration files are shared; the map is the caller's to filter
+        return collections.OrderedDict(model)
+
     # reads calibration files stored in .sip file (renamed .zip)
     @staticmethod
     def readSip(fp):
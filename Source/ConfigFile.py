@@ -105,6 +105,14 @@ class ConfigFile:
         ConfigFile.settings["fL1bCal"] = 1  # 1 for Factory, 2 for Class, 3 for Instrument Full
         ConfigFile.settings["fL1bThermal"] = 1  # 1 for internal thermistor, 2 for airTemp-based, 3 for caps-on darks
 
+        # 6S direct/diffuse irradiance cache (FRM regimes). Inputs are quantized to these bin widths
+        # and 6S is run on a regular grid of this step [nm] before interpolation to instrument bands.
+        ConfigFile.settings["fL1bSixSBinSZA"] = 0.5 # deg
+        ConfigFile.settings["fL1bSixSBinAOD"] = 0.01
+        ConfigFile.settings["fL1bSixSBinWV"] = 0.25 # g/cm^2
+        ConfigFile.settings["fL1bSixSBinPressure"] = 5.0 # hPa
+        ConfigFile.settings["fL1bSixSWavelengthStep"] = 10.0 # nm; 0 to run every band
+
         # # Cal/char directory (inclusing FidRadDB cal/chars for config)
         # ConfigFile.settings["calibrationPath"] = ConfigFile.getCalibrationDirectory()#PATH_TO_CONFIG#PACKAGE_DIR
 
@@ -213,6 +221,9 @@ class ConfigFile:
         ConfigFile.settings["seaBASSHeaderFileName"] = os.path.splitext(fileName)[0] + ".hdr" #
         ConfigFile.settings["bL2SaveSeaBASS"] = 1
         ConfigFile.settings["bL2WriteReport"] = 1
+        # Precision of the _unc, _sd and _median datasets on file: float64, float32 or int16.
+        #   int16 applies to _unc and _sd (medians fall back to float32)
+        ConfigFile.settings["L2UncertaintyStorage"] = "float64"
 
         # If this is a new config file, save it
         if new==1:
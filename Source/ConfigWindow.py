@@ -626,6 +626,12 @@ class ConfigWindow(QtWidgets.QDialog):
 
         self.l2SeaBASSHeaderLabel = QtWidgets.QLabel(f'  {ConfigFile.settings["seaBASSHeaderFileName"]}', self)
 
+        l2UncertaintyStorageLabel = QtWidgets.QLabel("Unc./SD Storage", self)
+        self.l2UncertaintyStorageComboBox = QtWidgets.QComboBox(self)
+        self.l2UncertaintyStorageComboBox.addItems(["float64", "float32", "int16"])
+        index = self.l2UncertaintyStorageComboBox.findText(ConfigFile.settings["L2UncertaintyStorage"],QtCore.Qt.MatchFixedString)
+        self.l2UncertaintyStorageComboBox.setCurrentIndex(index)
+
         l2WriteReportLabel = QtWidgets.QLabel("Write PDF Report", self)
         self.l2WriteReportCheckBox = QtWidgets.QCheckBox("", self)
         self.l2WriteReportCheckBox.clicked.connect(self.l2WriteReportCheckBoxUpdate)
@@ -1057,6 +1063,12 @@ class ConfigWindow(QtWidgets.QDialog):
         l2OCproductsHBox.addWidget(self.l2OCproducts)
         VBox4.addLayout(l2OCproductsHBox)
 
+        #   Horizontal Box; Uncertainty storage
+        l2UncertaintyStorageHBox = QtWidgets.QHBoxLayout()
+        l2UncertaintyStorageHBox.addWidget(l2UncertaintyStorageLabel)
+        l2UncertaintyStorageHBox.addWidget(self.l2UncertaintyStorageComboBox)
+        VBox4.addLayout(l2UncertaintyStorageHBox)
+
         #   Horizontal Box; Save SeaBASS
         l2SeaBASSHBox = QtWidgets.QHBoxLayout()
         l2SeaBASSHBox.addWidget(l2SaveSeaBASSLabel)
@@ -1861,6 +1873,7 @@ class ConfigWindow(QtWidgets.QDialog):
         ConfigFile.settings["bL2UncertaintyBreakdownPlot"] = int(self.l2UncertaintyBreakdownPlotCheckBox.isChecked())
         ConfigFile.settings["bL2SaveSeaBASS"] = int(self.l2SaveSeaBASSCheckBox.isChecked())
         ConfigFile.settings["bL2WriteReport"] = int(self.l2WriteReportCheckBox.isChecked())
+        ConfigFile.settings["L2UncertaintyStorage"] = self.l2UncertaintyStorageComboBox.currentText()
 
         self.checkForChlor()
 
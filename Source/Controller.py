@@ -2,9 +2,10 @@
 import os
 import datetime
 import collections
+import traceback
 import numpy as np
 
-from Source import PATH_TO_CONFIG, PACKAGE_DIR
+from Source import PATH_TO_CONFIG
 from Source.HDFRoot import HDFRoot
 from Source.MainConfig import MainConfig
 from Source.ConfigFile import ConfigFile
@@ -22,8 +23,11 @@ from Source.ProcessL1bDALEC import ProcessL1bDALEC
 from Source.ProcessL1bqc import ProcessL1bqc
 from Source.ProcessL2 import ProcessL2
 from Source.SeaBASSWriter import SeaBASSWriter
-from Source.PDFreport import PDF
+from Source.PDFreport import ReportBuilder
 from Source.Utilities import Utilities
+from Source.LogWriter import LogWriter
+from Source.PlotJobs import PlotJobs
+from Source.Profiler import Profiler
 
 
 class Controller:
@@ -33,112 +37,9 @@ class Controller:
 
     @staticmethod
     def writeReport(fileName, pathOut, outFilePath, level, inFilePath):
-        print('Writing PDF Report...')
-        numLevelDict = {'L1A':1,'L1AQC':2,'L1B':3,'L1BQC':4,'L2':5}
-        numLevel = numLevelDict[level]
-
-        # Reports are written during failure at any level or success at L2.
-        # The highest level succesfully processed will have the correct configurations in the HDF attributes.
-
-        #   Try to open current level. If this fails, open the previous level and use all the parameters
-        #   from the attributes up to that level, then use the ConfigFile.settings for the current level parameters.
-        try:
-            # Processing successful at this level
-            root = HDFRoot.readHDF5(outFilePath)
-            fail = 0
-            root.attributes['Fail'] = 0
-        except Exception:
-            fail =1
-            # Processing failed at this level. Open the level below it
-            #   This won't work for ProcessL1A looking back for RAW...
-            if level != 'L1A':
-                try:
-                    # Processing successful at the next lower level
-                    # Shift from the output to the input directory
-                    root = HDFRoot.readHDF5(inFilePath)
-                except Exception:
-                    msg = "Controller.writeReport: Unable to open HDF file. May be open in another application."
-                    if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
-                        Utilities.errorWindow("File Error", msg)
-                    Utilities.writeLogFileAndPrint(msg)
-                    return
-
-            else:
-                # Create a root with nothing but the fail flag in the attributes to pass to PDF reporting
-                #   PDF will contain parameters from ConfigFile.settings
-                root = HDFRoot()
-                root.id = "/"
-                root.attributes["HYPERINSPACE"] = MainConfig.settings["version"]
-                root.attributes['TIME-STAMP'] = 'Null' # Collection time not preserved in failed RAW>L1A
-            root.attributes['Fail'] = 1
-
-
-        timeStamp = root.attributes['TIME-STAMP']
-        title = f'File: {fileName} Collected: {timeStamp}'
-
-        # Reports
-        reportPath = os.path.join(pathOut, 'Reports')
-        if os.path.isdir(reportPath) is False:
-            os.mkdir(reportPath)
-        inLogPath = os.path.join(PACKAGE_DIR, 'Logs')
-
-        inPlotPath = os.path.join(pathOut,'Plots')
-        # # The inPlotPath is going to be different for L1A-L1E than L2 for many cruises...
-        # # In that case, move up one directory
-        # if os.path.isdir(os.path.join(inPlotPath, 'L1AQC_Anoms')) is False:
-        #     inPlotPath = os.path.join(pathOut,'..','Plots')
-
-        outHDF = os.path.split(outFilePath)[1]
-
-        if fail:
-            outPDF = os.path.join(reportPath, f'{os.path.splitext(outHDF)[0]}_fail.pdf')
-        else:
-            outPDF = os.path.join(reportPath, f'{os.path.splitext(outHDF)[0]}.pdf')
-
-        pdf = PDF()
-        pdf.set_title(title)
-        pdf.set_author(f'HyperCP_{MainConfig.settings["version"]}')
-
-        inLog = os.path.join(inLogPath,f'{fileName}_L1A.log')
-        if os.path.isfile(inLog):
-            print('Level 1A')
-            pdf.print_chapter('L1A', 'Process RAW to L1A', inLog, inPlotPath, fileName, root)
-
-        if numLevel > 1:
-            print('Level 1AQC')
-            inLog = os.path.join(inLogPath,f'{fileName}_L1A_L1AQC.log')
-            if os.path.isfile(inLog):
-                pdf.print_chapter('L1AQC', 'Process L1A to L1AQC', inLog, inPlotPath, fileName, root)
-
-        if numLevel > 2:
-            print('Level 1B')
-            inLog = os.path.join(inLogPath,f'{fileName}_L1AQC_L1B.log')
-            if os.path.isfile(inLog):
-                pdf.print_chapter('L1B', 'Process L1AQC to L1B', inLog, inPlotPath, fileName, root)
-
-        if numLevel > 3:
-            print('Level 1BQC')
-            inLog = os.path.join(inLogPath,f'{fileName}_L1B_L1BQC.log')
-            if os.path.isfile(inLog):
-                pdf.print_chapter('L1BQC', 'Process L1B to L1BQC', inLog, inPlotPath, fileName, root)
-
-        if numLevel > 4:
-            print('Level 2')
-            # For L2, reset Plot directory
-            inPlotPath = os.path.join(pathOut,'Plots')
-            if 'STATION' in outFilePath:
-                inLog = os.path.join(inLogPath,f'Stations_{fileName}_L1BQC_L2.log')
-            else:
-                inLog = os.path.join(inLogPath,f'{fileName}_L1BQC_L2.log')
-            if os.path.isfile(inLog):
-                pdf.print_chapter('L2', 'Process L1BQC to L2', inLog, inPlotPath, fileName, root)
-
-        try:
-            pdf.output(outPDF, 'F')
-        except Exception:
-            msg = '**********************Unable to write the PDF file. It may be open in another program.**********************'
-            Utilities.errorWindow("File Error", msg)
-            Utilities.writeLogFileAndPrint(msg)
+        # The report includes the plots queued so far
+        PlotJobs.render()
+        ReportBuilder.write(fileName, pathOut, outFilePath, level, inFilePath)
 
     @staticmethod
     def generateContext(calibrationMap):
@@ -286,6 +187,7 @@ class Controller:
         return ancillaryData
 
     @staticmethod
+    @Profiler.timed('L1A')
     # def processL1a(inFilePath, outFilePath, calibrationMap):
     def processL1a(inFilePath, outFilePath, calibrationMap):
         root = None
@@ -317,6 +219,7 @@ class Controller:
                 if ConfigFile.settings["SensorType"].lower() != "trios":
                     # TriOS L1a files are written in ProcessL1aTriOS
                     root.writeHDF5(outFFPs)
+                Profiler.addOutput(outFFPs)
             except Exception:
                 msg = '**********************Unable to write L1A file. It may be open in another program.**********************'
                 if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
@@ -333,6 +236,7 @@ class Controller:
         return root, outFFPs
 
     @staticmethod
+    @Profiler.timed('L1AQC')
     def processL1aqc(inFilePath, outFilePath, calibrationMap, ancillaryData):
         root = None
         test = Utilities.checkInputFiles(inFilePath)
@@ -358,6 +262,7 @@ class Controller:
         if root is not None:
             try:
                 root.writeHDF5(outFilePath)
+                Profiler.addOutput(outFilePath)
             except Exception:
                 msg = "Controller.processL1aqc: Unable to open HDF file. May be open in another application."
                 if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
@@ -374,6 +279,7 @@ class Controller:
         return root
 
     @staticmethod
+    @Profiler.timed('L1B')
     def processL1b(inFilePath, outFilePath):
         root = None
         if not os.path.isfile(inFilePath):
@@ -403,6 +309,7 @@ class Controller:
         if root is not None:
             try:
                 root.writeHDF5(outFilePath)
+                Profiler.addOutput(outFilePath)
             except Exception:
                 msg = "**********************Controller.ProcessL1b: Unable to write file. May be open in another application.**********************"
                 Utilities.errorWindow("File Error", msg)
@@ -418,6 +325,7 @@ class Controller:
         return root
 
     @staticmethod
+    @Profiler.timed('L1BQC')
     def processL1bqc(inFilePath, outFilePath):
         root = None
 
@@ -442,6 +350,7 @@ class Controller:
         if root is not None:
             try:
                 root.writeHDF5(outFilePath)
+                Profiler.addOutput(outFilePath)
             except Exception:
                 msg = "**********************Unable to write file. May be open in another application.**********************"
                 Utilities.errorWindow("File Error", msg)
@@ -458,6 +367,7 @@ class Controller:
 
 
     @staticmethod
+    @Profiler.timed('L2')
     def processL2(root,outFilePath,station=None):
 
         node = ProcessL2.processL2(root,station)
@@ -504,8 +414,10 @@ class Controller:
 
         # Write output file
         if node is not None:
+            node.setUncertaintyStorage(ConfigFile.settings["L2UncertaintyStorage"])
             try:
                 node.writeHDF5(outFilePath)
+                Profiler.addOutput(outFilePath)
                 return node
             except Exception:
                 msg = "**********************Unable to write file. May be open in another application.**********************"
@@ -523,6 +435,25 @@ class Controller:
     @staticmethod
     # def processSingleLevel(pathOut, inFilePath, calibrationMap, level, flag_Trios):
     def processSingleLevel(pathOut, inFilePath, calibrationMap, level):
+        # Log lines are buffered; make sure they reach disk at the end of each level, including on failure
+        Profiler.reset()
+        try:
+            return Controller._processSingleLevel(pathOut, inFilePath, calibrationMap, level)
+        except Exception:
+            Utilities.writeLogFile(traceback.format_exc())
+            raise
+        finally:
+            # Plots are queued during processing and drawn here, off the processing path.
+            #   A plotting failure must not replace a processing exception or skip the log and profile.
+            try:
+                PlotJobs.render()
+            except Exception:
+                Utilities.writeLogFileAndPrint(f'Controller.processSingleLevel: plotting failed\n{traceback.format_exc()}')
+            LogWriter.flush()
+            Profiler.writeReports(level, inFilePath)
+
+    @staticmethod
+    def _processSingleLevel(pathOut, inFilePath, calibrationMap, level):
         # Find the absolute path to the output directory
         pathOut = os.path.abspath(pathOut)
 
@@ -786,6 +717,15 @@ class Controller:
     # Process every file in a list of files from L0 to L2
     @staticmethod
     def processFilesMultiLevel(pathOut,inFiles, calibrationMap):
+        # Reports of the whole list are built together once processing is done
+        ReportBuilder.startBatch()
+        try:
+            Controller._processFilesMultiLevel(pathOut,inFiles, calibrationMap)
+        finally:
+            ReportBuilder.finishBatch()
+
+    @staticmethod
+    def _processFilesMultiLevel(pathOut,inFiles, calibrationMap):
         print("processFilesMultiLevel")
 
         L1A_complete = False
@@ -834,6 +774,15 @@ class Controller:
     @staticmethod
     # def processFilesSingleLevel(pathOut, inFiles, calibrationMap, level, flag_Trios):
     def processFilesSingleLevel(pathOut, inFiles, calibrationMap, level):
+        # Reports of the whole list are built together once processing is done
+        ReportBuilder.startBatch()
+        try:
+            Controller._processFilesSingleLevel(pathOut, inFiles, calibrationMap, level)
+        finally:
+            ReportBuilder.finishBatch()
+
+    @staticmethod
+    def _processFilesSingleLevel(pathOut, inFiles, calibrationMap, level):
 
         if level == "L1A":
             srchStr = ['raw', 'mlb', 'txt']
@@ -0,0 +1,144 @@
+''' Ensemble slicing of L2 input datasets without per-ensemble copies '''
+import datetime
+import collections
+import collections.abc
+
+import numpy as np
+
+
+class EnsembleSlice(collections.abc.Mapping):
+    ''' Rows of an EnsembleView. Reads as an ordered {column name: values} mapping, like the
+        column slices it replaces, while block holds the same values as one (time x column) array.
+        Columns are views into the file-wide array, not copies. '''
+
+    def __init__(self, names, block):
+        self.names = names
+        self.block = block
+        self.index = {name: i for i, name in enumerate(names)}
+
+    def __getitem__(self, name):
+        return self.block[:, self.index[name]]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class EnsembleView:
+    ''' The columns of a dataset gathered once per file into a (time x column) float array, with the
+        Datetime column kept alongside. Ensembles are row ranges of that array.
+
+        Build from a dataset's data (fromDataset) or from its columns (for the L1AQC groups, whose
+        columns are updated without being written back to data).
+    '''
+    dateColumns = ['Datetime', 'Datetag', 'Timetag2']
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc) # Unix zero hour
+
+    def __init__(self, columns):
+        self.allNames = list(columns)
+        self.dates = {k: columns[k] for k in EnsembleView.dateColumns if k in columns}
+        self.original = {k: columns[k] for k in self.allNames if k not in self.dates}
+
+        # Numeric columns go into the array, others (e.g. strings) are only kept as they are
+        self.names = []
+        values = []
+        for k, v in self.original.items():
+            try:
+                values.append(np.asarray(v, dtype=np.float64))
+            except (TypeError, ValueError):
+                continue
+            self.names.append(k)
+        if values:
+            self.block = np.column_stack(values)
+        else:
+            self.block = np.empty((len(next(iter(columns.values()), [])), 0))
+
+        self.dateTime = columns['Datetime'] if 'Datetime' in columns else None
+        self.micros = None
+        if self.dateTime is not None:
+            self.micros = np.array([(dt - EnsembleView.epoch) // datetime.timedelta(microseconds=1)
+                                    for dt in self.dateTime], dtype=np.int64)
+
+    @staticmethod
+    def fromDataset(ds):
+        return EnsembleView(collections.OrderedDict((k, ds.data[k]) for k in ds.data.dtype.names))
+
+    def __len__(self):
+        return self.block.shape[0]
+
+    @staticmethod
+    def rows(start, end):
+        ''' Row range of an ensemble. Ends are exclusive, the next ensemble picks them up, except for
+            start == end which would otherwise be empty. '''
+        if start == end:
+            return slice(start, end+1)
+        return slice(start, end)
+
+    def slice(self, start, end):
+        return EnsembleSlice(self.names, self.block[EnsembleView.rows(start, end)])
+
+    def column(self, name, start, end):
+        ''' Values of any column, including the date columns and those not held as floats '''
+        rows = EnsembleView.rows(start, end)
+        if name in self.dates:
+            return self.dates[name][rows]
+        return self.original[name][rows]
+
+    def meanDateTime(self, start, end):
+        ''' Mean datetime of an ensemble, None if it is empty '''
+        micros = self.micros[EnsembleView.rows(start, end)]
+        if len(micros) == 0:
+            return None
+        meanSec = np.mean(micros/1e6)
+        return datetime.datetime.utcfromtimestamp(meanSec).replace(tzinfo=datetime.timezone.utc)
+
+    def lowest(self, start, end, wl, x):
+        ''' Indexes within the ensemble of the x lowest values interpolated at wavelength wl '''
+        ensemble = self.slice(start, end)
+        values = EnsembleView.interpolate(ensemble.block, np.asarray(ensemble.names, dtype=float), wl)
+        return np.argsort(values)[0:x]
+
+    @staticmethod
+    def interpolate(block, wavelength, wl):
+        ''' Linear interpolation of each row of block (time x wavelength) at wl, as interp1d '''
+        order = np.argsort(wavelength, kind='stable')
+        x = wavelength[order]
+        if wl < x[0] or wl > x[-1]:
+            raise ValueError(f'A value ({wl}) in x_new is outside of the interpolation range.')
+        hi = np.clip(np.searchsorted(x, wl), 1, len(x)-1)
+        lo = hi - 1
+        yLo = block[:, order[lo]]
+        yHi = block[:, order[hi]]
+        slope = (yHi - yLo) / (x[hi] - x[lo])
+        return slope*(wl - x[lo]) + yLo
+
+    @staticmethod
+    def boundaries(micros, interval):
+        ''' (start, end) of the ensembles of interval seconds in a time series of epoch microseconds.
+            Each ensemble ends at the first record later than interval past its start. The
+            records left once the next ensemble would pass the end of the file are not used, and
+            a file shorter than the interval is one ensemble. Interval 0 is one ensemble per record. '''
+        n = len(micros)
+        if interval == 0:
+            return [(i, i+1) for i in range(n-1)]
+
+        step = datetime.timedelta(0, interval) // datetime.timedelta(microseconds=1)
+        endFileTime = micros[-1]
+        endTime = micros[0] + step
+        if endTime > endFileTime:
+            return [(0, n-1)]
+
+        bounds = []
+        start = 0
+        while True:
+            i = int(np.searchsorted(micros, endTime, side='right'))
+            if i >= n:
+                bounds.append((start, n))
+                return bounds
+            bounds.append((start, i))
+            start = i
+            endTime = micros[i] + step
+            if endTime > endFileTime:
+                return bounds
@@ -0,0 +1,209 @@
+''' Index of the FidRadDB cal/char files and cache of their parsed contents '''
+import os
+import json
+import hashlib
+import logging
+import collections
+from datetime import datetime
+
+import numpy as np
+
+from Source import PATH_TO_DATA
+from Source.HDFGroup import HDFGroup
+from Source.Utilities import Utilities
+
+
+class FidRadDB:
+    ''' FidRadDB files are named CP_<serial number>_<cal/char type>_<yyyymmddHHMMSS>.TXT, e.g.
+        CP_SAT0385_POLAR_20220603115256.TXT. The index of a folder maps each serialNumber_calCharType
+        tag to its files sorted by time stamp. It is kept as JSON in cacheDir and refreshed from the
+        file names, sizes and modification times, so the files themselves are only read when new or
+        changed. Parsed files are kept as npz in cacheDir, keyed by the SHA1 of their content. '''
+
+    cacheDir = os.path.join(PATH_TO_DATA, 'FidRadDB_Cache')
+    timeFormat = '%Y%m%d%H%M%S'
+
+    # Folder: (signature, {tag: (sorted time stamps [s], file paths)}, {file name: SHA1})
+    _indexes = {}
+    # SHA1: (group attributes, [(dataset name, attributes, data)])
+    _parsed = {}
+
+    @staticmethod
+    def _indexPath(folder):
+        digest = hashlib.sha1(os.path.abspath(folder).encode()).hexdigest()[:16]
+        return os.path.join(FidRadDB.cacheDir, f'{os.path.basename(os.path.normpath(folder))}_{digest}.json')
+
+    @staticmethod
+    def _sha1(path):
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _signature(folder):
+        ''' Names, modification times and sizes of the CP_ files of folder. Files edited in place
+            change it, unlike the folder modification time. '''
+        with os.scandir(folder) as it:
+            return tuple(sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                                for entry in it if entry.name.startswith('CP_') and entry.is_file()))
+
+    @staticmethod
+    def _refresh(folder):
+        ''' Update the JSON index of folder against its CP_ files. Returns {file name: entry}. '''
+        indexPath = FidRadDB._indexPath(folder)
+        entries = {}
+        if os.path.isfile(indexPath):
+            try:
+                with open(indexPath, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)['files']
+            except (OSError, ValueError, KeyError) as err:
+                logging.warning(f'FidRadDB: unable to read {indexPath}: {err}')
+
+        updated = {}
+        changed = False
+        with os.scandir(folder) as it:
+            for entry in it:
+                if not entry.name.startswith('CP_') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                old = entries.get(entry.name)
+                if old is not None and old['mtime'] == stat.st_mtime_ns and old['size'] == stat.st_size:
+                    updated[entry.name] = old
+                    continue
+                tag, _, timeStamp = os.path.splitext(entry.name)[0][3:].rpartition('_')
+                try:
+                    datetime.strptime(timeStamp, FidRadDB.timeFormat)
+                except ValueError:
+                    logging.warning(f'FidRadDB: no time stamp in {entry.name}, file not indexed')
+                    continue
+                updated[entry.name] = {'tag': tag, 'time': timeStamp, 'mtime': stat.st_mtime_ns,
+                                       'size': stat.st_size, 'sha1': FidRadDB._sha1(entry.path)}
+                changed = True
+
+        if changed or updated.keys() != entries.keys():
+            try:
+                os.makedirs(FidRadDB.cacheDir, exist_ok=True)
+                tmpPath = f'{indexPath}.{os.getpid()}.tmp'
+                with open(tmpPath, 'w', encoding='utf-8') as f:
+                    json.dump({'folder': os.path.abspath(folder), 'files': updated}, f, indent=1, sort_keys=True)
+                os.replace(tmpPath, indexPath)
+            except OSError as err:
+                logging.warning(f'FidRadDB: unable to write {indexPath}: {err}')
+        return updated
+
+    @staticmethod
+    def index(folder):
+        ''' Return ({tag: (sorted time stamps [s], file paths)}, {file name: SHA1}) of folder.
+            Held in memory while the names, modification times and sizes of its files are unchanged. '''
+        signature = FidRadDB._signature(folder)
+        cached = FidRadDB._indexes.get(folder)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+
+        entries = FidRadDB._refresh(folder)
+        byTag = collections.defaultdict(list)
+        for name, entry in entries.items():
+            # Seconds since UNIX epoch, as the acquisition time stamp is
+            seconds = datetime.strptime(entry['time'], FidRadDB.timeFormat).timestamp()
+            byTag[entry['tag']].append((seconds, os.path.join(folder, name)))
+        tags = {}
+        for tag, files in byTag.items():
+            files.sort()
+            tags[tag] = (np.array([f[0] for f in files]), [f[1] for f in files])
+        digests = {name: entry['sha1'] for name, entry in entries.items()}
+
+        FidRadDB._indexes[folder] = (signature, tags, digests)
+        return tags, digests
+
+    @staticmethod
+    def candidates(folder, serialNumber_calCharType):
+        ''' Sorted time stamps [s] and paths of the files of a serialNumber_calCharType tag '''
+        tags, _ = FidRadDB.index(folder)
+        return tags.get(serialNumber_calCharType, (np.array([]), []))
+
+    @staticmethod
+    def choose(folder, serialNumber_calCharType, acq_time_seconds, rule='most_recent_prior_acquisition'):
+        ''' File of a tag chosen by binary search on its time stamps. None if there are no files for the tag.
+
+            'most_recent_prior_acquisition' (RADCAL files): the latest file at or before the acquisition,
+            else the earliest file. 'most_recent' (sensor-specific characterisations): the latest file.
+        '''
+        times, paths = FidRadDB.candidates(folder, serialNumber_calCharType)
+        if len(paths) == 0:
+            return None
+        if rule == 'most_recent_prior_acquisition':
+            i = np.searchsorted(times, acq_time_seconds, side='right') - 1
+            # If nothing is prior to acquisition, the closest is the earliest
+            return paths[max(i, 0)]
+        elif rule == 'most_recent':
+            return paths[-1]
+        return None
+
+    @staticmethod
+    def _npzPath(digest):
+        return os.path.join(FidRadDB.cacheDir, f'{digest}.npz')
+
+    @staticmethod
+    def _parse(filepath, digest):
+        ''' Parsed contents of a file, from memory, the npz cache or Utilities.read_char. None if the
+            file cannot be parsed on its own (e.g. no file type line). '''
+        if digest in FidRadDB._parsed:
+            return FidRadDB._parsed[digest]
+
+        parsed = None
+        npzPath = FidRadDB._npzPath(digest)
+        if os.path.isfile(npzPath):
+            try:
+                with np.load(npzPath, allow_pickle=False) as npz:
+                    meta = json.loads(str(npz['meta']))
+                    parsed = (meta['attributes'],
+                              [(name, attributes, npz[f'data{i}'])
+                               for i, (name, attributes) in enumerate(meta['datasets'])])
+            except (OSError, KeyError, ValueError) as err:
+                logging.warning(f'FidRadDB: unable to read {npzPath}: {err}')
+
+        if parsed is None:
+            gp = HDFGroup()
+            try:
+                Utilities.read_char(filepath, gp)
+            except (KeyError, ValueError, TypeError):
+                return None
+            datasets = [(name, dict(ds.attributes), ds.data) for name, ds in gp.datasets.items()]
+            if any(data is None or data.dtype.hasobject for _, _, data in datasets):
+                return None
+            parsed = (dict(gp.attributes), datasets)
+            meta = json.dumps({'attributes': parsed[0], 'datasets': [(name, attributes) for name, attributes, _ in datasets]})
+            try:
+                os.makedirs(FidRadDB.cacheDir, exist_ok=True)
+                tmpPath = f'{npzPath}.{os.getpid()}.tmp.npz'
+                np.savez(tmpPath, meta=np.array(meta), **{f'data{i}': data for i, (_, _, data) in enumerate(datasets)})
+                os.replace(tmpPath, npzPath)
+            except OSError as err:
+                logging.warning(f'FidRadDB: unable to write {npzPath}: {err}')
+
+        FidRadDB._parsed[digest] = parsed
+        return parsed
+
+    @staticmethod
+    def read_char(filepath, gp):
+        ''' Read a cal/char file into gp as Utilities.read_char does, from the parsed-file cache
+            when possible. Files already partly in gp (e.g. repeated angles) are read directly. '''
+        folder, name = os.path.split(filepath)
+        digest = FidRadDB.index(folder)[1].get(name) if name.startswith('CP_') else None
+        if digest is None:
+            digest = FidRadDB._sha1(filepath)
+
+        parsed = FidRadDB._parse(filepath, digest)
+        if parsed is None or any(gp.getDataset(dsName) is not None for dsName, _, _ in parsed[1]):
+            Utilities.read_char(filepath, gp)
+            return
+
+        attributes, datasets = parsed
+        gp.attributes.update(attributes)
+        for dsName, dsAttributes, data in datasets:
+            ds = gp.addDataset(dsName)
+            ds.attributes.update(dsAttributes)
+            ds.data = data.copy()
+            ds.datasetToColumns()
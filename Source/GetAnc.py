@@ -1,5 +1,9 @@
 ''' API to retrieve atmospheric MERRA2 model data'''
 import os
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
 import numpy as np
 from PyQt5 import QtWidgets
 
@@ -10,158 +14,149 @@ from Source import OBPGSession, PATH_TO_DATA
 class GetAnc:
     '''API object for retrieving MERRA2'''
 
-    @staticmethod
-    def getAnc(inputGroup):
-        ''' Retrieve model data and save in Data/Anc and in ModData '''
-        server = 'oceandata.sci.gsfc.nasa.gov'
-        # cwd = os.getcwd()
-
-        if not os.path.exists(os.path.join(PATH_TO_DATA, 'Anc')):
-            os.makedirs(os.path.join(PATH_TO_DATA, 'Anc'))
-
-        # Get the dates, times, and locations from the input group
-        latDate = inputGroup.getDataset('LATITUDE').data["Datetag"]
-        latTime = inputGroup.getDataset('LATITUDE').data["Timetag2"]
-        lat = inputGroup.getDataset('LATITUDE').data["NONE"]
-        lon = inputGroup.getDataset('LONGITUDE').data["NONE"]
+    server = 'oceandata.sci.gsfc.nasa.gov'
+    protocol = 'https'
+    # Number of files downloaded at once
+    maxWorkers = 4
+    # Hourly MERRA2 files used and the datasets read from each
+    fileTypes = collections.OrderedDict([('MET', ['T10M', 'U10M', 'V10M']), ('AER', ['TOTEXTTAU'])])
+    requestErrors = (400, 401, 403, 404, 416)
 
-        modWind = []
-        modAirT = []
-        modAOD = []
+    @staticmethod
+    def fileName(stamp, fileType):
+        ''' MERRA2 file name for an hour stamp (yyyymmddThh0000) and a file type (MET or AER) '''
+        return f"GMAO_MERRA2.{stamp}.{fileType}.nc"
 
-        # Loop through the input group and extract model data for each element
-        oldFile,ancLat,ancLon,ancUwind,ancVwind,ancLatAer,ancLonAer,ancAirT = None,None,None,None,None,None,None,None
+    @staticmethod
+    def planFiles(latDate, latTime):
+        ''' Hour stamps of the MERRA2 files needed for a track, in order of first use,
+            and the index into them of each record '''
+        stamps = collections.OrderedDict()
+        recordFile = np.empty(len(latDate), dtype=int)
         for index, dateTag in enumerate(latDate):
             dateTagNew = Utilities.dateTagToDate(dateTag)
             year = int(str(int(dateTagNew))[0:4])
             month = int(str(int(dateTagNew))[4:6])
             day = int(str(int(dateTagNew))[6:8])
-            # doy = int(str(int(dateTag))[4:7])
             # Casting below can push hr to 24. Truncate the hr decimal using
             # int() so the script always calls from within the hour in question,
             # and no rounding occurs.
             hr = int(Utilities.timeTag2ToSec(latTime[index])/60/60)
 
-            file1 = f"GMAO_MERRA2.{year}{month:02.0f}{day:02.0f}T{hr:02.0f}0000.MET.nc"
-
-            if oldFile != file1:
-                ancPath = os.path.join(PATH_TO_DATA, 'Anc')
-                filePath1 = os.path.join(PATH_TO_DATA, 'Anc', file1)
-                if not os.path.exists(filePath1):
-                    # request = f"/cgi/getfile/{file1}"
-                    request = f"/ob/getfile/{file1}"
-                    msg = f'Retrieving anchillary file from server: {file1}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-
-                    status = OBPGSession.httpdl(server, request, localpath=ancPath,
-                        outputfilename=file1, uncompress=False, verbose=2)
-                else:
-                    status = 200
-                    msg = f'Ancillary file found locally: {file1}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-
-                file2 = f"GMAO_MERRA2.{year}{month:02.0f}{day:02.0f}T{hr:02.0f}0000.AER.nc"
-                filePath2 = os.path.join(PATH_TO_DATA, 'Anc', file2)
-                if not os.path.exists(filePath2):
-                    # request = f"/cgi/getfile/{file2}"
-                    request = f"/ob/getfile/{file2}"
-                    msg = f'Retrieving anchillary file from server: {file2}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-
-                    status = OBPGSession.httpdl(server, request, localpath=ancPath,
-                        outputfilename=file2, uncompress=False, verbose=2)
-                else:
-                    status = 200
-                    msg = f'Ancillary file found locally: {file2}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-
-                if status in (400, 401, 403, 404, 416):
-                    msg = f'Request error: {status}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    if os.environ["HYPERINSPACE_CMD"].lower() == 'true':
-                        return
-                    alert = QtWidgets.QMessageBox()
-                    alert.setText(f'Request error: {status}\n \
-                                    Check that server credentials have \n \
-                                    been entered in Configuration Window L1B. \n  \
-                                    MERRA2 model data are not available until \n \
-                                    the third week of the following month.')
-                    alert.exec_()
-                    return
-
-                # GMAO Atmospheric model data
-                node = HDFRoot.readHDF5(filePath1)
-                root = HDFRoot()
-                root.copyAttributes(node)
-
-                # dataset are read into root level
-                gmaoGroup = root.addGroup('GMAO')
-                for ds in node.datasets:
-                    name = ds.id
-                    newds = gmaoGroup.addDataset(name)
-                    newds.columns["None"] = ds.data[:].tolist()
-                    newds.columnsToDataset()
-                    newds.attributes['units'] = ds.attributes['units']
-
-                # extract and return ancillary data from netcdf4 files....
-                ancLat = np.array(gmaoGroup.getDataset("lat").data.tolist())
-                ancLon = np.array(gmaoGroup.getDataset("lon").data.tolist())
-
-                # AirTemp
-                ancAirT = gmaoGroup.getDataset("T10M") # Air temp at 10 m [K]
+            stamp = f"{year}{month:02.0f}{day:02.0f}T{hr:02.0f}0000"
+            recordFile[index] = stamps.setdefault(stamp, len(stamps))
 
-                # Wind
-                ancUwind = gmaoGroup.getDataset("U10M") # Eastward at 10m [m/s]
-                ancVwind = gmaoGroup.getDataset("V10M") # Northward
+        return list(stamps), recordFile
 
-                # Aerosols
-                node = HDFRoot.readHDF5(filePath2)
-                root = HDFRoot()
-                root.copyAttributes(node)
-
-                # dataset are read into root level
-                aerGroup = root.addGroup('AEROSOLS')
-                for ds in node.datasets:
-                    name = ds.id
-                    newds = aerGroup.addDataset(name)
-                    newds.columns["None"] = ds.data[:].tolist()
-                    newds.columnsToDataset()
-                    newds.attributes['units'] = ds.attributes['units']
-
-
-                # extract and return ancillary data from netcdf4 files....
-                ancLatAer = np.array(aerGroup.getDataset("lat").data.tolist())
-                ancLonAer = np.array(aerGroup.getDataset("lon").data.tolist())
-
-                # Total Aerosol Extinction AOT 550 nm, same as AOD(550)
-                ancTExt = aerGroup.getDataset("TOTEXTTAU")
-                ancTExt.attributes['wavelength'] = '550 nm'
-
-            oldFile = file1
+    @staticmethod
+    def fetchFiles(fileNames, ancPath):
+        ''' Download the files missing from ancPath, several at a time.
+            Returns {file name: status}: 200 for files found locally, as OBPGSession.httpdl otherwise '''
+        status = collections.OrderedDict()
+        missing = []
+        for fileName in fileNames:
+            if os.path.exists(os.path.join(ancPath, fileName)):
+                status[fileName] = 200
+                Utilities.writeLogFileAndPrint(f'Ancillary file found locally: {fileName}')
+            else:
+                missing.append(fileName)
+                Utilities.writeLogFileAndPrint(f'Retrieving anchillary file from server: {fileName}')
+
+        if missing:
+            # Start the shared session before the download threads use it
+            OBPGSession.getSession(verbose=2)
+
+            def download(fileName):
+                # request = f"/cgi/getfile/{fileName}"
+                request = f"/ob/getfile/{fileName}"
+                return OBPGSession.httpdl(GetAnc.server, request, localpath=ancPath,
+                    outputfilename=fileName, uncompress=False, verbose=2, protocol=GetAnc.protocol)
+
+            with ThreadPoolExecutor(max_workers=GetAnc.maxWorkers) as pool:
+                for fileName, fileStatus in zip(missing, pool.map(download, missing)):
+                    status[fileName] = fileStatus
+
+        return status
 
-            # Locate the relevant cell            
-            latInd = Utilities.find_nearest(ancLat,lat[index])
-            lonInd = Utilities.find_nearest(ancLon,lon[index])
+    @staticmethod
+    def nearest(grid, values):
+        ''' Index of the element of grid nearest to each of values (Utilities.find_nearest for an array) '''
+        grid = np.asarray(grid, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        return np.abs(grid[None, :] - values[:, None]).argmin(axis=1)
 
-            # position retrieval index has been confirmed manually in SeaDAS
-            uWind = ancUwind.data["None"][latInd][lonInd]
-            vWind = ancVwind.data["None"][latInd][lonInd]
-            modWind.append(np.sqrt(uWind*uWind + vWind*vWind)) # direction not needed
+    @staticmethod
+    def sampleFile(filePath, names, lat, lon):
+        ''' Values of the (lat x lon) datasets names at the grid cell nearest to each record.
+            Only the window of the global grid spanned by the records is read from the file.
+            Returns ({name: values}, {name: units}) '''
+        values, units = {}, {}
+        with h5py.File(filePath, 'r') as f:
+            latInd = GetAnc.nearest(f['lat'][:], lat)
+            lonInd = GetAnc.nearest(f['lon'][:], lon)
+            window = np.s_[latInd.min():latInd.max()+1, lonInd.min():lonInd.max()+1]
+            for name in names:
+                # position retrieval index has been confirmed manually in SeaDAS
+                data = f[name][window].astype(np.float64)
+                values[name] = data[latInd - latInd.min(), lonInd - lonInd.min()]
+                unit = f[name].attrs.get('units', b'')
+                units[name] = unit.decode('utf-8') if isinstance(unit, bytes) else str(unit)
+
+        return values, units
 
-            aTemp = ancAirT.data["None"][latInd][lonInd]
-            modAirT.append(aTemp - 273.15) # [C]
+    @staticmethod
+    def getAnc(inputGroup):
+        ''' Retrieve model data and save in Data/Anc and in ModData '''
+        ancPath = os.path.join(PATH_TO_DATA, 'Anc')
+        if not os.path.exists(ancPath):
+            os.makedirs(ancPath)
 
-            # Locate the relevant cell
-            latInd = Utilities.find_nearest(ancLatAer,lat[index])
-            lonInd = Utilities.find_nearest(ancLonAer,lon[index])
+        # Get the dates, times, and locations from the input group
+        latDate = inputGroup.getDataset('LATITUDE').data["Datetag"]
+        latTime = inputGroup.getDataset('LATITUDE').data["Timetag2"]
+        lat = inputGroup.getDataset('LATITUDE').data["NONE"]
+        lon = inputGroup.getDataset('LONGITUDE').data["NONE"]
 
-            # position confirmed in SeaDAS
-            modAOD.append(ancTExt.data["None"][latInd][lonInd])
+        # Plan and retrieve all the hourly files of the track up front
+        stamps, recordFile = GetAnc.planFiles(latDate, latTime)
+        fileNames = [GetAnc.fileName(stamp, fileType) for stamp in stamps for fileType in GetAnc.fileTypes]
+        fileStatus = GetAnc.fetchFiles(fileNames, ancPath)
+
+        for status in fileStatus.values():
+            if status in GetAnc.requestErrors:
+                msg = f'Request error: {status}'
+                print(msg)
+                Utilities.writeLogFile(msg)
+                if os.environ["HYPERINSPACE_CMD"].lower() == 'true':
+                    return
+                alert = QtWidgets.QMessageBox()
+                alert.setText(f'Request error: {status}\n \
+                                Check that server credentials have \n \
+                                been entered in Configuration Window L1B. \n  \
+                                MERRA2 model data are not available until \n \
+                                the third week of the following month.')
+                alert.exec_()
+                return
+
+        # Extract model data for all the records of each hour at once
+        modWind = np.full(len(latDate), np.nan)
+        modAirT = np.full(len(latDate), np.nan)
+        modAOD = np.full(len(latDate), np.nan)
+        for index, stamp in enumerate(stamps):
+            records = recordFile == index
+
+            # GMAO Atmospheric model data
+            met, metUnits = GetAnc.sampleFile(os.path.join(ancPath, GetAnc.fileName(stamp, 'MET')),
+                                              GetAnc.fileTypes['MET'], lat[records], lon[records])
+            # Wind, Eastward and Northward at 10m [m/s]. Direction not needed
+            modWind[records] = np.sqrt(met['U10M']*met['U10M'] + met['V10M']*met['V10M'])
+            # AirTemp at 10 m [K]
+            modAirT[records] = met['T10M'] - 273.15 # [C]
+
+            # Aerosols. Total Aerosol Extinction AOT 550 nm, same as AOD(550)
+            aer, _ = GetAnc.sampleFile(os.path.join(ancPath, GetAnc.fileName(stamp, 'AER')),
+                                       GetAnc.fileTypes['AER'], lat[records], lon[records])
+            modAOD[records] = aer['TOTEXTTAU']
 
         modData = HDFRoot()
         modGroup = modData.addGroup('MERRA2_model')
@@ -175,12 +170,12 @@ class GetAnc:
         #    Keeping for continuity of application
         modGroup.datasets['Datetag'] = latDate
         modGroup.datasets['Timetag2'] = latTime
-        modGroup.datasets['AOD'] = modAOD
-        modGroup.datasets['Wind'] = modWind
-        modGroup.datasets['AirTemp'] = modAirT
-        modGroup.attributes['Wind units'] = ancUwind.attributes['units']
+        modGroup.datasets['AOD'] = modAOD.tolist()
+        modGroup.datasets['Wind'] = modWind.tolist()
+        modGroup.datasets['AirTemp'] = modAirT.tolist()
+        modGroup.attributes['Wind units'] = metUnits['U10M']
         modGroup.attributes['Air Temp. units'] = 'C'
-        modGroup.attributes['AOD wavelength'] = ancTExt.attributes['wavelength']
+        modGroup.attributes['AOD wavelength'] = '550 nm'
         print('GetAnc: Model data retrieved')
 
         return modData
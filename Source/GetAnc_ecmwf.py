@@ -1,5 +1,7 @@
 import os
 import shutil
+import collections
+from concurrent.futures import ThreadPoolExecutor
 # import stat
 import numpy as np
 import xarray as xr
@@ -17,8 +19,31 @@ from Source.HDFRoot import HDFRoot
 from Source.Utilities import Utilities
 from Source.GetAnc_credentials import GetAnc_credentials
 
+class CDSRetriever:
+    ''' Retrieves CAMS fields from the Copernicus Atmosphere Data Store with cdsapi.
+
+        GetAnc_ecmwf.retriever can be replaced by any object with the same retrieve method,
+        e.g. one serving files from a local directory. '''
+
+    def retrieve(self, dataset: str, request: dict, pathOut: str) -> None:
+        url,key = GetAnc_credentials.read_user_credentials('ECMWF_ADS')
+        c = cdsapi.Client(timeout=5, url=url, key=key)
+        c.retrieve(dataset, request, pathOut)
+
+
 class GetAnc_ecmwf:
 
+    retriever = CDSRetriever()
+    # Number of CAMS requests made at once
+    maxWorkers = 4
+
+    CAMS_variables = {
+    '10m_u_component_of_wind' :'u10',
+    '10m_v_component_of_wind' :'v10',
+    'total_aerosol_optical_depth_550nm' :'aod550',
+    '2m_temperature': 't2m'
+    }
+
     @staticmethod
     def ECMWF_latLonTimeTags(lat: float, lon: float, timeStamp: datetime.datetime, latRes: float, lonRes: float, timeResHours: float) -> tuple[float,float,str,str,str]:
         '''
@@ -81,8 +106,6 @@ class GetAnc_ecmwf:
         if os.path.exists(pathOut):
             pass
         else:
-            url,key = GetAnc_credentials.read_user_credentials('ECMWF_ADS')
-
             year = dateStrRounded.split('-')[0]
             hour = timeStrRounded.split(':')[0]
 
@@ -93,9 +116,7 @@ class GetAnc_ecmwf:
                 print('CAMS dataset not available before 2015, skipping')
             else:
                 try:
-                 
-                    c = cdsapi.Client(timeout=5, url=url, key=key)
-                    c.retrieve(
+                    GetAnc_ecmwf.retriever.retrieve(
                         'cams-global-atmospheric-composition-forecasts',
                         {
                             'type' : 'forecast',
@@ -107,8 +128,8 @@ class GetAnc_ecmwf:
                             'format': 'netcdf',
                         },
                         pathOut)
-                except:
-                    raise Exception('CAMS atmospheric data could not be retrieved. Check inputs.')
+                except Exception as err:
+                    raise Exception('CAMS atmospheric data could not be retrieved. Check inputs.') from err
         return
 
     @staticmethod
@@ -136,31 +157,45 @@ class GetAnc_ecmwf:
                 --> description
         '''
 
-        ancillary = {}
+        pathOut = GetAnc_ecmwf.CAMS_retrieve(lat, lon, timeStamp, pathAncillary, latRes=latRes, lonRes=lonRes, timeResHours=timeResHours)
+        return GetAnc_ecmwf.CAMS_read(pathOut)
+
+    @staticmethod
+    def CAMS_retrieve(lat: float, lon: float, timeStamp: datetime.datetime, pathAncillary: str, latRes: float = 0.4, lonRes: float = 0.4, timeResHours: float = 1) -> str:
+        '''
+        Retrieves the CAMS file of the grid cell and time step of a record, unless already in pathAncillary.
+        Parameters as for get_ancillary_main.
+        :return:
+        pathOut: a string, full path to the CAMS netCDF file
+        '''
 
         #################### CAMS ####################
         pathCAMS = pathAncillary
-        if not os.path.exists(pathCAMS):
-            os.mkdir(pathCAMS)
+        os.makedirs(pathCAMS, exist_ok=True)
 
-        CAMS_variables = {
-        '10m_u_component_of_wind' :'u10',
-        '10m_v_component_of_wind' :'v10',
-        'total_aerosol_optical_depth_550nm' :'aod550',
-        '2m_temperature': 't2m'
-        }
+        latEff, lonEff, latLonTag, dateStrRounded, timeStrRounded = GetAnc_ecmwf.ECMWF_latLonTimeTags(lat, lon, timeStamp, latRes=latRes, lonRes=lonRes, timeResHours=timeResHours)
 
-        CAMSnc = {}
+        pathOut = os.path.join(pathCAMS, 'CAMS_%s_%s_%s.nc' % (latLonTag, dateStrRounded.replace('-',''), timeStrRounded.replace(':','')))
 
+        GetAnc_ecmwf.CAMS_download_ensembles(latEff, lonEff, dateStrRounded, timeStrRounded, GetAnc_ecmwf.CAMS_variables, pathOut)
 
-        latEff, lonEff, latLonTag, dateStrRounded, timeStrRounded = GetAnc_ecmwf.ECMWF_latLonTimeTags(lat, lon, timeStamp, latRes=latRes, lonRes=lonRes, timeResHours=timeResHours)
+        return pathOut
 
-        pathOut = os.path.join(pathCAMS, 'CAMS_%s_%s_%s.nc' % (latLonTag, dateStrRounded.replace('-',''), timeStrRounded.replace(':','')))
+    @staticmethod
+    def CAMS_read(pathOut: str) -> dict:
+        '''
+        Reads the variables of a single point CAMS file.
+        :param pathOut: a string, full path to the CAMS netCDF file
+        :return:
+        ancillary: a dictionary, as for get_ancillary_main. Empty if the file is missing.
+        '''
 
-        GetAnc_ecmwf.CAMS_download_ensembles(latEff, lonEff, dateStrRounded, timeStrRounded, CAMS_variables, pathOut)
+        ancillary = {}
+        CAMSnc = {}
 
         try:
-            CAMSnc['reanalysis'] = xr.open_dataset(pathOut,engine='netcdf4')
+            with xr.open_dataset(pathOut,engine='netcdf4') as CAMSfile:
+                CAMSnc['reanalysis'] = CAMSfile.load()
             CAMS_flag = True
         except:
             CAMS_flag = False
@@ -168,7 +203,7 @@ class GetAnc_ecmwf:
 
         if CAMS_flag:
             try:
-                for CAMS_variable, shortName in CAMS_variables.items():
+                for CAMS_variable, shortName in GetAnc_ecmwf.CAMS_variables.items():
                     var = CAMSnc['reanalysis'][shortName]
                     ancillary[CAMS_variable] = {}
                     ancillary[CAMS_variable]['value']      = var.values[0][0][0][0]
@@ -192,26 +227,38 @@ class GetAnc_ecmwf:
         lat = inputGroup.getDataset('LATITUDE').data["NONE"]
         lon = inputGroup.getDataset('LONGITUDE').data["NONE"]
 
-        modWind = []
-        modAirT = []
-        modAOD = []
-
-        # Loop through the input group and extract model data for each element
+        # Group the records by CAMS grid cell and time step, i.e. by file
+        groups = collections.OrderedDict()
         for index, dateTag in enumerate(latDate):
             dateTagNew = Utilities.dateTagToDateTime(dateTag)
             timeStamp = Utilities.timeTag2ToDateTime(dateTagNew,latTime[index])
-
-            ancillary = GetAnc_ecmwf.get_ancillary_main(lat[index], lon[index], timeStamp, ancPath)
-
-            # position retrieval index has been confirmed manually in SeaDAS
-            uWind = ancillary['10m_u_component_of_wind']['value']
-            vWind = ancillary['10m_v_component_of_wind']['value']
-            modWind.append(np.sqrt(uWind*uWind + vWind*vWind)) # direction not needed
-            #ancAOD = aerGroup.getDataset("TOTEXTTAU")
-            modAOD.append(ancillary['total_aerosol_optical_depth_550nm']['value'])
-            modAirT.append(ancillary['2m_temperature']['value'] - 273.15) # [C]
-
-
+            _, _, latLonTag, dateStrRounded, timeStrRounded = GetAnc_ecmwf.ECMWF_latLonTimeTags(
+                lat[index], lon[index], timeStamp, latRes=0.4, lonRes=0.4, timeResHours=1)
+            groups.setdefault((latLonTag, dateStrRounded, timeStrRounded), (lat[index], lon[index], timeStamp, []))[3].append(index)
+
+        # Retrieve the files several requests at a time, then read each once.
+        # Reading stays in this thread: the netCDF library is not thread-safe.
+        def retrieveGroup(group):
+            return GetAnc_ecmwf.CAMS_retrieve(group[0], group[1], group[2], ancPath)
+
+        with ThreadPoolExecutor(max_workers=GetAnc_ecmwf.maxWorkers) as pool:
+            paths = list(pool.map(retrieveGroup, groups.values()))
+        ancillaries = [GetAnc_ecmwf.CAMS_read(pathOut) for pathOut in paths]
+
+        # Spread the values of each file to its records
+        recordGroup = np.empty(len(latDate), dtype=int)
+        for k, group in enumerate(groups.values()):
+            recordGroup[group[3]] = k
+
+        def values(variable):
+            return np.array([ancillary[variable]['value'] for ancillary in ancillaries], dtype=np.float64)[recordGroup]
+
+        # position retrieval index has been confirmed manually in SeaDAS
+        uWind = values('10m_u_component_of_wind')
+        vWind = values('10m_v_component_of_wind')
+        modWind = np.sqrt(uWind*uWind + vWind*vWind).tolist() # direction not needed
+        modAOD = values('total_aerosol_optical_depth_550nm').tolist()
+        modAirT = (values('2m_temperature') - 273.15).tolist() # [C]
 
         modData = HDFRoot()
         modGroup = modData.addGroup('ECMWF')
@@ -4,11 +4,24 @@ import sys
 import numpy as np
 
 class HDFDataset:
+    # Reduced-precision storage of float data on file (see setStorage). Time tags are always float64.
+    storageOptions = ['float64', 'float32', 'int16']
+    fullPrecisionFields = ['Datetag', 'Timetag2']
+    # int16 values reserved for missing (non-finite) data and kept clear of the scaled range
+    int16Fill = -32768
+    int16Max = 32766
+
     def __init__(self):
         self.id = ""
         self.attributes = collections.OrderedDict()
         self.columns = collections.OrderedDict()
         self.data = None
+        # How float data are written to file. None or 'float64' writes them unchanged
+        self.storage = None
+        # Dataset of the same fields and rows that int16 values are stored relative to (see setStorage)
+        self.reference = None
+        # Name of that dataset when read from file, until the group applies it (see decodeRelative)
+        self.relativeTo = None
 
     def copy(self, ds):
         self.copyAttributes(ds)
@@ -44,6 +57,7 @@ class HDFDataset:
 
         # Read dataset
         self.data = f[:] # Gets converted to numpy.ndarray
+        self.decode()
         # print("Dataset:", name)
         # print("Data:", self.data.dtype)
 
@@ -53,14 +67,123 @@ class HDFDataset:
         #print("data:", self.data)
 
         if self.data is not None:
-            dset = f.create_dataset(self.id, data=self.data, dtype=self.data.dtype)
+            data, encoding = self.encode()
+            dset = f.create_dataset(self.id, data=data, dtype=data.dtype)
             # f = f.create_group(self.id)
             # Write attributes
             for k in self.attributes:
                 dset.attrs[k] = np.string_(self.attributes[k])
+            for k, v in encoding.items():
+                dset.attrs[k] = v
         else:
             print("Dataset.write(): Data is None")
 
+    def setStorage(self, storage, reference=None):
+        ''' Set how float data are written to file:
+            float64: unchanged
+            float32: single precision
+            int16:   each field scaled to int16 between its minimum and maximum, with
+                     SCALE_FACTOR and ADD_OFFSET attributes (one per int16 field, in order).
+                     With a reference dataset of the same fields and rows (e.g. ES_HYPER for
+                     ES_HYPER_unc), the field divided by the reference field is stored instead,
+                     and the RELATIVE_TO attribute names the reference.
+                     Non-finite values (or ratios) are stored as int16Fill and read back as NaN. '''
+        if storage not in HDFDataset.storageOptions:
+            raise ValueError(f'Unknown storage {storage}. Choose from {HDFDataset.storageOptions}')
+        self.storage = storage
+        self.reference = reference
+
+    def relativeReference(self, fields):
+        ''' The reference dataset if int16 fields can be stored relative to it, else None '''
+        ref = self.reference
+        if self.storage != 'int16' or ref is None or ref.data is None or ref.data.dtype.names is None:
+            return None
+        if ref.data.shape != self.data.shape or not all(name in ref.data.dtype.names for name in fields):
+            return None
+        return ref
+
+    def reducedFields(self):
+        ''' Names of the fields stored at reduced precision '''
+        return [name for name in self.data.dtype.names
+                if name not in HDFDataset.fullPrecisionFields and self.data.dtype[name].kind == 'f']
+
+    def encode(self):
+        ''' Returns (data as it is to be written, attributes describing the encoding) '''
+        if self.storage in [None, 'float64'] or self.data.dtype.names is None:
+            return self.data, {}
+        fields = self.reducedFields()
+        if not fields:
+            return self.data, {}
+
+        storedType = np.float32 if self.storage == 'float32' else np.int16
+        dtype = [(name, storedType if name in fields else self.data.dtype[name]) for name in self.data.dtype.names]
+        data = np.empty(self.data.shape, dtype=dtype)
+        reference = self.relativeReference(fields)
+        scales, offsets = [], []
+        for name in self.data.dtype.names:
+            if name not in fields:
+                data[name] = self.data[name]
+            elif self.storage == 'float32':
+                data[name] = self.data[name].astype(np.float32)
+            else:
+                values = self.data[name]
+                if reference is not None:
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        values = values / reference.data[name]
+                finite = np.isfinite(values)
+                if finite.any():
+                    lo, hi = values[finite].min(), values[finite].max()
+                else:
+                    lo, hi = 0.0, 0.0
+                offset = (hi + lo)/2
+                scale = (hi - lo)/(2*HDFDataset.int16Max) if hi > lo else 1.0
+                coded = np.full(values.shape, HDFDataset.int16Fill, dtype=np.int16)
+                coded[finite] = np.clip(np.round((values[finite] - offset)/scale),
+                                        -HDFDataset.int16Max, HDFDataset.int16Max)
+                data[name] = coded
+                scales.append(scale)
+                offsets.append(offset)
+
+        encoding = {'STORAGE': np.string_(self.storage)}
+        if self.storage == 'int16':
+            encoding['SCALE_FACTOR'] = np.array(scales, dtype=np.float64)
+            encoding['ADD_OFFSET'] = np.array(offsets, dtype=np.float64)
+            if reference is not None:
+                encoding['RELATIVE_TO'] = np.string_(reference.id)
+        return data, encoding
+
+    def decode(self):
+        ''' Restore float64 data from a reduced-precision dataset just read from file, remembering
+            the storage so that writing it again keeps the same precision '''
+        storage = self.attributes.pop('STORAGE', None)
+        if storage is None:
+            return
+        scales = list(self.attributes.pop('SCALE_FACTOR', []))
+        offsets = list(self.attributes.pop('ADD_OFFSET', []))
+        self.relativeTo = self.attributes.pop('RELATIVE_TO', None)
+        self.storage = storage
+
+        stored = self.data
+        reduced = [name for name in stored.dtype.names if stored.dtype[name] in [np.float32, np.int16]]
+        dtype = [(name, np.float64 if name in reduced else stored.dtype[name]) for name in stored.dtype.names]
+        self.data = np.empty(stored.shape, dtype=dtype)
+        for name in stored.dtype.names:
+            if name in reduced and stored.dtype[name] == np.int16:
+                values = stored[name]*scales.pop(0) + offsets.pop(0)
+                values[stored[name] == HDFDataset.int16Fill] = np.nan
+                self.data[name] = values
+            else:
+                self.data[name] = stored[name]
+
+    def decodeRelative(self, reference):
+        ''' Multiply the int16 fields stored relative to reference (see setStorage) back by it.
+            Called by the group once all its datasets are read. '''
+        for name in self.data.dtype.names:
+            if name not in HDFDataset.fullPrecisionFields and self.data.dtype[name].kind == 'f':
+                self.data[name] = self.data[name] * reference.data[name]
+        self.reference = reference
+        self.relativeTo = None
+
     def getColumn(self, name):
         if name in self.columns:
             return self.columns[name]
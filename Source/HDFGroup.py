@@ -88,7 +88,7 @@ class HDFGroup:
             ds = self.datasets[k]
             ds.printd()
 
-    def read(self, f):
+    def read(self, f, attributesOnly=False):
         name = f.name[f.name.rfind("/")+1:]
         self.id = name
 
@@ -99,6 +99,8 @@ class HDFGroup:
                 self.attributes[k] = f.attrs[k]
             else: # string attribute
                 self.attributes[k] = f.attrs[k].decode("utf-8")
+        if attributesOnly:
+            return
         # Read datasets
         for k in f.keys():
             item = f.get(k)
@@ -109,6 +111,10 @@ class HDFGroup:
                 ds = HDFDataset()
                 self.datasets[k] = ds
                 ds.read(item)
+        # Datasets stored relative to another (see HDFDataset.setStorage)
+        for ds in self.datasets.values():
+            if ds.relativeTo is not None:
+                ds.decodeRelative(self.datasets[ds.relativeTo])
 
     def write(self, f):
         #print("Group:", self.id)
@@ -47,6 +47,18 @@ class HDFRoot:
             return self.datasets[name]
         return None
 
+    def setUncertaintyStorage(self, storage):
+        ''' Precision at which the uncertainty (_unc), standard deviation (_sd) and median (_median)
+            datasets are written (see HDFDataset.setStorage). As int16, uncertainties and standard
+            deviations are stored relative to their radiometry (ES_HYPER for ES_HYPER_unc). Medians
+            are radiometry, so they are never scaled to int16. '''
+        for gp in self.groups:
+            for ds in gp.datasets.values():
+                if ds.id.endswith('_unc') or ds.id.endswith('_sd'):
+                    ds.setStorage(storage, gp.datasets.get(ds.id.rsplit('_', 1)[0]))
+                elif ds.id.endswith('_median'):
+                    ds.setStorage('float32' if storage == 'int16' else storage)
+
     def printd(self):
         print("Root:", self.id)
         #print("Processing Level:", self.processingLevel)
@@ -56,7 +68,9 @@ class HDFRoot:
             gp.printd()
 
     @staticmethod
-    def readHDF5(fp):
+    def readHDF5(fp, attributesOnly=False):
+        ''' Read an HDF5 file. With attributesOnly, only the root and group attributes are read
+            (no datasets), which is all that reports need. '''
         root = HDFRoot()
         with h5py.File(fp, "r") as f:
 
@@ -84,8 +98,8 @@ class HDFRoot:
                 if isinstance(item, h5py.Group):
                     gp = HDFGroup()
                     root.groups.append(gp)
-                    gp.read(item)
-                elif isinstance(item, h5py.Dataset):
+                    gp.read(item, attributesOnly)
+                elif isinstance(item, h5py.Dataset) and not attributesOnly:
                     # print("HDFRoot should not contain datasets")
                     ds = HDFDataset()
                     root.datasets.append(ds)
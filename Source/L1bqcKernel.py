@@ -0,0 +1,117 @@
+''' Array-based spectral and glint quality checks for L1BQC '''
+import warnings
+
+import numpy as np
+
+from Source.HDFDataset import HDFDataset
+
+
+class L1bqcKernel:
+    ''' QC criteria evaluated on whole (time x wavelength) arrays at once.
+
+        Each check returns a boolean mask over time (True where the record fails), so that
+        the caller decides how masks are combined and when rows are removed.
+    '''
+
+    @staticmethod
+    def toArray(source, waveRange=None):
+        ''' Return (wavelengths, time x wavelength array) for the wavelength-named fields of a
+            dataset recarray (or an HDFDataset) or an OrderedDict of columns. waveRange limits
+            the wavelengths, inclusive. '''
+        if isinstance(source, HDFDataset):
+            source = source.data
+        names = source.dtype.names if hasattr(source, 'dtype') else list(source.keys())
+
+        keys, wavelengths = [], []
+        for name in names:
+            try:
+                wavelength = float(name)
+            except ValueError:
+                continue
+            if waveRange is None or waveRange[0] <= wavelength <= waveRange[1]:
+                keys.append(name)
+                wavelengths.append(wavelength)
+
+        array = np.column_stack([np.asarray(source[k], dtype=float) for k in keys]) if keys else np.empty((0, 0))
+        return np.array(wavelengths), array
+
+    @staticmethod
+    def interpolate(wavelengths, array, wl):
+        ''' Linearly interpolate every row of array (time x wavelength) to the single wavelength wl.
+            Same arithmetic as scipy's interp1d, including raising outside the sampled range. '''
+        order = np.argsort(wavelengths, kind='stable')
+        x = np.asarray(wavelengths, dtype=float)[order]
+        y = np.asarray(array, dtype=float)[:, order]
+        if wl < x[0] or wl > x[-1]:
+            raise ValueError(f'{wl} is outside the interpolation range {x[0]} to {x[-1]}')
+
+        hi = np.clip(np.searchsorted(x, wl), 1, len(x)-1)
+        lo = hi - 1
+        slope = (y[:, hi] - y[:, lo]) / (x[hi] - x[lo])
+        return slope*(wl - x[lo]) + y[:, lo]
+
+    @staticmethod
+    def specOutliers(array, filterFactor):
+        ''' Flag spectra that, normalized to their peak, fall outside median +/- filterFactor*std
+            of all spectra in any band, or are negative.
+
+            Returns (mask, normalized spectra, median spectrum, std spectrum). '''
+        array = np.asarray(array, dtype=float)
+        peak = array[np.arange(array.shape[0]), np.argmax(array, axis=1)]
+        normSpec = array / peak[:, None]
+
+        aveSpec = np.median(normSpec, axis=0)
+        stdSpec = np.std(normSpec, axis=0)
+
+        # The last band in range has never been part of the test
+        test = normSpec[:, :-1]
+        upper = (aveSpec + filterFactor*stdSpec)[:-1]
+        lower = (aveSpec - filterFactor*stdSpec)[:-1]
+        mask = np.any((test > upper) | (test < lower) | (test < 0), axis=1)
+        return mask, normSpec, aveSpec, stdSpec
+
+    @staticmethod
+    def ltUVNIR(wavelengths, lt, UVA=(350, 400), NIR=(780, 850)):
+        ''' Flag Lt spectra brighter in the NIR than in the UVA (bands exclusive of the limits).
+
+            Returns (mask, mean UVA Lt, mean NIR Lt). '''
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        inUVA = (wavelengths > UVA[0]) & (wavelengths < UVA[1])
+        inNIR = (wavelengths > NIR[0]) & (wavelengths < NIR[1])
+        with warnings.catch_warnings():
+            # All-NaN records give NaN means, which are not flagged
+            warnings.simplefilter('ignore', RuntimeWarning)
+            ltUVA = np.nanmean(lt[:, inUVA], axis=1)
+            ltNIR = np.nanmean(lt[:, inNIR], axis=1)
+        return ltUVA < ltNIR, ltUVA, ltNIR
+
+    @staticmethod
+    def metFlags(esWavelengths, es, liWavelengths, li, esFlag, dawnDuskFlag, humidityFlag, cloudFlag, sixS=False):
+        ''' Meteorological flags from Es band ratios and the Li/Es ratio at 750 nm.
+
+            Returns a dict of masks keyed Flag1..Flag5 as stored in MET_FLAGS.
+            Flag1 (clouds from 6S Es) only applies when 6S is available. '''
+        esAt = {wl: L1bqcKernel.interpolate(esWavelengths, es, wl) for wl in [370.0, 470.0, 480.0, 680.0, 720.0, 750.0]}
+        li750 = L1bqcKernel.interpolate(liWavelengths, li, 750.0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Flag spectra affected by clouds (Ruddick 2006, IOCCG Protocols)
+            cloud = li750/esAt[750.0] >= cloudFlag
+            flags = {
+                # Compare with 6S Es. Placeholder while under development
+                'Flag1': cloud if sixS else np.zeros_like(cloud),
+                'Flag2': cloud,
+                # Significant Es, Wernand 2002
+                'Flag3': esAt[480.0] < esFlag,
+                # Dawn/dusk radiation, Wernand 2002
+                'Flag4': esAt[470.0]/esAt[680.0] < dawnDuskFlag,
+                # Rainfall and high humidity, Wernand 2002 (940/370), Garaba et al. 2012
+                'Flag5': esAt[720.0]/esAt[370.0] < humidityFlag,
+            }
+        return flags
+
+    @staticmethod
+    def runs(mask):
+        ''' Start and stop indices (inclusive) of each run of True in a boolean mask '''
+        edges = np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0])))
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
@@ -0,0 +1,90 @@
+''' L2 output datasets filled one ensemble at a time into preallocated arrays '''
+import collections
+import collections.abc
+
+import numpy as np
+
+
+class L2Rows(collections.abc.Mapping):
+    ''' Rows of one L2 output dataset. Reads as an ordered {column name: values so far} mapping,
+        where each column is a view into the preallocated (row x column) array, so the current
+        ensemble can be corrected in place with rows[k][-1]. Time stamps are kept alongside for
+        the datasets that carry them. '''
+
+    dateColumns = ['Datetime', 'Datetag', 'Timetag2']
+
+    def __init__(self, names, capacity, dated=True):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.values = np.full((max(capacity, 1), len(self.names)), np.nan)
+        self.n = 0
+        self.dates = {k: [] for k in L2Rows.dateColumns} if dated else None
+        self.attributes = collections.OrderedDict()
+
+    def __getitem__(self, name):
+        return self.values[:self.n, self.index[name]]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def newRow(self, timeObj=None):
+        ''' Start the row of a new ensemble and return it. Columns left unset remain NaN. '''
+        if self.n == len(self.values):
+            # Grow geometrically when there are more ensembles than allocated for
+            grown = np.full((2*len(self.values), len(self.names)), np.nan)
+            grown[:self.n] = self.values[:self.n]
+            self.values = grown
+        if self.dates is not None:
+            self.dates['Datetime'].append(timeObj['dateTime'])
+            self.dates['Datetag'].append(timeObj['dateTag'])
+            self.dates['Timetag2'].append(timeObj['timeTag'])
+        self.n += 1
+        return self.values[self.n-1]
+
+    def row(self):
+        ''' The current (last) row '''
+        return self.values[self.n-1]
+
+    def toColumns(self):
+        columns = collections.OrderedDict()
+        if self.dates is not None:
+            columns.update(self.dates)
+        for i, name in enumerate(self.names):
+            columns[name] = self.values[:self.n, i].tolist()
+        return columns
+
+
+class L2Accumulator:
+    ''' The L2 output datasets of a file while ensembles are processed. Each dataset is created
+        with its columns on the first ensemble, then receives one row per ensemble by index.
+        write() turns them into the HDF datasets of node once all ensembles are done. '''
+
+    def __init__(self, capacity):
+        # Expected number of rows (ensembles); datasets grow past it if needed
+        self.capacity = capacity
+        self.datasets = collections.OrderedDict()
+
+    def get(self, groupID, name):
+        return self.datasets.get((groupID, name))
+
+    def rows(self, groupID, name, names, dated=True):
+        ''' The rows of a dataset, created with columns names if this is the first ensemble '''
+        key = (groupID, name)
+        if key not in self.datasets:
+            self.datasets[key] = L2Rows(names, self.capacity, dated)
+        return self.datasets[key]
+
+    def write(self, node):
+        ''' Add the accumulated datasets, in order of creation, to the groups of node '''
+        for (groupID, name), rows in self.datasets.items():
+            if rows.n == 0:
+                continue
+            gp = node.getGroup(groupID)
+            ds = gp.getDataset(name) or gp.addDataset(name)
+            ds.columns = rows.toColumns()
+            ds.copyAttributes(rows)
+            ds.columnsToDataset()
+        self.datasets.clear()
@@ -0,0 +1,102 @@
+''' Buffered, per-process writer for the processing log files in Logs/ '''
+import os
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+import multiprocessing.util
+
+
+class LogWriter:
+    ''' Queues log lines for a background thread that appends them to Logs/<LOGFILE>.
+
+        The file is opened once per processed file (i.e. whenever os.environ["LOGFILE"]
+        changes or mode 'w' restarts it) instead of once per line. Each process owns
+        its listener and log file, so files processed in parallel do not share handles.
+    '''
+    logDir = 'Logs'
+    _lock = threading.RLock()
+    _pid = None
+    _fileName = None
+    _queue = None
+    _listener = None
+    _fileHandler = None
+    _logger = None
+    _atexitRegistered = False
+    _finalizePid = None
+
+    @staticmethod
+    def configure(fileName, mode='a'):
+        ''' Close any open log file and start writing to Logs/fileName, truncating it for mode 'w' '''
+        with LogWriter._lock:
+            LogWriter.close()
+            if not os.path.exists(LogWriter.logDir):
+                logging.getLogger().warning('Made directory: Logs/')
+                os.makedirs(LogWriter.logDir, exist_ok=True)
+
+            fileHandler = logging.FileHandler(os.path.join(LogWriter.logDir, fileName), mode=mode, encoding='utf-8')
+            fileHandler.setFormatter(logging.Formatter('%(message)s'))
+            # queue.Queue rather than SimpleQueue so that flush() can join on the listener
+            logQueue = queue.Queue()
+            listener = logging.handlers.QueueListener(logQueue, fileHandler)
+            listener.start()
+
+            # A private logger so that nothing else configured on the root logger ends up in the file
+            logger = logging.getLogger(f'HyperCP.LogWriter.{os.getpid()}')
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+            logger.addHandler(logging.handlers.QueueHandler(logQueue))
+
+            LogWriter._pid = os.getpid()
+            LogWriter._fileName = fileName
+            LogWriter._queue = logQueue
+            LogWriter._listener = listener
+            LogWriter._fileHandler = fileHandler
+            LogWriter._logger = logger
+            if not LogWriter._atexitRegistered:
+                atexit.register(LogWriter.close)
+                LogWriter._atexitRegistered = True
+            # multiprocessing children exit without running atexit handlers, but run its finalizers
+            if LogWriter._finalizePid != os.getpid():
+                multiprocessing.util.Finalize(None, LogWriter.close, exitpriority=0)
+                LogWriter._finalizePid = os.getpid()
+
+    @staticmethod
+    def write(logText, mode='a'):
+        ''' Queue a line for the log file named in os.environ["LOGFILE"] '''
+        fileName = os.environ["LOGFILE"]
+        with LogWriter._lock:
+            # A forked child inherits the queue but not the listener thread, so it starts its own
+            if mode == 'w' or fileName != LogWriter._fileName or LogWriter._pid != os.getpid():
+                LogWriter.configure(fileName, mode)
+            LogWriter._logger.info(logText)
+
+    @staticmethod
+    def flush():
+        ''' Block until every queued line is on disk '''
+        with LogWriter._lock:
+            if LogWriter._listener is None or LogWriter._pid != os.getpid():
+                return
+            LogWriter._queue.join()
+            LogWriter._fileHandler.flush()
+
+    @staticmethod
+    def close():
+        ''' Flush and release the current log file '''
+        with LogWriter._lock:
+            if LogWriter._listener is None:
+                return
+            if LogWriter._pid == os.getpid():
+                # stop() drains the queue before joining the writer thread
+                LogWriter._listener.stop()
+                LogWriter._fileHandler.close()
+                LogWriter._logger.removeHandler(LogWriter._logger.handlers[0])
+            LogWriter._pid = None
+            LogWriter._fileName = None
+            LogWriter._queue = None
+            LogWriter._listener = None
+            LogWriter._fileHandler = None
+            LogWriter._logger = None
@@ -31,9 +31,9 @@ def getSession(verbose=0, ntries=5):
 
 def httpdl(server, request, localpath='.', outputfilename=None, ntries=5,
            uncompress=False, timeout=30., verbose=0,
-           chunk_size=DEFAULT_CHUNK_SIZE):
+           chunk_size=DEFAULT_CHUNK_SIZE, protocol='https'):
     status = 0
-    urlStr = 'https://' + server + request
+    urlStr = protocol + '://' + server + request
 
     global obpgSession
     getSession(verbose=verbose, ntries=ntries)
@@ -1,15 +1,62 @@
 """ Build PDF report for each file """
 import os
 import glob
+import fnmatch
 import random
+import hashlib
+import multiprocessing
+import concurrent.futures
 from fpdf import FPDF
+from PIL import Image
 
-from Source import PATH_TO_CONFIG
+from Source import PATH_TO_CONFIG, PACKAGE_DIR
 from Source.SeaBASSHeader import SeaBASSHeader
 from Source.ConfigFile import ConfigFile
+from Source.MainConfig import MainConfig
+from Source.HDFRoot import HDFRoot
+from Source.PlotJobs import PlotJobs
+from Source.Utilities import Utilities
+
+
+class ReportImages:
+    ''' Downsampled copies of the plots embedded in reports, kept next to the plots in Report_Images.
+
+        A copy is named after the hash of the plot it was made from (see PlotJobs), or its size and
+        modification time, so it is made once per plot and reused by every report that embeds it.
+    '''
+    dirName = 'Report_Images'
+
+    def __init__(self, maxWidth=1000):
+        # Pixels. Plots are embedded 175 mm wide; 1000 px is about 145 dpi
+        self.maxWidth = maxWidth
+
+    def get(self, fp):
+        ''' Path to the downsampled copy of the PNG fp '''
+        key = PlotJobs.storedKey(fp)
+        if key is None:
+            stat = os.stat(fp)
+            key = f'{stat.st_size}_{stat.st_mtime_ns}'
+        key = hashlib.sha1(f'{key}_{self.maxWidth}'.encode()).hexdigest()[:16]
+
+        plotDir, name = os.path.split(fp)
+        cachePath = os.path.join(plotDir, ReportImages.dirName, f'{os.path.splitext(name)[0]}_{key}.png')
+        if not os.path.isfile(cachePath):
+            os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+            with Image.open(fp) as im:
+                im = im.convert('RGB')
+                if im.width > self.maxWidth:
+                    im = im.resize((self.maxWidth, round(im.height*self.maxWidth/im.width)), Image.LANCZOS)
+                # Plots have few colours; a palette keeps them sharp at a fraction of the size
+                im = im.quantize(colors=256)
+                tmpPath = f'{cachePath}.{os.getpid()}.tmp'
+                im.save(tmpPath, format='PNG', optimize=True)
+            os.replace(tmpPath, cachePath)
+        return cachePath
 
 
 class PDF(FPDF):
+    # ReportImages used to embed plots; None embeds the full resolution files
+    images = None
 
     def header(self):
         # Times bold 15
@@ -311,6 +358,20 @@ class PDF(FPDF):
         # Line break
         self.ln(4)
 
+    def plotFiles(self, plotDir, pattern):
+        ''' Plots in plotDir with names matching the glob pattern, from the directory's manifest
+            (see PlotJobs). Directories written before manifests existed are listed. '''
+        manifest = PlotJobs.readManifest(plotDir)
+        if manifest is None:
+            return glob.glob(os.path.join(plotDir, pattern))
+        return [os.path.join(plotDir, name) for name in fnmatch.filter(manifest, pattern)
+                if os.path.isfile(os.path.join(plotDir, name))]
+
+    def addImage(self, fp):
+        if self.images is not None:
+            fp = self.images.get(fp)
+        self.image(fp, w = 175)
+
     def chapter_body(self, inLog, headerBlock, level, inPlotPath, filebasename, root):
 
         self.set_font('Times', '', 12)
@@ -351,66 +412,60 @@ class PDF(FPDF):
 
             print('Adding deglitching plots...')
             # ES
-            fileList = glob.glob(os.path.join(inPath, \
-                f'{filebasename}_L1A_ESDark_*.png' ))
+            fileList = self.plotFiles(inPath, f'{filebasename}_L1A_ESDark_*.png')
             if len(fileList) > 0:
                 for i in range (0, 1): #range(0, len(fileList)):
                     randIndx = random.randint(0, len(fileList)-1)
                     # self.image(fileList[i], w = 175)
-                    self.image(fileList[randIndx], w = 175)
+                    self.addImage(fileList[randIndx])
             else:
                 self.multi_cell(0, 5, "None found.\n")
 
-            fileList = glob.glob(os.path.join(inPath, \
-                f'{filebasename}_L1A_ESLight_*.png' ))
+            fileList = self.plotFiles(inPath, f'{filebasename}_L1A_ESLight_*.png')
 
             if len(fileList) > 0:
                 for i in range (0, 1): #range(0, len(fileList)):
                     randIndx = random.randint(0, len(fileList)-1)
                     # self.image(fileList[i], w = 175)
-                    self.image(fileList[randIndx], w = 175)
+                    self.addImage(fileList[randIndx])
             else:
                 self.multi_cell(0, 5, "None found.\n")
 
             # LI
-            fileList = glob.glob(os.path.join(inPath, \
-                f'{filebasename}_L1A_LIDark_*.png' ))
+            fileList = self.plotFiles(inPath, f'{filebasename}_L1A_LIDark_*.png')
             if len(fileList) > 0:
                 for i in range (0, 1): #range(0, len(fileList)):
                     randIndx = random.randint(0, len(fileList)-1)
                     # self.image(fileList[i], w = 175)
-                    self.image(fileList[randIndx], w = 175)
+                    self.addImage(fileList[randIndx])
             else:
                 self.multi_cell(0, 5, "None found.\n")
 
-            fileList = glob.glob(os.path.join(inPath, \
-                f'{filebasename}_L1A_LILight_*.png' ))
+            fileList = self.plotFiles(inPath, f'{filebasename}_L1A_LILight_*.png')
             if len(fileList) > 0:
                 for i in range (0, 1): #range(0, len(fileList)):
                     randIndx = random.randint(0, len(fileList)-1)
                     # self.image(fileList[i], w = 175)
-                    self.image(fileList[randIndx], w = 175)
+                    self.addImage(fileList[randIndx])
             else:
                 self.multi_cell(0, 5, "None found.\n")
 
             # LT
-            fileList = glob.glob(os.path.join(inPath, \
-                f'{filebasename}_L1A_LTDark_*.png' ))
+            fileList = self.plotFiles(inPath, f'{filebasename}_L1A_LTDark_*.png')
             if len(fileList) > 0:
                 for i in range (0, 1): #range(0, len(fileList)):
                     randIndx = random.randint(0, len(fileList)-1)
                     # self.image(fileList[i], w = 175)
-                    self.image(fileList[randIndx], w = 175)
+                    self.addImage(fileList[randIndx])
             else:
                 self.multi_cell(0, 5, "None found.\n")
 
-            fileList = glob.glob(os.path.join(inPath, \
-                f'{filebasename}_L1A_LTLight_*.png' ))
+            fileList = self.plotFiles(inPath, f'{filebasename}_L1A_LTLight_*.png')
             if len(fileList) > 0:
                 for i in range (0, 1): #range(0, len(fileList)):
                     randIndx = random.randint(0, len(fileList)-1)
                     # self.image(fileList[i], w = 175)
-                    self.image(fileList[randIndx], w = 175)
+                    self.addImage(fileList[randIndx])
             else:
                 self.multi_cell(0, 5, "None found.\n")
 
@@ -420,7 +475,7 @@ class PDF(FPDF):
             self.multi_cell(0, 5, 'Randomized. Complete plots of hyperspectral \n'\
                 'interpolations can be found in [output_directory]/Plots/L1B_Interp.\n')
 
-            fileList = glob.glob(os.path.join(inPath, f'{filebasename}_*.png'))
+            fileList = self.plotFiles(inPath, f'{filebasename}_*.png')
             # NOTE: Should screen out the sixS plots here at some point
 
             print('Adding interpolation plots...')
@@ -429,22 +484,22 @@ class PDF(FPDF):
                 # for i in range(0, len(fileList)):
                 res = [i for i in fileList if 'L1B_LI' not in i and 'L1B_ES' not in i and 'L1B_LT' not in i]
                 for i, resi in enumerate(res):
-                    self.image(resi, w = 175)
+                    self.addImage(resi)
                 res = [i for i in fileList if 'L1B_ES' in i]
                 if len(res) >= 3:
                     for i in range (0, 3): #range(0, len(fileList)):
                         randIndx = random.randint(0, len(res))
-                        self.image(res[i], w = 175)
+                        self.addImage(res[i])
                 res = [i for i in fileList if 'L1B_LI' in i]
                 if len(res) >= 3:
                     for i in range (0, 3): #range(0, len(fileList)):
                         randIndx = random.randint(0, len(res))
-                        self.image(res[i], w = 175)
+                        self.addImage(res[i])
                 res = [i for i in fileList if 'L1B_LT' in i]
                 if len(res) >= 3:
                     for i in range (0, 3): #range(0, len(fileList)):
                         randIndx = random.randint(0, len(res))
-                        self.image(res[i], w = 175)
+                        self.addImage(res[i])
             else:
                 self.multi_cell(0, 5, "None found.\n")
 
@@ -462,37 +517,37 @@ class PDF(FPDF):
         if level == "L1BQC":
             print('Adding spectral filter plots')
             inSpecFilterPath = os.path.join(inPlotPath, f'{level}_Spectral_Filter')
-            fileList = glob.glob(os.path.join(inSpecFilterPath, f'*{filebasename}_*.png'))
+            fileList = self.plotFiles(inSpecFilterPath, f'*{filebasename}_*.png')
             if len(fileList) > 0:
                 self.cell(0, 6, 'Spectral Filters', 0, 1, 'L', 1)
                 for i, file in enumerate(fileList):
-                    self.image(file, w = 175)
+                    self.addImage(file)
 
         if level == "L2":            
             print('Adding radiometry plots')
-            fileList = glob.glob(os.path.join(inPlotPath, level, f'*{filebasename}_*.png'))
+            fileList = self.plotFiles(os.path.join(inPlotPath, level), f'*{filebasename}_*.png')
             if len(fileList) > 0:
                 self.cell(0, 6, 'Radiometry', 0, 1, 'L', 1)
                 for i, file in enumerate(fileList):
                     if ConfigFile.settings["bL2Stations"]:
                         if "STATION" in file:
-                            self.image(file, w = 175)
+                            self.addImage(file)
                     else:
                         if "STATION" not in file:
-                            self.image(file, w = 175)
+                            self.addImage(file)
 
             print('Adding ocean color product plots')
             inProdPath = os.path.join(inPlotPath, f'{level}_Products')
-            fileList = glob.glob(os.path.join(inProdPath, f'*{filebasename}_*.png'))
+            fileList = self.plotFiles(inProdPath, f'*{filebasename}_*.png')
             if len(fileList) > 0:
                 self.cell(0, 6, 'Derived Spectral Products', 0, 1, 'L', 1)
                 for i,file in enumerate(fileList):
                     if ConfigFile.settings["bL2Stations"]:
                         if "STATION" in file:
-                            self.image(file, w = 175)
+                            self.addImage(file)
                     else:
                         if "STATION" not in file:
-                            self.image(file, w = 175)
+                            self.addImage(file)
 
 
     def print_chapter(self, level, title, inLog, inPlotPath, filebasename, root):
@@ -513,3 +568,168 @@ class PDF(FPDF):
 
 
 
+
+
+
+def _initWorker(configFile, seaBASSHeader, mainSettings, logDir):
+    ''' Give a report worker the settings of the batch. Error windows cannot be raised from workers. '''
+    os.environ['HYPERINSPACE_CMD'] = 'TRUE'
+    ConfigFile.filename, ConfigFile.settings, ConfigFile.products = configFile
+    SeaBASSHeader.filename, SeaBASSHeader.settings = seaBASSHeader
+    MainConfig.settings = mainSettings
+    ReportBuilder.logDir = logDir
+
+
+class ReportBuilder:
+    ''' Writes the PDF report of a processed file.
+
+        Only the attributes of the HDF files are read, and plots come from the plot manifests.
+        Between startBatch() and finishBatch(), reports are queued and then built together,
+        in worker processes when there are several.
+    '''
+    images = ReportImages()
+    # Processing logs making up the body of the chapters
+    logDir = os.path.join(PACKAGE_DIR, 'Logs')
+    maxWorkers = os.cpu_count()
+    # Queued (fileName, pathOut, outFilePath, level, inFilePath) while a batch is open
+    batch = None
+
+    @staticmethod
+    def write(fileName, pathOut, outFilePath, level, inFilePath):
+        if ReportBuilder.batch is not None:
+            ReportBuilder.batch.append((fileName, pathOut, outFilePath, level, inFilePath))
+        else:
+            ReportBuilder.build(fileName, pathOut, outFilePath, level, inFilePath)
+
+    @staticmethod
+    def startBatch():
+        ReportBuilder.batch = []
+
+    @staticmethod
+    def finishBatch():
+        ''' Build the reports queued since startBatch() '''
+        jobs, ReportBuilder.batch = ReportBuilder.batch or [], None
+        # Daemonic workers (e.g. multiprocessing.Pool in run_Sample_Data.py) cannot spawn children
+        if ReportBuilder.maxWorkers <= 1 or len(jobs) <= 1 or multiprocessing.current_process().daemon:
+            for job in jobs:
+                ReportBuilder.build(*job)
+            return
+
+        nWorkers = min(ReportBuilder.maxWorkers, len(jobs))
+        print(f'Writing {len(jobs)} PDF reports on {nWorkers} processes...')
+        initargs = ((ConfigFile.filename, ConfigFile.settings, ConfigFile.products),
+                    (SeaBASSHeader.filename, SeaBASSHeader.settings), MainConfig.settings, ReportBuilder.logDir)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=nWorkers, initializer=_initWorker, initargs=initargs,
+                                                    mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(ReportBuilder.build, *job) for job in jobs]
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def build(fileName, pathOut, outFilePath, level, inFilePath):
+        print('Writing PDF Report...')
+        numLevelDict = {'L1A':1,'L1AQC':2,'L1B':3,'L1BQC':4,'L2':5}
+        numLevel = numLevelDict[level]
+
+        # Reports are written during failure at any level or success at L2.
+        # The highest level succesfully processed will have the correct configurations in the HDF attributes.
+
+        #   Try to open current level. If this fails, open the previous level and use all the parameters
+        #   from the attributes up to that level, then use the ConfigFile.settings for the current level parameters.
+        try:
+            # Processing successful at this level
+            root = HDFRoot.readHDF5(outFilePath, attributesOnly=True)
+            fail = 0
+            root.attributes['Fail'] = 0
+        except Exception:
+            fail =1
+            # Processing failed at this level. Open the level below it
+            #   This won't work for ProcessL1A looking back for RAW...
+            if level != 'L1A':
+                try:
+                    # Processing successful at the next lower level
+                    # Shift from the output to the input directory
+                    root = HDFRoot.readHDF5(inFilePath, attributesOnly=True)
+                except Exception:
+                    msg = "ReportBuilder.build: Unable to open HDF file. May be open in another application."
+                    if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
+                        Utilities.errorWindow("File Error", msg)
+                    Utilities.writeLogFileAndPrint(msg)
+                    return
+
+            else:
+                # Create a root with nothing but the fail flag in the attributes to pass to PDF reporting
+                #   PDF will contain parameters from ConfigFile.settings
+                root = HDFRoot()
+                root.id = "/"
+                root.attributes["HYPERINSPACE"] = MainConfig.settings["version"]
+                root.attributes['TIME-STAMP'] = 'Null' # Collection time not preserved in failed RAW>L1A
+            root.attributes['Fail'] = 1
+
+
+        timeStamp = root.attributes['TIME-STAMP']
+        title = f'File: {fileName} Collected: {timeStamp}'
+
+        # Reports
+        reportPath = os.path.join(pathOut, 'Reports')
+        os.makedirs(reportPath, exist_ok=True)
+        inLogPath = ReportBuilder.logDir
+
+        inPlotPath = os.path.join(pathOut,'Plots')
+        # # The inPlotPath is going to be different for L1A-L1E than L2 for many cruises...
+        # # In that case, move up one directory
+        # if os.path.isdir(os.path.join(inPlotPath, 'L1AQC_Anoms')) is False:
+        #     inPlotPath = os.path.join(pathOut,'..','Plots')
+
+        outHDF = os.path.split(outFilePath)[1]
+
+        if fail:
+            outPDF = os.path.join(reportPath, f'{os.path.splitext(outHDF)[0]}_fail.pdf')
+        else:
+            outPDF = os.path.join(reportPath, f'{os.path.splitext(outHDF)[0]}.pdf')
+
+        pdf = PDF()
+        pdf.images = ReportBuilder.images
+        pdf.set_title(title)
+        pdf.set_author(f'HyperCP_{MainConfig.settings["version"]}')
+
+        inLog = os.path.join(inLogPath,f'{fileName}_L1A.log')
+        if os.path.isfile(inLog):
+            print('Level 1A')
+            pdf.print_chapter('L1A', 'Process RAW to L1A', inLog, inPlotPath, fileName, root)
+
+        if numLevel > 1:
+            print('Level 1AQC')
+            inLog = os.path.join(inLogPath,f'{fileName}_L1A_L1AQC.log')
+            if os.path.isfile(inLog):
+                pdf.print_chapter('L1AQC', 'Process L1A to L1AQC', inLog, inPlotPath, fileName, root)
+
+        if numLevel > 2:
+            print('Level 1B')
+            inLog = os.path.join(inLogPath,f'{fileName}_L1AQC_L1B.log')
+            if os.path.isfile(inLog):
+                pdf.print_chapter('L1B', 'Process L1AQC to L1B', inLog, inPlotPath, fileName, root)
+
+        if numLevel > 3:
+            print('Level 1BQC')
+            inLog = os.path.join(inLogPath,f'{fileName}_L1B_L1BQC.log')
+            if os.path.isfile(inLog):
+                pdf.print_chapter('L1BQC', 'Process L1B to L1BQC', inLog, inPlotPath, fileName, root)
+
+        if numLevel > 4:
+            print('Level 2')
+            # For L2, reset Plot directory
+            inPlotPath = os.path.join(pathOut,'Plots')
+            if 'STATION' in outFilePath:
+                inLog = os.path.join(inLogPath,f'Stations_{fileName}_L1BQC_L2.log')
+            else:
+                inLog = os.path.join(inLogPath,f'{fileName}_L1BQC_L2.log')
+            if os.path.isfile(inLog):
+                pdf.print_chapter('L2', 'Process L1BQC to L2', inLog, inPlotPath, fileName, root)
+
+        try:
+            pdf.output(outPDF)
+        except Exception:
+            msg = '**********************Unable to write the PDF file. It may be open in another program.**********************'
+            Utilities.errorWindow("File Error", msg)
+            Utilities.writeLogFileAndPrint(msg)
@@ -0,0 +1,261 @@
+''' Deferred, cached rendering of the processing plots '''
+import os
+import glob
+import json
+import time
+import pickle
+import hashlib
+import logging
+import multiprocessing
+import concurrent.futures
+
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+
+from Source.Profiler import Profiler
+
+
+class PlotSpec:
+    ''' A figure described by the calls that draw it, so that it can be hashed, pickled to a
+        worker and rendered outside of the processing path.
+
+        Axes methods are recorded by calling them on the spec (spec.plot(x, y, 'bo')).
+        Other targets go through call() with a dotted name: 'fig.text' and 'fig.autofmt_xdate'
+        are sent to the Figure, 'xaxis.set_major_formatter' to the Axes' x axis.
+        PlotSpec.AXES and PlotSpec.FIGURE given as transform stand for the rendering figure's
+        transAxes and transFigure.
+    '''
+    AXES = 'transAxes'
+    FIGURE = 'transFigure'
+
+    def __init__(self, fp, figsize=(6.4, 4.8)):
+        self.fp = fp
+        self.figsize = tuple(figsize)
+        self.calls = []
+
+    def call(self, name, *args, **kwargs):
+        self.calls.append((name, args, kwargs))
+
+    def __getattr__(self, name):
+        # Private names are left alone so that pickling and copying see a plain object
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def key(self):
+        ''' Hash of everything that ends up in the PNG '''
+        return hashlib.sha1(pickle.dumps((matplotlib.__version__, self.figsize, self.calls), protocol=4)).hexdigest()
+
+
+# Figure and Axes reused by all jobs of a given size in a process
+_templates = {}
+
+def _initWorker():
+    matplotlib.use('Agg')
+
+def _template(figsize):
+    if figsize not in _templates:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        _templates[figsize] = (fig, fig.add_subplot(1, 1, 1))
+    fig, ax = _templates[figsize]
+
+    # Back to a blank figure
+    ax.cla()
+    for artist in fig.texts + fig.legends:
+        artist.remove()
+    fig.subplots_adjust(**{k: matplotlib.rcParams[f'figure.subplot.{k}']
+                           for k in ['left', 'bottom', 'right', 'top', 'wspace', 'hspace']})
+    return fig, ax
+
+def _render(spec, key):
+    fig, ax = _template(spec.figsize)
+    for name, args, kwargs in spec.calls:
+        if kwargs.get('transform') == PlotSpec.AXES:
+            kwargs = dict(kwargs, transform=ax.transAxes)
+        elif kwargs.get('transform') == PlotSpec.FIGURE:
+            kwargs = dict(kwargs, transform=fig.transFigure)
+
+        path = name.split('.')
+        target = ax
+        if path[0] == 'fig':
+            target, path = fig, path[1:]
+        for attr in path:
+            target = getattr(target, attr)
+        target(*args, **kwargs)
+
+    fig.savefig(spec.fp, metadata={PlotJobs.hashKey: key})
+    return spec.fp
+
+
+class PlotJobs:
+    ''' Queue of PlotSpecs collected during processing and rendered in one go.
+
+        render() is called by the Controller before reports are written and at the end of each
+        level. PNGs whose stored hash matches their spec are not redrawn. Each plot directory
+        keeps a manifest of the PNGs drawn into it, which reports use instead of listing the directory.
+    '''
+    pending = []
+    maxWorkers = os.cpu_count()
+    # Below this many jobs, starting worker processes costs more than it saves
+    minPoolJobs = 8
+    # PNG text chunk holding the hash of the spec a file was drawn from
+    hashKey = 'HyperCP plot hash'
+    manifestName = 'manifest.json'
+    # Entries of one render call: manifest.<time [ns]>.<pid>.part.json
+    fragmentPattern = 'manifest.*.*.part.json'
+    lockName = 'manifest.lock'
+    staleLockSeconds = 60
+
+    @staticmethod
+    def add(spec):
+        PlotJobs.pending.append(spec)
+
+    @staticmethod
+    def storedKey(fp):
+        ''' Hash stored in an existing PNG, or None '''
+        try:
+            with Image.open(fp) as im:
+                return im.info.get(PlotJobs.hashKey)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    @Profiler.timed('Plotting')
+    def render():
+        ''' Draw the pending jobs. Returns the list of files written. '''
+        # The last spec queued for a file wins
+        specs = {spec.fp: spec for spec in PlotJobs.pending}
+        PlotJobs.pending = []
+
+        keys = {fp: spec.key() for fp, spec in specs.items()}
+        jobs = [(spec, keys[fp]) for fp, spec in specs.items() if PlotJobs.storedKey(fp) != keys[fp]]
+        if len(specs) > len(jobs):
+            logging.info(f'PlotJobs: {len(specs)-len(jobs)} of {len(specs)} plots unchanged')
+        if not specs:
+            return []
+
+        for plotDir in {os.path.dirname(fp) for fp in specs}:
+            os.makedirs(plotDir, exist_ok=True)
+
+        # Daemonic workers (e.g. multiprocessing.Pool in run_Sample_Data.py) cannot spawn children
+        if PlotJobs.maxWorkers <= 1 or len(jobs) < PlotJobs.minPoolJobs or multiprocessing.current_process().daemon:
+            written = [_render(spec, key) for spec, key in jobs]
+        else:
+            nWorkers = min(PlotJobs.maxWorkers, len(jobs))
+            logging.info(f'PlotJobs: rendering {len(jobs)} plots on {nWorkers} processes')
+            # Fresh interpreters rather than forks of a process that may be running Qt and log threads
+            with concurrent.futures.ProcessPoolExecutor(max_workers=nWorkers, initializer=_initWorker,
+                                                        mp_context=multiprocessing.get_context('spawn')) as executor:
+                futures = [executor.submit(_render, spec, key) for spec, key in jobs]
+                written = [future.result() for future in futures]
+
+        PlotJobs.updateManifests(keys)
+        return written
+
+    @staticmethod
+    def _fragments(plotDir):
+        ''' Manifest fragments of plotDir, oldest first '''
+        fragments = glob.glob(os.path.join(plotDir, PlotJobs.fragmentPattern))
+        return sorted(fragments, key=lambda fp: [int(part) for part in os.path.basename(fp).split('.')[1:3]])
+
+    @staticmethod
+    def _readManifest(plotDir):
+        ''' (manifest, fragments read) of plotDir. The manifest is None if plotDir has none. '''
+        # Fragments are read before the manifest: a fragment removed in between was folded into it
+        entries = []
+        fragments = []
+        for fp in PlotJobs._fragments(plotDir):
+            try:
+                with open(fp, 'r', encoding='utf-8') as f:
+                    entries.append(json.load(f))
+                fragments.append(fp)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as err:
+                logging.warning(f'PlotJobs: unable to read {fp}: {err}')
+
+        manifest = None
+        fp = os.path.join(plotDir, PlotJobs.manifestName)
+        if os.path.isfile(fp):
+            try:
+                with open(fp, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as err:
+                logging.warning(f'PlotJobs: unable to read {fp}: {err}')
+        if manifest is None and not entries:
+            return None, fragments
+
+        manifest = manifest or {}
+        for fragment in entries:
+            for name, key in fragment.items():
+                # Redrawn plots move to the end, as a directory listing by date would
+                manifest.pop(name, None)
+                manifest[name] = key
+        return manifest, fragments
+
+    @staticmethod
+    def readManifest(plotDir):
+        ''' PNG names drawn into plotDir mapped to their hash, in the order they were drawn.
+            None if the directory has no manifest. '''
+        return PlotJobs._readManifest(plotDir)[0]
+
+    @staticmethod
+    def updateManifests(keys):
+        ''' Add {file path: hash} to the manifests of their directories.
+
+            Processes rendering into the same directory do not rewrite a shared file: each call
+            writes its entries to a new fragment, which readManifest merges. Fragments are folded
+            into the manifest by whichever process holds the directory's lock file. '''
+        byDir = {}
+        for fp, key in keys.items():
+            byDir.setdefault(os.path.dirname(fp), {})[os.path.basename(fp)] = key
+        for plotDir, entries in byDir.items():
+            fp = os.path.join(plotDir, f'manifest.{time.time_ns()}.{os.getpid()}.part.json')
+            tmpPath = f'{fp}.tmp'
+            with open(tmpPath, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, indent=0)
+            os.replace(tmpPath, fp)
+            PlotJobs.compactManifest(plotDir)
+
+    @staticmethod
+    def compactManifest(plotDir):
+        ''' Fold the fragments of plotDir into its manifest, unless another process is doing so.
+            Returns True if the manifest was rewritten. '''
+        lockPath = os.path.join(plotDir, PlotJobs.lockName)
+        try:
+            fd = os.open(lockPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                # Left by a process that died while holding it; the next call folds the fragments
+                if time.time() - os.path.getmtime(lockPath) > PlotJobs.staleLockSeconds:
+                    os.remove(lockPath)
+            except OSError:
+                pass
+            return False
+        except OSError as err:
+            logging.warning(f'PlotJobs: unable to lock {plotDir}: {err}')
+            return False
+
+        try:
+            manifest, fragments = PlotJobs._readManifest(plotDir)
+            if not fragments:
+                return False
+            fp = os.path.join(plotDir, PlotJobs.manifestName)
+            tmpPath = f'{fp}.{os.getpid()}.tmp'
+            with open(tmpPath, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=0)
+            os.replace(tmpPath, fp)
+            # Only once the manifest holds their entries
+            for fragment in fragments:
+                try:
+                    os.remove(fragment)
+                except OSError:
+                    # e.g. open in a reader on Windows; folded again by the next call
+                    pass
+            return True
+        finally:
+            os.close(fd)
+            os.remove(lockPath)
@@ -30,6 +30,7 @@ from Source.Weight_RSR import Weight_RSR
 from Source.CalibrationFileReader import CalibrationFileReader
 from Source.ProcessL1b_FactoryCal import ProcessL1b_FactoryCal
 from Source.Uncertainty_Visualiser import UncertaintyGUI # class for uncertainty visualisation plots
+from Source.Profiler import Profiler
 
 
 class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators which exist to give warnings to coders.
@@ -418,6 +419,7 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
         pass
 
     ## L2 uncertainty Processing
+    @Profiler.timed('FRM MC')
     def FRM_L2(self, rhoScalar: float, rhoVec: np.array, rhoDelta: np.array, waveSubset: np.array,
                xSlice: dict[str, np.array]) -> dict[str, np.array]:
         """
@@ -1430,6 +1432,7 @@ class HyperOCR(BaseInstrument):
             std_Signal=stdevSignal,
             )
 
+    @Profiler.timed('FRM MC')
     def FRM(self, node, uncGrp, raw_grps, raw_slices, stats, newWaveBands):
         """
         FRM regime propagation instrument uncertainties for HyperOCR, see D10 section 5.3.2 for more information.
@@ -1929,6 +1932,7 @@ class Trios(BaseInstrument):
             std_Signal=stdevSignal,
         )
 
+    @Profiler.timed('FRM MC')
     def FRM(self, node, uncGrp, raw_grps, raw_slices, stats, newWaveBands):
         """
         """
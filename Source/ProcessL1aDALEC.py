@@ -1,5 +1,8 @@
 '''Process Raw (L0) data to L1A HDF5'''
 import os
+import io
+import csv
+import itertools
 from datetime import datetime
 import datetime as dt
 import numpy as np
@@ -312,24 +315,21 @@ class ProcessL1aDALEC:
 
     @staticmethod
     def read_data(inputfile):
-        file_dat = open(inputfile,'r', encoding="utf-8")
+        ''' Read a DALEC raw file once. Data lines are checked against the rules of validate_line
+            column by column over the whole file, rather than line by line before a second read. '''
         flag_config = 0
         flag_end_config = 0
         flag_data = 0
         data_hdr=['DeviceID','SerialNumber','ChannelType','UTCtimestamp','Lat','Lon','SatelliteCompassHeading',
         'SolarAzimuth','SolarZenith','GearPos','DALECazimuth','RelAz','Pitch','Roll','Voltage','Humidity','DetectorTemp',
         'Qflag','Inttime','Signal_percent','DarkCounts','MaxCounts']
-        # data_type={'Lat':np.float64,'Lon':np.float64,'SatelliteCompassHeading':np.float64,'SolarAzimuth':np.float64,
-        #            'SolarZenith':np.float64,'GearPos':np.float64,'DALECazimuth':np.float64,'RelAz':np.float64,
-        #            'Pitch':np.float64,'Roll':np.float64,'Voltage':np.float64,'Humidity':np.float64,
-        #            'DetectorTemp':np.float64,'Qflag':np.float64,'Inttime':np.float64,
-        #            'Signal_percent':np.float64,'DarkCounts':np.float64,'MaxCounts':np.float64}
         for i in range(190):
             data_hdr.append('spec'+str(i))
 
-        index = 0
-        for line in file_dat:
-            index = index + 1
+        with open(inputfile,'r', encoding="utf-8") as file_dat:
+            lines = file_dat.readlines()
+
+        for index, line in enumerate(lines, 1):
             if '-CONFIGURATION' in line:
                 flag_config = index
             elif '-END CONFIGURATION' in line:
@@ -341,27 +341,52 @@ class ProcessL1aDALEC:
         if flag_data == 0:
             print('PROBLEM WITH Data FILE: data not found')
             exit()
-        skiprows=list(range(flag_data+1))
-
-        index = index + 1
-        if not file_dat.readline():  # Stop if there are fewer than 1 lines to skip
+        if len(lines) <= flag_data:  # Stop if there are fewer than 1 lines to skip
             print('PROBLEM WITH Data FILE: data not found')
             exit()
 
-        for line in file_dat:
-            if not ProcessL1aDALEC.validate_line(line.split(",")):
-                skiprows.append(index)
-                print("Bad data line: "+str(index))
-                print(line)
-            index = index + 1
-
-        file_dat.close()
+        metadata = pd.read_csv(io.StringIO(''.join(lines)), skiprows=flag_config, nrows=flag_end_config-flag_config-1,header=None, comment=';',sep='=')
 
-        # def toDatetime(dt):
-        #     #dateFormat='%Y-%m-%dT%H:%M:%S.%f'
-        #     return np.datetime64(dt.replace('Z', '000'))
+        # Data lines follow the OUTPUT FORMAT line and the line after it. Field counts first...
+        dataLines = lines[flag_data+1:]
+        counted = np.fromiter((line.count(',') for line in dataLines), dtype=np.int64, count=len(dataLines)) == len(data_hdr)-1
+        dataText = ''.join(itertools.compress(dataLines, counted))
+        textColumns = {name: str for name in ['DeviceID','ChannelType','UTCtimestamp']}
+        nanStrings = ['nan', 'NaN', 'NAN', '-nan', '-NaN', '-NAN', '+nan', '+NaN', '+NAN']
 
-        metadata = pd.read_csv(inputfile, skiprows=flag_config, nrows=flag_end_config-flag_config-1,header=None, comment=';',sep='=')
-        data = pd.read_csv(inputfile, skiprows=skiprows, names=data_hdr, on_bad_lines='warn')
+        # ... then the numeric fields: a typed read fails if any of them is not a number ...
+        nans = {}
+        try:
+            data = pd.read_csv(io.StringIO(dataText), names=data_hdr, header=None, quoting=csv.QUOTE_NONE,
+                               keep_default_na=False, na_values=nanStrings,
+                               dtype={**textColumns, **{name: np.float64 for name in data_hdr[4:]}})
+            valid = np.ones(len(data), dtype=bool)
+        except ValueError:
+            # ... in which case they are checked column by column (NaN values are numbers, as for float())
+            data = pd.read_csv(io.StringIO(dataText), names=data_hdr, header=None, quoting=csv.QUOTE_NONE,
+                               na_filter=False, low_memory=False, dtype=textColumns)
+            valid = np.ones(len(data), dtype=bool)
+            for name in data_hdr[4:]:
+                if data[name].dtype == object:
+                    notNumber = pd.to_numeric(data[name], errors='coerce').isna().to_numpy()
+                    nans[name] = np.zeros(len(data), dtype=bool)
+                    nans[name][notNumber] = data[name][notNumber].str.strip().str.lower().isin(['nan', '-nan', '+nan'])
+                    valid &= ~notNumber | nans[name]
+
+        # ... and the device and time stamp
+        valid &= (data['DeviceID'] == 'DALEC').to_numpy()
+        valid &= pd.to_datetime(data['UTCtimestamp'], format='%Y-%m-%dT%H:%M:%S.%fZ', errors='coerce').notna().to_numpy()
+
+        good = np.zeros(len(dataLines), dtype=bool)
+        good[counted] = valid
+        for index in np.flatnonzero(~good):
+            print("Bad data line: "+str(flag_data+1+index))
+            print(dataLines[index])
+
+        data = data[valid].reset_index(drop=True)
+        for name in data_hdr[4:]:
+            if name in nans:
+                data[name] = pd.to_numeric(data[name].mask(nans[name][valid]))
+            data[name] = data[name].astype(np.float64)
 
         return metadata,data
@@ -1,7 +1,9 @@
 '''Process Raw (L0) data to L1A HDF5'''
 import os
+import io
 import json
-from datetime import timedelta, date
+import mmap
+from datetime import timedelta
 import re
 import datetime as dt
 import numpy as np
@@ -254,27 +256,35 @@ class ProcessL1aTriOS:
     #     rec_arr2 = np.rec.fromarrays(tst, dtype=ds_dt)
     #     return rec_arr2
 
+    # Locate the first line matching a regex with one scan of the memory-mapped file
+    # Returns (line index, byte offset of the line end) or None
+    @staticmethod
+    def find_line(mm, pattern):
+        match = re.search(pattern, mm)
+        if match is None:
+            return None
+        end = mm.find(b'\n', match.end())
+        return mm[:match.start()].count(b'\n'), (len(mm) if end < 0 else end)
+
+    @staticmethod
+    def map_file(inputfile):
+        with open(inputfile, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
     # Function for reading and formatting .dat data file
     @staticmethod
     def read_dat(inputfile):
-        file_dat = open(inputfile,'r')
-        flag = 0
-        index = 0
-        for line in file_dat:
-            index = index + 1
-            # checking end of attributes
-            if '[END] of [Attributes]' in line:
-                flag = 1
-                break
-        if flag == 0:
+        mm = ProcessL1aTriOS.map_file(inputfile)
+        found = ProcessL1aTriOS.find_line(mm, rb'\[END\] of \[Attributes\]')
+        if found is None:
             print('PROBLEM WITH FILE .dat: Metadata not found')
-            end_meta = None
-        else:
-            end_meta = index
-        file_dat.close()
-        metadata = pd.read_csv(inputfile, skiprows=1, nrows=end_meta-3, header=None, sep='=')
+            return None, None
+        end_meta = found[0] + 1
+        metadata = pd.read_csv(io.BytesIO(mm), skiprows=1, nrows=end_meta-3, header=None, sep='=')
         meta = metadata[metadata[0].str.contains('Version|Date|PositionLatitude|PositionLongitude|IntegrationTime')][1]
-        data = pd.read_csv(inputfile, skiprows=end_meta+2, nrows=255, header=None, sep=r'\s+')[1]
+        data = pd.read_csv(io.BytesIO(mm), skiprows=end_meta+2, nrows=255, header=None, sep=r'\s+')[1]
         meta = meta.to_numpy(dtype=str)
         data = data.to_numpy(dtype=str)
         date1 = dt.datetime.strptime(meta[1], " %Y-%m-%d %H:%M:%S")
@@ -284,35 +294,29 @@ class ProcessL1aTriOS:
         return meta,data
 
     # Function for reading and formatting .mlb data file
+    # Returns meta (time x [Datetime, PositionLatitude, PositionLongitude, IntegrationTime]),
+    #   data (time x pixel) and the IDData strings
     @staticmethod
     def read_mlb(inputfile):
-        file_dat = open(inputfile,'r', encoding="utf-8")
-        flag = 0
-        index = 0
-        for line in file_dat:
-            index = index + 1
-            # checking end of attributes
-            if 'DateTime' in line:
-                flag = 1
-                break
-        if flag == 0:
+        mm = ProcessL1aTriOS.map_file(inputfile)
+        found = ProcessL1aTriOS.find_line(mm, rb'DateTime')
+        if found is None:
             print('PROBLEM WITH FILE .mlb: Metadata not found')
             return None, None, None
-        else:
-            end_meta = index
-        file_dat.close()
 
         # NOTE: This may differ from G1 to G2. G2 should have some column for internal thermistor
         # Datetime PositionLatitude PositionLongitude IntegrationTime c001-c255 Comment(filename-like) IDData(unknown)
         #   Sample dataset has an extra line after the headers with NaNs for metadata, 1-255, and no Comment or IDData
-        skip = 1 # 1 skips the headers plus the dummy line with NaN Datetime before data begins
-        data_temp = pd.read_csv(inputfile, skiprows=end_meta+skip, header=None, sep=r'\s+')
-        # Datetime PositionLatitude PositionLongitude IntegrationTime
-        meta = pd.concat([data_temp[0],data_temp[1],data_temp[2],data_temp[3]], axis=1, ignore_index=True)
-        data_temp = data_temp.drop(columns=[0,1,2,3])
-        time = data_temp.iloc[:,-1] # <---- This is from IDData?? Why not from Datetime?
-        # c001 - c255        
-        data = data_temp.iloc[:,:-2]
+        # Skip the headers plus the dummy line with NaN Datetime before data begins
+        start = mm.find(b'\n', found[1] + 1) + 1
+        if start == 0 or start >= len(mm):
+            print('PROBLEM WITH FILE .mlb: Data not found')
+            return None, None, None
+        data_temp = pd.read_csv(io.BytesIO(mm[start:]), header=None, sep=r'\s+')
+        meta = data_temp.iloc[:, :4].to_numpy(dtype=np.float64)
+        time = data_temp.iloc[:, -1].to_numpy(dtype=str) # <---- This is from IDData?? Why not from Datetime?
+        # c001 - c255
+        data = data_temp.iloc[:, 4:-2].to_numpy(dtype=np.float64)
         return meta,data,time
 
     # Function for reading cal files
@@ -396,8 +400,6 @@ class ProcessL1aTriOS:
         ProcessL1aTriOS.attr_ini(cal_path + 'SAM_'+name+'.ini',gp)
 
         # Formatting data
-        data = pd.DataFrame()
-        meta = pd.DataFrame()
         meta,data,time = ProcessL1aTriOS.read_mlb(input_file)
 
         # meta contains Datetime, PositionLat, PositionLon, and IntegrationTime
@@ -405,43 +407,33 @@ class ProcessL1aTriOS:
             msg = "Error reading mlb file"
             print(msg)
             Utilities.writeLogFile(msg)
-            return None,None        
+            return None,None
 
-        ## if date is the first field "%yyy-mm-dd"
         #   This derives date/time from IDData, not Datetime column of .mlb file
-        if len(time[0].rsplit('_')[0]) == 11:
-            dates = [i.rsplit('_')[0][1:] for i in time]
-            datetag = [float(i.rsplit('-')[0] + str(date(int(i.rsplit('-')[0]), int(i.rsplit('-')[1]), int(i.rsplit('-')[2])).timetuple().tm_yday)) for i in dates]
-            timetag = [float(i.rsplit('_')[1].replace('-','') + '000') for i in time]
-        ## if not it is in second place
-        else:
-            dates = [i.rsplit('_')[1] for i in time]
-            datetag = [float(i.rsplit('-')[0] + str(date(int(i.rsplit('-')[0]), int(i.rsplit('-')[1]), int(i.rsplit('-')[2])).timetuple().tm_yday)) for i in dates]
-            timetag = [float(i.rsplit('_')[2].replace('-','') + '000') for i in time]
+        datetag, timetag = ProcessL1aTriOS.tags_from_iddata(time)
 
         # NOTE: Placeholder for extracting thermistor temp from G2 RAMSES:
         # if G2: ... should have a group attribute for generation RAMSES
 
         # Reshape data
-        rec_datetag  = ProcessL1aTriOS.reshape_data('NONE',len(meta[0]),data=meta[0]) # <- From Datetime
-        rec_datetag2  = ProcessL1aTriOS.reshape_data('NONE',len(meta[0]),data=datetag) # <- From Comments
-        rec_timetag2  = ProcessL1aTriOS.reshape_data('NONE',len(meta[0]),data=timetag) # <- From Comments
-        rec_latitude  = ProcessL1aTriOS.reshape_data(sensor,len(meta[1]),data=meta[1])
-        rec_longitude  = ProcessL1aTriOS.reshape_data(sensor,len(meta[2]),data=meta[2])
-        rec_inttime  = ProcessL1aTriOS.reshape_data(sensor,len(meta[3]),data=meta[3])
+        rec_datetag2  = ProcessL1aTriOS.reshape_data('NONE',len(meta),data=datetag) # <- From Comments
+        rec_timetag2  = ProcessL1aTriOS.reshape_data('NONE',len(meta),data=timetag) # <- From Comments
+        rec_latitude  = ProcessL1aTriOS.reshape_data(sensor,len(meta),data=meta[:,1])
+        rec_longitude  = ProcessL1aTriOS.reshape_data(sensor,len(meta),data=meta[:,2])
+        rec_inttime  = ProcessL1aTriOS.reshape_data(sensor,len(meta),data=meta[:,3])
 
         # Placeholders, zero-buffered
-        rec_check  = ProcessL1aTriOS.reshape_data('SUM',len(meta[0]),data=np.zeros(len(meta)))
-        rec_darkave  = ProcessL1aTriOS.reshape_data(sensor,len(meta[0]),data=np.zeros(len(meta)))
-        rec_darksamp  = ProcessL1aTriOS.reshape_data(sensor,len(meta[0]),data=np.zeros(len(meta)))
-        rec_frame  = ProcessL1aTriOS.reshape_data('COUNTER',len(meta[0]),data=np.zeros(len(meta)))
-        rec_posframe  = ProcessL1aTriOS.reshape_data('COUNT',len(meta[0]),data=np.zeros(len(meta)))
-        rec_sample  = ProcessL1aTriOS.reshape_data('DELAY',len(meta[0]),data=np.zeros(len(meta)))
+        rec_check  = ProcessL1aTriOS.reshape_data('SUM',len(meta),data=np.zeros(len(meta)))
+        rec_darkave  = ProcessL1aTriOS.reshape_data(sensor,len(meta),data=np.zeros(len(meta)))
+        rec_darksamp  = ProcessL1aTriOS.reshape_data(sensor,len(meta),data=np.zeros(len(meta)))
+        rec_frame  = ProcessL1aTriOS.reshape_data('COUNTER',len(meta),data=np.zeros(len(meta)))
+        rec_posframe  = ProcessL1aTriOS.reshape_data('COUNT',len(meta),data=np.zeros(len(meta)))
+        rec_sample  = ProcessL1aTriOS.reshape_data('DELAY',len(meta),data=np.zeros(len(meta)))
         # NOTE: Placeholder for translating thermistor temp from G2 RAMSES:
         # if G2: ... else
-        rec_spectemp  = ProcessL1aTriOS.reshape_data('NONE',len(meta[0]),data=np.zeros(len(meta)))        
-        rec_thermalresp  = ProcessL1aTriOS.reshape_data('NONE',len(meta[0]),data=np.zeros(len(meta)))
-        rec_time  = ProcessL1aTriOS.reshape_data('NONE',len(meta[0]),data=np.zeros(len(meta)))
+        rec_spectemp  = ProcessL1aTriOS.reshape_data('NONE',len(meta),data=np.zeros(len(meta)))        
+        rec_thermalresp  = ProcessL1aTriOS.reshape_data('NONE',len(meta),data=np.zeros(len(meta)))
+        rec_time  = ProcessL1aTriOS.reshape_data('NONE',len(meta),data=np.zeros(len(meta)))
 
         # HDF5 Dataset creation
         gp.attributes['CalFileName'] = 'SAM_'+name+'.ini'
@@ -488,7 +480,7 @@ class ProcessL1aTriOS:
 
         #Create Data (LI,LT,ES) dataset
         ds_dt = np.dtype({'names': wl,'formats': [np.float64]*len(wl)})
-        my_arr = np.array(data).transpose() # 255 x N array of pixel data
+        my_arr = data.transpose() # 255 x N array of pixel data
         try:
             rec_arr = np.rec.fromarrays(my_arr, dtype=ds_dt)
         except ValueError as err:
@@ -530,31 +522,52 @@ class ProcessL1aTriOS:
         # NOTE: Caution! These are not chronological.
         # start_time = dt.datetime.strftime(dt.datetime(1900,1,1) + timedelta(days=rec_datetag[0][0]-2), "%Y%m%dT%H%M%SZ")# <- From Datetime
         # stop_time = dt.datetime.strftime(dt.datetime(1900,1,1) + timedelta(days=rec_datetag[-1][0]-2), "%Y%m%dT%H%M%SZ")# <- From Datetime
-        arr_datetag = rec_datetag.tolist()
-        start_time = dt.datetime.strftime(dt.datetime(1900,1,1) + timedelta(days=min(arr_datetag)[0]-2), "%Y%m%dT%H%M%SZ")# <- From Datetime
-        stop_time = dt.datetime.strftime(dt.datetime(1900,1,1) + timedelta(days=max(arr_datetag)[0]-2), "%Y%m%dT%H%M%SZ")# <- From Datetime
+        start_time = dt.datetime.strftime(dt.datetime(1900,1,1) + timedelta(days=meta[:,0].min()-2), "%Y%m%dT%H%M%SZ")# <- From Datetime
+        stop_time = dt.datetime.strftime(dt.datetime(1900,1,1) + timedelta(days=meta[:,0].max()-2), "%Y%m%dT%H%M%SZ")# <- From Datetime
 
         return start_time,stop_time
 
+    # DATETAG (YYYYDDD) and TIMETAG2 (HHMMSSmmm) from IDData strings such as
+    #   %0C1E_2022-07-19_08-00-30_000_088, or %2022-07-19_08-00-30_... with the date first
+    @staticmethod
+    def tags_from_iddata(time):
+        fields = pd.Series(time).str.split('_', expand=True)
+        if len(fields[0][0]) == 11:
+            dates, times = fields[0].str[1:], fields[1]
+        else:
+            dates, times = fields[1], fields[2]
+        days = pd.to_datetime(dates, format='%Y-%m-%d')
+        datetag = (days.dt.year*1000 + days.dt.dayofyear).to_numpy(dtype=np.float64)
+        hms = times.str.split('-', expand=True).astype(np.int64)
+        timetag = (hms[0]*10000000 + hms[1]*100000 + hms[2]*1000).to_numpy(dtype=np.float64)
+        return datetag, timetag
+
     # TriOS L0 exports are in reverse chronological order. Reorder all data fields
     @staticmethod
     def fixChronology(node):
         print('Sorting all datasets chronologically')
         for gp in node.groups:
-            dateTime = []
-            dateTagArray = gp.datasets['DATETAG'].data
-            timeTagArray = gp.datasets['TIMETAG2'].data
-            for i, dateTag in enumerate(dateTagArray):
-                dt1 = Utilities.dateTagToDateTime(dateTag[0])
-                dateTime.append(Utilities.timeTag2ToDateTime(dt1,timeTagArray[i][0]))
+            dateTag = gp.datasets['DATETAG'].data['NONE']
+            timeTag2 = gp.datasets['TIMETAG2'].data['NONE'].astype(np.int64)
+            # Milliseconds since 1970
+            days = (dateTag//1000 - 1970).astype(np.int64).astype('datetime64[Y]').astype('datetime64[D]') \
+                + (dateTag % 1000 - 1).astype(np.int64)
+            msec = days.astype(np.int64)*86400000 + (timeTag2//10000000)*3600000 \
+                + (timeTag2//100000 % 100)*60000 + (timeTag2//1000 % 100)*1000 + timeTag2 % 1000
+
+            order = np.argsort(msec, kind='stable')
+            # Records exported more than once share a timestamp. Keep the first.
+            keep = np.ones(len(order), dtype=bool)
+            keep[1:] = np.diff(msec[order]) != 0
+            if not keep.all():
+                Utilities.writeLogFile(f'{gp.id}: dropped {np.count_nonzero(~keep)} records with duplicate timestamps')
+            order = order[keep]
 
             for ds in gp.datasets:
 
                 # BACK_ and CAL_ are nLambda x 2 and nLambda x 1, respectively, not timestamped to DATETAG, TIMETAG2
                 if (not ds.startswith('BACK_')) and (not ds.startswith('CAL_')):
+                    gp.datasets[ds].data = gp.datasets[ds].data[order]
                     gp.datasets[ds].datasetToColumns()
-                    gp.datasets[ds].data = np.array([x for _, x in sorted(zip(dateTime,gp.datasets[ds].data))])
 
         return node
-
-    
@@ -4,10 +4,10 @@ import datetime
 import copy
 import bisect
 import numpy as np
-from pysolar.solar import get_azimuth, get_altitude
 
 from Source.HDFDataset import HDFDataset
 from Source.ProcessL1aqc_deglitch import ProcessL1aqc_deglitch
+from Source.SolarGeometry import SolarGeometry
 from Source.Utilities import Utilities
 from Source.ConfigFile import ConfigFile
 
@@ -250,15 +250,8 @@ class ProcessL1aqc:
                     gpsLon = gp.getDataset('LONPOS')
                     lonHemiData = gp.getDataset('LONHEMI')
 
-                    for i in range(gpsLat.data.shape[0]):
-                        latDM = gpsLat.data["NONE"][i]
-                        latDirection = latHemiData.data["NONE"][i]
-                        latDD = Utilities.dmToDd(latDM, latDirection)
-                        lonDM = gpsLon.data["NONE"][i]
-                        lonDirection = lonHemiData.data["NONE"][i]
-                        lonDD = Utilities.dmToDd(lonDM, lonDirection)
-                        ancLat.append(latDD)
-                        ancLon.append(lonDD)
+                    ancLat = SolarGeometry.dmToDd(gpsLat.data["NONE"], latHemiData.data["NONE"]).tolist()
+                    ancLon = SolarGeometry.dmToDd(gpsLon.data["NONE"], lonHemiData.data["NONE"]).tolist()
 
                     if gp.attributes['CalFileName'].startswith('GPRMC'):
                         gpsStatus = gp.getDataset('STATUS')
@@ -299,12 +292,10 @@ class ProcessL1aqc:
             if 'gpsDateTime' in locals():
                 # Solar geometry is preferentially acquired from SunTracker or pySAS
                 # Otherwise resorts to ancillary data. Otherwise processing fails.
-                # Run Pysolar to obtain solar geometry.
-                sunAzimuthAnc = []
-                sunZenithAnc = []
-                for i, dt_utc in enumerate(gpsDateTime):
-                    sunAzimuthAnc.append(get_azimuth(ancLat[i],ancLon[i],dt_utc,0)) # ancLat ancLon from GPS, not ancillary file
-                    sunZenithAnc.append(90 - get_altitude(ancLat[i],ancLon[i],dt_utc,0))
+                # Run SolarGeometry to obtain solar geometry.
+                # ancLat ancLon from GPS, not ancillary file
+                sunAzimuthAnc, sunZenithAnc = SolarGeometry.solarPosition(ancLat, ancLon, gpsDateTime)
+                sunAzimuthAnc, sunZenithAnc = sunAzimuthAnc.tolist(), sunZenithAnc.tolist()
 
                 # SATTHS fluxgate compass on SAS
                 if compass is None:
@@ -359,12 +350,9 @@ class ProcessL1aqc:
 
             # Solar geometry is preferentially acquired from SunTracker
             # Otherwise resorts to ancillary data. Otherwise processing fails.
-            # Run Pysolar to obtain solar geometry.
-            sunAzimuthAnc = []
-            sunZenithAnc = []
-            for i, dt_utc in enumerate(timeStamp):
-                sunAzimuthAnc.append(get_azimuth(ancLat[i],ancLon[i],dt_utc,0))
-                sunZenithAnc.append(90 - get_altitude(ancLat[i],ancLon[i],dt_utc,0))
+            # Run SolarGeometry to obtain solar geometry.
+            sunAzimuthAnc, sunZenithAnc = SolarGeometry.solarPosition(ancLat, ancLon, timeStamp)
+            sunAzimuthAnc, sunZenithAnc = sunAzimuthAnc.tolist(), sunZenithAnc.tolist()
 
             # relAzAnc either from ancillary relZz, ancillary sensorAz, (or THS compass above ^^)
             relAzAnc,sasAzAnc  = None,None
@@ -775,11 +763,7 @@ class ProcessL1aqc:
    
                     # I have added solar azimuth and solar zenith angle to 'SunTracker_sorad' group
                     # We can re use gps Lat and Lon fields as they are on same time grid
-                    sunAzimuth = []
-                    sunZenith = []
-                    for i, dt_utc in enumerate(gpsDateTime):
-                        sunAzimuth.append(get_azimuth(gpsLat.data[i],gpsLon.data[i],dt_utc,0))
-                        sunZenith.append(90 - get_altitude(gpsLat.data[i],gpsLon.data[i],dt_utc,0))
+                    sunAzimuth, sunZenith = SolarGeometry.solarPosition(gpsLat, gpsLon, gpsDateTime)
                   
                     gp.addDataset("SOLAR_AZ")
                     gp.datasets["SOLAR_AZ"].data = np.array(sunAzimuth, dtype=[('NONE', '<f8')])  
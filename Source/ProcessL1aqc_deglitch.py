@@ -6,6 +6,7 @@ import pandas as pd
 from Source.HDFRoot import HDFRoot
 from Source.ConfigFile import ConfigFile
 from Source.Utilities import Utilities
+from Source.Profiler import Profiler
 
 class ProcessL1aqc_deglitch:
     '''
@@ -309,6 +310,7 @@ class ProcessL1aqc_deglitch:
         return False
 
     @staticmethod
+    @Profiler.timed('Deglitching')
     def processL1aqc_deglitch(node):
         '''
         Apply data deglitching to light and shutter-dark data, then apply dark shutter correction to light data.
@@ -10,6 +10,7 @@ import numpy as np
 from Source import PATH_TO_CONFIG, PATH_TO_DATA
 from Source.ConfigFile import ConfigFile
 from Source.CalibrationFileReader import CalibrationFileReader
+from Source.FidRadDB import FidRadDB
 from Source.ProcessL1b_Interp import ProcessL1b_Interp
 from Source.ProcessL1b_FactoryCal import ProcessL1b_FactoryCal
 from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
@@ -31,17 +32,17 @@ class ProcessL1b:
 
         # Read uncertainty parameters from class-based calibration
         for f in glob.glob(os.path.join(inpath, r'*class_POLAR*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
         for f in glob.glob(os.path.join(inpath, r'*class_STRAY*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
         for f in glob.glob(os.path.join(inpath, r'*class_ANGULAR*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
         for f in glob.glob(os.path.join(inpath, r'*class_THERMAL*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
         for f in glob.glob(os.path.join(inpath, r'*class_LINEAR*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
         for f in glob.glob(os.path.join(inpath, r'*class_STAB*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
 
         # Unc dataset renaming
         Utilities.RenameUncertainties_Class(root)
@@ -84,56 +85,6 @@ class ProcessL1b:
 
         return root
 
-    @staticmethod
-    def choose_cal_char_per_time(acq_time_seconds, available_files_calTime_seconds, available_files, rule='most_recent_prior_acquisition'):
-        '''
-        Choose FidRadDB cal/char file according to it's timestamp, provided in filename.
-            e.g. 'CP_SAT0385_POLAR_20220603115256.TXT',
-            where:
-            - 'SAT0385' is the sensor ID
-            - 'POLAR' is the characterisation type
-            - '20220603115256' is the time stamp, i.e. the time when the given characterisation was masured at cal/char laboratory.
-
-        Two possible options are:
-            'most_recent_prior_acquisition' --> applicable to RADCAL files (default "multi cal option", i.e. ConfigFile.settings['MultiCal'] = 0
-            'most_recent' --> applicable to sensor-specific characterisations
-
-        return: a string, /full/path/to/selected_cal_char_file.TXT
-        '''
-
-        # TEST
-        # acq_time_seconds = 3
-        # available_files_calTime_seconds = np.array([0, 1, 2, 3.01, 30])
-        # available_files = np.array(['a', 'b', 'c', 'd', 'e'])
-
-        # Check goodness of some inputs...
-        if (len(available_files_calTime_seconds) == 0) or (len(available_files) == 0) or (len(available_files_calTime_seconds) != len(available_files)):
-            raise ValueError('Something wrong here! At least X candidate files (X>0) should be inputted to this function, with X corrsponding cal. timestamps!')
-
-        # Two possible rules (see above)
-        chosen_file = None
-        if rule == 'most_recent_prior_acquisition':
-
-            # Filter by only those cal./chars. whose timestamps is previous to measurement acquisition
-            prior2acq = available_files_calTime_seconds <= acq_time_seconds
-
-            # If found, chose the most recent prior to acquisition, otherwise simply choose the closest to acquisition
-            if np.any(prior2acq):
-                # Selection of the closest char data file PRE-EXISTING to the measuring date
-                chosen_file_idx = np.argmax(available_files_calTime_seconds[prior2acq])
-                chosen_file = available_files[prior2acq][chosen_file_idx]
-            else:
-                # Selection of the closest char data file to the measuring date
-                chosen_file_idx = np.argmin(np.abs(available_files_calTime_seconds - acq_time_seconds))
-                chosen_file = available_files[chosen_file_idx]
-        elif rule == 'most_recent':
-
-            # Choose the most recent (applicable to sensor-specific characterisations)
-            chosen_file_idx = np.argmax(available_files_calTime_seconds)
-            chosen_file = available_files[chosen_file_idx]
-
-        return chosen_file
-
     @staticmethod
     def read_FidRadDB_cal_char_files(root):
         '''Read FidRadDB cal/char files into root according:
@@ -167,12 +118,8 @@ class ProcessL1b:
                 # Get cal/char type from tag (e.g. 'POLAR')
                 calCharType = serialNumber_calCharType.split('_')[-1]
 
-                # Find available files in fidRadPath for the given serialNumber_calCharType tag
-                available_files = np.array(glob.glob(os.path.join(CODE_HOME,fidRadPath,'CP_%s_*' % serialNumber_calCharType)))
-
-                # get their timestamps anc convert to seconds since UNIX epoch (Jan 1 1970 00:00 UTC)
-                available_files_calTime0 = [os.path.basename(f).split('_')[-1].split('.')[0] for f in available_files]
-                available_files_calTime_seconds  = np.array([datetime.strptime(t, '%Y%m%d%H%M%S').timestamp() for t in available_files_calTime0])
+                # Find available files in fidRadPath for the given serialNumber_calCharType tag, from the FidRadDB index
+                _, available_files = FidRadDB.candidates(fidRadPath, serialNumber_calCharType)
 
                 # Unless this is a characterisation tag and not calibration tag (i.e. not RADCAL) + class-based regime, raise an error if files are missing...
                 if len(available_files) == 0 and not (calCharType != 'RADCAL' and ConfigFile.settings["fL1bCal"] == 2):
@@ -185,18 +132,16 @@ class ProcessL1b:
 
                     elif ConfigFile.settings["fL1bCal"] == 3:# sensor-specific
                         # Choose most recent sensor-specific characterisation (this is regardless of measurement acquisition time)
-                        chosen_file = ProcessL1b.choose_cal_char_per_time(
-                            acq_time_seconds, available_files_calTime_seconds, available_files, rule='most_recent')
-                        Utilities.read_char(chosen_file, gp)
+                        chosen_file = FidRadDB.choose(fidRadPath, serialNumber_calCharType, acq_time_seconds, rule='most_recent')
+                        FidRadDB.read_char(chosen_file, gp)
 
                 elif calCharType == 'RADCAL':
                     # RADCAL files to be ingested depend on the multical options
                     if ConfigFile.settings["MultiCal"] == 0:# Most recent prior to acquisition
 
                         # This will choose the most recent prior to acquisition unless nothing prior to acquisition exists, then it will choose simply the closest
-                        chosen_file = ProcessL1b.choose_cal_char_per_time(
-                            acq_time_seconds, available_files_calTime_seconds, available_files, rule='most_recent_prior_acquisition')
-                        Utilities.read_char(chosen_file, gp)
+                        chosen_file = FidRadDB.choose(fidRadPath, serialNumber_calCharType, acq_time_seconds, rule='most_recent_prior_acquisition')
+                        FidRadDB.read_char(chosen_file, gp)
 
                     elif ConfigFile.settings["MultiCal"] == 1:  # Pre-post average
 
@@ -207,13 +152,13 @@ class ProcessL1b:
                         preCal = os.path.join(CODE_HOME,fidRadPath,ConfigFile.settings.get("preCal_%s" % sensorType))
                         if preCal is None:
                             raise ValueError('Pre-calibration file should have been chosen if pre-post average was chosen (see GUI-->Edit-->Cal/Char options).')
-                        Utilities.read_char(preCal, gp)
+                        FidRadDB.read_char(preCal, gp)
 
                         # Read postCal into gp
                         postCal = os.path.join(CODE_HOME,fidRadPath,ConfigFile.settings.get("postCal_%s" % sensorType))
                         if postCal is None:
                             raise ValueError('Post-calibration file should have been chosen if pre-post average was chosen (see GUI-->Edit-->Cal/Char options).')
-                        Utilities.read_char(postCal, gp)
+                        FidRadDB.read_char(postCal, gp)
 
                         ###### TO BE CONTINUED #######
 
@@ -223,7 +168,7 @@ class ProcessL1b:
                         chooseCal = os.path.join(CODE_HOME,fidRadPath,ConfigFile.settings.get("chooseCal_%s" % sensorType))
                         if chooseCal is None:
                             raise ValueError('Calibration file should have been chosen if "Chose cal." option was chosen (see GUI-->Edit-->Cal/Char options).')
-                        Utilities.read_char(chooseCal, gp)
+                        FidRadDB.read_char(chooseCal, gp)
 
         return root
 
@@ -238,18 +183,18 @@ class ProcessL1b:
 
         # Read uncertainty parameters from class-based calibration
         for f in glob.glob(os.path.join(classbased_dir, r'*class_POLAR*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
         for f in glob.glob(os.path.join(classbased_dir, r'*class_STRAY*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
         for f in glob.glob(os.path.join(classbased_dir, r'*class_ANGULAR*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
         for f in glob.glob(os.path.join(classbased_dir, r'*class_THERMAL*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
 
         for f in glob.glob(os.path.join(classbased_dir, r'*class_LINEAR*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
         for f in glob.glob(os.path.join(classbased_dir, r'*class_STAB*')):
-            Utilities.read_char(f, gp)
+            FidRadDB.read_char(f, gp)
 
         # Read sensor-specific radiometric calibration
         root = ProcessL1b.read_FidRadDB_cal_char_files(root)
@@ -279,7 +224,7 @@ class ProcessL1b:
         # temporarily use class-based polar unc for FRM
         for f in glob.glob(os.path.join(classbased_dir, r'*class_POLAR*')):
             if any([s in os.path.basename(f) for s in ["LI", "LT"]]):  # don't read ES Pol which is the manufacturer cosine error
-                Utilities.read_char(f, gp)
+                FidRadDB.read_char(f, gp)
         # Polar correction to be developed and added to FRM branch.
 
         # unc dataset renaming
@@ -1,17 +1,16 @@
 ''' L1AQC to L1B for Full-FRM or Class-based '''
 import logging
-import os
 from datetime import datetime as dt
 import numpy as np
 import pandas as pd
 import pytz
 from scipy import interpolate
-import concurrent.futures
 
 from j6s import SixS
 
 # internal files
 from Source.ConfigFile import ConfigFile
+from Source.SixSCache import SixSCache, SixSRunner, SIXS_OUTPUTS
 from Source.Utilities import Utilities
 
 class ProcessL1b_FRMCal:
@@ -56,10 +55,6 @@ class ProcessL1b_FRMCal:
 
         anc_grp = node.getGroup(keys['anc'])
 
-        if ConfigFile.settings['bL1aqcSunTracker'] == 1:
-            rel_az = np.asarray(anc_grp.datasets['REL_AZ'].columns["REL_AZ"])
-        else:
-            rel_az = np.asarray(anc_grp.datasets['REL_AZ'].columns[keys['rel']])
         sun_zenith = np.asarray(anc_grp.datasets['SZA'].columns[keys['sza']])
         sun_azimuth = np.asarray(anc_grp.datasets['SOLAR_AZ'].columns[keys['saa']])
 
@@ -80,12 +75,6 @@ class ProcessL1b_FRMCal:
 
         ## SIXS configuration
         n_mesure = len(datetime)
-        nband = len(wvl)
-
-        # SIXS called over 3min bin
-        ## SIXS configuration
-        n_mesure = len(datetime)
-        nband = len(wvl)
         
         # SIXS called over 3min bin  - original code section in HyperCP Dev
         # deltat = (datetime[-1]-datetime[0])/len(datetime)
@@ -106,200 +95,49 @@ class ProcessL1b_FRMCal:
             n_bin += 1
   
         
-        percent_direct_solar_irradiance = np.zeros((n_bin, nband))
-        percent_diffuse_solar_irradiance = np.zeros((n_bin, nband))
-        direct_solar_irradiance = np.zeros((n_bin, nband))
-        diffuse_solar_irradiance = np.zeros((n_bin, nband))
-        environmental_irradiance = np.zeros((n_bin, nband))
         solar_zenith = np.zeros(n_bin)
 
-        # Instanciate the class only once outside the loop
-        s = SixS()
+        # 6S is run at bin centres of quantized geometry/atmosphere on a sparse wavelength grid.
+        # Outputs are cached on disk and only the misses are run, in a process pool.
+        cache = SixSCache(binSZA=ConfigFile.settings['fL1bSixSBinSZA'],
+                          binAOD=ConfigFile.settings['fL1bSixSBinAOD'],
+                          binWV=ConfigFile.settings['fL1bSixSBinWV'],
+                          binPressure=ConfigFile.settings['fL1bSixSBinPressure'])
+        runner = SixSRunner(cache, SixS)
+        sparse_wvl = SixSRunner.sparseWavelengths(wvl, ConfigFile.settings['fL1bSixSWavelengthStep'])
 
+        atmospheres = []
         for n in range(n_bin):
             # find ancillary point that match the 1st mesure of the 3min ensemble
             ind_anc = np.argmin(np.abs(np.array(anc_datetime)-datetime[n*n_min]))
 
             solar_zenith[n] = sun_azimuth[ind_anc]
+            # A missing AOD would leave the cache key without an aerosol bin; use the L1B default
+            aod_bin = aod[ind_anc] if not np.isnan(aod[ind_anc]) else ConfigFile.settings['fL1bDefaultAOD']
+            # Water vapour and pressure are not in the ancillary data; 6S defaults are used
+            atmospheres.append((sun_zenith[ind_anc], aod_bin, None, None))
 
-            s.geometry(
-                sun_zen=sun_zenith[ind_anc],
-                sun_azi=sun_azimuth[ind_anc],
-                view_zen=180,
-                view_azi=rel_az[ind_anc],
-                month=datetime[ind_anc].month,
-                day=datetime[ind_anc].day
-            )
-            s.gas()
-            s.aerosol(aot_550=aod[ind_anc])
-            s.target_altitude()
-            s.sensor_altitude()
-
-            s.to_be_implemented()
-
-            # Create placeholder to contain the values
-            # percent_direct_solar_irradiance = [0] * len(wvl)
-            # percent_diffuse_solar_irradiance = [0] * len(wvl)
-            # direct_solar_irradiance = [0] * len(wvl)
-            # diffuse_solar_irradiance = [0] * len(wvl)
-            # environmental_irradiance = [0] * len(wvl)
-
-            # Determine the number of workers to use
-            num_workers = os.cpu_count()
-            logging.info(f"Running on {num_workers} threads")
-            iterations_per_worker = len(wvl) // num_workers
-            logging.info(f"{iterations_per_worker} iteration per threads")
-
-            # Create the function for 6s that will be run by each worker
-            def run_model_and_accumulate(
-                    n,
-                    start,
-                    end,
-                    s,
-                    wvl,
-                    percent_direct_solar_irradiance,
-                    percent_diffuse_solar_irradiance,
-                    direct_solar_irradiance,
-                    diffuse_solar_irradiance,
-                    environmental_irradiance
-            ):
-                for i in range(start, end):
-                    wavelength = wvl[i]
-                    s.wavelength(wavelength)
-
-                    temp = s.run()
-
-                    # if math.isnan(float(temp["atmospheric_reflectance_at_sensor"])):
-                    #     print("atmospheric_path_radiance is NaN ...")
-
-                    # TODO: provide warning (with wavelength) if any of the values are NaN
-
-                    percent_direct_solar_irradiance[n,i] = float(
-                        temp["percent_of_direct_solar_irradiance_at_target"]
-                    )
-                    percent_diffuse_solar_irradiance[n,i] = float(
-                        temp["percent_of_diffuse_atmospheric_irradiance_at_target"]
-                    )
-                    direct_solar_irradiance[n,i] = float(
-                        temp["direct_solar_irradiance_at_target_[W m-2 um-1]"]
-                    )
-                    diffuse_solar_irradiance[n,i] = float(
-                        temp["diffuse_atmospheric_irradiance_at_target_[W m-2 um-1]"]
-                    )
-                    environmental_irradiance[n,i] = float(
-                        temp["environement_irradiance_at_target_[W m-2 um-1]"]
-                    )
-
-                return
-
-            with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-                futures = []
-                for i in range(num_workers):
-                    # Calculate the start and end indices for this worker
-                    start = i * iterations_per_worker
-                    end = (
-                        start + iterations_per_worker
-                        if i != num_workers - 1
-                        else len(wvl)
-                    )
-
-                    # Start the worker
-                    futures.append(
-                        executor.submit(
-                            run_model_and_accumulate,
-                            n,
-                            start,
-                            end,
-                            s,
-                            wvl,
-                            percent_direct_solar_irradiance,
-                            percent_diffuse_solar_irradiance,
-                            direct_solar_irradiance,
-                            diffuse_solar_irradiance,
-                            environmental_irradiance
-                        )
-                    )
-
-            # Wait for all workers to finish
-            concurrent.futures.wait(futures)
-
-            if np.isnan(percent_direct_solar_irradiance).any():
-                logging.debug("direct contains NaN values at: %s", wvl[np.isnan(percent_direct_solar_irradiance)[n]])
-
-            if np.isnan(percent_diffuse_solar_irradiance).any():
-                logging.debug("diffuse contains NaN values at: %s", wvl[np.isnan(percent_diffuse_solar_irradiance)[n]])
-
-            if np.isnan(direct_solar_irradiance).any():
-                logging.debug("irr_direct contains NaN values at: %s", wvl[np.isnan(direct_solar_irradiance)[n]])
-
-            if np.isnan(diffuse_solar_irradiance).any():
-                logging.debug("irr_diffuse contains NaN values at: %s", wvl[np.isnan(diffuse_solar_irradiance)[n]])
-
-            if np.isnan(environmental_irradiance).any():
-                logging.debug("irr_env contains NaN values at: %s", wvl[np.isnan(environmental_irradiance)[n]])
-
-            if np.isnan(solar_zenith).any():
-                logging.debug("solar_zenith contains NaN values at: %s", wvl[np.isnan(solar_zenith)[n]])
+        # 6S date only affects the Earth-Sun distance; the cache rescales irradiances per date
+        res = runner.run(atmospheres, sparse_wvl, datetime[0].month, datetime[0].day)
 
+        outputs = []
+        for j in range(len(SIXS_OUTPUTS)):
+            res_j = res[:, :, j]
             # Check for potential NaN values and interpolate them with neighbour
-            # direct
-            ind0 = np.where(np.isnan(percent_direct_solar_irradiance[n, :]))[0]
-            if len(ind0)>0:
-                for i0 in ind0:
-                    if i0==ind0[-1]:
-                        # End of array. Take left neighbor.
-                        percent_direct_solar_irradiance[n,i0] = percent_direct_solar_irradiance[n,i0-1]
-                    else:
-                        percent_direct_solar_irradiance[n,i0] = (percent_direct_solar_irradiance[n,i0-1]+percent_direct_solar_irradiance[n,i0+1])/2
-            # diffuse
-            ind0 = np.where(np.isnan(percent_diffuse_solar_irradiance[n, :]))[0]
-            if len(ind0)>0:
-                for i0 in ind0:
-                    if i0==ind0[-1]:
-                        # End of array. Take left neighbor.
-                        percent_diffuse_solar_irradiance[n,i0] = percent_diffuse_solar_irradiance[n,i0-1]
-                    else:
-                        percent_diffuse_solar_irradiance[n,i0] = (percent_diffuse_solar_irradiance[n,i0-1]+percent_diffuse_solar_irradiance[n,i0+1])/2
-
-            # irr_direct
-            ind0 = np.where(np.isnan(direct_solar_irradiance[n, :]))[0]
-            if len(ind0)>0:
-                for i0 in ind0:
-                    if i0==ind0[-1]:
-                        # End of array. Take left neighbor.
-                        direct_solar_irradiance[n,i0] = direct_solar_irradiance[n,i0-1]
-                    else:
-                        direct_solar_irradiance[n,i0] = (direct_solar_irradiance[n,i0-1]+direct_solar_irradiance[n,i0+1])/2
-
-            # irr_diffuse
-            ind0 = np.where(np.isnan(diffuse_solar_irradiance[n, :]))[0]
-            if len(ind0)>0:
-                for i0 in ind0:
-                    if i0==ind0[-1]:
-                        # End of array. Take left neighbor.
-                        diffuse_solar_irradiance[n,i0] = diffuse_solar_irradiance[n,i0-1]
-                    else:
-                        diffuse_solar_irradiance[n,i0] = (diffuse_solar_irradiance[n,i0-1]+diffuse_solar_irradiance[n,i0+1])/2
-
-            # irr_env
-            ind0 = np.where(np.isnan(environmental_irradiance[n, :]))[0]
-            if len(ind0)>0:
-                for i0 in ind0:
-                    if i0==ind0[-1]:
-                        # End of array. Take left neighbor.
-                        environmental_irradiance[n,i0] = environmental_irradiance[n,i0-1]
-                    else:
-                        environmental_irradiance[n,i0] = (environmental_irradiance[n,i0-1]+environmental_irradiance[n,i0+1])/2
-
-            # Check for potential zero values and interpolate them with neighbour
-            _, ind0 = np.where([percent_direct_solar_irradiance[n,:]==0])
-            if len(ind0)>0:
-                for i0 in ind0:
-                    if i0==ind0[-1]:
-                        # End of array. Take left neighbor.
-                        percent_direct_solar_irradiance[n,i0] = percent_direct_solar_irradiance[n,i0-1]
-                    else:
-                        percent_direct_solar_irradiance[n,i0] = (percent_direct_solar_irradiance[n,i0-1]+percent_direct_solar_irradiance[n,i0+1])/2
+            for n in range(n_bin):
+                if np.isnan(res_j[n, :]).any():
+                    logging.debug("%s contains NaN values at: %s", SIXS_OUTPUTS[j], sparse_wvl[np.isnan(res_j[n, :])])
+                    ProcessL1b_FRMCal.fill_with_neighbours(res_j[n, :], np.isnan(res_j[n, :]))
+            outputs.append(res_j)
+        # Check for potential zero values in direct ratio and interpolate them with neighbour
+        for n in range(n_bin):
+            ProcessL1b_FRMCal.fill_with_neighbours(outputs[0][n, :], outputs[0][n, :] == 0)
+
+        # Interpolate from the sparse 6S grid to the instrument bands
+        for j, res_j in enumerate(outputs):
+            outputs[j] = interpolate.interp1d(sparse_wvl, res_j, axis=1)(wvl)
+        percent_direct_solar_irradiance, percent_diffuse_solar_irradiance, direct_solar_irradiance, \
+            diffuse_solar_irradiance, environmental_irradiance = outputs
 
         # if only 1 bin, repeat value for each timestamp over cast duration (<3min)
         res_sixS = {}
@@ -330,6 +168,17 @@ class ProcessL1b_FRMCal:
 
         return res_sixS
 
+    @staticmethod
+    def fill_with_neighbours(row, mask):
+        ''' Replace flagged values in place with the mean of their neighbours, or the left neighbour at the end '''
+        ind0 = np.where(mask)[0]
+        for i0 in ind0:
+            if i0==ind0[-1] or i0==len(row)-1:
+                # End of array. Take left neighbor.
+                row[i0] = row[i0-1]
+            else:
+                row[i0] = (row[i0-1]+row[i0+1])/2
+
     @staticmethod
     def cosine_error_correction(node, sensorstring):
         ''' Used for both SeaBird and TriOS L1b'''
@@ -10,126 +10,90 @@ from Source.Utilities import Utilities
 
 class ProcessL1b_FactoryCal:
     '''Process L1AQC to L1B for SeaBird in Factory or Class regime '''
-    # Used to calibrate raw data (convert from L1a to L1b)
-    # Reference: "SAT-DN-00134_Instrument File Format.pdf"
     @staticmethod
-    def processDataset(ds, cd, inttime=None, immersed=False):
-        #print("FitType:", cd.fitType)
-        if cd.fitType == "OPTIC2":
-            ProcessL1b_FactoryCal.processOPTIC2(ds, cd, immersed)
-        # elif cd.fitType == "OPTIC1":
-        #     ProcessL1b_FactoryCal.processOPTIC1(ds, cd, immersed)
-        elif cd.fitType == "OPTIC3":
-            ProcessL1b_FactoryCal.processOPTIC3(ds, cd, immersed, inttime)
-        elif cd.fitType == "OPTIC4":
-            ProcessL1b_FactoryCal.processOPTIC4(ds, cd, immersed)
-        # elif cd.fitType == "THERM1":
-        #     ProcessL1b_FactoryCal.processTHERM1(ds, cd)
-        elif cd.fitType == "POW10":
-            ProcessL1b_FactoryCal.processPOW10(ds, cd, immersed)
-        elif cd.fitType == "POLYU":
-            ProcessL1b_FactoryCal.processPOLYU(ds, cd)
-        elif cd.fitType == "POLYF":
-            ProcessL1b_FactoryCal.processPOLYF(ds, cd)
-        # elif cd.fitType == "DDMM":
-        #     ProcessL1b_FactoryCal.processDDMM(ds, cd)
-        # elif cd.fitType == "HHMMSS":
-        #     ProcessL1b_FactoryCal.processHHMMSS(ds, cd)
-        # elif cd.fitType == "DDMMYY":
-        #     ProcessL1b_FactoryCal.processDDMMYY(ds, cd)
-        # elif cd.fitType == "TIME2":
-        #     ProcessL1b_FactoryCal.processTIME2(ds, cd)
-        elif cd.fitType == "COUNT":
-            pass
-        elif cd.fitType == "NONE":
-            pass
-        elif cd.fitType == "THERMAL_RESP":
-            pass
-        else:
-            msg = f'ProcessL1b_FactoryCal.processDataset: Unknown Fit Type: {cd.fitType}'
-            print(msg)
-            Utilities.writeLogFile(msg)
+    def processDataset(ds, calGroups, inttime=None, immersed=False):
+        ''' Calibrate ds in place with the compiled groups of its dataset type '''
+        for group in calGroups:
+            fitType = group['fitType']
+            if fitType not in ['OPTIC2', 'OPTIC3', 'OPTIC4', 'POW10', 'POLYU', 'POLYF']:
+                msg = f'ProcessL1b_FactoryCal.processDataset: Unknown Fit Type: {fitType}'
+                print(msg)
+                Utilities.writeLogFile(msg)
+                continue
+
+            # (rows, channels)
+            x = np.stack([ds.data[k] for k in group['ids']], axis=1)
+            if fitType == "OPTIC2":
+                y = ProcessL1b_FactoryCal.processOPTIC2(x, group, immersed)
+            elif fitType == "OPTIC3":
+                aint = inttime.data[group['type']].reshape(-1, 1)
+                y = ProcessL1b_FactoryCal.processOPTIC3(x, group, immersed, aint)
+            elif fitType == "OPTIC4":
+                y = ProcessL1b_FactoryCal.processOPTIC4(x, group, immersed)
+            elif fitType == "POW10":
+                y = ProcessL1b_FactoryCal.processPOW10(x, group, immersed)
+            elif fitType == "POLYU":
+                y = ProcessL1b_FactoryCal.processPOLYU(x, group)
+            else:
+                y = ProcessL1b_FactoryCal.processPOLYF(x, group)
+
+            for j, k in enumerate(group['ids']):
+                ds.data[k] = y[:, j]
 
     # # Process OPTIC1 - not implemented
     # @staticmethod
-    # def processOPTIC1(ds, cd, immersed):
+    # def processOPTIC1(x, group, immersed):
     #     return
 
     @staticmethod
-    def processOPTIC2(ds, cd, immersed):
-        a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * a1 * (ds.data[k][x] - a0)
+    def processOPTIC2(x, group, immersed):
+        im = group['im'] if immersed else 1.0
+        return im * group['a1'] * (x - group['a0'])
 
     @staticmethod
-    def processOPTIC3(ds, cd, immersed, inttime):
-        # a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        cint = float(cd.coefficients[3])
-        #print(inttime.data.shape[0], self.data.shape[0])
-        k = cd.id
-        #print(cint, aint)
-        #print(cd.id)
-        for x in range(ds.data.shape[0]):
-            aint = inttime.data[cd.type][x]
-            # ds.data[k][x] = im * a1 * (ds.data[k][x] - a0) * (cint/aint)
-            ##############################################################
-            #   When applying calibration to the dark current corrected
-            #   radiometry, a0 cancels (see ProSoftUserManual7.7 11.1.1.5 Eqns 5-6)
-            #   presuming light and dark factory cals are equivalent (which they are).
-            ##############################################################
-            ds.data[k][x] = im * a1 * (ds.data[k][x]) * (cint/aint)
+    def processOPTIC3(x, group, immersed, aint):
+        im = group['im'] if immersed else 1.0
+        # y = im * a1 * (x - a0) * (cint/aint)
+        ##############################################################
+        #   When applying calibration to the dark current corrected
+        #   radiometry, a0 cancels (see ProSoftUserManual7.7 11.1.1.5 Eqns 5-6)
+        #   presuming light and dark factory cals are equivalent (which they are).
+        ##############################################################
+        return im * group['a1'] * x * (group['cint']/aint)
 
     @staticmethod
-    def processOPTIC4(ds, cd, immersed):
-        a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        cint = float(cd.coefficients[3])
-        k = cd.id
+    def processOPTIC4(x, group, immersed):
+        im = group['im'] if immersed else 1.0
         aint = 1
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * a1 * (ds.data[k][x] - a0) * (cint/aint)
+        return im * group['a1'] * (x - group['a0']) * (group['cint']/aint)
 
     # # Process THERM1 - not implemented
     # #   This is for optical thermal sensors like pyrometers, I believe.
     # #   This is not for thermal responsivity of OPTICS3 sensors
     # @staticmethod
-    # def processTHERM1(ds, cd):
+    # def processTHERM1(x, group):
     #     return
 
     @staticmethod
-    def processPOW10(ds, cd, immersed):
-        a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * pow(10, ((ds.data[k][x]-a0)/a1))
+    def processPOW10(x, group, immersed):
+        im = group['im'] if immersed else 1.0
+        return im * np.power(10, (x - group['a0'])/group['a1'])
 
     @staticmethod
-    def processPOLYU(ds, cd):
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            num = 0
-            for i, coeff in enumerate(cd.coefficients):
-                a = float(coeff)
-                num += a * pow(ds.data[k][x],i)
-            ds.data[k][x] = num
+    def processPOLYU(x, group):
+        # Summed from the constant term up, as written in the cal file
+        num = np.zeros(x.shape)
+        for i, a in enumerate(group['coefficients'].T):
+            num += a * np.power(x, i)
+        return num
 
     @staticmethod
-    def processPOLYF(ds, cd):
-        a0 = float(cd.coefficients[0])
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            num = a0
-            for a in cd.coefficients[1:]:
-                num *= (ds.data[k][x] - float(a))
-            ds.data[k][x] = num
+    def processPOLYF(x, group):
+        a = group['coefficients'].T
+        num = np.broadcast_to(a[0], x.shape)
+        for ai in a[1:]:
+            num = num * (x - ai)
+        return num
 
     # @staticmethod
     # def processDDMM(ds, cd):
@@ -161,22 +125,22 @@ class ProcessL1b_FactoryCal:
     # Used to calibrate raw data (from L1a to L1b)
     @staticmethod
     def processGroup(gp, cf): # group, calibration file
+        # Compiled once per calibration file, usually with the calibration model (CalibrationFileReader)
+        if cf.compiled is None:
+            cf.compiled = cf.compileCalibration()
 
+        # Process INTTIME first, it scales the OPTIC3 datasets
         inttime = None
-        for cd in cf.data: # cd is the name of the cal file data
-            # Process slightly differently for INTTIME
-            if cd.type == "INTTIME":
-                #print("Process INTTIME")
-                ds = gp.getDataset("INTTIME")
-                ProcessL1b_FactoryCal.processDataset(ds, cd)
-                inttime = ds
-
-        for cd in cf.data:
+        if "INTTIME" in cf.compiled:
+            #print("Process INTTIME")
+            inttime = gp.getDataset("INTTIME")
+            ProcessL1b_FactoryCal.processDataset(inttime, cf.compiled["INTTIME"])
+
+        for dsType, calGroups in cf.compiled.items():
             # process each dataset in the cal file list of data, except INTTIME
-            if gp.getDataset(cd.type) and cd.type != "INTTIME":
-                #print("Dataset:", cd.type)
-                ds = gp.getDataset(cd.type)
-                ProcessL1b_FactoryCal.processDataset(ds, cd, inttime)
+            if gp.getDataset(dsType) and dsType != "INTTIME":
+                #print("Dataset:", dsType)
+                ProcessL1b_FactoryCal.processDataset(gp.getDataset(dsType), calGroups, inttime)
 
     @staticmethod
     def get_cal_file_lines(calibrationMap):
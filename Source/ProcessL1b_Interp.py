@@ -4,14 +4,14 @@ import datetime as dt
 import time
 import calendar
 from inspect import currentframe, getframeinfo
-from pysolar.solar import get_azimuth, get_altitude
 import numpy as np
 import scipy as sp
-import warnings
 
 from Source.HDFRoot import HDFRoot
 from Source.Utilities import Utilities
 from Source.ConfigFile import ConfigFile
+from Source.SolarGeometry import SolarGeometry
+from Source.Profiler import Profiler
 
 
 class ProcessL1b_Interp:
@@ -432,21 +432,11 @@ class ProcessL1b_Interp:
         # Perform interpolation on full hyperspectral time series
         #   In the case of solar geometries, calculate to new times, don't interpolate
         if dataName == 'SOLAR_AZ':
-            sunAzimuthAnc = []
-
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", category=UserWarning)
-                for i, dt_utc in enumerate(yDatetime):
-                    sunAzimuthAnc.append(get_azimuth(latData.columns['NONE'][i],lonData.columns['NONE'][i],dt_utc,0))
-            xData.columns['NONE'] = sunAzimuthAnc
+            sunAzimuthAnc, _ = SolarGeometry.solarPosition(latData.columns['NONE'], lonData.columns['NONE'], yDatetime)
+            xData.columns['NONE'] = sunAzimuthAnc.tolist()
         elif dataName == 'SZA':
-            sunZenithAnc = []
-
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", category=UserWarning)
-                for i, dt_utc in enumerate(yDatetime):
-                    sunZenithAnc.append(90 - get_altitude(latData.columns['NONE'][i],lonData.columns['NONE'][i],dt_utc,0))
-            xData.columns['NONE'] = sunZenithAnc
+            _, sunZenithAnc = SolarGeometry.solarPosition(latData.columns['NONE'], lonData.columns['NONE'], yDatetime)
+            xData.columns['NONE'] = sunZenithAnc.tolist()
         else:
             ProcessL1b_Interp.interpolateL1b_Interp(xData, xDatetime, yDatetime, xData, dataName, 'linear', fileName)
 
@@ -624,6 +614,7 @@ class ProcessL1b_Interp:
         return root
 
     @staticmethod
+    @Profiler.timed('Interpolation')
     def processL1b_Interp(node, fileName):
         '''
         Process time and wavelength interpolation across instruments and ancillary data
@@ -1,50 +1,15 @@
 ''' Process L1B to L1BQC '''
 import numpy as np
-import scipy as sp
 
 from Source.MainConfig import MainConfig
 from Source.Utilities import Utilities
 from Source.ConfigFile import ConfigFile
+from Source.L1bqcKernel import L1bqcKernel
 
 
 class ProcessL1bqc:
     '''Process L1BQC'''
 
-    @staticmethod
-    def interpolateColumn(columns, wl):
-        ''' Interpolate wavebands to estimate a single, unsampled waveband. This allows for QC filters
-            designed for nominal bands. '''
-        #print("interpolateColumn")
-        # Values to return
-        return_y = []
-
-        # Column to interpolate to
-        new_x = [wl]
-
-        # Get wavelength values
-        wavelength = []
-        for k in columns:
-            #print(k)
-            wavelength.append(float(k))
-        x = np.asarray(wavelength)
-
-        # get the length of a column
-        num = len(list(columns.values())[0])
-
-        # Perform interpolation for each row
-        for i in range(num):
-            values = []
-            for k in columns:
-                #print("b")
-                values.append(columns[k][i])
-            y = np.asarray(values)
-
-            new_y = sp.interpolate.interp1d(x, y)(new_x)
-            return_y.append(new_y[0])
-
-        return return_y
-
-
     @staticmethod
     def specQualityCheck(group, inFilePath, station=None):
         ''' Perform spectral filtering
@@ -95,104 +60,35 @@ class ProcessL1bqc:
 
         ltData = sasGroup.getDataset("LT")
         ltData.datasetToColumns()
-        ltColumns = ltData.columns
-        # These get popped off the columns, but restored when filterData runs datasetToColumns
-        ltColumns.pop('Datetag')
-        ltColumns.pop('Timetag2')
-        timeStamp = ltColumns.pop('Datetime')
+        timeStamp = ltData.columns['Datetime']
 
          # If the Lt spectrum in the NIR is brighter than in the UVA, something is very wrong
-        UVA = [350,400]
-        NIR = [780,850]
-        badTimes = None
-        i=0
-        start = -1
-        stop = []
-        for index, _ in enumerate(timeStamp):
-            ltUVA = []
-            ltNIR = []
-            for wave in ltColumns:
-                if float(wave) > UVA[0] and float(wave) < UVA[1]:
-                    ltUVA.append(ltColumns[wave][index])
-                elif float(wave) > NIR[0] and float(wave) < NIR[1]:
-                    ltNIR.append(ltColumns[wave][index])
-
-            if np.nanmean(ltUVA) < np.nanmean(ltNIR):
-                # badTimes.append(dateTime)
-            # if wind[index] > maxWind:
-                i += 1
-                if start == -1:
-                    msg =f'Bad Lt(UV) < Lt(NIR): {np.nanmean(ltUVA)}, {np.nanmean(ltNIR)}'
-                    Utilities.writeLogFile(msg)
-                    start = index
-                stop = index
-                if badTimes is None:
-                    badTimes = []
-            else:
-                if start != -1:
-                    msg = f'Passed. Lt(UV) >= Lt(NIR): {np.nanmean(ltUVA)}, {np.nanmean(ltNIR)}'
-                    # print(msg)
-                    Utilities.writeLogFile(msg)
-                    startstop = [timeStamp[start],timeStamp[stop]]
-                    msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-                    # print(msg)
-                    Utilities.writeLogFile(msg)
-                    badTimes.append(startstop)
-                    start = -1
-            end_index = index
-        msg = f'Percentage of data out of Lt limits: {round(100*i/len(timeStamp))} %'
-        print(msg)
-        Utilities.writeLogFile(msg)
+        wavelengths, lt = L1bqcKernel.toArray(ltData)
+        bad, ltUVA, ltNIR = L1bqcKernel.ltUVNIR(wavelengths, lt, UVA=[350,400], NIR=[780,850])
 
-        if start != -1 and stop == end_index: # Records from a mid-point to the end are bad
+        badTimes = None
+        starts, stops = L1bqcKernel.runs(bad)
+        for start, stop in zip(starts, stops):
+            msg =f'Bad Lt(UV) < Lt(NIR): {ltUVA[start]}, {ltNIR[start]}'
+            Utilities.writeLogFile(msg)
+            if stop+1 < len(timeStamp):
+                msg = f'Passed. Lt(UV) >= Lt(NIR): {ltUVA[stop+1]}, {ltNIR[stop+1]}'
+                Utilities.writeLogFile(msg)
             startstop = [timeStamp[start],timeStamp[stop]]
             msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-            # print(msg)
             Utilities.writeLogFile(msg)
-            if badTimes is None: # only one set of records
-                badTimes = [startstop]
-            else:
-                badTimes.append(startstop)
+            if badTimes is None:
+                badTimes = []
+            badTimes.append(startstop)
+        msg = f'Percentage of data out of Lt limits: {round(100*np.count_nonzero(bad)/len(timeStamp))} %'
+        print(msg)
+        Utilities.writeLogFile(msg)
 
-        if start==0 and stop==end_index: # All records are bad
-            return False
-        
-        # Restore timestamps to columns (since it's not going to filterData, where it otherwise happens)
-        ltData.datasetToColumns()
+        if len(bad) > 0 and np.all(bad): # All records are bad
+            return False, timeStamp
 
         return badTimes, timeStamp
 
-        # badTimes = []
-        # for indx, dateTime in enumerate(ltDatetime):
-        #     # If the Lt spectrum in the NIR is brighter than in the UVA, something is very wrong
-        #     UVA = [350,400]
-        #     NIR = [780,850]
-        #     ltUVA = []
-        #     ltNIR = []
-        #     for wave in ltColumns:
-        #         if float(wave) > UVA[0] and float(wave) < UVA[1]:
-        #             ltUVA.append(ltColumns[wave][indx])
-        #         elif float(wave) > NIR[0] and float(wave) < NIR[1]:
-        #             ltNIR.append(ltColumns[wave][indx])
-
-        #     if np.nanmean(ltUVA) < np.nanmean(ltNIR):
-        #         badTimes.append(dateTime)
-
-        # badTimes = np.unique(badTimes)
-        # # Duplicate each element to a list of two elements in a list
-        # # BUG: This is not optimal as it creates one badTimes record for each bad
-        # #    timestamp, rather than span of timestamps from badtimes[i][0] to badtimes[i][1]
-        # badTimes = np.rot90(np.matlib.repmat(badTimes,2,1), 3)
-        # msg = f'{len(np.unique(badTimes))/len(ltDatetime)*100:.1f}% of spectra flagged'
-        # print(msg)
-        # Utilities.writeLogFile(msg)
-
-        # if len(badTimes) == 0:
-        #     badTimes = None
-        #     # In case filterData does not need to be run:
-        #     ltData.datasetToColumns()
-        # return badTimes
-
     @staticmethod
     def metQualityCheck(refGroup, sasGroup, sixSGroup, ancGroup):
         ''' Perform meteorological quality control '''
@@ -204,88 +100,93 @@ class ProcessL1bqc:
 
         esData = refGroup.getDataset("ES")
         esData.datasetToColumns()
-        esColumns = esData.columns
-
-        esColumns.pop('Datetag')
-        esColumns.pop('Timetag2')
-        esTime = esColumns.pop('Datetime')
-
+        esTime = esData.columns['Datetime']
         liData = sasGroup.getDataset("LI")
         liData.datasetToColumns()
-        liColumns = liData.columns
-        liColumns.pop('Datetag')
-        liColumns.pop('Timetag2')
-        liColumns.pop('Datetime')
+        # Restores Lt columns (not going to filterData, where it otherwise happens)
+        sasGroup.getDataset("LT").datasetToColumns()
 
-        ltData = sasGroup.getDataset("LT")
-        ltData.datasetToColumns()
-        ltColumns = ltData.columns
-        ltColumns.pop('Datetag')
-        ltColumns.pop('Timetag2')
-        ltColumns.pop('Datetime')
-
-        li750 = ProcessL1bqc.interpolateColumn(liColumns, 750.0)
-        es370 = ProcessL1bqc.interpolateColumn(esColumns, 370.0)
-        es470 = ProcessL1bqc.interpolateColumn(esColumns, 470.0)
-        es480 = ProcessL1bqc.interpolateColumn(esColumns, 480.0)
-        es680 = ProcessL1bqc.interpolateColumn(esColumns, 680.0)
-        es720 = ProcessL1bqc.interpolateColumn(esColumns, 720.0)
-        es750 = ProcessL1bqc.interpolateColumn(esColumns, 750.0)
-        badTimes = []
-
-        flags1 = ancGroup.datasets['MET_FLAGS'].columns['Flag1']
-        flags2 = ancGroup.datasets['MET_FLAGS'].columns['Flag2']
-        flags3 = ancGroup.datasets['MET_FLAGS'].columns['Flag3']
-        flags4 = ancGroup.datasets['MET_FLAGS'].columns['Flag4']
-        flags5 = ancGroup.datasets['MET_FLAGS'].columns['Flag5']
+        esWavelengths, es = L1bqcKernel.toArray(esData)
+        liWavelengths, li = L1bqcKernel.toArray(liData)
+        masks = L1bqcKernel.metFlags(esWavelengths, es, liWavelengths, li,
+                                     esFlag, dawnDuskFlag, humidityFlag, cloudFLAG, sixS=sixSGroup is not None)
 
-        for indx, dateTime in enumerate(esTime):
-            # Flag spectra affected by clouds (Compare with 6S Es). Placeholder while under development
-            # Need to propagate 6S even in Default and Class for this to work
-            if sixSGroup is not None:
-                if li750[indx]/es750[indx] >= cloudFLAG:
-                    badTimes.append(dateTime)
-                    flags1[indx] = True
-
-            # Flag spectra affected by clouds (Ruddick 2006, IOCCG Protocols).
-            if li750[indx]/es750[indx] >= cloudFLAG:
-                badTimes.append(dateTime)
-                flags2[indx] = True
-
-            # Flag for significant es
-            # Wernand 2002
-            if es480[indx] < esFlag:
-                badTimes.append(dateTime)
-                flags3[indx] = True
-
-            # Flag spectra affected by dawn/dusk radiation
-            # Wernand 2002
-            #v = esXSlice["470.0"][0] / esXSlice["610.0"][0] # Fix 610 -> 680
-            if es470[indx]/es680[indx] < dawnDuskFlag:
-                badTimes.append(dateTime)
-                flags4[indx] = True
-
-            # Flag spectra affected by rainfall and high humidity
-            # Wernand 2002 (940/370), Garaba et al. 2012 also uses Es(940/370), presumably 720 was developed by Wang...???
-            # NOTE: Follow up on the source of this flag
-            if es720[indx]/es370[indx] < humidityFlag:
-                badTimes.append(dateTime)
-                flags5[indx] = True
+        metFlags = ancGroup.datasets['MET_FLAGS']
+        for flag, mask in masks.items():
+            metFlags.columns[flag] = (np.asarray(metFlags.columns[flag], dtype=bool) | mask).tolist()
 
+        flagged = np.any(list(masks.values()), axis=0)
+        badTimes = np.asarray(esTime)[flagged]
         badTimes = np.unique(badTimes)
         badTimes = np.rot90(np.matlib.repmat(badTimes,2,1), 3) # Duplicates each element to a list of two elements in a list
         msg = f'{len(np.unique(badTimes))/len(esTime)*100:.1f}% of spectra flagged (not filtered)'
         print(msg)
         Utilities.writeLogFile(msg)
 
-        # Restore timestamps to columns (since it's not going to filterData, where it otherwise happens)
-        esData.datasetToColumns()
-        liData.datasetToColumns()
-        ltData.datasetToColumns()
         if len(badTimes) == 0:
             badTimes = None
         return badTimes
 
+    @staticmethod
+    def limitQuality(values, timeStamp, bad, name, failText, kept=None):
+        ''' Log and return the [start, stop] datetimes of each run of bad records of an ancillary
+            value tested against its limits. The logged percentage is of the records kept by the
+            earlier criteria (kept mask), as when each criterion was removed in turn. '''
+        badTimes = []
+        starts, stops = L1bqcKernel.runs(bad)
+        for start, stop in zip(starts, stops):
+            Utilities.writeLogFile(f'{failText}: {round(values[start])}')
+            if stop+1 < len(values):
+                msg = f'Passed. {name}: {round(values[stop+1])}'
+                print(msg)
+                Utilities.writeLogFile(msg)
+            startstop = [timeStamp[start],timeStamp[stop]]
+            Utilities.writeLogFile(f'   Flag data from TT2: {startstop[0]} to {startstop[1]}')
+            badTimes.append(startstop)
+        if kept is None:
+            kept = np.ones(len(bad), dtype=bool)
+        nKept = max(np.count_nonzero(kept), 1)
+        msg = f'Percentage of data out of {name} limits: {round(100*np.count_nonzero(bad & kept)/nKept)} %'
+        print(msg)
+        Utilities.writeLogFile(msg)
+        return badTimes
+
+    @staticmethod
+    def removeBadTimes(node, badTimes):
+        ''' Delete the badTimes ranges from the L1B groups and their L1AQC counterparts, once per group.
+            Returns False if too few spectra remain. '''
+        sensorType = ConfigFile.settings['SensorType'].lower()
+        tooFew = False
+
+        # Radiometry and ancillary data share the L1B time axis
+        for gpName in ['IRRADIANCE', 'RADIANCE', 'ANCILLARY']:
+            if Utilities.filterData(node.getGroup(gpName), badTimes) > 0.99:
+                tooFew = True
+                break
+
+        if not tooFew:
+            sixSGroup = next((gp for gp in node.groups if gp.id.startswith("SIXS")), None)
+            if sixSGroup is not None:
+                Utilities.filterData(sixSGroup, badTimes)
+
+            # Filter L1AQC data for L1BQC criteria. badTimes start/stop
+            # are used to bracket the same spectral collections, though it
+            # will involve a difference number/percentage of the datasets.
+            if sensorType == 'seabird':
+                check = [Utilities.filterData(node.getGroup(f'{sensor}_{light}_L1AQC'), badTimes, 'L1AQC')
+                         for sensor in ['ES', 'LI', 'LT'] for light in ['DARK', 'LIGHT']]
+                tooFew = any(np.array(check) > 0.99)
+            elif sensorType in ['trios', 'sorad']:
+                for sensor in ['ES', 'LI', 'LT']:
+                    Utilities.filterData(node.getGroup(f'{sensor}_L1AQC'), badTimes, 'L1AQC')
+
+        if tooFew:
+            msg = "Too few spectra remaining. Abort."
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return False
+        return True
+
     @staticmethod
     def QC(node):
         ''' Add model data. QC for wind, Lt, SZA, spectral outliers, and met filters'''
@@ -294,17 +195,6 @@ class ProcessL1bqc:
         referenceGroup = node.getGroup("IRRADIANCE")
         sasGroup = node.getGroup("RADIANCE")
         gpsGroup = node.getGroup('GPS')
-        if ConfigFile.settings['SensorType'].lower() == 'seabird':
-            esDarkGroup = node.getGroup('ES_DARK_L1AQC')
-            esLightGroup = node.getGroup('ES_LIGHT_L1AQC')
-            ltDarkGroup = node.getGroup('LT_DARK_L1AQC')
-            ltLightGroup = node.getGroup('LT_LIGHT_L1AQC')
-            liDarkGroup = node.getGroup('LI_DARK_L1AQC')
-            liLightGroup = node.getGroup('LI_LIGHT_L1AQC')
-        elif ConfigFile.settings['SensorType'].lower() == 'trios' or ConfigFile.settings['SensorType'].lower() == 'sorad':
-            esGroup = node.getGroup('ES_L1AQC')
-            liGroup = node.getGroup('LI_L1AQC')
-            ltGroup = node.getGroup('LT_L1AQC')
 
         robotGroup = None
         ancGroup = None
@@ -474,225 +364,48 @@ class ProcessL1bqc:
 
         ##################################################################################
 
+        # Lt, wind and SZA criteria are independent of one another, so they are all evaluated
+        # on the full record and their bad ranges removed together in one pass. Their percentages
+        # are still logged against the records left by the criteria before them.
+        badTimes = []
+        ancTime = ancGroup.datasets["WINDSPEED"].columns["Datetime"]
+        kept = np.ones(len(ancTime), dtype=bool)
+
         # Lt Quality Filtering; anomalous elevation in the NIR
         if ConfigFile.settings["bL1bqcLtUVNIR"]:
             msg = "Applying Lt(NIR)>Lt(UV) quality filtering to eliminate spectra."
             print(msg)
             Utilities.writeLogFile(msg)
-            # This is not well optimized for large files...
-            badTimes, dateTime = ProcessL1bqc.ltQuality(sasGroup)
-            if badTimes is False:
+            ltBadTimes, _ = ProcessL1bqc.ltQuality(sasGroup)
+            if ltBadTimes is False:
                 return False
-
-            if badTimes is not None:
-                badTimes = Utilities.uniquePairs(badTimes)
-                badTimes = Utilities.catConsecutiveBadTimes(badTimes, dateTime)
-                print('Removing records... Can be slow for large files')
-                check = Utilities.filterData(referenceGroup, badTimes)
-                # check is now fraction removed
-                #   I.e., if >99% of the Es spectra from this entire file were remove, abort this file
-                if check > 0.99:
-                    msg = "Too few spectra remaining. Abort."
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return False
-                Utilities.filterData(sasGroup, badTimes)
-                Utilities.filterData(ancGroup, badTimes)
-
-                # Filter L1AQC data for L1BQC criteria. badTimes start/stop
-                # are used to bracket the same spectral collections, though it
-                # will involve a difference number/percentage of the datasets.
-                if ConfigFile.settings['SensorType'].lower() == 'seabird':
-                    check = []
-                    check.append(Utilities.filterData(esDarkGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(esLightGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(liDarkGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(liLightGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(ltDarkGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(ltLightGroup,badTimes,'L1AQC'))
-                    if any(np.array(check) > 0.99):
-                        msg = "Too few spectra remaining. Abort."
-                        print(msg)
-                        Utilities.writeLogFile(msg)
-                        return False
-                elif ConfigFile.settings['SensorType'].lower() == 'trios' or  ConfigFile.settings['SensorType'].lower() == 'sorad':
-                    Utilities.filterData(esGroup,badTimes,'L1AQC')
-                    Utilities.filterData(liGroup,badTimes,'L1AQC')
-                    Utilities.filterData(ltGroup,badTimes,'L1AQC')
-
-                if sixSGroup is not None:
-                    Utilities.filterData(sixSGroup,badTimes)
-
+            if ltBadTimes is not None:
+                badTimes.extend(ltBadTimes)
+                kept &= ~Utilities.badTimesMask(ancTime, ltBadTimes)
 
         # Filter low SZAs and high winds after interpolating model/ancillary data
         maxWind = float(ConfigFile.settings["fL1bqcMaxWind"])
-
-        wind = ancGroup.getDataset("WINDSPEED").data["WINDSPEED"]
-        timeStamp = ancGroup.datasets["WINDSPEED"].columns["Datetime"]
-
-        badTimes = None
-        i=0
-        start = -1
-        stop = []
-        for index, _ in enumerate(wind):
-            if wind[index] > maxWind:
-                i += 1
-                if start == -1:
-                    msg =f'High Wind: {round(wind[index])}'
-                    Utilities.writeLogFile(msg)
-                    start = index
-                stop = index
-                if badTimes is None:
-                    badTimes = []
-            else:
-                if start != -1:
-                    msg = f'Passed. Wind: {round(wind[index])}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    startstop = [timeStamp[start],timeStamp[stop]]
-                    msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-                    # print(msg)
-                    Utilities.writeLogFile(msg)
-                    badTimes.append(startstop)
-                    start = -1
-            end_index = index
-        msg = f'Percentage of data out of Wind limits: {round(100*i/len(timeStamp))} %'
-        print(msg)
-        Utilities.writeLogFile(msg)
-
-        if start != -1 and stop == end_index: # Records from a mid-point to the end are bad
-            startstop = [timeStamp[start],timeStamp[stop]]
-            msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-            # print(msg)
-            Utilities.writeLogFile(msg)
-            if badTimes is None: # only one set of records
-                badTimes = [startstop]
-            else:
-                badTimes.append(startstop)
-
-        if start==0 and stop==end_index: # All records are bad
+        wind = np.asarray(ancGroup.getDataset("WINDSPEED").data["WINDSPEED"], dtype=float)
+        windBad = wind > maxWind
+        if len(windBad) > 0 and np.all(windBad): # All records are bad
             return False
+        badTimes.extend(ProcessL1bqc.limitQuality(wind, ancTime, windBad, 'Wind', 'High Wind', kept))
+        kept &= ~windBad
 
-        if badTimes is not None and len(badTimes) != 0:
-            badTimes = Utilities.uniquePairs(badTimes)
-            badTimes = Utilities.catConsecutiveBadTimes(badTimes, timeStamp)
-            print('Removing records...')
-            check = Utilities.filterData(referenceGroup, badTimes)
-            if check > 0.99:
-                msg = "Too few spectra remaining. Abort."
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
-            Utilities.filterData(sasGroup, badTimes)
-            Utilities.filterData(ancGroup, badTimes)
-            # Filter L1AQC data for L1BQC criteria
-            if ConfigFile.settings['SensorType'].lower() == 'seabird':
-                check = []
-                check.append(Utilities.filterData(esDarkGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(esLightGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(liDarkGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(liLightGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(ltDarkGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(ltLightGroup,badTimes,'L1AQC'))
-                if any(np.array(check) > 0.99):
-                    msg = "Too few spectra remaining. Abort."
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return False
-            elif ConfigFile.settings['SensorType'].lower() == 'trios' or ConfigFile.settings['SensorType'].lower() == 'sorad':
-                Utilities.filterData(esGroup,badTimes,'L1AQC')
-                Utilities.filterData(liGroup,badTimes,'L1AQC')
-                Utilities.filterData(ltGroup,badTimes,'L1AQC')
-            if sixSGroup is not None:
-                Utilities.filterData(sixSGroup,badTimes)
-
-
-        # Filter SZAs
         SZAMin = float(ConfigFile.settings["fL1bqcSZAMin"])
         SZAMax = float(ConfigFile.settings["fL1bqcSZAMax"])
-
         # SZA will be in ancGroup at this point regardless of whether it is from Ancillary or Tracker
-        SZA = ancGroup.datasets["SZA"].columns["SZA"]
-        # SZA = ancGroup.datasets["SZA"].columns["NONE"]
+        SZA = np.asarray(ancGroup.datasets["SZA"].columns["SZA"], dtype=float)
         timeStamp = ancGroup.datasets["SZA"].columns["Datetime"]
-
-        badTimes = None
-        i=0
-        start = -1
-        stop = []
-        for index, _ in enumerate(SZA):
-            if SZA[index] < SZAMin or SZA[index] > SZAMax:
-                i += 1
-                if start == -1:
-                    msg =f'Low SZA. SZA: {round(SZA[index])}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    start = index
-                stop = index
-                if badTimes is None:
-                    badTimes = []
-            else:
-                if start != -1:
-                    msg = f'Passed. SZA: {round(SZA[index])}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    startstop = [timeStamp[start],timeStamp[stop]]
-                    msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-                    # print(msg)
-                    Utilities.writeLogFile(msg)
-                    badTimes.append(startstop)
-                    start = -1
-            end_index = index
-        msg = f'Percentage of data out of SZA limits: {round(100*i/len(timeStamp))} %'
-        print(msg)
-        Utilities.writeLogFile(msg)
-
-        if start != -1 and stop == end_index: # Records from a mid-point to the end are bad
-            startstop = [timeStamp[start],timeStamp[stop]]
-            msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-            # print(msg)
-            Utilities.writeLogFile(msg)
-            if badTimes is None: # only one set of records
-                badTimes = [startstop]
-            else:
-                badTimes.append(startstop)
-
-        if start==0 and stop==end_index: # All records are bad
+        SZABad = (SZA < SZAMin) | (SZA > SZAMax)
+        if len(SZABad) > 0 and np.all(SZABad): # All records are bad
             return False
+        badTimes.extend(ProcessL1bqc.limitQuality(SZA, timeStamp, SZABad, 'SZA', 'Low SZA. SZA', kept))
 
-
-        if badTimes is not None and len(badTimes) != 0:
-            badTimes = Utilities.uniquePairs(badTimes)
-            badTimes = Utilities.catConsecutiveBadTimes(badTimes, timeStamp)
+        if len(badTimes) != 0:
             print('Removing records...')
-            check = Utilities.filterData(referenceGroup, badTimes)
-            if check > 0.99:
-                msg = "Too few spectra remaining. Abort."
-                print(msg)
-                Utilities.writeLogFile(msg)
+            if not ProcessL1bqc.removeBadTimes(node, badTimes):
                 return False
-            Utilities.filterData(sasGroup, badTimes)
-            Utilities.filterData(ancGroup, badTimes)
-            # Filter L1AQC data for L1BQC criteria
-            if ConfigFile.settings['SensorType'].lower() == 'seabird':
-                check = []
-                check.append(Utilities.filterData(esDarkGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(esLightGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(liDarkGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(liLightGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(ltDarkGroup,badTimes,'L1AQC'))
-                check.append(Utilities.filterData(ltLightGroup,badTimes,'L1AQC'))
-                if any(np.array(check) > 0.99):
-                    msg = "Too few spectra remaining. Abort."
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return False
-            elif ConfigFile.settings['SensorType'].lower() == 'trios' or ConfigFile.settings['SensorType'].lower() == 'sorad':
-                Utilities.filterData(esGroup,badTimes,'L1AQC')
-                Utilities.filterData(liGroup,badTimes,'L1AQC')
-                Utilities.filterData(ltGroup,badTimes,'L1AQC')
-            if sixSGroup is not None:
-                Utilities.filterData(sixSGroup,badTimes)
 
        # Spectral Outlier Filter
         enableSpecQualityCheck = ConfigFile.settings['bL1bqcEnableSpecQualityCheck']
@@ -703,7 +416,7 @@ class ProcessL1bqc:
             Utilities.writeLogFile(msg)
             inFilePath = node.attributes['In_Filepath']
             badTimes1,_ = ProcessL1bqc.specQualityCheck(referenceGroup, inFilePath)
-            badTimes2,timeStamp = ProcessL1bqc.specQualityCheck(sasGroup, inFilePath)
+            badTimes2,_ = ProcessL1bqc.specQualityCheck(sasGroup, inFilePath)
             if badTimes1 is not None and badTimes2 is not None:
                 badTimes = np.append(badTimes1,badTimes2, axis=0)
             elif badTimes1 is not None:
@@ -713,53 +426,11 @@ class ProcessL1bqc:
             # badTimes = badTimes.tolist()            
 
             if badTimes is not None:
-                # These contain many consecutive single-timestamp records that need to be concatonated.
-                badTimes = Utilities.uniquePairs(badTimes)
-                badTimes = Utilities.catConsecutiveBadTimes(badTimes, timeStamp.tolist())
                 msg = "Removing spectra from combined flags."
                 print(msg)
                 Utilities.writeLogFile(msg)
-                check = Utilities.filterData(referenceGroup, badTimes)
-                if check > 0.99:
-                    msg = "Too few spectra remaining. Abort."
-                    print(msg)
-                    Utilities.writeLogFile(msg)
+                if not ProcessL1bqc.removeBadTimes(node, badTimes):
                     return False
-                check = Utilities.filterData(sasGroup, badTimes)
-                if check > 0.99:
-                    msg = "Too few spectra remaining. Abort."
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return False
-                check = Utilities.filterData(ancGroup, badTimes)
-                if check > 0.99:
-                    msg = "Too few spectra remaining. Abort."
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return False
-
-                if sixSGroup is not None:
-                    Utilities.filterData(sixSGroup,badTimes)
-
-                # Filter L1AQC data for L1BQC criteria
-                if ConfigFile.settings['SensorType'].lower() == 'seabird':
-                    check = []
-                    check.append(Utilities.filterData(esDarkGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(esLightGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(liDarkGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(liLightGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(ltDarkGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(ltLightGroup,badTimes,'L1AQC'))
-                    if any(np.array(check) > 0.99):
-                        msg = "Too few spectra remaining. Abort."
-                        print(msg)
-                        Utilities.writeLogFile(msg)
-                        return False
-                elif ConfigFile.settings['SensorType'].lower() == 'trios' or ConfigFile.settings['SensorType'].lower() == 'sorad':
-                    
-                    Utilities.filterData(esGroup,badTimes,'L1AQC')
-                    Utilities.filterData(liGroup,badTimes,'L1AQC')
-                    Utilities.filterData(ltGroup,badTimes,'L1AQC')
 
         # Next apply the Meteorological FLAGGING prior to slicing
         # esData = referenceGroup.getDataset("ES")
@@ -779,62 +450,15 @@ class ProcessL1bqc:
             AncDatetime = metFlags.columns['Datetime']
             Flag3 = metFlags.columns['Flag3']  # <- placeholder to delete Flag3 records
 
-            badTimes = []
-            for indx, dateTime in enumerate(AncDatetime):
-                if Flag3[indx]:
-                    badTimes.append(dateTime)
+            starts, stops = L1bqcKernel.runs(np.asarray(Flag3, dtype=bool))
+            badTimes = [[AncDatetime[start], AncDatetime[stop]] for start, stop in zip(starts, stops)]
 
-            badTimes = np.unique(badTimes)
-            # Duplicate each element to a list of two elements in a list
-            badTimes = np.rot90(np.matlib.repmat(badTimes,2,1), 3)
-            # msg = f'{len(np.unique(badTimes))/len(AncDatetime)*100:.1f}% of spectra flagged'
-
-            if badTimes is not None:
-                badTimes = Utilities.uniquePairs(badTimes)
-                badTimes = Utilities.catConsecutiveBadTimes(badTimes, dateTime)
+            if len(badTimes) != 0:
                 msg = "Removing spectra from Met flags. ######################### Hard-coded override for Flag3"
                 print(msg)
                 Utilities.writeLogFile(msg)
-                check = Utilities.filterData(referenceGroup, badTimes)
-                if check > 0.99:
-                    msg = "Too few spectra remaining. Abort."
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return False
-                check = Utilities.filterData(sasGroup, badTimes)
-                if check > 0.99:
-                    msg = "Too few spectra remaining. Abort."
-                    print(msg)
-                    Utilities.writeLogFile(msg)
+                if not ProcessL1bqc.removeBadTimes(node, badTimes):
                     return False
-                check = Utilities.filterData(ancGroup, badTimes)
-                if check > 0.99:
-                    msg = "Too few spectra remaining. Abort."
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return False
-
-                if sixSGroup is not None:
-                    Utilities.filterData(sixSGroup,badTimes)
-
-                # Filter L1AQC data for L1BQC criteria
-                if ConfigFile.settings['SensorType'].lower() == 'seabird':
-                    check = []
-                    check.append(Utilities.filterData(esDarkGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(esLightGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(liDarkGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(liLightGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(ltDarkGroup,badTimes,'L1AQC'))
-                    check.append(Utilities.filterData(ltLightGroup,badTimes,'L1AQC'))
-                    if any(np.array(check) > 0.99):
-                        msg = "Too few spectra remaining. Abort."
-                        print(msg)
-                        Utilities.writeLogFile(msg)
-                        return False
-                elif ConfigFile.settings['SensorType'].lower() == 'trios' or ConfigFile.settings['SensorType'].lower() == 'sorad':
-                    Utilities.filterData(esGroup,badTimes,'L1AQC')
-                    Utilities.filterData(liGroup,badTimes,'L1AQC')
-                    Utilities.filterData(ltGroup,badTimes,'L1AQC')
 
         return True
 
@@ -5,15 +5,17 @@ import warnings
 import time
 
 import datetime
-import copy
 import numpy as np
-import scipy as sp
 
 from PyQt5 import QtWidgets
 from tqdm import tqdm
 
 from Source.HDFRoot import HDFRoot
+from Source.EnsembleView import EnsembleView, EnsembleSlice
+from Source.L2Accumulator import L2Accumulator
+from Source.ReflectanceCorrections import ReflectanceCorrections
 from Source.Utilities import Utilities
+from Source.BatchContext import BatchContext
 from Source.ConfigFile import ConfigFile
 from Source.RhoCorrections import RhoCorrections
 from Source.Uncertainty_Analysis import Propagate
@@ -27,49 +29,26 @@ class ProcessL2:
     ''' Process L2 '''
 
     @staticmethod
-    def nirCorrectionSatellite(root, sensor, rrsNIRCorr, nLwNIRCorr):
-        newReflectanceGroup = root.getGroup("REFLECTANCE")
-        newRrsData = newReflectanceGroup.getDataset(f'Rrs_{sensor}')
-        newnLwData = newReflectanceGroup.getDataset(f'nLw_{sensor}')
-
-        # These will include all slices in root so far
-        # Below the most recent/current slice [-1] will be selected for processing
-        rrsSlice = newRrsData.columns
-        nLwSlice = newnLwData.columns
-
-        for k in rrsSlice:
-            if (k != 'Datetime') and (k != 'Datetag') and (k != 'Timetag2'):
-                rrsSlice[k][-1] -= rrsNIRCorr
-        for k in nLwSlice:
-            if (k != 'Datetime') and (k != 'Datetag') and (k != 'Timetag2'):
-                nLwSlice[k][-1] -= nLwNIRCorr
-
-        newRrsData.columnsToDataset()
-        newnLwData.columnsToDataset()
+    def nirCorrectionSatellite(output, sensor, rrsNIRCorr, nLwNIRCorr):
+        # Only the most recent/current slice (the last row so far in output) is corrected
+        ReflectanceCorrections.subtract(output.get('REFLECTANCE', f'Rrs_{sensor}').row()[np.newaxis, :], rrsNIRCorr)
+        ReflectanceCorrections.subtract(output.get('REFLECTANCE', f'nLw_{sensor}').row()[np.newaxis, :], nLwNIRCorr)
 
 
     @staticmethod
-    def nirCorrection(node, sensor, F0):
+    def nirCorrection(output, sensor, F0):
         # F0 is sensor specific, but ultimately, SimSpec can only be applied to hyperspectral data anyway,
         # so output the correction and apply it to satellite bands later.
         simpleNIRCorrection = int(ConfigFile.settings["bL2SimpleNIRCorrection"])
         simSpecNIRCorrection = int(ConfigFile.settings["bL2SimSpecNIRCorrection"])
 
-        newReflectanceGroup = node.getGroup("REFLECTANCE")
-        newRrsData = newReflectanceGroup.getDataset(f'Rrs_{sensor}')
-        newnLwData = newReflectanceGroup.getDataset(f'nLw_{sensor}')
-        newRrsUNCData = newReflectanceGroup.getDataset(f'Rrs_{sensor}_unc')
-        newnLwUNCData = newReflectanceGroup.getDataset(f'nLw_{sensor}_unc')
-
-        newNIRData = newReflectanceGroup.getDataset(f'nir_{sensor}')
-        newNIRnLwData = newReflectanceGroup.getDataset(f'nir_nLw_{sensor}')
-
-        # These will include all slices in node so far
-        # Below the most recent/current slice [-1] will be selected for processing
-        rrsSlice = newRrsData.columns
-        nLwSlice = newnLwData.columns
-        nirSlice = newNIRData.columns
-        nirnLwSlice = newNIRnLwData.columns
+        # Rows of all slices in output so far. Only the most recent/current slice (the last row)
+        # is corrected here, as a (1 x band) view; ReflectanceCorrections works on any number of rows.
+        rrsRows = output.get('REFLECTANCE', f'Rrs_{sensor}')
+        nLwRows = output.get('REFLECTANCE', f'nLw_{sensor}')
+        rrs = rrsRows.row()[np.newaxis, :]
+        nLw = nLwRows.row()[np.newaxis, :]
+        wavelength = [float(k) for k in rrsRows.names]
 
         # # Perform near-infrared residual correction to remove additional atmospheric and glint contamination
         # if ConfigFile.settings["bL2PerformNIRCorrection"]:
@@ -77,166 +56,43 @@ class ProcessL2:
             # Data show a minimum near 725; using an average from above 750 leads to negative reflectances
             # Find the minimum between 700 and 800, and subtract it from spectrum (spectrally flat)
             Utilities.writeLogFileAndPrint("Perform simple residual NIR subtraction.")
-
-            # rrs correction
-            NIRRRs = []
-            for k in rrsSlice:
-                if (k == 'Datetime') or (k == 'Datetag') or (k == 'Timetag2'):
-                    continue
-                if float(k) >= 700 and float(k) <= 800:
-                    NIRRRs.append(rrsSlice[k][-1])
-            rrsNIRCorr = min(NIRRRs)
-            if rrsNIRCorr < 0:
-                #   NOTE: SeaWiFS protocols for residual NIR were never intended to ADD reflectance
-                #   This is most likely in blue, non-turbid waters not intended for NIR offset correction.
-                #   Revert to NIR correction of 0 when this happens. No good way to update the L2 attribute
-                #   metadata because it may only be on some ensembles within a file.
+            rrsNIRCorr, nLwNIRCorr, bad = ReflectanceCorrections.simpleNIR(rrs, nLw, wavelength)
+            if bad.any():
+                # No good way to update the L2 attribute metadata because it may only be on some ensembles within a file.
                 Utilities.writeLogFileAndPrint('Bad NIR Correction. Revert to No NIR correction.')
-                rrsNIRCorr = 0
-            # Subtract average from each waveband
-            for k in rrsSlice:
-                if (k == 'Datetime') or (k == 'Datetag') or (k == 'Timetag2'):
-                    continue
-
-                rrsSlice[k][-1] -= rrsNIRCorr
-
-            nirSlice['NIR_offset'].append(rrsNIRCorr)
-
-            # nLw correction
-            NIRRRs = []
-            for k in nLwSlice:
-                if (k == 'Datetime') or (k == 'Datetag') or (k == 'Timetag2'):
-                    continue
-                if float(k) >= 700 and float(k) <= 800:
-                    NIRRRs.append(nLwSlice[k][-1])
-            nLwNIRCorr = min(NIRRRs)
-            # Subtract average from each waveband
-            for k in nLwSlice:
-                if (k == 'Datetime') or (k == 'Datetag') or (k == 'Timetag2'):
-                    continue
-                nLwSlice[k][-1] -= nLwNIRCorr
-
-            nirnLwSlice['NIR_offset'].append(nLwNIRCorr)
 
         elif simSpecNIRCorrection:
             # From Ruddick 2005, Ruddick 2006 use NIR normalized similarity spectrum
             # (spectrally flat)
             Utilities.writeLogFileAndPrint("Perform similarity spectrum residual NIR subtraction.")
-
-            # For simplicity, follow calculation in rho (surface reflectance), then covert to rrs
-            ρSlice = copy.deepcopy(rrsSlice)
-            for k,value in ρSlice.items():
-                if (k == 'Datetime') or (k == 'Datetag') or (k == 'Timetag2'):
-                    continue
-                ρSlice[k][-1] = value[-1] * np.pi
-
-            # These ratios are for rho = pi*Rrs
-            α1 = 2.35 # 720/780 only good for rho(720)<0.03
-            α2 = 1.91 # 780/870 try to avoid, data is noisy here
-            threshold = 0.03
-
-            # Retrieve TSIS-1s
-            wavelength = [float(key) for key in F0.keys()]
-            F0 = [value for value in F0.values()]
-
-            # Rrs
-            ρ720 = []
-            x = []
-            for k in ρSlice:
-                if (k == 'Datetime') or (k == 'Datetag') or (k == 'Timetag2'):
-                    continue
-                if float(k) >= 700 and float(k) <= 750:
-                    x.append(float(k))
-
-                    # convert to surface reflectance ρ = π * Rrs
-                    ρ720.append(ρSlice[k][-1]) # Using current element/slice [-1]
-
-            # if not ρ720:
-            #     print("Error: NIR wavebands unavailable")
-            #     if os.environ["HYPERINSPACE_CMD"].lower() == 'false':
-            #         QtWidgets.QMessageBox.critical("Error", "NIR wavebands unavailable")
-            ρ1 = sp.interpolate.interp1d(x,ρ720)(720)
-            F01 = sp.interpolate.interp1d(wavelength,F0)(720)
-            ρ780 = []
-            x = []
-            for k in ρSlice:
-                if k in ('Datetime', 'Datetag', 'Timetag2'):
-                    continue
-                if float(k) >= 760 and float(k) <= 800:
-                    x.append(float(k))
-                    ρ780.append(ρSlice[k][-1])
-            if not ρ780:
+            if not ReflectanceCorrections.grid(wavelength)[780].any():
                 print("Error: NIR wavebands unavailable")
                 if os.environ["HYPERINSPACE_CMD"].lower() == 'false':
                     QtWidgets.QMessageBox.critical("Error", "NIR wavebands unavailable")
-            ρ2 = sp.interpolate.interp1d(x,ρ780)(780)
-            F02 = sp.interpolate.interp1d(wavelength,F0)(780)
-            ρ870 = []
-            x = []
-            for k in ρSlice:
-                if k in ('Datetime', 'Datetag', 'Timetag2'):
-                    continue
-                if float(k) >= 850 and float(k) <= 890:
-                    x.append(float(k))
-                    ρ870.append(ρSlice[k][-1])
-            if not ρ870:
-                Utilities.writeLogFileAndPrint('No data found at 870 nm')
-                ρ3 = None
-                F03 = None
-            else:
-                ρ3 = sp.interpolate.interp1d(x,ρ870)(870)
-                F03 = sp.interpolate.interp1d(wavelength,F0)(870)
-
-            # Reverts to primary mode even on threshold trip in cases where no 870nm available
-            if ρ1 < threshold or not ρ870:
-                ε = (α1*ρ2 - ρ1)/(α1-1)
-                εnLw = (α1*ρ2*F02 - ρ1*F01)/(α1-1)
-                Utilities.writeLogFileAndPrint(f'offset(rrs) = {ε}; offset(nLw) = {εnLw}')
-            else:
+
+            # Retrieve TSIS-1s
+            rrsNIRCorr, nLwNIRCorr, tripped, bad = ReflectanceCorrections.simSpecNIR(
+                rrs, wavelength, list(F0.values()), [float(key) for key in F0.keys()])
+            if tripped.any():
                 Utilities.writeLogFileAndPrint("SimSpec threshold tripped. Using 780/870 instead.")
-                ε = (α2*ρ3 - ρ2)/(α2-1)
-                εnLw = (α2*ρ3*F03 - ρ2*F02)/(α2-1)
-                Utilities.writeLogFileAndPrint(f'offset(rrs) = {ε}; offset(nLw) = {εnLw}')
-
-            rrsNIRCorr = ε/np.pi
-            nLwNIRCorr = εnLw/np.pi
-
-            # Now apply to rrs and nLw
-            # NOTE: This correction is also susceptible to a correction that ADDS to reflectance
-            #   spectrally, depending on spectral shape (see test_SimSpec.m).
-            #   This is most likely in blue, non-turbid waters not intended for SimSpec.
-            #   Revert to NIR correction of 0 when this happens. No good way to update the L2 attribute
-            #   metadata because it may only be on some ensembles within a file.
-            if rrsNIRCorr < 0:
-                Utilities.writeLogFileAndPrint('Bad NIR Correction. Revert to No NIR correction.')
-                rrsNIRCorr = 0
-                nLwNIRCorr = 0
+            if bad.any():
                 # L2 metadata will be updated
+                Utilities.writeLogFileAndPrint('Bad NIR Correction. Revert to No NIR correction.')
+            Utilities.writeLogFileAndPrint(f'offset(rrs) = {rrsNIRCorr[0]*np.pi}; offset(nLw) = {nLwNIRCorr[0]*np.pi}')
 
-            for k in rrsSlice:
-                if (k == 'Datetime') or (k == 'Datetag') or (k == 'Timetag2'):
-                    continue
-
-                rrsSlice[k][-1] -= float(rrsNIRCorr) # Only working on the last (most recent' [-1]) element of the slice
-                nLwSlice[k][-1] -= float(nLwNIRCorr)
-
-
-            nirSlice['NIR_offset'].append(rrsNIRCorr)
-            nirnLwSlice['NIR_offset'].append(nLwNIRCorr)
-
-        newRrsData.columnsToDataset()
-        newnLwData.columnsToDataset()
-        newRrsUNCData.columnsToDataset()
-        newnLwUNCData.columnsToDataset()
-        newNIRData.columnsToDataset()
-        newNIRnLwData.columnsToDataset()
+        # Now apply to rrs and nLw
+        ReflectanceCorrections.subtract(rrs, rrsNIRCorr)
+        ReflectanceCorrections.subtract(nLw, nLwNIRCorr)
+        output.get('REFLECTANCE', f'nir_{sensor}')['NIR_offset'][-1] = rrsNIRCorr[0]
+        output.get('REFLECTANCE', f'nir_nLw_{sensor}')['NIR_offset'][-1] = nLwNIRCorr[0]
 
-        return rrsNIRCorr, nLwNIRCorr
+        return rrsNIRCorr[0], nLwNIRCorr[0]
 
 
     @staticmethod
-    def spectralReflectance(node, sensor, timeObj, xSlice, F0, F0_unc, rhoScalar, rhoVec, waveSubset, xUNC):
-        ''' The slices, stds, F0, rhoVec here are sensor-waveband specific '''
+    def spectralReflectance(output, sensor, timeObj, xSlice, F0, F0_unc, rhoScalar, rhoVec, waveSubset, xUNC):
+        ''' The slices, stds, F0, rhoVec here are sensor-waveband specific. Adds this ensemble's row
+            to each output dataset of the sensor in output (L2Accumulator) '''
         esXSlice = xSlice['es'] # mean
         esXmedian = xSlice['esMedian']
         esXRemaining = xSlice['esRemaining']
@@ -249,384 +105,124 @@ class ProcessL2:
         ltXmedian = xSlice['ltMedian']
         ltXRemaining = xSlice['ltRemaining']
         ltXstd = xSlice['ltSTD']
-        dateTime = timeObj['dateTime']
-        dateTag = timeObj['dateTag']
-        timeTag = timeObj['timeTag']
 
         threeCRho = int(ConfigFile.settings["bL23CRho"])
         ZhangRho = int(ConfigFile.settings["bL2ZhangRho"])
 
-        # Root (new/output) groups:
-        newReflectanceGroup = node.getGroup("REFLECTANCE")
-        newRadianceGroup = node.getGroup("RADIANCE")
-        newIrradianceGroup = node.getGroup("IRRADIANCE")
-
-        newRhoHyper, newRhoUNCHyper, newNIRnLwData, newNIRData, nLw = None, None, None, None, None
-
-        # If this is the first ensemble spectrum, set up the new datasets
-        if not f'Rrs_{sensor}' in newReflectanceGroup.datasets:
-            newESData = newIrradianceGroup.addDataset(f"ES_{sensor}")
-            newLIData = newRadianceGroup.addDataset(f"LI_{sensor}")
-            newLTData = newRadianceGroup.addDataset(f"LT_{sensor}")
-            newLWData = newRadianceGroup.addDataset(f"LW_{sensor}")
-
-            newESDataMedian = newIrradianceGroup.addDataset(f"ES_{sensor}_median")
-            newLIDataMedian = newRadianceGroup.addDataset(f"LI_{sensor}_median")
-            newLTDataMedian = newRadianceGroup.addDataset(f"LT_{sensor}_median")
-
-            newRrsData = newReflectanceGroup.addDataset(f"Rrs_{sensor}")
-            newRrsUncorrData = newReflectanceGroup.addDataset(f"Rrs_{sensor}_uncorr") # Preserve uncorrected Rrs (= lt/es)
-            newnLwData = newReflectanceGroup.addDataset(f"nLw_{sensor}")
-
-            # September 2023. For clarity, drop the "Delta" nominclature in favor of
-            # either STD (standard deviation of the sample) or UNC (uncertainty)
-            newESSTDData = newIrradianceGroup.addDataset(f"ES_{sensor}_sd")
-            newLISTDData = newRadianceGroup.addDataset(f"LI_{sensor}_sd")
-            newLTSTDData = newRadianceGroup.addDataset(f"LT_{sensor}_sd")
-
-            # No average (mean or median) or standard deviation values associated with Lw or reflectances,
-            #   because these are calculated from the means of Lt, Li, Es
-      
-            newESUNCData = newIrradianceGroup.addDataset(f"ES_{sensor}_unc")
-            newLIUNCData = newRadianceGroup.addDataset(f"LI_{sensor}_unc")
-            newLTUNCData = newRadianceGroup.addDataset(f"LT_{sensor}_unc")
-            newLWUNCData = newRadianceGroup.addDataset(f"LW_{sensor}_unc")
-            newRrsUNCData = newReflectanceGroup.addDataset(f"Rrs_{sensor}_unc")
-            newnLwUNCData = newReflectanceGroup.addDataset(f"nLw_{sensor}_unc")
-
-            # Add standard deviation datasets for comparison
-            newLWSTDData = newRadianceGroup.addDataset(f"LW_{sensor}_sd")
-            newRrsSTDData = newReflectanceGroup.addDataset(f"Rrs_{sensor}_sd")
-            newnLwSTDData = newReflectanceGroup.addDataset(f"nLw_{sensor}_sd")
+        # Wavebands of waveSubset found in all of es, li and lt. Compared as floats, which is more
+        #   robust (able to handle sensor and hyper bands; old version had issues with '.0')
+        common = set(float(x) for x in esXSlice) & set(float(x) for x in liXSlice) & set(float(x) for x in ltXSlice)
+        iBands = [i for i, wvl in enumerate(waveSubset) if wvl in common]
+        keys = [str(waveSubset[i]) for i in iBands]
 
-            # For CV, use CV = STD/n
+        def _band(xDict):
+            return np.array([xDict[k][0] for k in keys], dtype=np.float64) # Always the zeroth element
 
-            if sensor == 'HYPER':
-                newRhoHyper = newReflectanceGroup.addDataset(f"rho_{sensor}")
-                newRhoUNCHyper = newReflectanceGroup.addDataset(f"rho_{sensor}_unc")
-                if ConfigFile.settings["bL2PerformNIRCorrection"]:
-                    newNIRData = newReflectanceGroup.addDataset(f'nir_{sensor}')
-                    newNIRnLwData = newReflectanceGroup.addDataset(f'nir_nLw_{sensor}')
-        else:
-            newESData = newIrradianceGroup.getDataset(f"ES_{sensor}")
-            newLIData = newRadianceGroup.getDataset(f"LI_{sensor}")
-            newLTData = newRadianceGroup.getDataset(f"LT_{sensor}")
-            newLWData = newRadianceGroup.getDataset(f"LW_{sensor}")
-
-            newESDataMedian = newIrradianceGroup.getDataset(f"ES_{sensor}_median")
-            newLIDataMedian = newRadianceGroup.getDataset(f"LI_{sensor}_median")
-            newLTDataMedian = newRadianceGroup.getDataset(f"LT_{sensor}_median")
-
-            newRrsData = newReflectanceGroup.getDataset(f"Rrs_{sensor}")
-            newRrsUncorrData = newReflectanceGroup.getDataset(f"Rrs_{sensor}_uncorr")
-            newnLwData = newReflectanceGroup.getDataset(f"nLw_{sensor}")
-
-            newESSTDData = newIrradianceGroup.getDataset(f"ES_{sensor}_sd")
-            newLISTDData = newRadianceGroup.getDataset(f"LI_{sensor}_sd")
-            newLTSTDData = newRadianceGroup.getDataset(f"LT_{sensor}_sd")
-
-            # No average (mean or median) or standard deviation values associated with Lw or reflectances,
-            #   because these are calculated from the means of Lt, Li, Es
-      
-            newESUNCData = newIrradianceGroup.getDataset(f"ES_{sensor}_unc")
-            newLIUNCData = newRadianceGroup.getDataset(f"LI_{sensor}_unc")
-            newLTUNCData = newRadianceGroup.getDataset(f"LT_{sensor}_unc")
-            newLWUNCData = newRadianceGroup.getDataset(f"LW_{sensor}_unc")
-            newRrsUNCData = newReflectanceGroup.getDataset(f"Rrs_{sensor}_unc")
-            newnLwUNCData = newReflectanceGroup.getDataset(f"nLw_{sensor}_unc")
-
-            newLWSTDData = newRadianceGroup.getDataset(f"LW_{sensor}_sd")
-            newRrsSTDData = newReflectanceGroup.getDataset(f"Rrs_{sensor}_sd")
-            newnLwSTDData = newReflectanceGroup.getDataset(f"nLw_{sensor}_sd")
+        def _remaining(xDict):
+            # (remaining ensemble values x band)
+            return np.column_stack([np.asarray(xDict[k], dtype=np.float64) for k in keys])
 
-            if sensor == 'HYPER':
-                newRhoHyper = newReflectanceGroup.getDataset(f"rho_{sensor}")
-                newRhoUNCHyper = newReflectanceGroup.getDataset(f"rho_{sensor}_unc")
-                if ConfigFile.settings["bL2PerformNIRCorrection"]:
-                    newNIRData = newReflectanceGroup.getDataset(f'nir_{sensor}')
-                    newNIRnLwData = newReflectanceGroup.addDataset(f'nir_nLw_{sensor}')
-
-        # Add datetime stamps back onto ALL datasets associated with the current sensor
-        # If this is the first spectrum, add date/time, otherwise append
-        # Groups REFLECTANCE, IRRADIANCE, and RADIANCE are intiallized with empty datasets, but
-        # ANCILLARY is not.
-        if "Datetag" not in newRrsData.columns:
-            for gp in node.groups:
-                if gp.id == "ANCILLARY": # Ancillary is already populated. The other groups only have empty (named) datasets
-                    continue
-                else:
-                    for ds in gp.datasets:
-                        if sensor in ds: # Only add datetime stamps to the current sensor datasets
-                            gp.datasets[ds].columns["Datetime"] = [dateTime] # mean of the ensemble datetime stamp
-                            gp.datasets[ds].columns["Datetag"] = [dateTag]
-                            gp.datasets[ds].columns["Timetag2"] = [timeTag]
-        else:
-            for gp in node.groups:
-                if gp.id == "ANCILLARY":
-                    continue
-                else:
-                    for ds in gp.datasets:
-                        if sensor in ds:
-                            gp.datasets[ds].columns["Datetime"].append(dateTime)
-                            gp.datasets[ds].columns["Datetag"].append(dateTag)
-                            gp.datasets[ds].columns["Timetag2"].append(timeTag)
+        es, li, lt = _band(esXSlice), _band(liXSlice), _band(ltXSlice)
+        f0 = np.array([F0[k] for k in keys], dtype=np.float64)
+        f0UNC = np.array([F0_unc[k] for k in keys], dtype=np.float64)
 
         # Organise Uncertainty into wavebands
-        lwUNC = {}
-        rrsUNC = {}
-        rhoUNC = {}
-        esUNC = {}
-        liUNC = {}
-        ltUNC = {}
-
         # Only Factory - Trios has no uncertainty here
         if ConfigFile.settings['fL1bCal'] >= 2 or ConfigFile.settings['SensorType'].lower() == 'seabird':
             #or ConfigFile.settings['SensorType'].lower() == 'dalec':
-            esUNC = xUNC[f'esUNC_{sensor}']  # should already be convolved to hyperspec
-            liUNC = xUNC[f'liUNC_{sensor}']  # added reference to HYPER as band convolved uncertainties will no longer
-            ltUNC = xUNC[f'ltUNC_{sensor}']  # overwite normal instrument uncertainties during processing
-            rhoUNC = xUNC[f'rhoUNC_{sensor}']
-            for i, wvl in enumerate(waveSubset):
-                k = str(wvl)
-                if (any([wvl == float(x) for x in esXSlice]) and
-                        any([wvl == float(x) for x in liXSlice]) and
-                        any([wvl == float(x) for x in ltXSlice])):  # More robust (able to handle sensor and hyper bands
-                    if sensor == 'HYPER':
-                        lwUNC[k] = xUNC['lwUNC'][i]
-                        rrsUNC[k] = xUNC['rrsUNC'][i]
-                    else:  # apply the sensor specific Lw and Rrs uncertainties
-                        lwUNC[k] = xUNC[f'lwUNC_{sensor}'][i]
-                        rrsUNC[k] = xUNC[f'rrsUNC_{sensor}'][i]
-            #print(sensor+" rrsUNC")
-            #print(rrsUNC)
+            esUNC = _band(xUNC[f'esUNC_{sensor}'])  # should already be convolved to hyperspec
+            liUNC = _band(xUNC[f'liUNC_{sensor}'])  # added reference to HYPER as band convolved uncertainties will no longer
+            ltUNC = _band(xUNC[f'ltUNC_{sensor}'])  # overwite normal instrument uncertainties during processing
+            if sensor == 'HYPER':
+                lwUNC = np.array([xUNC['lwUNC'][i] for i in iBands], dtype=np.float64)
+                rrsUNC = np.array([xUNC['rrsUNC'][i] for i in iBands], dtype=np.float64)
+            else:  # apply the sensor specific Lw and Rrs uncertainties
+                lwUNC = np.array([xUNC[f'lwUNC_{sensor}'][i] for i in iBands], dtype=np.float64)
+                rrsUNC = np.array([xUNC[f'rrsUNC_{sensor}'][i] for i in iBands], dtype=np.float64)
         else:
             # factory case
-            for wvl in waveSubset:
-                k = str(wvl)
-                if (any([wvl == float(x) for x in esXSlice]) and
-                        any([wvl == float(x) for x in liXSlice]) and
-                        any([wvl == float(x) for x in ltXSlice])):  # old version had issues with '.0'
-                    esUNC[k] = 0
-                    liUNC[k] = 0
-                    ltUNC[k] = 0
-                    rhoUNC[k] = 0
-                    lwUNC[k] = 0
-                    rrsUNC[k] = 0
-
-        deleteKey = []
-        for i, wvl in enumerate(waveSubset):  # loop through wavebands
-            k = str(wvl)
-            if (any(wvl == float(x) for x in esXSlice) and
-                    any(wvl == float(x) for x in liXSlice) and
-                    any(wvl == float(x) for x in ltXSlice)):
-                # Initialize the new dataset if this is the first slice
-                if k not in newESData.columns:
-                    newESData.columns[k] = []
-                    newLIData.columns[k] = []
-                    newLTData.columns[k] = []
-                    newLWData.columns[k] = []
-                    newRrsData.columns[k] = []
-                    newRrsUncorrData.columns[k] = []
-                    newnLwData.columns[k] = []
-
-                    # No average (mean or median) or standard deviation values associated with Lw or reflectances,
-                    #   because these are calculated from the means of Lt, Li, Es
-                    newESDataMedian.columns[k] = []
-                    newLIDataMedian.columns[k] = []
-                    newLTDataMedian.columns[k] = []
-
-                    newESSTDData.columns[k] = []
-                    newLISTDData.columns[k] = []
-                    newLTSTDData.columns[k] = []
-                    newESUNCData.columns[k] = []
-                    newLIUNCData.columns[k] = []
-                    newLTUNCData.columns[k] = []
-                    newLWUNCData.columns[k] = []
-                    newRrsUNCData.columns[k] = []
-                    newnLwUNCData.columns[k] = []
-
-                    newLWSTDData.columns[k] = []
-                    newRrsSTDData.columns[k] = []
-                    newnLwSTDData.columns[k] = []
-
-                    if sensor == 'HYPER':
-                        newRhoHyper.columns[k] = []
-                        newRhoUNCHyper.columns[k] = []
-                        if ConfigFile.settings["bL2PerformNIRCorrection"]:
-                            newNIRData.columns['NIR_offset'] = [] # not used until later; highly unpythonic
-                            newNIRnLwData.columns['NIR_offset'] = []
-
-                # At this waveband (k); still using complete wavelength set
-                es = esXSlice[k][0] # Always the zeroth element; i.e. XSlice data are independent of past slices and node
-                li = liXSlice[k][0]
-                lt = ltXSlice[k][0]
-                esRemaining = np.asarray(esXRemaining[k]) # array of remaining ensemble values in this band
-                liRemaining = np.asarray(liXRemaining[k])
-                ltRemaining = np.asarray(ltXRemaining[k])
-                f0 = F0[k]
-                f0UNC = F0_unc[k]
-
-                esMedian = esXmedian[k][0]
-                liMedian = liXmedian[k][0]
-                ltMedian = ltXmedian[k][0]
-
-                esSTD = esXstd[k][0]
-                liSTD = liXstd[k][0]
-                ltSTD = ltXstd[k][0]
-
-                # Calculate the remote sensing reflectance
-                nLwUNC = {}
-                lwRemainingSD = 0
-                rrsRemainingSD = 0
-                nLwRemainingSD = 0
-                if threeCRho:
-                    lw = lt - (rhoScalar * li)
-                    rrs = lw / es
-                    nLw = rrs*f0
-
-                    # Now calculate the std for lw, rrs
-                    lwRemaining = ltRemaining - (rhoScalar * liRemaining)
-                    rrsRemaining = lwRemaining / esRemaining
-                    lwRemainingSD = np.std(lwRemaining)
-                    rrsRemainingSD = np.std(rrsRemaining)
-                    nLwRemainingSD = np.std(rrsRemaining*f0)
-
-                elif ZhangRho:
-                    # Only populate the valid wavelengths
-                    if float(k) in waveSubset:
-                        lw = lt - (rhoVec[k] * li)
-                        rrs = lw / es
-                        nLw = rrs*f0
-
-                        # Now calculate the std for lw, rrs
-                        lwRemaining = ltRemaining - (rhoVec[k] * liRemaining)
-                        rrsRemaining = lwRemaining / esRemaining
-                        lwRemainingSD = np.std(lwRemaining)
-                        rrsRemainingSD = np.std(rrsRemaining)
-                        nLwRemainingSD = np.std(rrsRemaining*f0)
+            esUNC = liUNC = ltUNC = lwUNC = rrsUNC = np.zeros(len(keys))
 
-                else:
-                    lw = lt - (rhoScalar * li)
-                    rrs = lw / es
-                    nLw = rrs*f0
-
-                    # Now calculate the std for lw, rrs
-                    lwRemaining = ltRemaining - (rhoScalar * liRemaining)
-                    rrsRemaining = lwRemaining / esRemaining
-                    lwRemainingSD = np.std(lwRemaining)
-                    rrsRemainingSD = np.std(rrsRemaining)
-                    nLwRemainingSD = np.std(rrsRemaining*f0)
-
-                # nLw uncertainty;
-                nLwUNC[k] = np.power((rrsUNC[k]**2)*(f0**2) + (rrs**2)*(f0UNC**2), 0.5)
-
-                newESData.columns[k].append(es)
-                newLIData.columns[k].append(li)
-                newLTData.columns[k].append(lt)
-
-                rrs_uncorr = lt / es
-
-                newESSTDData.columns[k].append(esSTD)
-                newLISTDData.columns[k].append(liSTD)
-                newLTSTDData.columns[k].append(ltSTD)
-
-                newLWSTDData.columns[k].append(lwRemainingSD)
-                newRrsSTDData.columns[k].append(rrsRemainingSD)
-                newnLwSTDData.columns[k].append(nLwRemainingSD)
-
-                newESDataMedian.columns[k].append(esMedian)
-                newLIDataMedian.columns[k].append(liMedian)
-                newLTDataMedian.columns[k].append(ltMedian)
-
-                # Only populate valid wavelengths. Mark others for deletion
-                if float(k) in waveSubset:  # should be redundant!
-                    newRrsUncorrData.columns[k].append(rrs_uncorr)
-                    newLWData.columns[k].append(lw)
-                    newRrsData.columns[k].append(rrs)
-                    newnLwData.columns[k].append(nLw)
-
-                    newLWUNCData.columns[k].append(lwUNC[k])
-                    newRrsUNCData.columns[k].append(rrsUNC[k])
-                    # newnLwUNCData.columns[k].append(nLwUNC)
-                    newnLwUNCData.columns[k].append(nLwUNC[k])
-                    if ConfigFile.settings['fL1bCal']==1 and ((ConfigFile.settings['SensorType'].lower() == 'trios' or\
-                                                                ConfigFile.settings['SensorType'].lower() == 'sorad') or \
-                                                              ConfigFile.settings['SensorType'].lower() == 'dalec'):
-                    # Specifique case for Factory-Trios and Dalec
-                        newESUNCData.columns[k].append(esUNC[k])
-                        newLIUNCData.columns[k].append(liUNC[k])
-                        newLTUNCData.columns[k].append(ltUNC[k])
-                    else:
-                        newESUNCData.columns[k].append(esUNC[k][0])
-                        newLIUNCData.columns[k].append(liUNC[k][0])
-                        newLTUNCData.columns[k].append(ltUNC[k][0])
-
-                    if sensor == 'HYPER':
-                        if ZhangRho:
-                            newRhoHyper.columns[k].append(rhoVec[k])
-                            if xUNC is not None:  # TriOS factory does not require uncertainties
-                                newRhoUNCHyper.columns[k].append(xUNC[f'rhoUNC_{sensor}'][k])
-                            else:
-                                newRhoUNCHyper.columns[k].append(np.nan)
-                        else:
-                            newRhoHyper.columns[k].append(rhoScalar)
-                            if xUNC is not None:  # perhaps there is a better check for TriOS Factory branch?
-                                try:
-                                    # TODO: explore why rho UNC is 1 index smaller than everything else
-                                    # last wvl is missing
-                                    newRhoUNCHyper.columns[k].append(xUNC[f'rhoUNC_{sensor}'][k])
-                                except KeyError:
-                                    newRhoUNCHyper.columns[k].append(0)
-                            else:
-                                newRhoUNCHyper.columns[k].append(np.nan)
-                else:
-                    deleteKey.append(k)
-
-        # Eliminate reflectance keys/values in wavebands outside of valid set for the sake of Zhang model
-        deleteKey = list(set(deleteKey))
-        for key in deleteKey:
-            # Only need to do this for the first ensemble in file
-            if key in newRrsData.columns:
-                del newLWData.columns[key]
-                del newRrsUncorrData.columns[key]
-                del newRrsData.columns[key]
-                del newnLwData.columns[key]
-
-                del newLWUNCData.columns[key]
-                del newRrsUNCData.columns[key]
-                del newnLwUNCData.columns[key]
-                if sensor == 'HYPER':
-                    del newRhoHyper.columns[key]
-
-        newESData.columnsToDataset()
-        newLIData.columnsToDataset()
-        newLTData.columnsToDataset()
-        newLWData.columnsToDataset()
-        newRrsUncorrData.columnsToDataset()
-        newRrsData.columnsToDataset()
-        newnLwData.columnsToDataset()
-
-        newESDataMedian.columnsToDataset()
-        newLIDataMedian.columnsToDataset()
-        newLTDataMedian.columnsToDataset()
-
-        newESSTDData.columnsToDataset()
-        newLISTDData.columnsToDataset()
-        newLTSTDData.columnsToDataset()
-        newLWSTDData.columnsToDataset()
-        newRrsSTDData.columnsToDataset()
-        newnLwSTDData.columnsToDataset()
-        newESUNCData.columnsToDataset()
-        newLIUNCData.columnsToDataset()
-        newLTUNCData.columnsToDataset()
-        newLWUNCData.columnsToDataset()
-        newRrsUNCData.columnsToDataset()
-        newnLwUNCData.columnsToDataset()
+        # Calculate the remote sensing reflectance
+        if not threeCRho and ZhangRho:
+            rho = np.array([rhoVec[k] for k in keys], dtype=np.float64)
+        else:
+            rho = rhoScalar
+        lw = lt - (rho * li)
+        rrs = lw / es
+        nLw = rrs*f0
+        rrs_uncorr = lt / es
+
+        # Now calculate the std for lw, rrs from the remaining spectra of the ensemble
+        lwRemaining = _remaining(ltXRemaining) - (rho * _remaining(liXRemaining))
+        rrsRemaining = lwRemaining / _remaining(esXRemaining)
+        lwRemainingSD = np.std(lwRemaining, axis=0)
+        rrsRemainingSD = np.std(rrsRemaining, axis=0)
+        nLwRemainingSD = np.std(rrsRemaining*f0, axis=0)
+
+        # nLw uncertainty;
+        nLwUNC = np.power((rrsUNC**2)*(f0**2) + (rrs**2)*(f0UNC**2), 0.5)
+
+        # Rows of this ensemble, by (group, dataset). On the first ensemble the datasets are set up in this order.
+        # September 2023. For clarity, drop the "Delta" nominclature in favor of
+        # either STD (standard deviation of the sample) or UNC (uncertainty)
+        # No average (mean or median) or standard deviation values associated with Lw or reflectances,
+        #   because these are calculated from the means of Lt, Li, Es
+        rows = [
+            ('IRRADIANCE', f'ES_{sensor}', es),
+            ('RADIANCE', f'LI_{sensor}', li),
+            ('RADIANCE', f'LT_{sensor}', lt),
+            ('RADIANCE', f'LW_{sensor}', lw),
+            ('IRRADIANCE', f'ES_{sensor}_median', _band(esXmedian)),
+            ('RADIANCE', f'LI_{sensor}_median', _band(liXmedian)),
+            ('RADIANCE', f'LT_{sensor}_median', _band(ltXmedian)),
+            ('REFLECTANCE', f'Rrs_{sensor}', rrs),
+            ('REFLECTANCE', f'Rrs_{sensor}_uncorr', rrs_uncorr), # Preserve uncorrected Rrs (= lt/es)
+            ('REFLECTANCE', f'nLw_{sensor}', nLw),
+            ('IRRADIANCE', f'ES_{sensor}_sd', _band(esXstd)),
+            ('RADIANCE', f'LI_{sensor}_sd', _band(liXstd)),
+            ('RADIANCE', f'LT_{sensor}_sd', _band(ltXstd)),
+            ('IRRADIANCE', f'ES_{sensor}_unc', esUNC),
+            ('RADIANCE', f'LI_{sensor}_unc', liUNC),
+            ('RADIANCE', f'LT_{sensor}_unc', ltUNC),
+            ('RADIANCE', f'LW_{sensor}_unc', lwUNC),
+            ('REFLECTANCE', f'Rrs_{sensor}_unc', rrsUNC),
+            ('REFLECTANCE', f'nLw_{sensor}_unc', nLwUNC),
+            # Add standard deviation datasets for comparison
+            ('RADIANCE', f'LW_{sensor}_sd', lwRemainingSD),
+            ('REFLECTANCE', f'Rrs_{sensor}_sd', rrsRemainingSD),
+            ('REFLECTANCE', f'nLw_{sensor}_sd', nLwRemainingSD),
+            ]
 
         if sensor == 'HYPER':
-            newRhoHyper.columnsToDataset()
-            newRhoUNCHyper.columnsToDataset()
-            newRrsUncorrData.columnsToDataset()
+            if ZhangRho:
+                rhoRow = np.array([rhoVec[k] for k in keys], dtype=np.float64)
+            else:
+                rhoRow = np.full(len(keys), rhoScalar)
+            rhoUNCRow = np.full(len(keys), np.nan) # TriOS factory does not require uncertainties
+            if xUNC is not None:
+                for j, k in enumerate(keys):
+                    if ZhangRho:
+                        rhoUNCRow[j] = xUNC[f'rhoUNC_{sensor}'][k]
+                    else:
+                        try:
+                            # TODO: explore why rho UNC is 1 index smaller than everything else
+                            # last wvl is missing
+                            rhoUNCRow[j] = xUNC[f'rhoUNC_{sensor}'][k]
+                        except KeyError:
+                            rhoUNCRow[j] = 0
+            rows.append(('REFLECTANCE', f'rho_{sensor}', rhoRow))
+            rows.append(('REFLECTANCE', f'rho_{sensor}_unc', rhoUNCRow))
+
+        for groupID, name, values in rows:
+            dsRows = output.rows(groupID, name, keys)
+            dsRows.newRow(timeObj)[:] = values
+
+        # NIR offsets are filled in by nirCorrection
+        if sensor == 'HYPER' and ConfigFile.settings["bL2PerformNIRCorrection"]:
+            for name in [f'nir_{sensor}', f'nir_nLw_{sensor}']:
+                dsRows = output.rows('REFLECTANCE', name, ['NIR_offset'])
+                dsRows.newRow(timeObj)
 
 
     @staticmethod
@@ -704,35 +300,9 @@ class ProcessL2:
     @staticmethod
     def interpolateColumn(columns, wl):
         ''' Interpolate wavebands to estimate a single, unsampled waveband '''
-        #print("interpolateColumn")
-        # Values to return
-        return_y = []
-
-        # Column to interpolate to
-        new_x = [wl]
-
-        # Get wavelength values
-        wavelength = []
-        for k in columns:
-            #print(k)
-            wavelength.append(float(k))
-        x = np.asarray(wavelength)
-
-        # get the length of a column
-        num = len(list(columns.values())[0])
-
-        # Perform interpolation for each row
-        for i in range(num):
-            values = []
-            for k in columns:
-                #print("b")
-                values.append(columns[k][i])
-            y = np.asarray(values)
-
-            new_y = sp.interpolate.interp1d(x, y)(new_x)
-            return_y.append(new_y[0])
-
-        return return_y
+        wavelength = np.asarray([float(k) for k in columns])
+        block = np.column_stack([np.asarray(columns[k], dtype=np.float64) for k in columns])
+        return EnsembleView.interpolate(block, wavelength, wl).tolist()
 
 
     @staticmethod
@@ -743,51 +313,21 @@ class ProcessL2:
             VIS = [400,700]
 
         reflData = reflGroup.getDataset(field)
-        # reflData.datasetToColumns()
         reflColumns = reflData.columns
-        reflDate = reflColumns.pop('Datetag')
-        reflTime = reflColumns.pop('Timetag2')
-        # reflColumns.pop('Datetag')
-        # reflColumns.pop('Timetag2')
-        timeStamp = reflColumns.pop('Datetime')
-
-        badTimes = []
-        for indx, timeTag in enumerate(timeStamp):
-            # If any spectra in the vis are negative, delete the whole spectrum
-            reflVIS = []
-            wavelengths = []
-            for wave in reflColumns:
-                wavelengths.append(float(wave))
-                if float(wave) > VIS[0] and float(wave) < VIS[1]:
-                    reflVIS.append(reflColumns[wave][indx])
-                # elif float(wave) > NIR[0] and float(wave) < NIR[1]:
-                #     ltNIR.append(ltColumns[wave][indx])
-
-            # Flag entire record for removal
-            if any(item < 0 for item in reflVIS):
-                badTimes.append(timeTag)
-
-            # Set negatives to 0
-            NIR = [VIS[-1]+1,max(wavelengths)]
-            UV = [min(wavelengths),VIS[0]-1]
-            for wave in reflColumns:
-                if ((float(wave) >= UV[0] and float(wave) < UV[1]) or \
-                            (float(wave) >= NIR[0] and float(wave) <= NIR[1])) and \
-                            reflColumns[wave][indx] < 0:
-                    reflColumns[wave][indx] = 0
-
-        badTimes = np.unique(badTimes)
+        timeStamp = reflColumns['Datetime']
+        wavebands = [k for k in reflColumns if k not in ('Datetime', 'Datetag', 'Timetag2')]
+
+        # If any spectra in the vis are negative, flag the whole spectrum (record) for removal.
+        # Elsewhere, set negatives to 0
+        refl = np.column_stack([np.asarray(reflColumns[k], dtype=np.float64) for k in wavebands])
+        bad = ReflectanceCorrections.negative(refl, [float(k) for k in wavebands], VIS)
+        for i, k in enumerate(wavebands):
+            reflColumns[k] = refl[:, i].tolist()
+
+        badTimes = np.unique(np.asarray(timeStamp, dtype=object)[bad])
         badTimes = np.rot90(np.matlib.repmat(badTimes,2,1), 3) # Duplicates each element to a list of two elements (start, stop)
         Utilities.writeLogFileAndPrint(f'{len(np.unique(badTimes))/len(timeStamp)*100:.1f}% of {field} spectra flagged')
 
-        # # Need to add these at the beginning of the ODict
-        reflColumns['Timetag2'] = reflTime
-        reflColumns['Datetag'] = reflDate
-        reflColumns['Datetime'] = timeStamp
-        reflColumns.move_to_end('Timetag2', last=False)
-        reflColumns.move_to_end('Datetag', last=False)
-        reflColumns.move_to_end('Datetime', last=False)
-
         reflData.columnsToDataset()
 
         if len(badTimes) == 0:
@@ -813,31 +353,35 @@ class ProcessL2:
     @staticmethod
     def sliceAveHyper(y, hyperSlice):
         ''' Take the slice mean of the lowest X% of hyperspectral slices '''
-        xSlice = collections.OrderedDict()
-        xSliceRemaining = collections.OrderedDict()
-        xMedian = collections.OrderedDict()
-        hasNan = False
+        # (time x band) values of the lowest X% within the interval window
+        if isinstance(hyperSlice, EnsembleSlice):
+            block = hyperSlice.block[y]
+        else:
+            block = np.column_stack([np.asarray(v, dtype=np.float64) for v in hyperSlice.values()])[y]
+
         # Ignore runtime warnings when array is all NaNs
         with warnings.catch_warnings():
             warnings.simplefilter("ignore", category=RuntimeWarning)
-            for k in hyperSlice: # each k is a time series at a waveband.
-                v = [hyperSlice[k][i] for i in y] # selects the lowest 5% within the interval window...
-                mean = np.nanmean(v) # ... and averages them
-                median = np.nanmedian(v) # ... and the median spectrum
-                xSlice[k] = [mean]
-                xMedian[k] = [median]
-                if np.isnan(mean):
-                    hasNan = True
-
-                # Retain remaining spectra for use in calculating Rrs_sd
-                xSliceRemaining[k] = v
+            mean = np.nanmean(block, axis=0) # ... averages them
+            median = np.nanmedian(block, axis=0) # ... and the median spectrum
+        hasNan = bool(np.isnan(mean).any())
+
+        xSlice = collections.OrderedDict()
+        xSliceRemaining = collections.OrderedDict()
+        xMedian = collections.OrderedDict()
+        for i, k in enumerate(hyperSlice): # each k is a time series at a waveband.
+            xSlice[k] = [mean[i]]
+            xMedian[k] = [median[i]]
+            # Retain remaining spectra for use in calculating Rrs_sd
+            xSliceRemaining[k] = block[:, i]
 
         return hasNan, xSlice, xMedian, xSliceRemaining
 
 
     @staticmethod
-    def sliceAveOther(node, start, end, y, ancGroup, sixSGroup):
-        ''' Take the slice AND the mean averages of ancillary and 6S data with X% '''        
+    def sliceAveOther(node, start, end, y, ancGroup, sixSGroup, views=None):
+        ''' Take the slice AND the mean averages of ancillary and 6S data with X%
+            views holds the EnsembleViews of the group datasets, by group id and dataset id '''
 
         def _sliceAveOther(node, start, end, y, group):
             if node.getGroup(group.id):
@@ -845,6 +389,7 @@ class ProcessL2:
             else:
                 newGroup = node.addGroup(group.id)
 
+            dateTime = None
             for dsID in group.datasets:
                 if newGroup.getDataset(dsID):
                     newDS = newGroup.getDataset(dsID)
@@ -852,49 +397,46 @@ class ProcessL2:
                     newDS = newGroup.addDataset(dsID)
                 ds = group.getDataset(dsID)
 
-                # Set relAz to abs(relAz) prior to averaging
-                if dsID == 'REL_AZ':
-                    ds.columns['REL_AZ'] = np.abs(ds.columns['REL_AZ']).tolist()
-
-                ds.datasetToColumns()
-                dsSlice = ProcessL2.columnToSlice(ds.columns,start, end)
-                dsXSlice, date, sliceTime, subDScol = None, None, None, None
-
-                for subDScol in dsSlice: # each dataset contains columns (including date, time, data, and possibly flags)
-                    if subDScol == 'Datetime':
-                        timeStamp = dsSlice[subDScol]
-                        # Stores the mean datetime by converting to (and back from) epoch second
-                        if len(timeStamp) > 0:
-                            epoch = datetime.datetime(1970, 1, 1,tzinfo=datetime.timezone.utc) #Unix zero hour
-                            tsSeconds = []
-                            for dt in timeStamp:
-                                tsSeconds.append((dt-epoch).total_seconds())
-                            meanSec = np.mean(tsSeconds)
-                            dateTime = datetime.datetime.utcfromtimestamp(meanSec).replace(tzinfo=datetime.timezone.utc)
-                            date = Utilities.datetime2DateTag(dateTime)
-                            sliceTime = Utilities.datetime2TimeTag2(dateTime)
-                    if subDScol not in ('Datetime', 'Datetag', 'Timetag2'):
-                        v = [dsSlice[subDScol][i] for i in y] # y is an array of indexes for the lowest X%
-
-                        if dsXSlice is None:
-                            dsXSlice = collections.OrderedDict()
-                            dsXSlice['Datetag'] = [date]
-                            dsXSlice['Timetag2'] = [sliceTime]
-                            dsXSlice['Datetime'] = [dateTime]
-
-                        if subDScol not in dsXSlice:
-                            dsXSlice[subDScol] = []
-                        if (subDScol.endswith('FLAG')) or (subDScol.endswith('STATION')):
-                            # Find the most frequest element
-                            dsXSlice[subDScol].append(Utilities.mostFrequent(v))
-                        else:
-                            # Otherwise take a nanmean of the slice
-                            with warnings.catch_warnings():
-                                warnings.simplefilter("ignore", category=RuntimeWarning)
-                                dsXSlice[subDScol].append(np.nanmean(v)) # Warns of empty when empty...
+                # NOTE: REL_AZ is averaged as it is stored. The absolute value is taken of the ensemble
+                #   mean in ensemblesReflectance.
+                if views is not None and group.id in views:
+                    view = views[group.id][dsID]
+                else:
+                    view = EnsembleView.fromDataset(ds)
+
+                # Stores the mean datetime
+                date, sliceTime = None, None
+                if view.dateTime is not None:
+                    meanDateTime = view.meanDateTime(start, end)
+                    if meanDateTime is not None:
+                        dateTime = meanDateTime
+                        date = Utilities.datetime2DateTag(dateTime)
+                        sliceTime = Utilities.datetime2TimeTag2(dateTime)
+
+                names = [k for k in view.allNames if k not in EnsembleView.dateColumns]
+                if not names:
+                    continue
+
+                # nanmean of all columns of the lowest X% at once (y is an array of indexes for the lowest X%)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", category=RuntimeWarning)
+                    means = np.nanmean(view.slice(start, end).block[y], axis=0) # Warns of empty when empty...
+                meanIndex = {k: i for i, k in enumerate(view.names)}
+
+                dsXSlice = collections.OrderedDict()
+                dsXSlice['Datetag'] = [date]
+                dsXSlice['Timetag2'] = [sliceTime]
+                dsXSlice['Datetime'] = [dateTime]
+                for subDScol in names: # each dataset contains columns (including date, time, data, and possibly flags)
+                    if subDScol.endswith('FLAG') or subDScol.endswith('STATION') or subDScol not in meanIndex:
+                        # Find the most frequest element
+                        v = np.asarray(view.column(subDScol, start, end))[y].tolist()
+                        dsXSlice[subDScol] = [Utilities.mostFrequent(v)]
+                    else:
+                        dsXSlice[subDScol] = [means[meanIndex[subDScol]]]
 
                 # Just test a sample column to see if it needs adding or appending
-                if subDScol not in newDS.columns:
+                if view.allNames[-1] not in newDS.columns:
                     newDS.columns = dsXSlice
                 else:
                     for item in newDS.columns:
@@ -905,57 +447,33 @@ class ProcessL2:
                 newDS.columns.move_to_end('Datetime', last=False)
                 newDS.columnsToDataset()
 
-        _sliceAveOther(node, start, end, y, ancGroup)        
+        _sliceAveOther(node, start, end, y, ancGroup)
         _sliceAveOther(node, start, end, y, sixSGroup)
 
     @staticmethod
     def ensemblesReflectance(node, sasGroup, refGroup, ancGroup, uncGroup,
                              esRawGroup, liRawGroup, ltRawGroup,
-                             sixSGroup, start, end):
+                             sixSGroup, start, end, views, output):
         '''Calculate the lowest X% Lt(780). Check for Nans in Li, Lt, Es, or wind. Send out for
         meteorological quality flags. Perform glint corrections. Calculate the Rrs. Correct for NIR
-        residuals.'''
+        residuals.
 
-        esData = refGroup.getDataset("ES")
-        liData = sasGroup.getDataset("LI")
-        ltData = sasGroup.getDataset("LT")
+        views holds the EnsembleViews of ES, LI and LT and of the ANCILLARY and SIXS_MODEL datasets,
+        built once per file in stationsEnsemblesReflectance. Results are added to output (L2Accumulator).'''
 
-        # Copy datasets to dictionary
-        esData.datasetToColumns()
-        esColumns = esData.columns
-        liData.datasetToColumns()
-        liColumns = liData.columns
-        ltData.datasetToColumns()
-        ltColumns = ltData.columns
-
-        esSlice = ProcessL2.columnToSlice(esColumns,start, end)
-        liSlice = ProcessL2.columnToSlice(liColumns,start, end)
-        ltSlice = ProcessL2.columnToSlice(ltColumns,start, end)
-        n = len(list(ltSlice.values())[0])
+        # Ensemble rows, without date columns
+        esSlice = views['ES'].slice(start, end)
+        liSlice = views['LI'].slice(start, end)
+        ltSlice = views['LT'].slice(start, end)
+        n = len(ltSlice.block)
 
         # Test for ensemble shorter than 1 minute, which will have too few darks in Lt at L1AQC for uncertainties
-        esStartTime = esSlice['Datetime'][0]
-        esStopTime = esSlice['Datetime'][-1]
+        timeStamp = views['ES'].column('Datetime', start, end)
+        esStartTime = timeStamp[0]
+        esStopTime = timeStamp[-1]
         if (esStopTime - esStartTime) < datetime.timedelta(seconds=60):
             Utilities.writeLogFileAndPrint('ProcessL2.ensemblesReflectance ensemble is less than 1 minute. Skipping.')
             return False
-        #SIXS
-        if sixSGroup is not None:
-            diffuseData = sixSGroup.getDataset("diffuse_ratio")
-            directData = sixSGroup.getDataset("direct_ratio")
-            sixSesData = sixSGroup.getDataset("sixS_irradiance")
-            # no need to retain SZA
-            # Copy datasets to dictionary
-            diffuseData.datasetToColumns()
-            # diffuseColumns = diffuseData.columns
-            directData.datasetToColumns()
-            # directColumns = directData.columns
-            sixSesData.datasetToColumns()
-            # sixSesColumns = sixSesData.columns
-
-            # diffuseSlice = ProcessL2.columnToSlice(diffuseColumns,start, end)
-            # directSlice = ProcessL2.columnToSlice(directColumns,start, end)
-            # sixSesSlice = ProcessL2.columnToSlice(sixSesColumns,start, end)
 
         # process raw groups for generating standard deviations
         def _sliceRawData(ES_raw, LI_raw, LT_raw):
@@ -1032,18 +550,6 @@ class ProcessL2:
         enablePercentLt = float(ConfigFile.settings["bL2EnablePercentLt"])
         percentLt = float(ConfigFile.settings["fL2PercentLt"])
 
-        timeStamp = esSlice.pop("Datetime")
-        esSlice.pop("Datetag")
-        esSlice.pop("Timetag2")
-
-        liSlice.pop("Datetag")
-        liSlice.pop("Timetag2")
-        liSlice.pop("Datetime")
-
-        ltSlice.pop("Datetag")
-        ltSlice.pop("Timetag2")
-        ltSlice.pop("Datetime")
-
         # Process StdSlices for Band Convolution
         # Get common wavebands from esSlice to interp stats
         instrument_wb = np.asarray(list(esSlice.keys()), dtype=float)
@@ -1138,13 +644,8 @@ class ProcessL2:
             ltXstdSentinel3B = Weight_RSR.processSentinel3Bands(ltStdSlice, sensor='B')
 
         # Store the mean datetime of the slice
-        if len(timeStamp) > 0:
-            epoch = datetime.datetime(1970, 1, 1,tzinfo=datetime.timezone.utc) #Unix zero hour
-            tsSeconds = []
-            for dt in timeStamp:
-                tsSeconds.append((dt-epoch).total_seconds())
-            meanSec = np.mean(tsSeconds)
-            dateTime = datetime.datetime.utcfromtimestamp(meanSec).replace(tzinfo=datetime.timezone.utc)
+        dateTime = views['ES'].meanDateTime(start, end)
+        if dateTime is not None:
             dateTag = Utilities.datetime2DateTag(dateTime)
             timeTag = Utilities.datetime2TimeTag2(dateTime)
 
@@ -1167,33 +668,17 @@ class ProcessL2:
             x = n  # if only 5 or fewer records retained, use them all...
 
         if enablePercentLt and x > 1:
-            # Find the indexes for the lowest X%
-            lt780 = ProcessL2.interpolateColumn(ltSlice, 780.0)
-            index = np.argsort(lt780)  # gives indexes if values were to be sorted
-            # returns indexes of the first x values (if values were sorted); i.e. the indexes of the lowest X% of unsorted lt780
-            y = index[0:x]
+            # Find the indexes for the lowest X% of Lt(780)
+            y = views['LT'].lowest(start, end, 780.0, x)
             Utilities.writeLogFileAndPrint(f'{len(y)} spectra remaining in slice to average after filtering to lowest {percentLt}%.')
         else:
             # If Percent Lt is turned off, this will average the whole slice, and if
             # ensemble is off (set to 0), just the one spectrum will be used.
-            first_band = next(iter(ltSlice))
-            first_band_values = ltSlice[first_band]
-            y=list(range(0,len(first_band_values)))
+            y=list(range(0,n))
 
         EnsembleN = len(y) # After taking lowest X%
-        if 'Ensemble_N' not in node.getGroup('REFLECTANCE').datasets:
-            node.getGroup('REFLECTANCE').addDataset('Ensemble_N')
-            node.getGroup('IRRADIANCE').addDataset('Ensemble_N')
-            node.getGroup('RADIANCE').addDataset('Ensemble_N')
-            node.getGroup('REFLECTANCE').datasets['Ensemble_N'].columns['N'] = []
-            node.getGroup('IRRADIANCE').datasets['Ensemble_N'].columns['N'] = []
-            node.getGroup('RADIANCE').datasets['Ensemble_N'].columns['N'] = []
-        node.getGroup('REFLECTANCE').datasets['Ensemble_N'].columns['N'].append(EnsembleN)
-        node.getGroup('IRRADIANCE').datasets['Ensemble_N'].columns['N'].append(EnsembleN)
-        node.getGroup('RADIANCE').datasets['Ensemble_N'].columns['N'].append(EnsembleN)
-        node.getGroup('REFLECTANCE').datasets['Ensemble_N'].columnsToDataset()
-        node.getGroup('IRRADIANCE').datasets['Ensemble_N'].columnsToDataset()
-        node.getGroup('RADIANCE').datasets['Ensemble_N'].columnsToDataset()
+        for groupID in ['REFLECTANCE', 'IRRADIANCE', 'RADIANCE']:
+            output.rows(groupID, 'Ensemble_N', ['N'], dated=False).newRow()[0] = EnsembleN
 
         # Take the mean of the lowest X% in the slice
         sliceAveFlag = []
@@ -1258,7 +743,7 @@ class ProcessL2:
 
         # Take the mean of the lowest X% for the ancillary group in the slice
         # (Combines Slice and XSlice -- as above -- into one method)
-        ProcessL2.sliceAveOther(node, start, end, y, ancGroup, sixSGroup)
+        ProcessL2.sliceAveOther(node, start, end, y, ancGroup, sixSGroup, views)
         newAncGroup = node.getGroup("ANCILLARY") # Just populated above
         newAncGroup.attributes['ANC_SOURCE_FLAGS'] = ['0: Undetermined, 1: Field, 2: Model, 3: Fallback']
 
@@ -1321,13 +806,8 @@ class ProcessL2:
 
         ########################################################################
         # Calculate Rho_sky
-        wavebands = [*esColumns] # just grabs the keys
-        wavelength = []
-        wavelengthStr = []
-        for k in wavebands:
-            if k != "Datetag" and k != "Datetime" and k != "Timetag2":
-                wavelengthStr.append(k)
-                wavelength.append(float(k))
+        wavelengthStr = list(esSlice.names)
+        wavelength = [float(k) for k in wavelengthStr]
         waveSubset = wavelength  # Only used for Zhang; No subsetting for threeC or Mobley corrections
         rhoVec = {}
 
@@ -1401,8 +881,10 @@ class ProcessL2:
 
         # Calculate hyperspectral Coddingtion TSIS_1 hybrid F0 function
         # NOTE: TSIS uncertainties reported as 1-sigma
-        F0_hyper, F0_unc, F0_raw, F0_unc_raw, wv_raw = Utilities.TSIS_1(dateTag, wavelength)
-        # Recycling _raw in TSIS_1 calls below prevents the dataset having to be reread
+        # The hybrid spectrum is read once per batch (or process)
+        TSIS = BatchContext.reference('TSIS-1')
+        F0_hyper, F0_unc, F0_raw, F0_unc_raw, wv_raw = Utilities.TSIS_1(dateTag, wavelength,
+                                                                        TSIS['F0_raw'], TSIS['F0_unc_raw'], TSIS['wv_raw'])
 
         if F0_hyper is None:
             Utilities.writeLogFileAndPrint("No hyperspectral TSIS-1 F0. Aborting.")
@@ -1521,13 +1003,13 @@ class ProcessL2:
             liUNCSlice = xUNC["liUNC_HYPER"]
             ltUNCSlice = xUNC["ltUNC_HYPER"]
 
-        # Populate the relevant fields in node
-        ProcessL2.spectralReflectance(node, sensor, timeObj, xSlice, F0_hyper, F0_unc, rhoScalar, rhoVec, waveSubset, xUNC)
+        # Populate the relevant fields in output
+        ProcessL2.spectralReflectance(output, sensor, timeObj, xSlice, F0_hyper, F0_unc, rhoScalar, rhoVec, waveSubset, xUNC)
 
         # Apply residual NIR corrections
         # Perfrom near-infrared residual correction to remove additional atmospheric and glint contamination
         if ConfigFile.settings["bL2PerformNIRCorrection"]:
-            rrsNIRCorr, nLwNIRCorr = ProcessL2.nirCorrection(node, sensor, F0_hyper)
+            rrsNIRCorr, nLwNIRCorr = ProcessL2.nirCorrection(output, sensor, F0_hyper)
 
         # Satellites
         if ConfigFile.settings['bL2WeightMODISA'] or ConfigFile.settings['bL2WeightMODIST']:
@@ -1568,10 +1050,10 @@ class ProcessL2:
                     xUNC['ltUNC'] = Weight_RSR.processMODISBands(ltUNCSlice, sensor='A')
 
                 sensor = 'MODISA'
-                ProcessL2.spectralReflectance(node, sensor, timeObj, xSlice, F0_MODIS, F0_MODIS_unc, rhoScalar, rhoVecMODIS, waveSubsetMODIS, xUNC)
+                ProcessL2.spectralReflectance(output, sensor, timeObj, xSlice, F0_MODIS, F0_MODIS_unc, rhoScalar, rhoVecMODIS, waveSubsetMODIS, xUNC)
                 if ConfigFile.settings["bL2PerformNIRCorrection"]:
                     # Can't apply good NIR corrs at satellite bands, so use the correction factors from the hyperspectral instead.
-                    ProcessL2.nirCorrectionSatellite(node, sensor, rrsNIRCorr, nLwNIRCorr)
+                    ProcessL2.nirCorrectionSatellite(output, sensor, rrsNIRCorr, nLwNIRCorr)
 
             if ConfigFile.settings['bL2WeightMODIST']:
                 print('Processing MODIST')
@@ -1602,10 +1084,10 @@ class ProcessL2:
                     xUNC['ltUNC'] = Weight_RSR.processMODISBands(ltUNCSlice, sensor='T')
 
                 sensor = 'MODIST'
-                ProcessL2.spectralReflectance(node, sensor, timeObj, xSlice, F0_MODIS, F0_MODIS_unc, rhoScalar, rhoVecMODIS, waveSubsetMODIS,  xUNC)
+                ProcessL2.spectralReflectance(output, sensor, timeObj, xSlice, F0_MODIS, F0_MODIS_unc, rhoScalar, rhoVecMODIS, waveSubsetMODIS,  xUNC)
                 if ConfigFile.settings["bL2PerformNIRCorrection"]:
                     # Can't apply good NIR corrs at satellite bands, so use the correction factors from the hyperspectral instead.
-                    ProcessL2.nirCorrectionSatellite(node, sensor, rrsNIRCorr, nLwNIRCorr)
+                    ProcessL2.nirCorrectionSatellite(output, sensor, rrsNIRCorr, nLwNIRCorr)
 
         if ConfigFile.settings['bL2WeightVIIRSN'] or ConfigFile.settings['bL2WeightVIIRSJ']:
             # F0 = F0_VIIRS
@@ -1640,10 +1122,10 @@ class ProcessL2:
                     xUNC['ltUNC'] = Weight_RSR.processVIIRSBands(ltUNCSlice, sensor='N')
 
                 sensor = 'VIIRSN'
-                ProcessL2.spectralReflectance(node, sensor, timeObj, xSlice, F0_VIIRS, F0_VIIRS_unc, rhoScalar, rhoVecVIIRS,  waveSubsetVIIRS,  xUNC)
+                ProcessL2.spectralReflectance(output, sensor, timeObj, xSlice, F0_VIIRS, F0_VIIRS_unc, rhoScalar, rhoVecVIIRS,  waveSubsetVIIRS,  xUNC)
                 if ConfigFile.settings["bL2PerformNIRCorrection"]:
                     # Can't apply good NIR corrs at satellite bands, so use the correction factors from the hyperspectral instead.
-                    ProcessL2.nirCorrectionSatellite(node, sensor, rrsNIRCorr, nLwNIRCorr)
+                    ProcessL2.nirCorrectionSatellite(output, sensor, rrsNIRCorr, nLwNIRCorr)
 
             if ConfigFile.settings['bL2WeightVIIRSJ']:
                 print('Processing VIIRSJ')
@@ -1674,10 +1156,10 @@ class ProcessL2:
                     xUNC['ltUNC'] = Weight_RSR.processVIIRSBands(ltUNCSlice, sensor='N')
 
                 sensor = 'VIIRSJ'
-                ProcessL2.spectralReflectance(node, sensor, timeObj, xSlice, F0_VIIRS, F0_VIIRS_unc, rhoScalar, rhoVecVIIRS, waveSubsetVIIRS,  xUNC)
+                ProcessL2.spectralReflectance(output, sensor, timeObj, xSlice, F0_VIIRS, F0_VIIRS_unc, rhoScalar, rhoVecVIIRS, waveSubsetVIIRS,  xUNC)
                 if ConfigFile.settings["bL2PerformNIRCorrection"]:
                     # Can't apply good NIR corrs at satellite bands, so use the correction factors from the hyperspectral instead.
-                    ProcessL2.nirCorrectionSatellite(node, sensor, rrsNIRCorr, nLwNIRCorr)
+                    ProcessL2.nirCorrectionSatellite(output, sensor, rrsNIRCorr, nLwNIRCorr)
 
         if ConfigFile.settings['bL2WeightSentinel3A']:
             # F0 = F0_Sentinel3
@@ -1712,10 +1194,10 @@ class ProcessL2:
                 #     xUNC['ltUNC'] = Weight_RSR.processSentinel3Bands(ltUNCSlice, sensor='A')
 
                 sensor = 'Sentinel3A'
-                ProcessL2.spectralReflectance(node, sensor, timeObj, xSlice, F0_Sentinel3, F0_Sentinel3_unc, rhoScalar, rhoVecSentinel3, waveSubsetSentinel3,  xUNC)
+                ProcessL2.spectralReflectance(output, sensor, timeObj, xSlice, F0_Sentinel3, F0_Sentinel3_unc, rhoScalar, rhoVecSentinel3, waveSubsetSentinel3,  xUNC)
                 if ConfigFile.settings["bL2PerformNIRCorrection"]:
                     # Can't apply good NIR corrs at satellite bands, so use the correction factors from the hyperspectral instead.
-                    ProcessL2.nirCorrectionSatellite(node, sensor, rrsNIRCorr, nLwNIRCorr)
+                    ProcessL2.nirCorrectionSatellite(output, sensor, rrsNIRCorr, nLwNIRCorr)
 
             if ConfigFile.settings['bL2WeightSentinel3B']:
                 print('Processing Sentinel3B')
@@ -1746,18 +1228,15 @@ class ProcessL2:
                 #     xUNC['ltUNC'] = Weight_RSR.processSentinel3Bands(ltUNCSlice, sensor='B')
 
                 sensor = 'Sentinel3B'
-                ProcessL2.spectralReflectance(node, sensor, timeObj, xSlice, F0_Sentinel3, F0_Sentinel3_unc, rhoScalar, rhoVecSentinel3, waveSubsetSentinel3,  xUNC)
+                ProcessL2.spectralReflectance(output, sensor, timeObj, xSlice, F0_Sentinel3, F0_Sentinel3_unc, rhoScalar, rhoVecSentinel3, waveSubsetSentinel3,  xUNC)
                 if ConfigFile.settings["bL2PerformNIRCorrection"]:
                     # Can't apply good NIR corrs at satellite bands, so use the correction factors from the hyperspectral instead.
-                    ProcessL2.nirCorrectionSatellite(node, sensor, rrsNIRCorr, nLwNIRCorr)
+                    ProcessL2.nirCorrectionSatellite(output, sensor, rrsNIRCorr, nLwNIRCorr)
 
         # Transfer attributes from L1BQC to L2 for sensors (place in [sensor]_HYPER datasets)
-        for gp in node.groups:
-            if gp.id == 'IRRADIANCE':
-                gp.datasets['ES_HYPER'].attributes = refGroup.datasets['ES'].attributes.copy()
-            if gp.id == 'RADIANCE':
-                gp.datasets['LT_HYPER'].attributes = sasGroup.datasets['LT'].attributes.copy()
-                gp.datasets['LI_HYPER'].attributes = sasGroup.datasets['LI'].attributes.copy()
+        output.get('IRRADIANCE', 'ES_HYPER').attributes = refGroup.datasets['ES'].attributes.copy()
+        output.get('RADIANCE', 'LT_HYPER').attributes = sasGroup.datasets['LT'].attributes.copy()
+        output.get('RADIANCE', 'LI_HYPER').attributes = sasGroup.datasets['LI'].attributes.copy()
 
         return True
 
@@ -1893,10 +1372,6 @@ class ProcessL2:
         #
         # Ensembles. Break up data into time intervals, and calculate averages and reflectances
         #
-        esData = referenceGroup.getDataset("ES")
-        esColumns = esData.columns
-        timeStamp = esColumns["Datetime"]
-        esLength = len(list(esColumns.values())[0])
         interval = float(ConfigFile.settings["fL2TimeInterval"])
 
         # interpolate Light/Dark data for Raw groups if HyperOCR data is being processed
@@ -1908,73 +1383,39 @@ class ProcessL2:
                         instrument.darkToLightTimer(liRawGroup, 'LI'),
                         instrument.darkToLightTimer(ltRawGroup, 'LT')]):
                 Utilities.writeLogFileAndPrint("failed to interpolate dark data to light data timer")
+
+        # Gather each dataset into one array for the whole file; ensembles are row ranges of these
+        views = {
+            'ES': EnsembleView.fromDataset(referenceGroup.getDataset("ES")),
+            'LI': EnsembleView.fromDataset(sasGroup.getDataset("LI")),
+            'LT': EnsembleView.fromDataset(sasGroup.getDataset("LT")),
+            ancGroup.id: {dsID: EnsembleView.fromDataset(ds) for dsID, ds in ancGroup.datasets.items()},
+            }
+        if sixSGroup is not None:
+            views[sixSGroup.id] = {dsID: EnsembleView.fromDataset(ds) for dsID, ds in sixSGroup.datasets.items()}
+
         if interval == 0:
             # Here, take the complete time series
             print("No time binning. This can take a moment.")
-            progressBar = tqdm(total=esLength, unit_scale=True, unit_divisor=1)
-            for i in range(0, esLength-1):
-                progressBar.update(1)
-                start = i
-                end = i+1
-
-                if not ProcessL2.ensemblesReflectance(node, sasGroup, referenceGroup, ancGroup,
-                                                    uncGroup, esRawGroup,liRawGroup, ltRawGroup,
-                                                    sixSGroup, start, end):
-                    Utilities.writeLogFileAndPrint('ProcessL2.ensemblesReflectance unsliced failed. Abort.')
-                    continue
+            progressBar = tqdm(total=len(views['ES']), unit_scale=True, unit_divisor=1)
+            failMsg = 'ProcessL2.ensemblesReflectance unsliced failed. Abort.'
         else:
             Utilities.writeLogFileAndPrint('Binning datasets to ensemble time interval.')
-
-            # Iterate over the time ensembles
-            start = 0
-            endTime = timeStamp[0] + datetime.timedelta(0,interval)
-            endFileTime = timeStamp[-1]
-            EndOfFileFlag = False
-            # endTime is theoretical based on interval
-            if endTime > endFileTime:
-                endTime = endFileTime
-                EndOfFileFlag = True # In case the whole file is shorter than the selected interval
-
-            for i in range(0, esLength):
-                timei = timeStamp[i]
-                if (timei > endTime) or EndOfFileFlag: # end of increment reached
-                    if EndOfFileFlag:
-                        end = len(timeStamp)-1 # File shorter than interval; include all spectra
-                        if not ProcessL2.ensemblesReflectance(node, sasGroup, referenceGroup, ancGroup, 
-                                                            uncGroup, esRawGroup,liRawGroup, ltRawGroup,
-                                                            sixSGroup, start, end):
-                            Utilities.writeLogFileAndPrint('ProcessL2.ensemblesReflectance with slices failed. Continue.')
-                            break # End of file reached. Safe to break
-
-                        break # End of file reached. Safe to break
-                    else:
-                        endTime = timei + datetime.timedelta(0,interval) # increment for the next bin loop
-                        end = i # end of the slice is up to and not including...so -1 is not needed
-
-                    if endTime > endFileTime:
-                        endTime = endFileTime
-                        EndOfFileFlag = True
-             
-                    if not ProcessL2.ensemblesReflectance(node, sasGroup, referenceGroup, ancGroup, 
-                                                            uncGroup, esRawGroup,liRawGroup, ltRawGroup,
-                                                            sixSGroup, start, end):
-                        Utilities.writeLogFileAndPrint('ProcessL2.ensemblesReflectance with slices failed. Continue.')
-
-                        start = i
-                        continue # End of ensemble reached. Continue.
-                    start = i
-
-                    if EndOfFileFlag:
-                        # No need to continue incrementing; all records captured in one ensemble
-                        break
-
-            # For the rare case where end of record is reached at, but not exceeding, endTime...
-            if not EndOfFileFlag:
-                end = i+1 # i is the index of end of record; plus one to include i due to -1 list slicing
-                if not ProcessL2.ensemblesReflectance(node, sasGroup, referenceGroup, ancGroup, 
-                                                            uncGroup, esRawGroup,liRawGroup, ltRawGroup,
-                                                            sixSGroup, start, end):
-                    Utilities.writeLogFileAndPrint('ProcessL2.ensemblesReflectance ender clause failed.')
+            progressBar = None
+            failMsg = 'ProcessL2.ensemblesReflectance with slices failed. Continue.'
+
+        # Iterate over the time ensembles. Spectral results are gathered in output with one row per
+        #   ensemble, and only become datasets of node once all ensembles are done.
+        bounds = EnsembleView.boundaries(views['ES'].micros, interval)
+        output = L2Accumulator(len(bounds))
+        for start, end in bounds:
+            if progressBar is not None:
+                progressBar.update(1)
+            if not ProcessL2.ensemblesReflectance(node, sasGroup, referenceGroup, ancGroup,
+                                                uncGroup, esRawGroup,liRawGroup, ltRawGroup,
+                                                sixSGroup, start, end, views, output):
+                Utilities.writeLogFileAndPrint(failMsg)
+        output.write(node)
 
         #####################################
         #
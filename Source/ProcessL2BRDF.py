@@ -3,6 +3,7 @@ import numpy as np
 import xarray as xr
 from Source import PATH_TO_DATA
 import Source.ocbrdf.ocbrdf_main as oc_brdf
+from Source.Profiler import Profiler
 
 
 class ProcessL2BRDF():
@@ -21,7 +22,7 @@ class ProcessL2BRDF():
     # 2024.07.10: adapted for HyperCP by Juan Gossn (EUMETSAT) from Constant Mazeran's BRDF Python tool (BRDF4OLCI project)
 
     @staticmethod
-
+    @Profiler.timed('BRDF')
     def procBRDF(root,BRDF_option='M02'):
         '''
         Purpose: read all the necessary inputs to perform BRDF correction
@@ -45,6 +46,9 @@ class ProcessL2BRDF():
                 aod = gp.datasets["AOD"].columns["AOD"]
                 wind = gp.datasets["WINDSPEED"].columns["WINDSPEED"]
 
+        # One engine for all Rrs datasets, so that LUTs and geometry coefficients are shared among them
+        engine = None
+
         for gp in root.groups:
             if (gp.id == "REFLECTANCE"):
                 # NB: BRDF Morel must be applied over Rrs and not nLw because of the iterative process to update chl.
@@ -126,7 +130,9 @@ class ProcessL2BRDF():
                             } )
                         
                         # Compute and apply BRDF
-                        OC_BRDF = oc_brdf.brdf_prototype(xr_ds, brdf_model=BRDF_option)
+                        if engine is None:
+                            engine = oc_brdf.BRDFEngine(brdf_model=BRDF_option)
+                        OC_BRDF = engine.correct(xr_ds)
                         
                         # Store BRDF corrected rrs
                         Rrs_BRDF = Rrs.copy()
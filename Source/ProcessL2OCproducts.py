@@ -1,3 +1,4 @@
+import collections
 
 import numpy as np
 
@@ -21,387 +22,294 @@ class ProcessL2OCproducts():
     ''' Most product algorithms can be found at https://oceancolor.gsfc.nasa.gov/atbd/
     TODO: Uncertainty propagation'''
 
-    @staticmethod
-    def procProds(root):
-
-        Reflectance = root.getGroup("REFLECTANCE")
-
-        dateTime = Reflectance.datasets['Rrs_HYPER'].columns['Datetime']
-        dateTag = Reflectance.datasets['Rrs_HYPER'].columns['Datetag']
-        timeTag2 = Reflectance.datasets['Rrs_HYPER'].columns['Timetag2']
-
-        # Multispectral bands required for some algorithms
-        # Confirm necessary satellite bands are processed
-        if ConfigFile.products["bL2Prodoc3m"] or ConfigFile.products["bL2Prodkd490"] or \
-            ConfigFile.products["bL2Prodpic"] or ConfigFile.products["bL2Prodpoc"] or \
-            ConfigFile.products["bL2Prodgocad"] or ConfigFile.products["bL2Prodgiop"] or \
-            ConfigFile.products["bL2Prodqaa"] or ConfigFile.products["bL2ProdweiQA"]:
-            Rrs412 = Reflectance.datasets["Rrs_MODISA"].columns['412']
-            Rrs443 = Reflectance.datasets["Rrs_MODISA"].columns['443']
-            Rrs488 = Reflectance.datasets["Rrs_MODISA"].columns['488']
-            Rrs531 = Reflectance.datasets["Rrs_MODISA"].columns['531']
-            Rrs547 = Reflectance.datasets["Rrs_MODISA"].columns['551'] # 551 in name only
-            Rrs555 = Reflectance.datasets["Rrs_MODISA"].columns['555']
-            Rrs667 = Reflectance.datasets["Rrs_MODISA"].columns['667'].copy()
-
-        # waveSat = [412, 443, 488, 532, 547, 555, 667]
-
-        RrsHYPER = Reflectance.datasets["Rrs_HYPER"]
-
-        Ancillary = root.getGroup("ANCILLARY")
-        DerProd = None
-
-        if not root.getGroup("DERIVED_PRODUCTS"):
-            DerProd = root.addGroup("DERIVED_PRODUCTS")
-
-        # chlor_a
-        if ConfigFile.products["bL2Prodoc3m"]:
-            msg = "Processing chlor_a"
-            print(msg)
-            Utilities.writeLogFile(msg)
-
-            DerProd.attributes['chlor_a_UNITS'] = 'mg m^-3'
-            chlDS = DerProd.addDataset('chlor_a')
-            chlDS.columns['Datetime'] = dateTime
-            chlDS.columns['Datetag'] = dateTag
-            chlDS.columns['Timetag2'] = timeTag2
-
-            chlor_a = []
-            for i in range(0, len(dateTime)):
-                chlor_a.append(L2chlor_a(Rrs443[i], Rrs488[i], Rrs547[i], Rrs555[i], Rrs667[i]))
-
-            chlDS.columns['chlor_a'] = chlor_a
-            chlDS.columnsToDataset()
-
-
-        # pic
+    # Product registry, in the order products are written to DERIVED_PRODUCTS.
+    #   switch:  ConfigFile.products key that turns the product on
+    #   inputs:  shared inputs it needs (see loadInputs)
+    #   depends: other products whose results it uses. These are computed first, even if not selected
+    #   kernel:  name of the ProcessL2OCproducts method computing it from (inputs, results)
+    #   outputs: dataset name -> (ConfigFile.products key also required to write it, or None; units attributes)
+    registry = collections.OrderedDict([
+        ('chlor_a', {
+            'switch': 'bL2Prodoc3m', 'message': 'Processing chlor_a',
+            'inputs': ['MODISA'], 'depends': [], 'kernel': 'chlorA',
+            'outputs': {'chlor_a': (None, {'chlor_a_UNITS': 'mg m^-3'})}}),
         # Not yet implemented
-        if ConfigFile.products["bL2Prodpic"]:
-            msg = "Processing pic"
-            print(msg)
-            Utilities.writeLogFile(msg)
-
-            picDS = DerProd.addDataset('pic')
-            DerProd.attributes['pic_UNITS'] = 'mol m^-3'
-            picDS.columns['Datetime'] = dateTime
-            picDS.columns['Datetag'] = dateTag
-            picDS.columns['Timetag2'] = timeTag2
-
-            pic = L2pic(root)
-            picDS.columns['pic'] = pic
-            picDS.columnsToDataset()
-
-        # poc
-        if ConfigFile.products["bL2Prodpoc"]:
-            msg = "Processing poc"
-            print(msg)
-            Utilities.writeLogFile(msg)
-
-            pocDS = DerProd.addDataset('poc')
-            DerProd.attributes['poc_UNITS'] = 'mg m^-3'
-            pocDS.columns['Datetime'] = dateTime
-            pocDS.columns['Datetag'] = dateTag
-            pocDS.columns['Timetag2'] = timeTag2
-
-            # Vectorwise
-            poc = L2poc(Rrs443, Rrs555)
-
-            pocDS.columns['poc'] = poc.tolist()
-            pocDS.columnsToDataset()
-
-        # kd490
-        if ConfigFile.products["bL2Prodkd490"]:
-            msg = "Processing kd490"
-            print(msg)
-            Utilities.writeLogFile(msg)
-
-            kdDS = DerProd.addDataset('kd490')
-            DerProd.attributes['kd490_UNITS'] = 'm^-1'
-            kdDS.columns['Datetime'] = dateTime
-            kdDS.columns['Datetag'] = dateTag
-            kdDS.columns['Timetag2'] = timeTag2
-
-            # Vectorwise
-            kd490 = L2kd490(Rrs488, Rrs547)
-
-            kdDS.columns['kd490'] = kd490.tolist()
-            kdDS.columnsToDataset()
-
-        # ipar
-        if ConfigFile.products["bL2Prodipar"]:
-            msg = "Processing ipar"
-            print(msg)
-            Utilities.writeLogFile(msg)
-
-            Es_ds = root.getGroup("IRRADIANCE").datasets["ES_HYPER"]
-            keys = list(Es_ds.columns.keys())
-            values = list(Es_ds.columns.values())
-            waveStr = keys[3:]
-            Es = np.array(values[3:])
-            wavelength = np.array([float(i) for i in waveStr])
-            fullSpec = np.array(list(range(400, 701)))
-
-            iparDS = DerProd.addDataset('ipar')
-            DerProd.attributes['ipar_UNITS'] = 'Einstein m^-2 d^-1'
-            iparDS.columns['Datetime'] = dateTime
-            iparDS.columns['Datetag'] = dateTag
-            iparDS.columns['Timetag2'] = timeTag2
-
-            ipar = []
-            for n in range(0, len(dateTime)):
-                ipar.append(L2ipar(wavelength, Es[:,n], fullSpec))
-
-            iparDS.columns['ipar'] = ipar
-            iparDS.columnsToDataset()
-
+        ('pic', {
+            'switch': 'bL2Prodpic', 'message': 'Processing pic',
+            'inputs': [], 'depends': [], 'kernel': 'pic',
+            'outputs': {'pic': (None, {'pic_UNITS': 'mol m^-3'})}}),
+        ('poc', {
+            'switch': 'bL2Prodpoc', 'message': 'Processing poc',
+            'inputs': ['MODISA'], 'depends': [], 'kernel': 'poc',
+            'outputs': {'poc': (None, {'poc_UNITS': 'mg m^-3'})}}),
+        ('kd490', {
+            'switch': 'bL2Prodkd490', 'message': 'Processing kd490',
+            'inputs': ['MODISA'], 'depends': [], 'kernel': 'kd490',
+            'outputs': {'kd490': (None, {'kd490_UNITS': 'm^-1'})}}),
+        ('ipar', {
+            'switch': 'bL2Prodipar', 'message': 'Processing ipar',
+            'inputs': ['ES_HYPER'], 'depends': [], 'kernel': 'ipar',
+            'outputs': {'ipar': (None, {'ipar_UNITS': 'Einstein m^-2 d^-1'})}}),
         # Spectral QA
         # ''' Wei, Lee, and Shang (2016).
         #      A system to measure the data quality of spectral remote sensing
         #      reflectance of aquatic environments. Journal of Geophysical Research,
         #      121, doi:10.1002/2016JC012126'''
+        ('wei_QA', {
+            'switch': 'bL2ProdweiQA', 'message': 'Processing Wei QA',
+            'inputs': ['MODISA'], 'depends': [], 'kernel': 'weiQA',
+            'outputs': {'wei_QA': (None, {'wei_QA_UNITS': 'score'})}}),
+        # ''' Average Visible Wavelength
+        #     Vandermuelen et al. 2020'''
+        ('avw', {
+            'switch': 'bL2Prodavw', 'message': 'Processing avw',
+            'inputs': ['HYPER'], 'depends': [], 'kernel': 'avw',
+            'outputs': {'avw': (None, {'avw_UNITS': 'nm', 'lambda_max_UNITS': 'nm', 'brightness_UNITS': 'nm/sr'})}}),
+        # ''' Quantitative Water Index Polynomial
+        #     Dierssen et al. 2022'''
+        ('qwip', {
+            'switch': 'bL2Prodqwip', 'message': 'Processing QWIP',
+            'inputs': ['HYPER'], 'depends': ['avw'], 'kernel': 'qwip',
+            'outputs': {'qwip': (None, {'qwip_UNITS': 'sr^-1'})}}),
+        # CDOM (GOCAD)
+        # ''' Global Ocean Carbon Algorithm Database
+        #     Aurin et al. 2018 MLRs for global dataset (GOCAD) '''
+        ('gocad', {
+            'switch': 'bL2Prodgocad', 'message': 'Processing CDOM, Sg, DOC',
+            'inputs': ['MODISA', 'SALINITY'], 'depends': [], 'kernel': 'gocad',
+            'outputs': {'gocad_ag': ('bL2Prodag', {'ag_UNITS': '1/m'}),
+                        'gocad_Sg': ('bL2ProdSg', {'Sg_UNITS': '1/nm'}),
+                        'gocad_doc': ('bL2ProdDOC', {'doc_UNITS': 'umol/L'})}}),
+        # GIOP
+        # ''' Generalized ocean color inversion model for Inherent Optical Properties
+        #     Werdell et al. 2013
+        #     Not yet implemented'''
 
-        if ConfigFile.products["bL2ProdweiQA"]:
-            msg = "Processing Wei QA"
-            print(msg)
-            Utilities.writeLogFile(msg)
-
-            DerProd.attributes['wei_QA_UNITS'] = 'score'
-            weiQADS = DerProd.addDataset('wei_QA')
-            weiQADS.columns['Datetime'] = dateTime
-            weiQADS.columns['Datetag'] = dateTag
-            weiQADS.columns['Timetag2'] = timeTag2
-
-            # Reorganize datasets into multidimensional numpy arrays
-            Rrs_mArray = np.transpose(np.array([ Rrs412, Rrs443, Rrs488, Rrs547, Rrs667 ]))
-            Rrs_wave =    np.array([412, 443, 488, 547, 667])
-
-            # Interpolation to QA bands, which are representative of several missions (see L2wei_QA.py)
-            test_lambda = np.array([412, 443, 488, 551, 670])
-            test_Rrs = np.empty((Rrs_mArray.shape[0],len(test_lambda))) * np.nan
-            for i, Rrsi in enumerate(Rrs_mArray):
-                test_Rrs[i,:] = Utilities.interp(Rrs_wave.tolist(), Rrsi.tolist(), test_lambda.tolist(), \
-                    kind='linear', fill_value=0.0)
-
+        # QAA
+        # ''' Quasi-Analytcal Algorithm
+        #     Lee et al. 2002, updated to QAAv6 for MODIS bands'''
+        ('qaa', {
+            'switch': 'bL2Prodqaa', 'message': 'Processing qaa',
+            'inputs': ['MODISA', 'HYPER', 'SST', 'SALINITY'], 'depends': [], 'kernel': 'qaa',
+            'outputs': {f'qaa_{iop}': (f'bL2Prod{iop}Qaa', {f'{iop}_UNITS': '1/m'})
+                        for iop in ['a', 'adg', 'aph', 'b', 'bb', 'bbp', 'c']}}),
+    ])
+
+    # MODIS Aqua bands used by the multispectral algorithms. Rrs547 is stored as 551 in name only
+    modisBands = {412: '412', 443: '443', 488: '488', 531: '531', 547: '551', 555: '555', 667: '667'}
+
+    # Shared input: (group, dataset) it is read from
+    inputSources = {
+        'MODISA': ('REFLECTANCE', 'Rrs_MODISA'),
+        'HYPER': ('REFLECTANCE', 'Rrs_HYPER'),
+        'ES_HYPER': ('IRRADIANCE', 'ES_HYPER'),
+        'SST': ('ANCILLARY', 'SST'),
+        'SALINITY': ('ANCILLARY', 'SALINITY'),
+    }
 
-            # maxCos, cos, clusterID, totScore = QAscores_5Bands(test_Rrs, test_lambda)
-            _, _, _, totScore = QAscores_5Bands(test_Rrs, test_lambda)
+    @staticmethod
+    def resolveOrder(selected):
+        ''' Selected product names plus their dependencies, ordered so that every product
+            follows the products it depends on '''
+        order = []
+
+        def visit(name, path):
+            if name in order:
+                return
+            if name not in ProcessL2OCproducts.registry:
+                requiredBy = f' (required by {path[-1]})' if path else ''
+                raise ValueError(f'Unknown product: {name}{requiredBy}')
+            if name in path:
+                raise ValueError(f'Circular product dependency: {" -> ".join(path + [name])}')
+            for dependency in ProcessL2OCproducts.registry[name]['depends']:
+                visit(dependency, path + [name])
+            order.append(name)
+
+        for name in selected:
+            visit(name, [])
+        return order
 
-            weiQADS.columns['QA_score'] = totScore.tolist()
-            weiQADS.columnsToDataset()
+    @staticmethod
+    def hyperspectral(ds):
+        ''' (wavelengths, wavelength x time array) from a hyperspectral dataset in columns '''
+        keys = list(ds.columns.keys())
+        values = list(ds.columns.values())
+        # Skip Datetime, Datetag, Timetag2
+        wavelength = np.array([float(i) for i in keys[3:]])
+        return wavelength, np.array(values[3:])
 
-        # avw
-        # ''' Average Visible Wavelength
-        #     Vandermuelen et al. 2020'''
+    @staticmethod
+    def loadInputs(root, names):
+        ''' Read each shared input named in names once, as arrays. Inputs not found in root are
+            left out (and logged), so that the products needing them can be skipped '''
+        inputs = {'root': root}
+        for name in names:
+            if name not in ProcessL2OCproducts.inputSources:
+                raise ValueError(f'Unknown product input: {name}')
+            gpName, dsName = ProcessL2OCproducts.inputSources[name]
+            gp = root.getGroup(gpName)
+            ds = gp.getDataset(dsName) if gp is not None else None
+            if ds is None:
+                Utilities.writeLogFile(f'{gpName}/{dsName} not found. Products using it are skipped.')
+                continue
+
+            if name == 'MODISA':
+                inputs[name] = {band: np.array(ds.columns[key]) for band, key in ProcessL2OCproducts.modisBands.items()}
+            elif name in ['HYPER', 'ES_HYPER']:
+                inputs[name] = ProcessL2OCproducts.hyperspectral(ds)
+            else:
+                inputs[name] = np.array(ds.columns[name])
+        return inputs
 
-        if ConfigFile.products["bL2Prodavw"]:
-            msg = "Processing avw"
-            print(msg)
-            Utilities.writeLogFile(msg)
+    @staticmethod
+    def chlorA(inputs, _):
+        Rrs = inputs['MODISA']
+        chlor_a = [L2chlor_a(Rrs[443][i], Rrs[488][i], Rrs[547][i], Rrs[555][i], Rrs[667][i])
+                   for i in range(len(Rrs[443]))]
+        return {'chlor_a': {'chlor_a': chlor_a}}
 
-            keys = list(RrsHYPER.columns.keys())
-            values = list(RrsHYPER.columns.values())
-            waveStr = keys[3:]
-            wavelength = np.array([float(i) for i in waveStr])
-            Rrs = np.array(values[3:])
-
-            avwDS = DerProd.addDataset('avw')
-            DerProd.attributes['avw_UNITS'] = 'nm'
-            DerProd.attributes['lambda_max_UNITS'] = 'nm'
-            DerProd.attributes['brightness_UNITS'] = 'nm/sr'
-            avwDS.columns['Datetime'] = dateTime
-            avwDS.columns['Datetag'] = dateTag
-            avwDS.columns['Timetag2'] = timeTag2
-
-            # Vectorwise
-            avw, lambda_max, brightness = L2avw(wavelength, Rrs)
-
-            avwDS.columns['avw'] = avw
-            avwDS.columns['lambda_max'] = lambda_max
-            avwDS.columns['brightness'] = brightness
-            avwDS.columnsToDataset()
-
-        # qwip
-        # ''' Quantitative Water Index Polynomial
-        #     Dierssen et al. 2022'''
+    @staticmethod
+    def pic(inputs, _):
+        return {'pic': {'pic': L2pic(inputs['root'])}}
 
-        if ConfigFile.products["bL2Prodqwip"]:
-            msg = "Processing QWIP"
-            print(msg)
-            Utilities.writeLogFile(msg)
+    @staticmethod
+    def poc(inputs, _):
+        # Vectorwise
+        Rrs = inputs['MODISA']
+        return {'poc': {'poc': L2poc(Rrs[443], Rrs[555]).tolist()}}
 
-            qwipDS = DerProd.addDataset('qwip')
-            DerProd.attributes['qwip_UNITS'] = 'sr^-1'
+    @staticmethod
+    def kd490(inputs, _):
+        # Vectorwise
+        Rrs = inputs['MODISA']
+        return {'kd490': {'kd490': L2kd490(Rrs[488], Rrs[547]).tolist()}}
 
-            qwipDS.columns['Datetime'] = dateTime
-            qwipDS.columns['Datetag'] = dateTag
-            qwipDS.columns['Timetag2'] = timeTag2
+    @staticmethod
+    def ipar(inputs, _):
+        wavelength, Es = inputs['ES_HYPER']
+        fullSpec = np.array(list(range(400, 701)))
+        ipar = [L2ipar(wavelength, Es[:,n], fullSpec) for n in range(Es.shape[1])]
+        return {'ipar': {'ipar': ipar}}
 
-            qwip = L2qwip(wavelength, Rrs, avw)
+    @staticmethod
+    def weiQA(inputs, _):
+        # Reorganize datasets into multidimensional numpy arrays
+        Rrs = inputs['MODISA']
+        Rrs_wave = np.array([412, 443, 488, 547, 667])
+        Rrs_mArray = np.transpose(np.array([Rrs[wl] for wl in Rrs_wave]))
+
+        # Interpolation to QA bands, which are representative of several missions (see L2wei_QA.py)
+        test_lambda = np.array([412, 443, 488, 551, 670])
+        test_Rrs = np.empty((Rrs_mArray.shape[0],len(test_lambda))) * np.nan
+        for i, Rrsi in enumerate(Rrs_mArray):
+            test_Rrs[i,:] = Utilities.interp(Rrs_wave.tolist(), Rrsi.tolist(), test_lambda.tolist(), \
+                kind='linear', fill_value=0.0)
+
+        # maxCos, cos, clusterID, totScore = QAscores_5Bands(test_Rrs, test_lambda)
+        _, _, _, totScore = QAscores_5Bands(test_Rrs, test_lambda)
+        return {'wei_QA': {'QA_score': totScore.tolist()}}
 
-            qwipDS.columns['qwip'] = qwip
-            qwipDS.columnsToDataset()
+    @staticmethod
+    def avw(inputs, _):
+        # Vectorwise
+        avw, lambda_max, brightness = L2avw(*inputs['HYPER'])
+        return {'avw': {'avw': avw, 'lambda_max': lambda_max, 'brightness': brightness}}
 
-        # CDOM (GOCAD)
-        # ''' Global Ocean Carbon Algorithm Database
-        #     Aurin et al. 2018 MLRs for global dataset (GOCAD) '''
+    @staticmethod
+    def qwip(inputs, results):
+        wavelength, Rrs = inputs['HYPER']
+        return {'qwip': {'qwip': L2qwip(wavelength, Rrs, results['avw']['avw']['avw'])}}
 
-        if ConfigFile.products["bL2Prodgocad"]:
-            msg = "Processing CDOM, Sg, DOC"
-            print(msg)
-            Utilities.writeLogFile(msg)
+    @staticmethod
+    def gocad(inputs, _):
+        Rrs = inputs['MODISA']
+        waveStr = ['275', '355', '380', '412', '443', '488']
+        waveStrS = ['275', '300', '350', '380', '412']
 
-            SAL = Ancillary.datasets["SALINITY"].columns["SALINITY"]
-
-            waveStr = ['275', '355', '380', '412', '443', '488']
-            waveStrS = ['275', '300', '350', '380', '412']
-
-            # Vectorwise
-            ag, Sg, doc = \
-                L2gocad(Rrs443, Rrs488, Rrs531, Rrs547, SAL, fill=-9999)
-
-            if ConfigFile.products["bL2Prodag"]:
-                DerProd.attributes['ag_UNITS'] = '1/m'
-                agDS = DerProd.addDataset('gocad_ag')
-                agDS.columns['Datetime'] = dateTime
-                agDS.columns['Datetag'] = dateTag
-                agDS.columns['Timetag2'] = timeTag2
-                ag = dict(zip(waveStr,np.transpose(ag).tolist()))
-                for key, value in ag.items(): agDS.columns[key] = value
-                agDS.columnsToDataset()
-            if ConfigFile.products["bL2ProdSg"]:
-                DerProd.attributes['Sg_UNITS'] = '1/nm'
-                SgDS = DerProd.addDataset('gocad_Sg')
-                SgDS.columns['Datetime'] = dateTime
-                SgDS.columns['Datetag'] = dateTag
-                SgDS.columns['Timetag2'] = timeTag2
-                Sg = dict(zip(waveStrS,np.transpose(Sg).tolist()))
-                for key, value in Sg.items(): SgDS.columns[key] = value
-                SgDS.columnsToDataset()
-            if ConfigFile.products["bL2ProdDOC"]:
-                DerProd.attributes['doc_UNITS'] = 'umol/L'
-                docDS = DerProd.addDataset('gocad_doc')
-                docDS.columns['Datetime'] = dateTime
-                docDS.columns['Datetag'] = dateTag
-                docDS.columns['Timetag2'] = timeTag2
-                docDS.columns['doc'] = doc.tolist()
-                docDS.columnsToDataset()
+        # Vectorwise
+        ag, Sg, doc = \
+            L2gocad(Rrs[443], Rrs[488], Rrs[531], Rrs[547], inputs['SALINITY'], fill=-9999)
 
+        return {'gocad_ag': dict(zip(waveStr, np.transpose(ag).tolist())),
+                'gocad_Sg': dict(zip(waveStrS, np.transpose(Sg).tolist())),
+                'gocad_doc': {'doc': doc.tolist()}}
 
+    @staticmethod
+    def qaa(inputs, _):
+        Rrs = inputs['MODISA']
+        # For fun, let's apply it to the full hyperspectral dataset
+        wavelength, RrsHyper = inputs['HYPER']
+        T = inputs['SST']
+        S = inputs['SALINITY']
+
+        # Maximum range based on P&F/S&B
+        minMax = [380, 800]
+        inRange = (wavelength >= minMax[0]) & (wavelength <= minMax[1])
+        wavelength = wavelength[inRange]
+        RrsHyper = RrsHyper[inRange]
+        waveStr = [f'{x}' for x in wavelength]
+
+        iops = {iop: np.empty(np.shape(RrsHyper)) for iop in ['a', 'adg', 'aph', 'b', 'bb', 'bbp', 'c']}
+        for i in range(RrsHyper.shape[1]):
+            *values, msg = L2qaa(Rrs[412][i], Rrs[443][i], Rrs[488][i], Rrs[555][i], Rrs[667][i], \
+                RrsHyper[:,i], wavelength, T[i], S[i])
+            for iop, value in zip(iops, values):
+                iops[iop][:,i] = value
+            for msgs in msg:
+                Utilities.writeLogFile(msgs)
+
+        return {f'qaa_{iop}': dict(zip(waveStr, value.tolist())) for iop, value in iops.items()}
 
-        # GIOP
-        # ''' Generalized ocean color inversion model for Inherent Optical Properties
-        #     Werdell et al. 2013
-        #     Not yet implemented'''
+    @staticmethod
+    def procProds(root):
+        ''' Compute the selected derived products from inputs shared across products, then
+            write them all to the DERIVED_PRODUCTS group '''
 
+        Reflectance = root.getGroup("REFLECTANCE")
 
-        # QAA
-        # ''' Quasi-Analytcal Algorithm
-        #     Lee et al. 2002, updated to QAAv6 for MODIS bands'''
+        dateTime = Reflectance.datasets['Rrs_HYPER'].columns['Datetime']
+        dateTag = Reflectance.datasets['Rrs_HYPER'].columns['Datetag']
+        timeTag2 = Reflectance.datasets['Rrs_HYPER'].columns['Timetag2']
 
-        if ConfigFile.products["bL2Prodqaa"]:
-            msg = "Processing qaa"
+        selected = [name for name, product in ProcessL2OCproducts.registry.items()
+                    if ConfigFile.products[product['switch']]]
+        order = ProcessL2OCproducts.resolveOrder(selected)
+
+        inputNames = []
+        for name in order:
+            inputNames.extend(n for n in ProcessL2OCproducts.registry[name]['inputs'] if n not in inputNames)
+        inputs = ProcessL2OCproducts.loadInputs(root, inputNames)
+
+        results = {}
+        for name in order:
+            product = ProcessL2OCproducts.registry[name]
+            missing = [n for n in product['inputs'] if n not in inputs] + \
+                [n for n in product['depends'] if n not in results]
+            if missing:
+                msg = f'Skipping {name}: missing {", ".join(missing)}'
+                print(msg)
+                Utilities.writeLogFile(msg)
+                continue
+            msg = product['message']
             print(msg)
             Utilities.writeLogFile(msg)
+            results[name] = getattr(ProcessL2OCproducts, product['kernel'])(inputs, results)
 
-            # For fun, let's apply it to the full hyperspectral dataset
-            keys = list(RrsHYPER.columns.keys())
-            values = list(RrsHYPER.columns.values())
-            waveStr = keys[3:]
-            wavelength = np.array([float(i) for i in waveStr])
-            Rrs = np.array(values[3:])
-
-            T = Ancillary.datasets["SST"].columns["SST"]
-            S = Ancillary.datasets["SALINITY"].columns["SALINITY"]
-
-            # Maximum range based on P&F/S&B
-            minMax = [380, 800]
-            waveTemp = []
-            RrsHyperTemp = []
-            for i, wl in enumerate(wavelength):
-                if wl >= minMax[0] and wl <= minMax[1]:
-                    waveTemp.append(wl)
-                    RrsHyperTemp.append(Rrs[i])
-            wavelength = np.array(waveTemp)
-            Rrs = np.array(RrsHyperTemp)
-            waveStr = [f'{x}' for x in wavelength]
-
-            a = np.empty(np.shape(Rrs))
-            adg = np.empty(np.shape(Rrs))
-            aph = np.empty(np.shape(Rrs))
-            b = np.empty(np.shape(Rrs))
-            bb = np.empty(np.shape(Rrs))
-            bbp = np.empty(np.shape(Rrs))
-            c = np.empty(np.shape(Rrs))
-            for i in range(0, len(dateTime)):
-
-                a[:,i], adg[:,i], aph[:,i], b[:,i], bb[:,i], bbp[:,i], c[:,i], msg = \
-                    L2qaa(Rrs412[i], Rrs443[i], Rrs488[i], Rrs555[i], Rrs667[i], \
-                        Rrs[:,i], wavelength, \
-                            T[i], S[i])
-                for msgs in msg:
-                    Utilities.writeLogFile(msgs)
-
-            if ConfigFile.products["bL2ProdaQaa"]:
-                DerProd.attributes['a_UNITS'] = '1/m'
-                aDS = DerProd.addDataset('qaa_a')
-                aDS.columns['Datetime'] = dateTime
-                aDS.columns['Datetag'] = dateTag
-                aDS.columns['Timetag2'] = timeTag2
-                a = dict(zip(waveStr,a.tolist()))
-                for key, value in a.items(): aDS.columns[key] = value
-                aDS.columnsToDataset()
-            if ConfigFile.products["bL2ProdadgQaa"]:
-                DerProd.attributes['adg_UNITS'] = '1/m'
-                adgDS = DerProd.addDataset('qaa_adg')
-                adgDS.columns['Datetime'] = dateTime
-                adgDS.columns['Datetag'] = dateTag
-                adgDS.columns['Timetag2'] = timeTag2
-                adg = dict(zip(waveStr,adg.tolist()))
-                for key, value in adg.items(): adgDS.columns[key] = value
-                adgDS.columnsToDataset()
-            if ConfigFile.products["bL2ProdaphQaa"]:
-                DerProd.attributes['aph_UNITS'] = '1/m'
-                aphDS = DerProd.addDataset('qaa_aph')
-                aphDS.columns['Datetime'] = dateTime
-                aphDS.columns['Datetag'] = dateTag
-                aphDS.columns['Timetag2'] = timeTag2
-                aph = dict(zip(waveStr,aph.tolist()))
-                for key, value in aph.items(): aphDS.columns[key] = value
-                aphDS.columnsToDataset()
-            if ConfigFile.products["bL2ProdbQaa"]:
-                DerProd.attributes['b_UNITS'] = '1/m'
-                bDS = DerProd.addDataset('qaa_b')
-                bDS.columns['Datetime'] = dateTime
-                bDS.columns['Datetag'] = dateTag
-                bDS.columns['Timetag2'] = timeTag2
-                b = dict(zip(waveStr,b.tolist()))
-                for key, value in b.items(): bDS.columns[key] = value
-                bDS.columnsToDataset()
-            if ConfigFile.products["bL2ProdbbQaa"]:
-                DerProd.attributes['bb_UNITS'] = '1/m'
-                bbDS = DerProd.addDataset('qaa_bb')
-                bbDS.columns['Datetime'] = dateTime
-                bbDS.columns['Datetag'] = dateTag
-                bbDS.columns['Timetag2'] = timeTag2
-                bb = dict(zip(waveStr,bb.tolist()))
-                for key, value in bb.items(): bbDS.columns[key] = value
-                bbDS.columnsToDataset()
-            if ConfigFile.products["bL2ProdbbpQaa"]:
-                DerProd.attributes['bbp_UNITS'] = '1/m'
-                bbpDS = DerProd.addDataset('qaa_bbp')
-                bbpDS.columns['Datetime'] = dateTime
-                bbpDS.columns['Datetag'] = dateTag
-                bbpDS.columns['Timetag2'] = timeTag2
-                bbp = dict(zip(waveStr,bbp.tolist()))
-                for key, value in bbp.items(): bbpDS.columns[key] = value
-                bbpDS.columnsToDataset()
-            if ConfigFile.products["bL2ProdcQaa"]:
-                DerProd.attributes['c_UNITS'] = '1/m'
-                cDS = DerProd.addDataset('qaa_c')
-                cDS.columns['Datetime'] = dateTime
-                cDS.columns['Datetag'] = dateTag
-                cDS.columns['Timetag2'] = timeTag2
-                c = dict(zip(waveStr,c.tolist()))
-                for key, value in c.items(): cDS.columns[key] = value
-                cDS.columnsToDataset()
+        DerProd = root.getGroup("DERIVED_PRODUCTS")
+        if DerProd is None:
+            DerProd = root.addGroup("DERIVED_PRODUCTS")
 
+        # Write the selected products (not those only computed as dependencies) in registry order
+        for name in selected:
+            if name not in results:
+                continue
+            for dsName, (switch, units) in ProcessL2OCproducts.registry[name]['outputs'].items():
+                if switch is not None and not ConfigFile.products[switch]:
+                    continue
+                DerProd.attributes.update(units)
+                ds = DerProd.addDataset(dsName)
+                ds.columns['Datetime'] = dateTime
+                ds.columns['Datetag'] = dateTag
+                ds.columns['Timetag2'] = timeTag2
+                ds.columns.update(results[name][dsName])
+                ds.columnsToDataset()
@@ -0,0 +1,168 @@
+''' Per-stage timings and memory peaks of the processing, reported next to the outputs '''
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import datetime
+import functools
+import contextlib
+import tracemalloc
+
+
+class Profiler:
+    ''' Timers and tracemalloc peaks around the processing stages.
+
+        Off unless the environment variable HYPERCP_PROFILE is set before start-up: TRUE records times
+        and memory peaks, TIME only times (tracemalloc slows the processing down several fold).
+        Stages nest, e.g. L2/ZhangRho, and repeated calls of a stage are added up. Each output file of
+        a level gets a JSON report <output>_profile.json when the level is done. Peaks are the largest
+        traced memory above what was in use when the stage was entered.
+    '''
+    mode = os.getenv('HYPERCP_PROFILE', '').upper()
+    enabled = mode in ('TRUE', 'TIME')
+    traceMemory = mode == 'TRUE'
+    reportSuffix = '_profile.json'
+
+    # Open stages: [name, start time, traced memory at start, peak traced memory]
+    _open = []
+    # Stage path: {'calls', 'seconds', 'peakMB'}, in the order stages first end
+    _stages = {}
+    _outputs = []
+    # tracemalloc was started here, and is stopped with the reports
+    _startedTracing = False
+
+    @staticmethod
+    def reset():
+        Profiler._stages = {}
+        Profiler._outputs = []
+
+    @staticmethod
+    def _notePeak():
+        ''' Carry the peak since the last note to all open stages and start a new peak '''
+        if not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in Profiler._open:
+            frame[3] = max(frame[3], peak)
+        tracemalloc.reset_peak()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def stage(name):
+        ''' Time the body of a with statement as stage name, inside the stages already open '''
+        if not Profiler.enabled:
+            yield
+            return
+
+        if Profiler.traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            Profiler._startedTracing = True
+        Profiler._notePeak()
+        current = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        frame = [name, time.perf_counter(), current, current]
+        Profiler._open.append(frame)
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - frame[1]
+            Profiler._notePeak()
+            path = '/'.join(f[0] for f in Profiler._open)
+            Profiler._open.pop()
+            record = Profiler._stages.setdefault(path, {'calls': 0, 'seconds': 0.0, 'peakMB': 0.0})
+            record['calls'] += 1
+            record['seconds'] += seconds
+            record['peakMB'] = max(record['peakMB'], (frame[3] - frame[2])/2**20)
+
+    @staticmethod
+    def timed(name):
+        ''' Decorator timing each call of a function as stage name '''
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not Profiler.enabled:
+                    return func(*args, **kwargs)
+                with Profiler.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def addOutput(outFilePath):
+        ''' Output file(s) of the level being processed, to write the reports next to '''
+        if not Profiler.enabled or not outFilePath:
+            return
+        if isinstance(outFilePath, str):
+            outFilePath = [outFilePath]
+        Profiler._outputs.extend(fp for fp in outFilePath if fp not in Profiler._outputs)
+
+    @staticmethod
+    def report(level, inFilePath=None):
+        ''' Stages recorded since the last reset, as written to the JSON reports '''
+        return {
+            'level': level,
+            'input': inFilePath,
+            'created': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'memoryTraced': Profiler.traceMemory,
+            'stages': {path: {'calls': record['calls'], 'seconds': round(record['seconds'], 6),
+                              'peakMB': round(record['peakMB'], 3)}
+                       for path, record in Profiler._stages.items()},
+        }
+
+    @staticmethod
+    def reportPath(outFilePath):
+        return f'{os.path.splitext(outFilePath)[0]}{Profiler.reportSuffix}'
+
+    @staticmethod
+    def writeReports(level, inFilePath=None):
+        ''' Write the report of a level next to each of its outputs and start over. Returns the
+            report paths. '''
+        if not Profiler.enabled:
+            return []
+        report = Profiler.report(level, inFilePath)
+        written = []
+        for outFilePath in Profiler._outputs:
+            fp = Profiler.reportPath(outFilePath)
+            try:
+                tmpPath = f'{fp}.{os.getpid()}.tmp'
+                with open(tmpPath, 'w', encoding='utf-8') as f:
+                    json.dump(dict(report, output=outFilePath), f, indent=1)
+                os.replace(tmpPath, fp)
+                written.append(fp)
+            except OSError as err:
+                logging.warning(f'Profiler: unable to write {fp}: {err}')
+        Profiler.reset()
+        if Profiler._startedTracing and not Profiler._open:
+            tracemalloc.stop()
+            Profiler._startedTracing = False
+        return written
+
+    @staticmethod
+    def merge(reports):
+        ''' Stages of several reports (e.g. the files of one level) added up, peaks taken at their largest '''
+        stages = {}
+        for report in reports:
+            for path, record in report['stages'].items():
+                merged = stages.setdefault(path, {'calls': 0, 'seconds': 0.0, 'peakMB': 0.0})
+                merged['calls'] += record['calls']
+                merged['seconds'] += record['seconds']
+                merged['peakMB'] = max(merged['peakMB'], record['peakMB'])
+        return {'stages': stages}
+
+    @staticmethod
+    def compare(report, baseline, tolerance=0.25, minSeconds=0.05):
+        ''' Stages of report slower than in the baseline report by more than tolerance (a fraction of
+            the baseline time). Differences below minSeconds are ignored as timer noise.
+            Returns [(stage, baseline seconds, seconds)]. '''
+        regressions = []
+        for path, record in report['stages'].items():
+            reference = baseline['stages'].get(path)
+            if reference is None:
+                continue
+            seconds, refSeconds = record['seconds'], reference['seconds']
+            if seconds - refSeconds > max(tolerance*refSeconds, minSeconds):
+                regressions.append((path, refSeconds, seconds))
+        return regressions
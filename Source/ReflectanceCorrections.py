@@ -0,0 +1,115 @@
+''' NIR residual and negative value corrections of (ensemble x band) reflectance arrays '''
+import numpy as np
+
+from Source.EnsembleView import EnsembleView
+
+
+class ReflectanceCorrections:
+    ''' Corrections of Rrs and nLw spectra held as (ensemble x band) arrays. Rows are ensembles,
+        columns the wavebands of the grid. Band masks are computed once per wavelength grid. '''
+
+    # Mueller and Austin 1995: data show a minimum near 725; using an average from above 750
+    #   leads to negative reflectances. Use the minimum between 700 and 800 (spectrally flat).
+    simpleWindow = (700, 800)
+
+    # Ruddick et al. 2005/2006 similarity spectrum. These ratios are for rho = pi*Rrs
+    α1 = 2.35 # 720/780 only good for rho(720)<0.03
+    α2 = 1.91 # 780/870 try to avoid, data is noisy here
+    threshold = 0.03
+    # Waveband: window of the grid interpolated to it
+    simSpecWindows = {720: (700, 750), 780: (760, 800), 870: (850, 890)}
+
+    _grids = {}
+
+    @staticmethod
+    def grid(wavelength):
+        ''' Wavelengths and band masks of a grid, computed once per grid '''
+        key = tuple(float(wl) for wl in wavelength)
+        if key not in ReflectanceCorrections._grids:
+            w = np.asarray(key)
+            masks = {'wavelength': w}
+            lo, hi = ReflectanceCorrections.simpleWindow
+            masks['simple'] = (w >= lo) & (w <= hi)
+            for wl, (lo, hi) in ReflectanceCorrections.simSpecWindows.items():
+                masks[wl] = (w >= lo) & (w <= hi)
+            ReflectanceCorrections._grids[key] = masks
+        return ReflectanceCorrections._grids[key]
+
+    @staticmethod
+    def simpleNIR(rrs, nLw, wavelength):
+        ''' Offsets of the simple NIR residual correction for each row: the minimum of each spectrum
+            between 700 and 800 nm. Returns Rrs offsets, nLw offsets and the rows where the Rrs offset
+            was negative and reverted to 0. '''
+        window = ReflectanceCorrections.grid(wavelength)['simple']
+        rrsNIRCorr = np.min(rrs[:, window], axis=1)
+        nLwNIRCorr = np.min(nLw[:, window], axis=1)
+
+        # NOTE: SeaWiFS protocols for residual NIR were never intended to ADD reflectance
+        #   This is most likely in blue, non-turbid waters not intended for NIR offset correction.
+        #   Revert to NIR correction of 0 when this happens.
+        bad = rrsNIRCorr < 0
+        rrsNIRCorr[bad] = 0
+        return rrsNIRCorr, nLwNIRCorr, bad
+
+    @staticmethod
+    def simSpecNIR(rrs, wavelength, F0, F0wavelength):
+        ''' Offsets of the similarity spectrum NIR residual correction for each row. F0 is one
+            spectrum on F0wavelength, or one per row. Returns Rrs offsets, nLw offsets, the rows where
+            the 720 nm threshold tripped (780/870 used), and the rows reverted to no correction. '''
+        masks = ReflectanceCorrections.grid(wavelength)
+        w = masks['wavelength']
+        α1, α2 = ReflectanceCorrections.α1, ReflectanceCorrections.α2
+
+        # For simplicity, follow calculation in rho (surface reflectance), then covert to rrs
+        ρ = np.pi * rrs
+        F0 = np.atleast_2d(np.asarray(F0, dtype=np.float64))
+        F0wavelength = np.asarray(F0wavelength, dtype=np.float64)
+
+        def _at(wl):
+            window = masks[wl]
+            return (EnsembleView.interpolate(ρ[:, window], w[window], wl),
+                    EnsembleView.interpolate(F0, F0wavelength, wl))
+
+        ρ1, F01 = _at(720)
+        ρ2, F02 = _at(780)
+        ε = (α1*ρ2 - ρ1)/(α1-1)
+        εnLw = (α1*ρ2*F02 - ρ1*F01)/(α1-1)
+
+        # Reverts to primary mode even on threshold trip in cases where no 870nm available
+        tripped = np.zeros(len(ρ), dtype=bool)
+        if masks[870].any():
+            ρ3, F03 = _at(870)
+            tripped = ~(ρ1 < ReflectanceCorrections.threshold)
+            ε = np.where(tripped, (α2*ρ3 - ρ2)/(α2-1), ε)
+            εnLw = np.where(tripped, (α2*ρ3*F03 - ρ2*F02)/(α2-1), εnLw)
+
+        rrsNIRCorr = ε/np.pi
+        nLwNIRCorr = np.broadcast_to(εnLw/np.pi, rrsNIRCorr.shape).copy()
+
+        # NOTE: This correction is also susceptible to a correction that ADDS to reflectance
+        #   spectrally, depending on spectral shape (see test_SimSpec.m).
+        #   This is most likely in blue, non-turbid waters not intended for SimSpec.
+        #   Revert to NIR correction of 0 when this happens.
+        bad = rrsNIRCorr < 0
+        rrsNIRCorr[bad] = 0
+        nLwNIRCorr[bad] = 0
+        return rrsNIRCorr, nLwNIRCorr, tripped, bad
+
+    @staticmethod
+    def subtract(x, offsets):
+        ''' Subtract one offset per row (spectrally flat), in place '''
+        x -= np.asarray(offsets, dtype=np.float64).reshape(-1, 1)
+
+    @staticmethod
+    def negative(refl, wavelength, VIS):
+        ''' Rows with any negative value within VIS (exclusive). Negative values in the UV below
+            VIS[0]-1 and the NIR from VIS[-1]+1 are set to 0 in place. '''
+        w = ReflectanceCorrections.grid(wavelength)['wavelength']
+        vis = (w > VIS[0]) & (w < VIS[1])
+        outside = ((w >= w.min()) & (w < VIS[0]-1)) | ((w >= VIS[-1]+1) & (w <= w.max()))
+
+        bad = np.any(refl[:, vis] < 0, axis=1)
+        clipped = refl[:, outside]
+        clipped[clipped < 0] = 0
+        refl[:, outside] = clipped
+        return bad
@@ -9,7 +9,8 @@ import matplotlib.pyplot as plt
 from Source.ZhangRho import get_sky_sun_rho, PATH_TO_DATA
 from Source.ConfigFile import ConfigFile
 from Source.Utilities import Utilities
-from Source.HDFRoot import HDFRoot
+from Source.Profiler import Profiler
+from Source.BatchContext import BatchContext
 
 class RhoCorrections:
 
@@ -35,19 +36,14 @@ class RhoCorrections:
         relAz_idx = Utilities.find_nearest(phiViews, relAzMean)
         relAz = phiViews[relAz_idx]
 
-        # load in the LUT HDF file
-        inFilePath = os.path.join(PATH_TO_DATA, 'rhoTable_AO1999.hdf')
+        # The LUT as a 2D array, read once per batch (or process)
         try:
-            lut = HDFRoot.readHDF5(inFilePath)
+            lut = BatchContext.reference('M99')['LUT']
         except Exception:
             msg = "Unable to open M99 LUT."
             Utilities.errorWindow("File Error", msg)
             print(msg)
             Utilities.writeLogFile(msg)
-
-        lutData = lut.groups[0].datasets['LUT'].data
-        # convert to a 2D array
-        lut = np.array(lutData.tolist())
         # match to the row
         row = lut[(lut[:,0] == wind) & (lut[:,1] == sza) & \
             (lut[:,2] == theta) & (lut[:,4] == relAz)]
@@ -149,6 +145,7 @@ class RhoCorrections:
         return rhoScalar, rhoDelta
 
     @staticmethod
+    @Profiler.timed('ZhangRho')
     # def ZhangCorr(windSpeedMean, AOD, cloud, sza, wTemp, sal, relAz, waveBands):
     def ZhangCorr(windSpeedMean, AOD, cloud, sza, wTemp, sal, relAz, sva, waveBands, Propagate = None, db = None):
         Utilities.writeLogFileAndPrint('Calculating Zhang glint correction (FULL MODEL).')
@@ -37,9 +37,14 @@ Notes:
 #==========================================================================================================================================
 
 import re
+import io
+import csv
 from datetime import datetime
 from collections import OrderedDict
 
+import numpy as np
+import pandas as pd
+
 #==========================================================================================================================================
 
 def is_number(s):
@@ -151,9 +156,9 @@ class readSB:
             return
 
         """ Remove any/all newline and carriage return characters """
-        lines = [re.sub("[\r\n]+",'',line).strip() for line in lines]
+        lines = [line.replace('\r','').replace('\n','').strip() for line in lines]
 
-        for line in lines:
+        for iline, line in enumerate(lines):
 
             """ Extract header """
             if not end_header \
@@ -265,36 +270,16 @@ class readSB:
                         print('Warning: No below_detection_limit in file: {:}. Unable to mask values as NaNs. Use no_warn=True to suppress this message.'.format(self.filename))
 
                 end_header = True
-                continue
-
-            """ Extract data after headers """
-            if end_header and line:
-                try:
-                    for var,dat in zip(_vars,re.split(delim,line)):
-                        if is_number(dat):
-                            if is_int(dat):
-                                dat = int(dat)
-                            else:
-                                dat = float(dat)
-
-                            if mask_above_detection_limit and self.adl != '':
-                                if dat == float(self.adl):
-                                    dat = float('nan')
+                break
 
-                            if mask_below_detection_limit and self.bdl != '':
-                                if dat == float(self.bdl):
-                                    dat = float('nan')
+        """ Extract data after headers in a single columnar read """
+        if end_header:
+            try:
+                self._read_data(lines[iline+1:], _vars, delim, mask_missing, mask_above_detection_limit, mask_below_detection_limit)
 
-                            if mask_missing and dat == self.missing:
-                                dat = float('nan')
-
-                        self.data[var].append(dat)
-
-                    self.length = self.length + 1
-
-                except Exception as e:
-                    raise Exception('Unable to parse data from line in file: {:}. Error: {:}. In line: {:}'.format(self.filename,e,line))
-                    return
+            except Exception as e:
+                raise Exception('Unable to parse data from file: {:}. Error: {:}'.format(self.filename,e))
+                return
 
         try:
             self.variables = OrderedDict(zip(_vars,zip(_vars,_units)))
@@ -307,6 +292,70 @@ class readSB:
 
         return
 
+#==========================================================================================================================================
+
+    def _read_data(self, lines, _vars, delim, mask_missing, mask_above_detection_limit, mask_below_detection_limit):
+        """ Parse the data block with one pandas.read_csv call.
+
+            Values are converted as they were field by field: integers to int, other numbers
+            to float, anything else kept as a string. Fill values are masked as NaN.
+        """
+        sep = {',+': ',', '\\s+': '\\s+', '\\t+': '\\t'}[delim]
+        # Comments are not expected in the data block, but keep them as the header comments are kept
+        self.comments.extend(line[1:] for line in lines if '!' in line and '!/' not in line)
+        text = '\n'.join(line for line in lines if line and '!' not in line)
+        if not text:
+            return
+
+        readArgs = dict(sep=sep, header=None, names=_vars, index_col=False, quoting=csv.QUOTE_NONE, keep_default_na=False)
+        df = pd.read_csv(io.StringIO(text), float_precision='round_trip', **readArgs)
+
+        fills = []
+        if mask_above_detection_limit and self.adl != '':
+            fills.append(float(self.adl))
+        if mask_below_detection_limit and self.bdl != '':
+            fills.append(float(self.bdl))
+        if mask_missing:
+            fills.append(self.missing)
+
+        # Integral values in a float column were read as int if written without a decimal
+        #   point or exponent, so those columns need their text once more
+        integral = {var: np.isfinite(df[var].to_numpy()) & (np.mod(df[var].to_numpy(), 1) == 0)
+                    for var in _vars if df[var].dtype.kind == 'f'}
+        integral = {var: isInt for var, isInt in integral.items() if isInt.any()}
+        if integral:
+            raw = pd.read_csv(io.StringIO(text), dtype=str, usecols=list(integral), **readArgs)
+
+        for var in _vars:
+            values = df[var].to_numpy()
+
+            if values.dtype.kind not in 'iuf':
+                # Non-numeric column (e.g. hh:mm:ss times); convert each field
+                converted = []
+                for dat in values:
+                    dat = str(dat)
+                    if is_number(dat):
+                        dat = int(dat) if is_int(dat) else float(dat)
+                        if dat in fills:
+                            dat = float('nan')
+                    converted.append(dat)
+                self.data[var] = converted
+                continue
+
+            isInt = integral.get(var)
+            if isInt is not None:
+                tokens = raw[var].to_numpy()
+                isInt[isInt] = [not any(c in dat for c in '.eE') for dat in tokens[isInt]]
+            mask = np.isin(values, fills)
+            if mask.any() or isInt is not None and isInt.any():
+                values = values.astype(object)
+                if isInt is not None:
+                    values[isInt] = tokens[isInt].astype(np.int64).tolist()
+                values[mask] = float('nan')
+            self.data[var] = values.tolist()
+
+        self.length = len(df)
+
 #==========================================================================================================================================
 
     def fd_datetime(self):
@@ -2,6 +2,7 @@
 import os
 import time
 import numpy as np
+import pandas as pd
 
 from Source import PATH_TO_CONFIG
 from Source.HDFRoot import HDFRoot
@@ -16,18 +17,22 @@ class SeaBASSWriter:
     @staticmethod
     def sbFileName(fp,headerBlock,formattedData,dtype):
         version = SeaBASSHeader.settings["version"]
+        # Date and time of the first row
+        year, month, day, hour, minute, second = (int(x) for x in formattedData[0][:6])
+        dateStr = f'{year:04d}{month:02d}{day:02d}'
+        timeStr = f'{hour:02d}{minute:02d}{second:02d}'
          # Conforms to SeaBASS file names: Experiment_Cruise_Platform_Instrument_YYMMDD_HHmmSS_Level_DataType_Revision
         if ConfigFile.settings['bL2Stations']:
             station = str(headerBlock['station']).replace('.','_')
             outFileName = \
                 (   f"{os.path.split(fp)[0]}/SeaBASS/{headerBlock['experiment']}_{headerBlock['cruise']}_"
-                    f"{headerBlock['platform']}_{headerBlock['instrument_model']}_{formattedData[0].split(',')[0]}_"
-                    f"{formattedData[0].split(',')[1].replace(':','')}_L2_{dtype}_STATION_{station}_{version}.sb")
+                    f"{headerBlock['platform']}_{headerBlock['instrument_model']}_{dateStr}_"
+                    f"{timeStr}_L2_{dtype}_STATION_{station}_{version}.sb")
         else:
             outFileName = \
             (   f"{os.path.split(fp)[0]}/SeaBASS/{headerBlock['experiment']}_{headerBlock['cruise']}_"
-                f"{headerBlock['platform']}_{headerBlock['instrument_model']}_{formattedData[0].split(',')[0]}_"
-                f"{formattedData[0].split(',')[1].replace(':','')}_L2_{dtype}_{version}.sb")
+                f"{headerBlock['platform']}_{headerBlock['instrument_model']}_{dateStr}_"
+                f"{timeStr}_L2_{dtype}_{version}.sb")
         headerBlock['data_file_name'] = outFileName.split('/')[-1]
         return outFileName
 
@@ -125,54 +130,51 @@ class SeaBASSWriter:
         return headerBlock
 
 
+    # printf-style formats of the data block, keyed on SeaBASS field name. Date and time are
+    #   each written from three (integer valued) columns. Anything else is radiometry.
+    fieldFormats = {
+        'date': '%04d%02d%02d',
+        'time': '%02d:%02d:%02d',
+        'lat': '%.4f',
+        'lon': '%.4f',
+        'RelAz': '%.1f',
+        'SZA': '%.1f',
+        'AOT': '%.4f',
+        'cloud': '%.0f',
+        'wind': '%.1f',
+        'bincount': '%.0f',
+        }
+    dataFormat = '%.6f'
+
+    @staticmethod
+    def rowFormat(fields):
+        ''' Single format string for a data row given the comma separated /fields line '''
+        return ','.join(SeaBASSWriter.fieldFormats.get(field, SeaBASSWriter.dataFormat) for field in fields.split(','))
+
     @staticmethod
     def formatData2(dataset,dsDelta,dtype, units):
+        ''' Returns the data block as a (rows x columns) float array, with date and time split
+            into year, month, day, hour, minute, second columns, along with the /fields and
+            /units lines. NaNs are replaced with -9999.0. See rowFormat for writing the rows. '''
 
         dsCopy = dataset.data.copy() # By copying here, we leave the ancillary data tacked on to radiometry for later
-        # dsDelta = dsDelta.data.copy()
-
-        # Convert Dates and Times and remove from dataset
-        newData = dsCopy
-        dateDay = dsCopy['Datetag'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'Datetag')
-        if dsDelta is not None:
-            if 'Datetag' in dsDelta.columns:
-                del dsDelta.columns['Datetag']
-        dateDT = [Utilities.dateTagToDateTime(x) for x in dateDay]
-        timeTag2 = dsCopy['Timetag2'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'Timetag2')
-        if dsDelta is not None:
-            if 'Timetag2' in dsDelta.columns:
-                del dsDelta.columns['Timetag2']
 
         if dsDelta is not None:
+            for name in ['Datetag', 'Timetag2']:
+                if name in dsDelta.columns:
+                    del dsDelta.columns[name]
             dsDelta.columnsToDataset()
 
-        timeDT = []
-        for i in range(len(dateDT)):
-            timeDT.append(Utilities.timeTag2ToDateTime(dateDT[i],timeTag2[i]))
-
-        # Retrieve ancillaries and remove from dataset (they are not on deltas)
-        lat = dsCopy['LATITUDE'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'LATITUDE')
-        lon = dsCopy['LONGITUDE'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'LONGITUDE')
-        aod = dsCopy['AOD'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'AOD')
-        cloud = dsCopy['CLOUD'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'CLOUD')
-        sza = dsCopy['SZA'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'SZA')
-        relAz = dsCopy['REL_AZ'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'REL_AZ')
-        newData = SeaBASSWriter.removeColumns(newData,'HEADING')
-        newData = SeaBASSWriter.removeColumns(newData,'SOLAR_AZ')
-        wind = dsCopy['WIND'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'WIND')
-        bincount = dsCopy['BINCOUNT'].tolist()
-        newData = SeaBASSWriter.removeColumns(newData,'BINCOUNT')
-
-        dsCopy = newData
+        # Convert Dates and Times
+        dateDT = pd.to_datetime(dsCopy['Datetag'].astype(np.int64).astype(str), format='%Y%j')
+        timeTag2 = dsCopy['Timetag2'].astype(np.int64)
+        dateTimeCols = [dateDT.year, dateDT.month, dateDT.day,
+                        timeTag2 // 10000000, (timeTag2 // 100000) % 100, (timeTag2 // 1000) % 100]
+
+        # Retrieve ancillaries in output order and remove from dataset (they are not on deltas)
+        ancNames = ['LATITUDE','LONGITUDE','REL_AZ','SZA','AOD','CLOUD','WIND','BINCOUNT']
+        ancCols = [dsCopy[name] for name in ancNames]
+        dsCopy = SeaBASSWriter.removeColumns(dsCopy, ['Datetag','Timetag2','HEADING','SOLAR_AZ'] + ancNames)
 
         # Change field names for SeaBASS compliance
         bands = list(dsCopy.dtype.names)
@@ -205,25 +207,15 @@ class SeaBASSWriter:
             unitsLine.extend([units]*lenRad)    # data uncertainty
         unitsLineStr = ','.join(unitsLine)
 
-        # Add data for each row
-        dataOut = []
-        formatStr = str('{:04d}{:02d}{:02d},{:02d}:{:02d}:{:02d},{:.4f},{:.4f},{:.1f},{:.1f}'\
-            + ',{:.4f},{:.0f},{:.1f},{:.0f}' + ',{:.6f}'*lenRad)
+        # Assemble the data block column-wise
+        columns = dateTimeCols + ancCols + [dsCopy[band] for band in bands]
         if dsDelta is not None:
-            formatStr = formatStr + ',{:.6f}' * lenRad
-        for i in range(dsCopy.shape[0]):
-            subList = [lat[i],lon[i],relAz[i],sza[i],aod[i],cloud[i],wind[i],bincount[i]]
-            lineList = [timeDT[i].year,timeDT[i].month,timeDT[i].day,timeDT[i].hour,timeDT[i].minute,timeDT[i].second] +\
-                subList + list(dsCopy[i].tolist())
-
-            if dsDelta is not None:
-                lineList = lineList + list(dsDelta.data[i].tolist())
+            columns += [dsDelta.data[name] for name in dsDelta.data.dtype.names[:lenRad]]
+        dataOut = np.column_stack([np.asarray(col, dtype=float) for col in columns])
 
-            # Replace NaNs with -9999.0
-            lineList = [-9999.0 if np.isnan(element) else element for element in lineList]
+        # Replace NaNs with -9999.0
+        dataOut[np.isnan(dataOut)] = -9999.0
 
-            lineStr = formatStr.format(*lineList)
-            dataOut.append(lineStr)
         return dataOut, fieldsLineStr, unitsLineStr
 
     @staticmethod
@@ -256,8 +248,8 @@ class SeaBASSWriter:
         outFile.write('/units='+units+'\n')
         outFile.write('/end_header\n')
 
-        for line in formattedData:
-            outFile.write(f'{line}\n')
+        # One call for the whole data block
+        np.savetxt(outFile, formattedData, fmt=SeaBASSWriter.rowFormat(fields))
 
         outFile.close()
 
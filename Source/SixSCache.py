@@ -0,0 +1,208 @@
+''' Persistent cache and process pool runner for 6S direct/diffuse irradiance outputs '''
+import os
+import logging
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+from Source import PATH_TO_DATA
+
+
+# 6S output keys in the order they are stored in the cache
+SIXS_OUTPUTS = (
+    'percent_of_direct_solar_irradiance_at_target',
+    'percent_of_diffuse_atmospheric_irradiance_at_target',
+    'direct_solar_irradiance_at_target_[W m-2 um-1]',
+    'diffuse_atmospheric_irradiance_at_target_[W m-2 um-1]',
+    'environement_irradiance_at_target_[W m-2 um-1]',
+)
+# Outputs that are absolute irradiances and scale with Earth-Sun distance
+SIXS_IRRADIANCES = [2, 3, 4]
+
+
+def earthSunFactor(doy):
+    ''' Earth-Sun distance correction applied by 6S (VARSOL) for day of year doy '''
+    om = (0.9856*(np.asarray(doy, dtype=float)-4))*np.pi/180.
+    return 1./((1.-0.01673*np.cos(om))**2)
+
+
+class SixSCache:
+    ''' On-disk store of 6S outputs keyed on quantized (SZA, AOD, water vapour, pressure, wavelength).
+
+        Each key is the tuple of integer bin indices for the five inputs. Values are the
+        SIXS_OUTPUTS for the bin centre, with irradiances normalized to 1 AU so that
+        entries can be shared across dates.
+    '''
+    fileName = 'SixS_cache.npz'
+    # Placeholder bin index for inputs that are not provided (6S defaults used)
+    NOVALUE = -1
+
+    def __init__(self, cacheDir=None, binSZA=0.5, binAOD=0.01, binWV=0.25, binPressure=5.0, binWavelength=1.0):
+        if cacheDir is None:
+            cacheDir = os.path.join(PATH_TO_DATA, 'SixS')
+        self.cacheDir = cacheDir
+        self.filePath = os.path.join(cacheDir, SixSCache.fileName)
+        self.binWidths = np.array([binSZA, binAOD, binWV, binPressure, binWavelength], dtype=float)
+        self.table = {}
+        self.nNew = 0
+        self.load()
+
+    def quantize(self, sza, aod, wv, pressure, wavelength):
+        ''' Return the integer bin key for a set of 6S inputs '''
+        key = []
+        for value, width in zip((sza, aod, wv, pressure, wavelength), self.binWidths):
+            if value is None or np.isnan(value):
+                key.append(SixSCache.NOVALUE)
+            else:
+                key.append(int(np.round(value/width)))
+        return tuple(key)
+
+    def binCentre(self, key):
+        ''' Return the (sza, aod, wv, pressure, wavelength) values at the centre of a bin '''
+        return tuple(None if k == SixSCache.NOVALUE else float(k*w) for k, w in zip(key, self.binWidths))
+
+    def load(self):
+        ''' Populate the table from disk. Entries made with different bin widths are ignored. '''
+        if not os.path.isfile(self.filePath):
+            return
+        try:
+            with np.load(self.filePath) as npz:
+                if not np.allclose(npz['binWidths'], self.binWidths):
+                    logging.info('SixSCache: bin widths changed, starting a new cache')
+                    return
+                for key, value in zip(npz['keys'], npz['values']):
+                    self.table[tuple(int(k) for k in key)] = value
+        except (OSError, KeyError, ValueError) as err:
+            logging.warning(f'SixSCache: unable to read {self.filePath}: {err}')
+
+    def get(self, key):
+        return self.table.get(key)
+
+    def put(self, key, values):
+        self.table[key] = np.asarray(values, dtype=float)
+        self.nNew += 1
+
+    def save(self):
+        ''' Merge with any entries written by other processes since loading, then replace the file atomically '''
+        if self.nNew == 0:
+            return
+        os.makedirs(self.cacheDir, exist_ok=True)
+        onDisk = SixSCache.__new__(SixSCache)
+        onDisk.filePath, onDisk.binWidths, onDisk.table = self.filePath, self.binWidths, {}
+        onDisk.load()
+        onDisk.table.update(self.table)
+        self.table = onDisk.table
+
+        keys = np.array(list(self.table.keys()), dtype=np.int64).reshape(-1, 5)
+        values = np.array(list(self.table.values()), dtype=float).reshape(-1, len(SIXS_OUTPUTS))
+        tmpPath = f'{self.filePath}.{os.getpid()}.tmp.npz'
+        np.savez(tmpPath, keys=keys, values=values, binWidths=self.binWidths)
+        os.replace(tmpPath, self.filePath)
+        self.nNew = 0
+
+
+# Per-process 6S instance, created once by the pool initializer
+_model = None
+
+def _initWorker(modelFactory):
+    global _model
+    _model = modelFactory()
+
+def _runAtmosphere(params, wavelengths, month, day):
+    ''' Run 6S for one atmosphere over a list of wavelengths. Returns a (wavelengths x outputs) array.
+
+        Irradiance at the target does not depend on viewing geometry or solar azimuth,
+        so these are fixed to keep cache entries independent of them.
+    '''
+    sza, aod, _wv, _pressure = params
+    s = _model
+    s.geometry(sun_zen=sza, sun_azi=0.0, view_zen=180, view_azi=0.0, month=month, day=day)
+    s.gas()
+    s.aerosol(aot_550=aod)
+    s.target_altitude()
+    s.sensor_altitude()
+    s.to_be_implemented()
+
+    result = np.full((len(wavelengths), len(SIXS_OUTPUTS)), np.nan)
+    for i, wavelength in enumerate(wavelengths):
+        s.wavelength(wavelength)
+        temp = s.run()
+        for j, name in enumerate(SIXS_OUTPUTS):
+            result[i, j] = float(temp[name])
+    return result
+
+
+class SixSRunner:
+    ''' Runs the cache misses of a set of 6S requests in a process pool '''
+
+    def __init__(self, cache, modelFactory, maxWorkers=None):
+        self.cache = cache
+        self.modelFactory = modelFactory
+        self.maxWorkers = maxWorkers or os.cpu_count()
+
+    def run(self, atmospheres, wavelengths, month, day):
+        ''' Return an (atmospheres x wavelengths x outputs) array for atmospheres given as
+            [(sza, aod, wv, pressure), ...], with irradiances scaled to the given date.
+        '''
+        keys = [[self.cache.quantize(*params, wl) for wl in wavelengths] for params in atmospheres]
+
+        # Collect misses, grouped by atmosphere so each task configures 6S once
+        misses = {}
+        for row in keys:
+            for key in row:
+                if self.cache.get(key) is None:
+                    misses.setdefault(key[:4], set()).add(key[4])
+        if misses:
+            nMiss = sum(len(v) for v in misses.values())
+            logging.info(f'SixSRunner: {nMiss} of {len(keys)*len(wavelengths)} 6S runs not cached')
+            self._runMisses(misses, month, day)
+            self.cache.save()
+
+        factor = earthSunFactor(SixSRunner.dayOfYear(month, day))
+        result = np.empty((len(atmospheres), len(wavelengths), len(SIXS_OUTPUTS)))
+        for i, row in enumerate(keys):
+            for j, key in enumerate(row):
+                result[i, j, :] = self.cache.get(key)
+        result[:, :, SIXS_IRRADIANCES] *= factor
+        return result
+
+    def _runMisses(self, misses, month, day):
+        tasks = []
+        for atmosKey, wlKeys in misses.items():
+            wlKeys = sorted(wlKeys)
+            centre = self.cache.binCentre(atmosKey + (0,))[:4]
+            wavelengths = [self.cache.binCentre(atmosKey + (k,))[4] for k in wlKeys]
+            tasks.append((atmosKey, wlKeys, centre, wavelengths))
+
+        norm = 1./earthSunFactor(SixSRunner.dayOfYear(month, day))
+        # Daemonic workers (e.g. multiprocessing.Pool in run_Sample_Data.py) cannot spawn children
+        if self.maxWorkers <= 1 or len(tasks) == 1 or multiprocessing.current_process().daemon:
+            _initWorker(self.modelFactory)
+            results = [_runAtmosphere(centre, wavelengths, month, day) for _, _, centre, wavelengths in tasks]
+        else:
+            nWorkers = min(self.maxWorkers, len(tasks))
+            logging.info(f'SixSRunner: running on {nWorkers} processes')
+            with concurrent.futures.ProcessPoolExecutor(max_workers=nWorkers, initializer=_initWorker,
+                                                        initargs=(self.modelFactory,)) as executor:
+                futures = [executor.submit(_runAtmosphere, centre, wavelengths, month, day)
+                           for _, _, centre, wavelengths in tasks]
+                results = [future.result() for future in futures]
+
+        for (atmosKey, wlKeys, _, _), result in zip(tasks, results):
+            result[:, SIXS_IRRADIANCES] *= norm
+            for k, values in zip(wlKeys, result):
+                self.cache.put(atmosKey + (k,), values)
+
+    @staticmethod
+    def dayOfYear(month, day):
+        # 6S uses a non-leap calendar
+        return int(np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])[month-1] + day)
+
+    @staticmethod
+    def sparseWavelengths(wvl, step):
+        ''' Regular wavelength grid at step nm spanning wvl, on which 6S is run before interpolation '''
+        wvl = np.asarray(wvl, dtype=float)
+        if step <= 0:
+            return wvl
+        return np.arange(np.floor(wvl.min()/step)*step, np.ceil(wvl.max()/step)*step + step/2, step)
@@ -1,18 +1,17 @@
-import os
 import numpy as np
 
 # for analysis NPL developed packages
 import punpy
-from Source.Weight_RSR import Weight_RSR
+from Source.BandConvolution import BandConvolution
 
 # zhangWrapper
 import collections
-from Source import ZhangRho, PATH_TO_DATA
+from Source import ZhangRho
 from Source.RhoCorrections import RhoCorrections
 
 # M99 Rho
-from Source.HDFRoot import HDFRoot
 from Source.Utilities import Utilities
+from Source.BatchContext import BatchContext
 
 # TODO remove this part and properly address the warning
 import warnings
@@ -415,63 +414,39 @@ class Propagate:
 
     @staticmethod
     def band_Conv_Sensor_S3A(Hyperspec, Wavelengths) -> np.array:
-        """ band convolution of Rrs for S3A using Source.Weight_RSR"""
+        """ band convolution of Rrs for S3A using Source.BandConvolution"""
 
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processSentinel3Bands(
-            hyperspec_as_dict, sensor='A'
-        )
-        return np.array([value[0] for value in rad_band.values()])  # convert back to np.array for correct punpy return
+        return BandConvolution.convolve('Sentinel3A', Wavelengths, Hyperspec)[1]
 
     @staticmethod
     def band_Conv_Sensor_S3B(Hyperspec, Wavelengths) -> np.array:
-        """ band convolution of Rrs for S3B using Source.Weight_RSR"""
+        """ band convolution of Rrs for S3B using Source.BandConvolution"""
 
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processSentinel3Bands(
-            hyperspec_as_dict, sensor='B'
-        )
-        return np.array([value[0] for value in rad_band.values()])  # return np.array for punpy
+        return BandConvolution.convolve('Sentinel3B', Wavelengths, Hyperspec)[1]
 
     @staticmethod
     def band_Conv_Sensor_AQUA(Hyperspec, Wavelengths) -> np.array:
-        """ band convolution of Rrs for EOS-AQUA Modis using Source.Weight_RSR"""
+        """ band convolution of Rrs for EOS-AQUA Modis using Source.BandConvolution"""
 
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processMODISBands(
-            hyperspec_as_dict, sensor='A'
-        )
-        return np.array([value[0] for value in rad_band.values()])  # return as np.array for punpy
+        return BandConvolution.convolve('MODISA', Wavelengths, Hyperspec)[1]
 
     @staticmethod
     def band_Conv_Sensor_TERRA(Hyperspec, Wavelengths) -> np.array:
-        """ band convolution of Rrs for EOS-Terra Modis using Source.Weight_RSR"""
+        """ band convolution of Rrs for EOS-Terra Modis using Source.BandConvolution"""
 
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processMODISBands(
-            hyperspec_as_dict, sensor='T'
-        )
-        return np.array([value[0] for value in rad_band.values()])
+        return BandConvolution.convolve('MODIST', Wavelengths, Hyperspec)[1]
 
     @staticmethod
     def band_Conv_Sensor_NOAA_J(Hyperspec, Wavelengths) -> np.array:
-        """ band convolution of Rrs for NOAA Virrs using Source.Weight_RSR"""
+        """ band convolution of Rrs for NOAA Virrs using Source.BandConvolution"""
 
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processVIIRSBands(
-            hyperspec_as_dict, sensor='J'  # uses else to identify, string does not matter
-        )
-        return np.array([value[0] for value in rad_band.values()])
+        return BandConvolution.convolve('VIIRSJ', Wavelengths, Hyperspec)[1]
 
     @staticmethod
     def band_Conv_Sensor_NOAA_N(Hyperspec, Wavelengths) -> np.array:
-        """ band convolution of Rrs for NOAA Virrs using Source.Weight_RSR"""
+        """ band convolution of Rrs for NOAA Virrs using Source.BandConvolution"""
 
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processVIIRSBands(
-            hyperspec_as_dict, sensor='N'
-        )
-        return np.array([value[0] for value in rad_band.values()])
+        return BandConvolution.convolve('VIIRSN', Wavelengths, Hyperspec)[1]
 
     @staticmethod
     def no_Conv(Hyperspec, *args, **kwargs) -> np.array:
@@ -555,13 +530,8 @@ class Propagate:
         relAz_idx = Utilities.find_nearest(phiViews, relAzMean)
         relAz = phiViews[relAz_idx]
 
-        # load in the LUT HDF file
-        inFilePath = os.path.join(PATH_TO_DATA, 'rhoTable_AO1999.hdf')
-        lut = HDFRoot.readHDF5(inFilePath)
-        lutData = lut.groups[0].datasets['LUT'].data
-
-        # convert to a 2D array
-        lut = np.array(lutData.tolist())
+        # The LUT as a 2D array, read once per batch (or process)
+        lut = BatchContext.reference('M99')['LUT']
 
         # match to the row
         row = lut[(lut[:, 0] == wind) & (lut[:, 1] == sza) & \
@@ -5,13 +5,11 @@ import collections
 from collections import Counter
 import csv
 import re
-import logging
 import hashlib
 from tqdm import tqdm
 import requests
 from PyQt5.QtWidgets import QMessageBox
 import pytz
-import matplotlib.pyplot as plt
 from matplotlib.pyplot import cm
 import matplotlib.dates as mdates
 import numpy as np
@@ -26,6 +24,9 @@ from Source.SB_support import readSB
 from Source.HDFRoot import HDFRoot
 from Source.ConfigFile import ConfigFile
 from Source.MainConfig import MainConfig
+from Source.LogWriter import LogWriter
+from Source.L1bqcKernel import L1bqcKernel
+from Source.PlotJobs import PlotSpec, PlotJobs
 # from Source.Uncertainty_Visualiser import Show_Uncertainties  # class for uncertainty visualisation plots
 register_matplotlib_converters()
 
@@ -361,6 +362,7 @@ class Utilities:
 
     @staticmethod
     def errorWindow(winText,errorText):
+        LogWriter.flush()
         if os.environ["HYPERINSPACE_CMD"].lower() == 'true':
             return
         msgBox = QMessageBox()
@@ -391,11 +393,8 @@ class Utilities:
 
     @staticmethod
     def writeLogFile(logText, mode='a'):
-        if not os.path.exists('Logs'):
-            logging.getLogger().warning('Made directory: Logs/')
-            os.mkdir('Logs')
-        with open('Logs/' + os.environ["LOGFILE"], mode, encoding="utf-8") as logFile:
-            logFile.write(logText + "\n")
+        # Lines are buffered and written by a background thread; see LogWriter.flush
+        LogWriter.write(logText, mode)
 
     # Converts degrees minutes to decimal degrees format
     @staticmethod
@@ -1095,6 +1094,29 @@ class Utilities:
         return darkGroup
 
 
+    @staticmethod
+    def badTimesMask(timeStamp, badTimes):
+        ''' Boolean mask over timeStamp, True where it falls in any [start, stop] pair (inclusive)
+            of badTimes. timeStamp need not be sorted. '''
+        timeStamp = pd.to_datetime(list(timeStamp), utc=True).asi8
+        badMask = np.zeros(len(timeStamp), dtype=bool)
+        if len(badTimes) == 0 or len(timeStamp) == 0:
+            return badMask
+
+        starts = pd.to_datetime([pair[0] for pair in badTimes], utc=True).asi8
+        stops = pd.to_datetime([pair[1] for pair in badTimes], utc=True).asi8
+
+        # Count the ranges covering each (sorted) record with a difference array
+        order = np.argsort(timeStamp, kind='stable')
+        sortedTime = timeStamp[order]
+        first = np.searchsorted(sortedTime, starts, side='left')
+        last = np.searchsorted(sortedTime, stops, side='right')
+        cover = np.zeros(len(timeStamp) + 1, dtype=np.int64)
+        np.add.at(cover, first, 1)
+        np.add.at(cover, last, -1)
+        badMask[order] = np.cumsum(cover[:-1]) > 0
+        return badMask
+
     @staticmethod
     def filterData(group, badTimes, level = None):
         ''' Delete flagged records. Level is only specified to point to the timestamp.
@@ -1103,9 +1125,6 @@ class Utilities:
             
             filterData for L1AQC is contained within ProcessL1aqc.py'''
 
-        # NOTE: This is still very slow on long files with many badTimes, despite badTimes being filtered for
-        #   unique pairs.
-
         Utilities.writeLogFileAndPrint(f'Remove {group.id} Data')
         # internal switch to trigger the reset of CAL & BACK
         # dataset that we have to delete to avoid conflict during filtering
@@ -1139,37 +1158,16 @@ class Utilities:
         startLength = len(timeStamp)
         Utilities.writeLogFileAndPrint(f'   Length of dataset prior to removal {startLength} long')
 
-        # Delete the records in badTime ranges from each dataset in the group
-        finalCount = 0
+        # Delete the records in badTime ranges from each dataset in the group, all at once
         originalLength = len(timeStamp)
-        for dateTime in badTimes:
-            # Need to reinitialize for each loop
-            startLength = len(timeStamp)
-            newTimeStamp = []
-
-            # Utilities.writeLogFileAndPrint(f'Eliminate data between: {dateTime}'
-            # print(msg)
-            # Utilities.writeLogFile(msg)
-
-            start = dateTime[0]
-            stop = dateTime[1]
-
-            if startLength > 0:
-                rowsToDelete = []
-                for i in range(startLength):
-                    if start <= timeStamp[i] and stop >= timeStamp[i]:
-                        try:
-                            rowsToDelete.append(i)
-                            finalCount += 1
-                        except Exception:
-                            print('error')
-                    else:
-                        newTimeStamp.append(timeStamp[i])
-                group.datasetDeleteRow(rowsToDelete)
-            else:
-                Utilities.writeLogFileAndPrint('Data group is empty. Continuing.')
-                break
-            timeStamp = newTimeStamp.copy()
+        if originalLength > 0:
+            badMask = Utilities.badTimesMask(timeStamp, badTimes)
+            finalCount = int(np.count_nonzero(badMask))
+            if finalCount:
+                group.datasetDeleteRow(np.flatnonzero(badMask))
+        else:
+            Utilities.writeLogFileAndPrint('Data group is empty. Continuing.')
+            finalCount = 0
 
         if ConfigFile.settings['SensorType'].lower() == 'trios' or ConfigFile.settings['SensorType'].lower() == "sorad":
             # TRIOS: reset CAL and BACK as before filtering
@@ -1193,9 +1191,8 @@ class Utilities:
 
     @staticmethod
     def plotRadiometry(root, filename, rType, plotDelta = False):
-        # refresh figure to ensure debug plots do not affect Rrs plotting
-        # plt.figure()
-        plt.figure(1, figsize=(8,6))
+        # Drawn later by PlotJobs; the file path is set once known
+        spec = PlotSpec(None, figsize=(8,6))
 
         outDir = MainConfig.settings["outDir"]
 
@@ -1460,7 +1457,7 @@ class Utilities:
                 minRad = 0
 
             # Plot the Hyperspectral spectrum
-            plt.plot(wave, y, c=c, zorder=-1)
+            spec.plot(wave, y, c=c, zorder=-1)
 
             # Add the Wei QA score to the Rrs plot, if calculated
             if rType == 'Rrs':
@@ -1469,10 +1466,9 @@ class Utilities:
                     groupProd = root.getGroup("DERIVED_PRODUCTS")
                     score = groupProd.getDataset('wei_QA')
                     QA_note = f"Wei: {score.columns['QA_score'][i]}"
-                    axes = plt.gca()
-                    axes.text(0.7,1.1 - (i+1)/len(score.columns['QA_score']), QA_note,
+                    spec.text(0.7,1.1 - (i+1)/len(score.columns['QA_score']), QA_note,
                         verticalalignment='top', horizontalalignment='right',
-                        transform=axes.transAxes,
+                        transform=PlotSpec.AXES,
                         color=c, fontdict=font)
 
                 # Add the QWIP score to the Rrs plot, if calculated
@@ -1480,15 +1476,14 @@ class Utilities:
                     groupProd = root.getGroup("DERIVED_PRODUCTS")
                     score = groupProd.getDataset('qwip')
                     QA_note = f"QWIP: {score.columns['qwip'][i]:5.3f}"
-                    axes = plt.gca()
-                    axes.text(0.75,1.1 - (i+1)/len(score.columns['qwip']), QA_note,
+                    spec.text(0.75,1.1 - (i+1)/len(score.columns['qwip']), QA_note,
                         verticalalignment='top', horizontalalignment='left',
-                        transform=axes.transAxes,
+                        transform=PlotSpec.AXES,
                         color=c, fontdict=font)
 
             # Add Lw to Lt plots
             if rType=='LT':
-                plt.plot(subwave, yLw, c=c, zorder=-1, linestyle='dashed')
+                spec.plot(subwave, yLw, c=c, zorder=-1, linestyle='dashed')
 
             if plotDelta:
                 # Generate the polygon for uncertainty bounds
@@ -1498,11 +1493,11 @@ class Utilities:
                 deltaPolyyPlus = y + list(reversed(dPolyyPlus))
                 deltaPolyyMinus = y + list(reversed(dPolyyMinus))
 
-                plt.fill(deltaPolyx, deltaPolyyPlus, alpha=0.2, c=c, zorder=-1)
-                plt.fill(deltaPolyx, deltaPolyyMinus, alpha=0.2, c=c, zorder=-1)
+                spec.fill(deltaPolyx, deltaPolyyPlus, alpha=0.2, c=c, zorder=-1)
+                spec.fill(deltaPolyx, deltaPolyyMinus, alpha=0.2, c=c, zorder=-1)
 
                 # deltaPolyy = dPolyyMinus + list(reversed(dPolyyPlus))
-                # plt.fill(deltaPolyx, deltaPolyy, alpha=0.2, c=c, zorder=-1)
+                # spec.fill(deltaPolyx, deltaPolyy, alpha=0.2, c=c, zorder=-1)
 
 
                 if rType=='LT':
@@ -1510,74 +1505,73 @@ class Utilities:
                     dPolyyMinus = [(yLw[i]-dyLw[i]) for i in range(len(yLw))]
                     deltaPolyyPlus = yLw + list(reversed(dPolyyPlus))
                     deltaPolyyMinus = yLw + list(reversed(dPolyyMinus))
-                    plt.fill(deltaPolyx, deltaPolyyPlus, alpha=0.2, c=c, zorder=-1)
-                    plt.fill(deltaPolyx, deltaPolyyMinus, alpha=0.2, c=c, zorder=-1)
+                    spec.fill(deltaPolyx, deltaPolyyPlus, alpha=0.2, c=c, zorder=-1)
+                    spec.fill(deltaPolyx, deltaPolyyMinus, alpha=0.2, c=c, zorder=-1)
 
             # Satellite Bands
             if ConfigFile.settings['bL2WeightMODISA']:
                 # Plot the MODISA spectrum
                 if plotDelta:
-                    plt.errorbar(wave_MODISA, y_MODISA, yerr=dy_MODISA, fmt='.',
+                    spec.errorbar(wave_MODISA, y_MODISA, yerr=dy_MODISA, fmt='.',
                         elinewidth=0.1, color=c, ecolor='black', zorder=3) # ecolor is broken
                 else:
-                    plt.plot(wave_MODISA, y_MODISA, 'o', c=c)
+                    spec.plot(wave_MODISA, y_MODISA, 'o', c=c)
             if ConfigFile.settings['bL2WeightMODIST']:
                 # Plot the MODIST spectrum
                 if plotDelta:
-                    plt.errorbar(wave_MODIST, y_MODIST, yerr=dy_MODIST, fmt='.',
+                    spec.errorbar(wave_MODIST, y_MODIST, yerr=dy_MODIST, fmt='.',
                         elinewidth=0.1, color=c, ecolor='black')
                 else:
-                    plt.plot(wave_MODIST, y_MODIST, 'o', c=c)
+                    spec.plot(wave_MODIST, y_MODIST, 'o', c=c)
             if ConfigFile.settings['bL2WeightVIIRSN']:
                 # Plot the VIIRSN spectrum
                 if plotDelta:
-                    plt.errorbar(wave_VIIRSN, y_VIIRSN, yerr=dy_VIIRSN, fmt='.',
+                    spec.errorbar(wave_VIIRSN, y_VIIRSN, yerr=dy_VIIRSN, fmt='.',
                         elinewidth=0.1, color=c, ecolor='black')
                 else:
-                    plt.plot(wave_VIIRSN, y_VIIRSN, 'o', c=c)
+                    spec.plot(wave_VIIRSN, y_VIIRSN, 'o', c=c)
             if ConfigFile.settings['bL2WeightVIIRSJ']:
                 # Plot the VIIRSJ spectrum
                 if plotDelta:
-                    plt.errorbar(wave_VIIRSJ, y_VIIRSJ, yerr=dy_VIIRSJ, fmt='.',
+                    spec.errorbar(wave_VIIRSJ, y_VIIRSJ, yerr=dy_VIIRSJ, fmt='.',
                         elinewidth=0.1, color=c, ecolor='black')
                 else:
-                    plt.plot(wave_VIIRSJ, y_VIIRSJ, 'o', c=c)
+                    spec.plot(wave_VIIRSJ, y_VIIRSJ, 'o', c=c)
             if ConfigFile.settings['bL2WeightSentinel3A']:
                 # Plot the Sentinel3A spectrum
                 if plotDelta:
-                    plt.errorbar(wave_Sentinel3A, y_Sentinel3A, yerr=dy_Sentinel3A, fmt='.',
+                    spec.errorbar(wave_Sentinel3A, y_Sentinel3A, yerr=dy_Sentinel3A, fmt='.',
                         elinewidth=0.1, color=c, ecolor='black')
                 else:
-                    plt.plot(wave_Sentinel3A, y_Sentinel3A, 'o', c=c)
+                    spec.plot(wave_Sentinel3A, y_Sentinel3A, 'o', c=c)
             if ConfigFile.settings['bL2WeightSentinel3B']:
                 # Plot the Sentinel3B spectrum
                 if plotDelta:
-                    plt.errorbar(wave_Sentinel3B, y_Sentinel3B, yerr=dy_Sentinel3B, fmt='.',
+                    spec.errorbar(wave_Sentinel3B, y_Sentinel3B, yerr=dy_Sentinel3B, fmt='.',
                         elinewidth=0.1, color=c, ecolor='black')
                 else:
-                    plt.plot(wave_Sentinel3B, y_Sentinel3B, 'o', c=c)
+                    spec.plot(wave_Sentinel3B, y_Sentinel3B, 'o', c=c)
 
-        axes = plt.gca()
-        axes.set_title(filename, fontdict=font)
-        # axes.set_xlim([390, 800])
-        axes.set_ylim([minRad, maxRad])
+        spec.set_title(filename, fontdict=font)
+        # spec.set_xlim([390, 800])
+        spec.set_ylim([minRad, maxRad])
 
-        plt.xlabel('wavelength (nm)', fontdict=font)
+        spec.set_xlabel('wavelength (nm)', fontdict=font)
         if rType=='LT':
-            plt.ylabel(f'LT (LW dash) [{units}]', fontdict=font)
+            spec.set_ylabel(f'LT (LW dash) [{units}]', fontdict=font)
         else:
-            plt.ylabel(f'{rType} [{units}]', fontdict=font)
+            spec.set_ylabel(f'{rType} [{units}]', fontdict=font)
 
         # Tweak spacing to prevent clipping of labels
-        plt.subplots_adjust(left=0.15)
-        plt.subplots_adjust(bottom=0.15)
+        spec.call('fig.subplots_adjust', left=0.15)
+        spec.call('fig.subplots_adjust', bottom=0.15)
 
         note = f'Interval: {ConfigFile.settings["fL2TimeInterval"]} s'
-        axes.text(0.2, -0.1, note,
+        spec.text(0.2, -0.1, note,
         verticalalignment='top', horizontalalignment='right',
-        transform=axes.transAxes,
+        transform=PlotSpec.AXES,
         color='black', fontdict=font)
-        axes.grid()
+        spec.grid()
 
         # plt.show() # --> QCoreApplication::exec: The event loop is already running
 
@@ -1585,9 +1579,8 @@ class Utilities:
         # filebasename = filename.split('_')
         # fp = os.path.join(plotDir, '_'.join(filebasename[0:-1]) + '_' + rType + '.png')
         filebasename = filename.split('.hdf')
-        fp = os.path.join(plotDir, filebasename[0] + '_' + rType + '.png')
-        plt.savefig(fp)
-        plt.close() # This prevents displaying the plot on screen with certain IDEs
+        spec.fp = os.path.join(plotDir, filebasename[0] + '_' + rType + '.png')
+        PlotJobs.add(spec)
 
 
     @staticmethod
@@ -1623,7 +1616,6 @@ class Utilities:
             'size': 16,
             }
 
-        progressBar = None
         # Steps in wavebands used for plots
         # This happens prior to waveband interpolation, so each interval is ~3.3 nm
         step = ConfigFile.settings['fL1bPlotInterval']
@@ -1634,69 +1626,37 @@ class Utilities:
             l = round((len(xData.data.dtype.names)-3)/step) # skip date and time and datetime
             index = l
         else:
-            l = len(xData.data.dtype.names)-3 # skip date and time and datetime
             index = None
 
-        if index:
-            progressBar = tqdm(total=l, unit_scale=True, unit_divisor=step)
-
-        ticker = 0
-        if index is not None:
-            for k in xData.data.dtype.names:
-                if index % step == 0:
-                    if k == "Datetag" or k == "Timetag2" or k == "Datetime":
-                        continue
-                    ticker += 1
-                    progressBar.update(1)
-
-                    x = np.copy(xData.data[k]).tolist()
-                    new_x = np.copy(newXData.columns[k]).tolist()
-
-                    fig = plt.figure(figsize=(12, 4))
-                    ax = fig.add_subplot(1, 1, 1)
-                    # ax.plot(xTimer, x, 'bo', label='Raw')
-                    ax.plot(dfx['x'], x, 'bo', label='Raw')
-                    # ax.plot(yTimer, new_x, 'k.', label='Interpolated')
-                    ax.plot(dfy['x'], new_x, 'k.', label='Interpolated')
-                    ax.legend()
-
-                    plt.xlabel('Date/Time (UTC)', fontdict=font)
-                    plt.ylabel(f'{instr}_{k}', fontdict=font)
-                    plt.subplots_adjust(left=0.15)
-                    plt.subplots_adjust(bottom=0.15)
-
-                    # plt.savefig(os.path.join('Plots','L1E',f'{fileBaseName}_{instr}_{k}.png'))
-                    plt.savefig(os.path.join(plotDir,f'{fileBaseName}_{instr}_{k}.png'))
-                    plt.close()
+        # Time axes shared by all the band plots of this instrument
+        xTime = dfx['x'].to_numpy()
+        yTime = dfy['x'].to_numpy()
+
+        for k in xData.data.dtype.names:
+            if index is not None and index % step != 0:
+                index +=1
+                continue
+            if k == "Datetag" or k == "Timetag2" or k == "Datetime":
+                continue
+
+            if index is None and k == 'NONE':
+                spec = PlotSpec(os.path.join(plotDir,f'{fileBaseName}_{instr}.png'), figsize=(12, 4))
+            else:
+                spec = PlotSpec(os.path.join(plotDir,f'{fileBaseName}_{instr}_{k}.png'), figsize=(12, 4))
+            # ax.plot(xTimer, x, 'bo', label='Raw')
+            spec.plot(xTime, np.copy(xData.data[k]), 'bo', label='Raw')
+            # ax.plot(yTimer, new_x, 'k.', label='Interpolated')
+            spec.plot(yTime, np.asarray(newXData.columns[k]), 'k.', label='Interpolated')
+            spec.legend()
+
+            spec.set_xlabel('Date/Time (UTC)', fontdict=font)
+            spec.set_ylabel(f'{instr}_{k}' if index is not None else f'{instr}', fontdict=font)
+            spec.call('fig.subplots_adjust', left=0.15)
+            spec.call('fig.subplots_adjust', bottom=0.15)
+            PlotJobs.add(spec)
+            if index is not None:
                 index +=1
-        else:
-            for k in xData.data.dtype.names:
-                if k == "Datetag" or k == "Timetag2" or k == "Datetime":
-                    continue
-
-                x = np.copy(xData.data[k]).tolist()
-                new_x = np.copy(newXData.columns[k]).tolist()
-
-                fig = plt.figure(figsize=(12, 4))
-                ax = fig.add_subplot(1, 1, 1)
-                # ax.plot(xTimer, x, 'bo', label='Raw')
-                ax.plot(dfx['x'], x, 'bo', label='Raw')
-                # ax.plot(yTimer, new_x, 'k.', label='Interpolated')
-                ax.plot(dfy['x'], new_x, 'k.', label='Interpolated')
-                ax.legend()
-
-                plt.xlabel('Date/Time (UTC)', fontdict=font)
-                plt.ylabel(f'{instr}', fontdict=font)
-                plt.subplots_adjust(left=0.15)
-                plt.subplots_adjust(bottom=0.15)
-
-                if k == 'NONE':
-                    plt.savefig(os.path.join(plotDir,f'{fileBaseName}_{instr}.png'))
-                else:
-                    plt.savefig(os.path.join(plotDir,f'{fileBaseName}_{instr}_{k}.png'))
-                plt.close()
 
-        print('\n')
 
     @staticmethod
     def specFilter(inFilePath, Dataset, timeStamp, station=None, filterRange=[400, 700],\
@@ -1724,94 +1684,51 @@ class Utilities:
                     'size': 16,
                     }
 
-        # Collect each column name ignoring Datetag and Timetag2 (i.e. each wavelength) in the desired range
-        x = []
-        wave = []
-        for k in Dataset.data.dtype.names:
-            if Utilities.isFloat(k):
-                if float(k)>=filterRange[0] and float(k)<=filterRange[1]:
-                    x.append(k)
-                    wave.append(float(k))
-
-        # Read in each spectrum
-        total = Dataset.data.shape[0]
-        specArray = []
-        normSpec = []
+        # Each wavelength in the desired range as a (time x wavelength) array
+        wave, specArray = L1bqcKernel.toArray(Dataset, waveRange=filterRange)
 
         if ConfigFile.settings['bL1bqcEnableSpecQualityCheckPlot']:
-            # cmap = cm.get_cmap("jet")
-            # color=iter(cmap(np.linspace(0,1,total)))
             print('Creating plots...')
-            # plt.figure(1, figsize=(10,8))
-            plt.figure(figsize=(10,8))
+            spec = PlotSpec(None, figsize=(10,8))
 
-        for timei in range(total):
-            y = []
-            for waveband in x:
-                y.append(Dataset.data[waveband][timei])
-
-            specArray.append(y)
-            peakIndx = y.index(max(y))
-            normSpec.append(y / y[peakIndx])
-            # plt.plot(wave, y / y[peakIndx], color='grey')
-
-        normSpec = np.array(normSpec)
-
-        aveSpec = np.median(normSpec, axis = 0)
-        stdSpec = np.std(normSpec, axis = 0)
-
-        badTimes  = []
-        badIndx = []
-        # For each spectral band...
-        for i in range(0, len(normSpec[0])-1):
-            # For each timeseries radiometric measurement...
-            for j, rad in enumerate(normSpec[:,i]):
-                # Identify outliers and negative values for elimination
-                if rad > (aveSpec[i] + filterFactor*stdSpec[i]) or \
-                    rad < (aveSpec[i] - filterFactor*stdSpec[i]) or \
-                    rad < 0:
-                    badIndx.append(j)
-                    badTimes.append(timeStamp[j])
-
-        badIndx = np.unique(badIndx)
-        badTimes = np.unique(badTimes)
+        # Identify outliers and negative values for elimination
+        badMask, normSpec, aveSpec, stdSpec = L1bqcKernel.specOutliers(specArray, filterFactor)
+        badTimes = np.unique(np.asarray(timeStamp)[badMask])
         # Duplicates each element to a list of two elements in a list:
-        badTimes = np.rot90(np.matlib.repmat(badTimes,2,1), 3)
+        badTimes = np.column_stack([badTimes, badTimes])
 
         if ConfigFile.settings['bL1bqcEnableSpecQualityCheckPlot']:
             # t0 = time.time()
-            for timei in range(total):
+            for timei in range(specArray.shape[0]):
             # for i in badIndx:
-                if timei in badIndx:
-                    # plt.plot( wave, normSpec[i,:], color='red', linewidth=0.5, linestyle=(0, (1, 10)) ) # long-dot
-                    plt.plot( wave, normSpec[timei,:], color='red', linewidth=0.5, linestyle=(0, (5, 5)) ) # dashed
+                if badMask[timei]:
+                    # spec.plot( wave, normSpec[i,:], color='red', linewidth=0.5, linestyle=(0, (1, 10)) ) # long-dot
+                    spec.plot( wave, normSpec[timei,:], color='red', linewidth=0.5, linestyle=(0, (5, 5)) ) # dashed
                 else:
-                    plt.plot(wave, normSpec[timei,:], color='grey')
+                    spec.plot(wave, normSpec[timei,:], color='grey')
 
             # t1 = time.time()
             # print(f'Time elapsed: {str(round((t1-t0)))} Seconds')
 
-            plt.plot(wave, aveSpec, color='black', linewidth=0.5)
-            plt.plot(wave, aveSpec + filterFactor*stdSpec, color='black', linewidth=2, linestyle='dashed')
-            plt.plot(wave, aveSpec - filterFactor*stdSpec, color='black', linewidth=2, linestyle='dashed')
+            spec.plot(wave, aveSpec, color='black', linewidth=0.5)
+            spec.plot(wave, aveSpec + filterFactor*stdSpec, color='black', linewidth=2, linestyle='dashed')
+            spec.plot(wave, aveSpec - filterFactor*stdSpec, color='black', linewidth=2, linestyle='dashed')
 
-            plt.title(f'Sigma = {filterFactor}', fontdict=font)
-            plt.xlabel('Wavelength [nm]', fontdict=font)
-            plt.ylabel(f'{rType} [Normalized to peak value]', fontdict=font)
-            plt.subplots_adjust(left=0.15)
-            plt.subplots_adjust(bottom=0.15)
-            axes = plt.gca()
-            axes.grid()
+            spec.set_title(f'Sigma = {filterFactor}', fontdict=font)
+            spec.set_xlabel('Wavelength [nm]', fontdict=font)
+            spec.set_ylabel(f'{rType} [Normalized to peak value]', fontdict=font)
+            spec.call('fig.subplots_adjust', left=0.15)
+            spec.call('fig.subplots_adjust', bottom=0.15)
+            spec.grid()
 
             # Save the plot
             _,filename = os.path.split(inFilePath)
             filebasename,_ = filename.rsplit('_',1)
             if station:
-                fp = os.path.join(plotDir, f'STATION_{station}_{filebasename}_{rType}.png')
+                spec.fp = os.path.join(plotDir, f'STATION_{station}_{filebasename}_{rType}.png')
             else:
-                fp = os.path.join(plotDir, f'{filebasename}_{rType}.png')
-            plt.savefig(fp)
-            plt.close()
+                spec.fp = os.path.join(plotDir, f'{filebasename}_{rType}.png')
+            PlotJobs.add(spec)
 
         return badTimes
 
@@ -1924,7 +1841,7 @@ class Utilities:
         minIOP = 0
 
         # Plot
-        plt.figure(1, figsize=(8,6))
+        spec = PlotSpec(None, figsize=(8,6))
 
         if algorithm == "qaa" or algorithm == "giop":
             if ConfigFile.products["bL2Prodqaa"] and ConfigFile.products[qaaName]:
@@ -1943,7 +1860,7 @@ class Utilities:
                     #     maxIOP = 20
 
                     # Plot the Hyperspectral spectrum
-                    plt.plot(waveQAA, y, c=c, zorder=-1)
+                    spec.plot(waveQAA, y, c=c, zorder=-1)
 
                     # if plotDelta:
                     #     # Generate the polygon for uncertainty bounds
@@ -1952,8 +1869,8 @@ class Utilities:
                     #     dPolyyMinus = [(y[i]-dy[i]) for i in range(len(y))]
                     #     deltaPolyyPlus = y + list(reversed(dPolyyPlus))
                     #     deltaPolyyMinus = y + list(reversed(dPolyyMinus))
-                    #     plt.fill(deltaPolyx, deltaPolyyPlus, alpha=0.2, c=c, zorder=-1)
-                    #     plt.fill(deltaPolyx, deltaPolyyMinus, alpha=0.2, c=c, zorder=-1)
+                    #     spec.fill(deltaPolyx, deltaPolyyPlus, alpha=0.2, c=c, zorder=-1)
+                    #     spec.fill(deltaPolyx, deltaPolyyMinus, alpha=0.2, c=c, zorder=-1)
             if ConfigFile.products["bL2Prodgiop"] and ConfigFile.products[giopName]:
                 for i in range(totalGIOP):
                     y = []
@@ -1965,7 +1882,7 @@ class Utilities:
                         maxIOP = max(y)+0.1*max(y)
 
                     # Plot the Hyperspectral spectrum
-                    plt.plot(waveGIOP, y,  c=c, ls='--', zorder=-1)
+                    spec.plot(waveGIOP, y,  c=c, ls='--', zorder=-1)
 
         if algorithm == "gocad":
             if ConfigFile.products["bL2Prodgocad"] and ConfigFile.products[gocadName]:
@@ -1980,7 +1897,7 @@ class Utilities:
 
                     # Plot the point spectrum
                     # plt.scatter(waveGOCAD, y, s=100, c=c, marker='*', zorder=-1)
-                    plt.plot(waveGOCAD, y, c=c, marker='*', markersize=13, linestyle = '', zorder=-1)
+                    spec.plot(waveGOCAD, y, c=c, marker='*', markersize=13, linestyle = '', zorder=-1)
 
                     # Now extrapolate using the slopes
                     Sg = []
@@ -1990,63 +1907,61 @@ class Utilities:
                         if k == '275':
                             wave = np.array(list(range(275, 300)))
                             ag_extrap = agDataGOCAD.data['275'][i] * np.exp(-1*sgDataGOCAD.data[k][i] * (wave - 275))
-                            plt.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
-                            plt.text(285, 0.9*maxIOP - 0.12*yScaler, '{} {:.4f}'.format('S275 = ', sgDataGOCAD.data[k][i]), color=c)
+                            spec.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
+                            spec.text(285, 0.9*maxIOP - 0.12*yScaler, '{} {:.4f}'.format('S275 = ', sgDataGOCAD.data[k][i]), color=c)
 
                         if k == '300':
                             wave = np.array(list(range(300, 355)))
                             # uses the trailing end of the last extrapolation.
                             ag_extrap = ag_extrap[-1] * np.exp(-1*sgDataGOCAD.data[k][i] * (wave - 300))
-                            plt.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
-                            plt.text(300, 0.7*maxIOP - 0.12*yScaler, '{} {:.4f}'.format('S300 = ', sgDataGOCAD.data[k][i]), color=c)
+                            spec.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
+                            spec.text(300, 0.7*maxIOP - 0.12*yScaler, '{} {:.4f}'.format('S300 = ', sgDataGOCAD.data[k][i]), color=c)
 
                         if k == '350':
                             # Use the 350 slope starting at 355 (where we have ag)
                             wave = np.array(list(range(355, 380)))
                             ag_extrap = agDataGOCAD.data['355'][i] * np.exp(-1*sgDataGOCAD.data[k][i] * (wave - 355))
-                            plt.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
-                            plt.text(350, 0.5*maxIOP - 0.12*yScaler, '{} {:.4f}'.format('S350 = ', sgDataGOCAD.data[k][i]), color=c)
+                            spec.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
+                            spec.text(350, 0.5*maxIOP - 0.12*yScaler, '{} {:.4f}'.format('S350 = ', sgDataGOCAD.data[k][i]), color=c)
 
                         if k == '380':
                             wave = np.array(list(range(380, 412)))
                             ag_extrap = agDataGOCAD.data['380'][i] * np.exp(-1*sgDataGOCAD.data[k][i] * (wave - 380))
-                            plt.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
-                            plt.text(380, 0.3*maxIOP - 0.12*yScaler, '{} {:.4f}'.format('S380 = ', sgDataGOCAD.data[k][i]), color=c)
+                            spec.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
+                            spec.text(380, 0.3*maxIOP - 0.12*yScaler, '{} {:.4f}'.format('S380 = ', sgDataGOCAD.data[k][i]), color=c)
 
                         if k == '412':
                             wave = np.array(list(range(412, 700)))
                             ag_extrap = agDataGOCAD.data['412'][i] * np.exp(-1*sgDataGOCAD.data[k][i] * (wave - 412))
-                            plt.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
-                            plt.text(440, 0.15*maxIOP- 0.12*yScaler, '{} {:.4f}'.format('S412 = ', sgDataGOCAD.data[k][i]), color=c)
+                            spec.plot(wave, ag_extrap,  c=[0.9, 0.9, 0.9], ls='--', zorder=-1)
+                            spec.text(440, 0.15*maxIOP- 0.12*yScaler, '{} {:.4f}'.format('S412 = ', sgDataGOCAD.data[k][i]), color=c)
 
                     # Now tack on DOC
-                    plt.text(600, 0.5 - 0.12*yScaler, '{} {:3.2f}'.format('DOC = ', docDataGOCAD.data['doc'][i]) , color=c)
+                    spec.text(600, 0.5 - 0.12*yScaler, '{} {:3.2f}'.format('DOC = ', docDataGOCAD.data['doc'][i]) , color=c)
 
-        axes = plt.gca()
-        axes.set_title(filename, fontdict=font)
-        axes.set_ylim([minIOP, maxIOP])
+        spec.set_title(filename, fontdict=font)
+        spec.set_ylim([minIOP, maxIOP])
 
-        plt.xlabel('wavelength (nm)', fontdict=font)
-        plt.ylabel(f'{label} [1/m]', fontdict=font)
+        spec.set_xlabel('wavelength (nm)', fontdict=font)
+        spec.set_ylabel(f'{label} [1/m]', fontdict=font)
 
         # Tweak spacing to prevent clipping of labels
-        plt.subplots_adjust(left=0.15)
-        plt.subplots_adjust(bottom=0.15)
+        spec.call('fig.subplots_adjust', left=0.15)
+        spec.call('fig.subplots_adjust', bottom=0.15)
 
         note = f'Interval: {ConfigFile.settings["fL2TimeInterval"]} s'
-        axes.text(0.95, 0.95, note,
+        spec.text(0.95, 0.95, note,
         verticalalignment='top', horizontalalignment='right',
-        transform=axes.transAxes,
+        transform=PlotSpec.AXES,
         color='black', fontdict=font)
-        axes.grid()
+        spec.grid()
 
         # plt.show() # --> QCoreApplication::exec: The event loop is already running
 
         # Save the plot
         filebasename = filename.split('_')
-        fp = os.path.join(plotDir, '_'.join(filebasename[0:-1]) + '_' + label + '.png')
-        plt.savefig(fp)
-        plt.close() # This prevents displaying the plot on screen with certain IDEs
+        spec.fp = os.path.join(plotDir, '_'.join(filebasename[0:-1]) + '_' + label + '.png')
+        PlotJobs.add(spec)
 
     @staticmethod
     def readAnomAnalFile(filePath):
@@ -2193,9 +2108,13 @@ class Utilities:
         # try:
         # text_xlabel="Time Series"
         text_ylabel=f'{sensorType}({waveBand}) {lightDark}'
+        fp = os.path.join(plotDir,fileName)
+        # plotName = f'{fp}_W{windowSize}S{sigma}_{sensorType}{lightDark}_{waveBand}.png'
+        plotName = f'{fp}_{sensorType}{lightDark}_{waveBand}.png'
+
         # plt.figure(figsize=(15, 8))
-        fig, ax = plt.subplots(1)
-        fig.autofmt_xdate()
+        spec = PlotSpec(plotName)
+        spec.call('fig.autofmt_xdate')
 
         # First Pass
         y_anomaly = np.array(radiometry1D)[badIndex]
@@ -2207,28 +2126,23 @@ class Utilities:
         y_anomaly3 = np.array(radiometry1D)[badIndex3]
         x_anomaly3 = x[badIndex3]
 
-        plt.plot(x, radiometry1D, marker='o', color='k', linestyle='', fillstyle='none')
-        plt.plot(x_anomaly, y_anomaly, marker='x', color='red', markersize=12, linestyle='')
-        plt.plot(x_anomaly2, y_anomaly2, marker='+', color='red', markersize=12, linestyle='')
-        plt.plot(x_anomaly3, y_anomaly3, marker='o', color='red', markersize=12, linestyle='', fillstyle='full', markerfacecolor='blue')
+        spec.plot(x, radiometry1D, marker='o', color='k', linestyle='', fillstyle='none')
+        spec.plot(x_anomaly, y_anomaly, marker='x', color='red', markersize=12, linestyle='')
+        spec.plot(x_anomaly2, y_anomaly2, marker='+', color='red', markersize=12, linestyle='')
+        spec.plot(x_anomaly3, y_anomaly3, marker='o', color='red', markersize=12, linestyle='', fillstyle='full', markerfacecolor='blue')
         # y_av = moving_average(radiometry1D, window_size)
-        plt.plot(x[3:-3], avg[3:-3], color='green')
+        spec.plot(x[3:-3], avg[3:-3], color='green')
 
         xfmt = mdates.DateFormatter('%y-%m-%d %H:%M')
-        ax.xaxis.set_major_formatter(xfmt)
+        spec.call('xaxis.set_major_formatter', xfmt)
 
-        plt.text(0,0.95,'Marked for exclusions in ALL bands', transform=plt.gcf().transFigure)
-        # plt.xlabel(text_xlabel, fontdict=font)
-        plt.ylabel(text_ylabel, fontdict=font)
-        plt.title('WindowSize = ' + str(windowSize) + ' Sigma Factor = ' + str(sigma), fontdict=font)
-
-        fp = os.path.join(plotDir,fileName)
-        # plotName = f'{fp}_W{windowSize}S{sigma}_{sensorType}{lightDark}_{waveBand}.png'
-        plotName = f'{fp}_{sensorType}{lightDark}_{waveBand}.png'
+        spec.call('fig.text', 0,0.95,'Marked for exclusions in ALL bands', transform=PlotSpec.FIGURE)
+        # spec.set_xlabel(text_xlabel, fontdict=font)
+        spec.set_ylabel(text_ylabel, fontdict=font)
+        spec.set_title('WindowSize = ' + str(windowSize) + ' Sigma Factor = ' + str(sigma), fontdict=font)
 
         print(plotName)
-        plt.savefig(plotName)
-        plt.close()
+        PlotJobs.add(spec)
         # except:
         #     e = sys.exc_info()[0]
         #     print("Error: %s" % e)
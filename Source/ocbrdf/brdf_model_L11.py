@@ -1,7 +1,7 @@
 import numpy as np
 import xarray as xr
 
-from .brdf_utils import ADF_OCP, solve_2nd_order_poly, drop_unused_coords
+from .brdf_utils import ADF_OCP, open_lut, solve_2nd_order_poly, drop_unused_coords
 from .Raman import Raman
 
 
@@ -40,8 +40,8 @@ class L11:
             assert abs(band_ref - band_required) < threshold, 'Band %d nm missing or too far'% band_ref
         self.b442, self.b490, self.b560, self.b665 = bands_ref
 
-        # Read BRDF LUT and compute default coeffs
-        LUT_OCP = xr.open_dataset(adf % 'L11',engine='netcdf4')
+        # Read BRDF LUT (once per process) and compute default coeffs
+        LUT_OCP = open_lut(adf, 'L11')
         self.LUT = xr.Dataset()
         self.LUT['Gw0'] = LUT_OCP.Gw0
         self.LUT['Gw1'] = LUT_OCP.Gw1
@@ -64,7 +64,10 @@ class L11:
     """ Initialize pixel: coefficient at current geometry and water IOP at current bands """
     def init_pixels(self, theta_s, theta_v, delta_phi):
         self.coeffs = self.interp(theta_s, theta_v, delta_phi)
+        self.init_bands()
 
+    """ Initialize water IOPs at current bands, e.g. when coefficients from another set of bands are reused """
+    def init_bands(self):
         # Compute IOPs at current bands
         self.aw = self.awLUT.interp(bands = self.bands, kwargs={'fill_value':'extrapolate'})
         self.bbw = self.bbwLUT.interp(bands = self.bands, kwargs={'fill_value':'extrapolate'})
@@ -1,7 +1,7 @@
 import numpy as np
 import xarray as xr
 
-from .brdf_utils import ADF_OCP, solve_2nd_order_poly, drop_unused_coords
+from .brdf_utils import ADF_OCP, open_lut, interp_linear, solve_2nd_order_poly, drop_unused_coords
 
 ''' Morel et al. (2002) BRDF correction
     R gothic included
@@ -37,32 +37,17 @@ class M02:
             assert abs(band_ref - band_required) < threshold, 'Band %d nm missing or too far' % band_ref
         self.b442, self.b490, self.b510, self.b560 = bands_ref
 
-        # Read BRDF LUT and compute default coeffs
-        LUT_OCP = xr.open_dataset(adf % 'M02',engine='netcdf4')
-        self.LUT = xr.Dataset()
-
-        # Homogeneise naming convention with other methods... (PZA --> OZA transformation comes below...)
-        self.LUT['Rgoth'] = LUT_OCP.r_goth_LUT.rename({'PZA_r_goth':'theta_v_Rgoth',
-                                                       'wind_speeds_r_goth':'wind_Rgoth'})
-        self.LUT['foq'] = LUT_OCP.f_over_q_LUT.rename({'SZA_FOQ':'theta_s',
-                                                       'PZA_FOQ':'theta_v',
-                                                       'RAA_FOQ':'delta_phi',
-                                                       'wind_speeds_FOQ':'wind_foq',
-                                                       'tau_a_FOQ':'aot_foq',
-                                                       'log_chl_FOQ':'log_chl_foq'})
-
-        # f0 factor to convert Rrs to Irradiance Reflectance (R) --> in order to apply OC4ME
-        self.LUT['f0'] = LUT_OCP.f0_LUT
+        # Read BRDF LUT (once per process) and compute default coeffs
+        LUT_OCP = open_lut(adf, 'M02')
+        self.LUT = open_lut(adf, 'M02', M02.prepare_lut)
 
         # Index of refraction
         self.n_w = float(LUT_OCP.water_refraction_index.data)
 
-        # Remove trivial aot indexation
-        self.LUT['foq'] = self.LUT['foq'].squeeze()
-
-        # Interpolate for wind speed.
-        self.LUT['Rgoth'] = self.LUT['Rgoth'].interp(wind_Rgoth=np.clip(wind,0,16))
-        self.LUT['foq'  ] = self.LUT['foq'  ].interp(wind_foq  =np.clip(wind,0,10))
+        # Wind speed. Interpolated along with the geometries, so that the LUT is not
+        # expanded to one copy per record
+        self.wind_Rgoth = np.clip(wind,0,16)
+        self.wind_foq = np.clip(wind,0,10)
 
         #
         self.coeffs0 = self.interp_geometries(0., 0., 0.)
@@ -74,6 +59,28 @@ class M02:
         self.OC4MEchl0 = float(LUT_OCP.oc4me_chl0.values)
         self.niter = LUT_OCP.oc4me_niter
 
+    """ BRDF LUT with naming homogenised with the other methods """
+    @staticmethod
+    def prepare_lut(LUT_OCP):
+        LUT = xr.Dataset()
+
+        # Homogeneise naming convention with other methods... (PZA --> OZA transformation comes below...)
+        LUT['Rgoth'] = LUT_OCP.r_goth_LUT.rename({'PZA_r_goth':'theta_v_Rgoth',
+                                                  'wind_speeds_r_goth':'wind_Rgoth'})
+        LUT['foq'] = LUT_OCP.f_over_q_LUT.rename({'SZA_FOQ':'theta_s',
+                                                  'PZA_FOQ':'theta_v',
+                                                  'RAA_FOQ':'delta_phi',
+                                                  'wind_speeds_FOQ':'wind_foq',
+                                                  'tau_a_FOQ':'aot_foq',
+                                                  'log_chl_FOQ':'log_chl_foq'})
+
+        # f0 factor to convert Rrs to Irradiance Reflectance (R) --> in order to apply OC4ME
+        LUT['f0'] = LUT_OCP.f0_LUT
+
+        # Remove trivial aot indexation
+        LUT['foq'] = LUT['foq'].squeeze()
+        return LUT
+
     """ Initialize pixel: coefficient at current geometry and water IOP at current bands """
 
     def init_pixels(self, theta_s, theta_v, delta_phi):
@@ -91,8 +98,9 @@ class M02:
                                    float(np.min(self.LUT.theta_v)),
                                    float(np.max(self.LUT.theta_v)))
 
-        Rgoth = self.LUT.Rgoth.interp(theta_v_Rgoth=theta_v_Rgoth_0)
-        foq = self.LUT.foq.interp(theta_s=theta_s, theta_v=theta_v_0, delta_phi=delta_phi)
+        # Multilinear, so interpolating wind with the geometries matches interpolating it first
+        Rgoth = self.LUT.Rgoth.interp(theta_v_Rgoth=theta_v_Rgoth_0, wind_Rgoth=self.wind_Rgoth)
+        foq = self.LUT.foq.interp(theta_s=theta_s, theta_v=theta_v_0, delta_phi=delta_phi, wind_foq=self.wind_foq)
 
         return Coeffs(Rgoth, foq)
 
@@ -116,7 +124,7 @@ class M02:
         # f/Q LUT indexed with ln(CHL), i.e. log_e(CHL)
         log_chl_foq = log10_chl_foq * np.log(10)
 
-        forward_mod = coeffs.Rgoth * coeffs.foq.interp(wavelengths_FOQ=wave_foq).interp(log_chl_foq=log_chl_foq)
+        forward_mod = coeffs.Rgoth * interp_linear(coeffs.foq.interp(wavelengths_FOQ=wave_foq), 'log_chl_foq', log_chl_foq)
 
         return forward_mod
 
@@ -147,7 +155,7 @@ class M02:
         log_chl_f0 = log10_chl_f0 * np.log(10)
         f0_chl = self.LUT['f0'].interp(log_chl_f0=log_chl_f0)
 
-        fQ_chl = self.coeffs.foq.interp(log_chl_foq=log10_chl_f0)
+        fQ_chl = interp_linear(self.coeffs.foq, 'log_chl_foq', log10_chl_f0)
 
         # Drop unused coordinates to avoid ambiguities in indexation...
         Rrs = drop_unused_coords(Rrs)
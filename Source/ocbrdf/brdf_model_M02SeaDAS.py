@@ -1,7 +1,7 @@
 import numpy as np
 import xarray as xr
 
-from .brdf_utils import ADF_OCP, solve_2nd_order_poly
+from .brdf_utils import ADF_OCP, open_lut, interp_linear, solve_2nd_order_poly
 
 ''' Morel et al. (2002) BRDF correction
     R gothic NOT included
@@ -36,22 +36,13 @@ class M02SeaDAS:
             assert abs(band_ref - band_required) < threshold, 'Band %d nm missing or too far' % band_ref
         self.b442, self.b490, self.b510, self.b560 = bands_ref
 
-        # Read BRDF LUT and compute default coeffs
-        LUT_OCP = xr.open_dataset(adf % 'M02SeaDAS',engine='netcdf4')
-        self.LUT = xr.Dataset()
-
-        # Homogeneise naming convention with other methods... (PZA --> OZA transformation comes below...)
-        self.LUT['foq'] = LUT_OCP.f_over_q_LUT.rename({'SZA_FOQ':'theta_s',
-                                                       'PZA_FOQ':'theta_v',
-                                                       'RAA_FOQ':'delta_phi',
-                                                       'log_chl_FOQ':'log_chl_foq'})
+        # Read BRDF LUT (once per process) and compute default coeffs
+        LUT_OCP = open_lut(adf, 'M02SeaDAS')
+        self.LUT = open_lut(adf, 'M02SeaDAS', M02SeaDAS.prepare_lut)
 
         # Index of refraction
         self.n_w = float(LUT_OCP.water_refraction_index.data)
 
-        # Remove trivial aot indexation
-        self.LUT['foq'] = self.LUT['foq'].squeeze()
-
         #
         self.coeffs0 = self.interp_geometries(0., 0., 0.)
         self.coeffs = Coeffs(np.nan)
@@ -62,6 +53,21 @@ class M02SeaDAS:
         self.OC4MEchl0 = float(LUT_OCP.oc4me_chl0.values)
         self.niter = LUT_OCP.oc4me_niter
 
+    """ BRDF LUT with naming homogenised with the other methods """
+    @staticmethod
+    def prepare_lut(LUT_OCP):
+        LUT = xr.Dataset()
+
+        # Homogeneise naming convention with other methods... (PZA --> OZA transformation comes below...)
+        LUT['foq'] = LUT_OCP.f_over_q_LUT.rename({'SZA_FOQ':'theta_s',
+                                                  'PZA_FOQ':'theta_v',
+                                                  'RAA_FOQ':'delta_phi',
+                                                  'log_chl_FOQ':'log_chl_foq'})
+
+        # Remove trivial aot indexation
+        LUT['foq'] = LUT['foq'].squeeze()
+        return LUT
+
     """ Initialize pixel: coefficient at current geometry and water IOP at current bands """
 
     def init_pixels(self, theta_s, theta_v, delta_phi):
@@ -99,7 +105,7 @@ class M02SeaDAS:
         # f/Q LUT indexed with ln(CHL), i.e. log_e(CHL)
         log_chl_foq = log10_chl_foq * np.log(10)
 
-        forward_mod = coeffs.foq.interp(wavelengths_FOQ=wave_foq).interp(log_chl_foq=log_chl_foq)
+        forward_mod = interp_linear(coeffs.foq.interp(wavelengths_FOQ=wave_foq), 'log_chl_foq', log_chl_foq)
 
         return forward_mod
 
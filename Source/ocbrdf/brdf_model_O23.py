@@ -1,7 +1,7 @@
 import numpy as np
 import xarray as xr
 
-from .brdf_utils import ADF_OCP, solve_2nd_order_poly, drop_unused_coords
+from .brdf_utils import ADF_OCP, open_lut, solve_2nd_order_poly, drop_unused_coords
 from .Raman import Raman
 
 
@@ -39,8 +39,8 @@ class O23:
             assert abs(band_ref - band_required) < threshold, 'Band %d nm missing or too far'%br
         self.b442, self.b490, self.b560, self.b665 = bands_ref
 
-        # Read BRDF LUT and compute default coeffs
-        LUT_OCP = xr.open_dataset(adf % 'O23',engine='netcdf4')
+        # Read BRDF LUT (once per process) and compute default coeffs
+        LUT_OCP = open_lut(adf, 'O23')
         self.LUT = xr.Dataset()
         self.LUT['Gw0'] = LUT_OCP.Gw0
         self.LUT['Gw1'] = LUT_OCP.Gw1 
@@ -62,7 +62,10 @@ class O23:
     """ Initialize pixel: coefficient at current geometry and water IOP at current bands """
     def init_pixels(self, theta_s, theta_v, delta_phi):
         self.coeffs = self.interp(theta_s, theta_v, delta_phi)
+        self.init_bands()
 
+    """ Initialize water IOPs at current bands, e.g. when coefficients from another set of bands are reused """
+    def init_bands(self):
         # Compute IOPs at current bands
         self.aw = self.awLUT.interp(bands = self.bands, kwargs={'fill_value':'extrapolate'})
         self.bbw = self.bbwLUT.interp(bands = self.bands, kwargs={'fill_value':'extrapolate'})
@@ -1,12 +1,55 @@
 import numpy as np
 import xarray as xr
 import os
+import copy
 
 # Define default auxiliary data file (OLCI OCP ADF)
 ref_path = os.path.dirname(os.path.realpath(__file__))
 # ADF_OCP = os.path.join(ref_path, '..', 'AuxiliaryData/OCP/S3A_OL_2_OCP_AX_20160216T000000_20991231T235959_20240327T100000___________________EUM_O_AL_008.SEN3/OL_2_OCP_AX.nc')
 ADF_OCP = os.path.join(ref_path, 'BRDF_LUTs','BRDF_%s.nc')
 
+# LUTs read from disk once per process, keyed on (file, preparation)
+_LUT_CACHE = {}
+
+def open_lut(adf, name, prepare=None):
+    """ Return the LUT adf % name, loaded in memory on first use and kept for the process.
+    prepare(LUT) optionally derives the form a model works with (renamed, squeezed...);
+    its result is cached as well. Cached LUTs are shared, so do not modify them in place.
+    """
+    key = (adf % name, prepare)
+    if key not in _LUT_CACHE:
+        if prepare is None:
+            with xr.open_dataset(adf % name, engine='netcdf4') as LUT:
+                _LUT_CACHE[key] = LUT.load()
+        else:
+            _LUT_CACHE[key] = prepare(open_lut(adf, name))
+    return _LUT_CACHE[key]
+
+def subset_rows(coeffs, index, dim='n'):
+    """ Shallow copy of a model coefficients object with its dim-indexed arrays restricted to index """
+    subset = copy.copy(coeffs)
+    for k, v in vars(coeffs).items():
+        if isinstance(v, xr.DataArray) and dim in v.dims:
+            setattr(subset, k, v.isel({dim: index}))
+    return subset
+
+def interp_linear(da, dim, x):
+    """ Linear interpolation of da along dim at x, as da.interp({dim: x}) (NaN outside the grid),
+    but with x sharing dimensions with da (e.g. one chl per record) handled by a single gather
+    instead of one interpolation per record
+    """
+    grid = da[dim].values
+    x = xr.DataArray(x)
+    i = np.clip(np.searchsorted(grid, x.values, side='right') - 1, 0, len(grid) - 2)
+    i = xr.DataArray(i, dims=x.dims)
+    w = (x.variable - grid[i.values]) / (grid[i.values + 1] - grid[i.values])
+
+    da = da.drop_vars(dim)
+    lo = da.isel({dim: i})
+    hi = da.isel({dim: i + 1})
+    result = lo + (hi - lo) * xr.DataArray(w, coords=x.coords)
+    return result.where((x >= grid[0]) & (x <= grid[-1]))
+
 def solve_2nd_order_poly(A, B, C):
     """ Solve 2nd order polynomial inversion 
     where coefficients are xr dataArray
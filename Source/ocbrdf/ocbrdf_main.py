@@ -5,7 +5,7 @@ from .brdf_model_M02 import M02
 from .brdf_model_M02SeaDAS import M02SeaDAS
 from .brdf_model_L11 import L11
 from .brdf_model_O23 import O23
-from .brdf_utils import ADF_OCP, squeeze_trivial_dims
+from .brdf_utils import ADF_OCP, open_lut, subset_rows, squeeze_trivial_dims
 
 """
 Main BRDF correction module
@@ -41,93 +41,151 @@ Main BRDF correction module
 """
 
 
+class BRDFEngine:
+    """ BRDF correction of several datasets with the same model
+        LUTs are read once per process (see brdf_utils.open_lut). Coefficients interpolated at the
+        geometry of the previous dataset are reused when the next one has the same sza, vza, raa
+        and wind (e.g. hyperspectral and multispectral Rrs of the same ensembles), and records
+        that have converged are no longer iterated.
+    """
+    models = {'M02': M02, 'M02SeaDAS': M02SeaDAS, 'L11': L11, 'O23': O23}
+    # Fields not updated by the model inversion
+    fixedFields = ['Rw', 'Rw_unc', 'sza', 'vza', 'raa', 'wind', 'aot', 'nrrs', 'C_brdf', 'convergeFlag']
+
+    def __init__(self, brdf_model='L11', adf=None):
+        if brdf_model not in self.models:
+            print("BRDF model %s not supported" % brdf_model)
+            sys.exit(1)
+        self.brdf_model = brdf_model
+        self.adf = adf
+        self.geometry = None
+        self.coeffs = None
+
+    """ Initialise the model at the bands and geometry of ds """
+    def init_model(self, ds):
+        if self.brdf_model == 'M02':
+            BRDF_model = M02(bands=ds.bands, aot=ds.aot, wind=ds.wind, adf=self.adf)
+        else:
+            BRDF_model = self.models[self.brdf_model](bands=ds.bands, adf=self.adf)
+
+        geometry = [ds[k] for k in ['sza', 'vza', 'raa', 'wind']]
+        if self.geometry is not None and all(a.dims == b.dims and np.array_equal(a.values, b.values, equal_nan=True)
+                                             for a, b in zip(geometry, self.geometry)):
+            BRDF_model.coeffs, BRDF_model.coeffs0 = self.coeffs
+            if hasattr(BRDF_model, 'init_bands'):
+                BRDF_model.init_bands()
+        else:
+            BRDF_model.init_pixels(ds['sza'], ds['vza'], ds['raa'])
+            self.geometry = geometry
+            self.coeffs = (BRDF_model.coeffs, BRDF_model.coeffs0)
+
+        return BRDF_model
+
+    """ Correct ds (see module description for the required and output fields) """
+    def correct(self, ds):
+        brdf_model = self.brdf_model
+
+        # Squeeze trivial dimensions (e.g. # of casts, extractions, etc. to avoid interpolation issues)
+        ds, squeezedDims = squeeze_trivial_dims(ds)
+
+        # Initialise model and pixels
+        BRDF_model = self.init_model(ds)
+
+        # Compute IOP and normalize by iterating
+        ds['nrrs'] = ds['Rw'] / np.pi
+
+        ds['convergeFlag'] = (0 * ds['sza']).astype(bool)
+        ds['C_brdf'] = 0 * ds['nrrs'] + 1
+
+        coeffs, coeffs0 = BRDF_model.coeffs, BRDF_model.coeffs0
+        for iter_brdf in range(int(BRDF_model.niter)):
+
+            # M02: Initialise chl_iter
+            if brdf_model in ['M02', 'M02SeaDAS'] and (iter_brdf == 0):
+                chl_iter = {}
+                ds['log10_chl'] = 0 * ds['sza'] + float(np.log10(BRDF_model.OC4MEchl0))
+                chl_iter[-1]    = 0 * ds['sza'] + float(BRDF_model.OC4MEchl0)
+
+            # Only iterate the records that have not converged yet
+            active = None
+            if 'n' in ds['convergeFlag'].dims and bool(ds['convergeFlag'].any()):
+                active = np.flatnonzero(~ds['convergeFlag'].values)
+                if active.size == 0:
+                    break
+                dsIter = ds.isel(n=active)
+                BRDF_model.coeffs = subset_rows(coeffs, active)
+                BRDF_model.coeffs0 = subset_rows(coeffs0, active)
+            else:
+                dsIter = ds
+
+            dsIter = BRDF_model.backward(dsIter, iter_brdf)
+            if active is None:
+                ds = dsIter
+            else:
+                # Write back the retrievals of the active records
+                for name, var in dsIter.data_vars.items():
+                    if name in ds and 'n' in var.dims and name not in self.fixedFields:
+                        ds[name][{'n': active}] = var.transpose(*ds[name].dims).data
+
+            # M02: Check convergence (dummy for M02SeaDAS for the moment... epsilon set to 0)
+            if brdf_model in ['M02', 'M02SeaDAS']:
+                chl_iter[iter_brdf] = 10 ** ds['log10_chl']
+                #  Check if convergence is reached |chl_old-chl_new| < epsilon * chl_new
+                ds['convergeFlag'] = (ds['convergeFlag']) | (
+                    (np.abs(chl_iter[iter_brdf - 1] - chl_iter[iter_brdf]) < float(BRDF_model.OC4MEepsilon) * chl_iter[
+                        iter_brdf]))
+
+            # Apply forward model in both geometries
+            forward_mod = BRDF_model.forward(dsIter)
+            forward_mod0 = BRDF_model.forward(dsIter, normalized=True)
+
+            ratio = forward_mod0 / forward_mod
+
+            # Drop remnant coordinates to avoid ambiguities in the update of the BRDF factor.
+            for coord in ratio.coords:
+                if coord not in ds['C_brdf'].coords:
+                    ratio = ratio.drop(coord)
+
+            # Update the BRDF factor of the records not converged before this iteration
+            if active is None:
+                ds['C_brdf'] = xr.where(ds['convergeFlag'], ds['C_brdf'], ratio)
+            else:
+                ratio = xr.where(ds['convergeFlag'].isel(n=active), ds['C_brdf'].isel(n=active), ratio)
+                ds['C_brdf'][{'n': active}] = ratio.transpose(*ds['C_brdf'].dims).data
+                BRDF_model.coeffs, BRDF_model.coeffs0 = coeffs, coeffs0
+
+            # Normalize reflectance
+            ds['nrrs'] = ds['Rw'] / np.pi * ds['C_brdf']
+
+        # Flag BRDF where NaN and set to 1 (no correction applied).
+        ds['C_brdf_fail'] = np.isnan(ds['C_brdf'])
+        ds['C_brdf'] = xr.where(ds['C_brdf_fail'], 1, ds['C_brdf'])
+        ds['nrrs'] = xr.where(ds['C_brdf_fail'], ds['Rw'] / np.pi, ds['nrrs'])
+
+        # If QAA_fail is raised, raise C_brdf_fail (but still apply C_brdf).
+        if 'QAA_fail' in ds:
+            ds['C_brdf_fail'] = (ds['C_brdf_fail']) | (ds['QAA_fail'])
+
+        # Compute uncertainty
+        ds = brdf_uncertainty(ds, self.adf)
+
+        # Compute flag
+        ds['flags_level2'] = ds['Rw'] * 0  # TODO
+
+        # Convert to reflectance unit
+        ds['rho_ex_w'] = ds['nrrs'] * np.pi
+
+        # Expand squeezed trivial dimensions
+        for dim,d0 in squeezedDims.items():
+            ds = ds.expand_dims(dim,axis=d0)
+
+        return ds
+
+
 def brdf_prototype(ds, adf=None, brdf_model='L11'):
     # TEST brdf_models not supported in the GUI: hard overwrite
     # brdf_model = 'M02SeaDAS'
-
-    # Squeeze trivial dimensions (e.g. # of casts, extractions, etc. to avoid interpolation issues)
-    ds, squeezedDims = squeeze_trivial_dims(ds)
-
-    # Initialise model
-    if brdf_model == 'M02':
-        BRDF_model = M02(bands=ds.bands, aot=ds.aot, wind=ds.wind, adf=None)  # Don't use brdf_py.ADF context
-    elif brdf_model == 'M02SeaDAS':
-        BRDF_model = M02SeaDAS(bands=ds.bands, adf=None)  # Don't use brdf_py.ADF context
-    elif brdf_model == 'L11':
-        BRDF_model = L11(bands=ds.bands, adf=None)  # Don't use brdf_py.ADF context
-    elif brdf_model == 'O23':
-        BRDF_model = O23(bands=ds.bands, adf=None)  # Don't use brdf_py.ADF context
-    else:
-        print("BRDF model %s not supported" % brdf_model)
-        sys.exit(1)
-
-    # Init pixel
-    BRDF_model.init_pixels(ds['sza'], ds['vza'], ds['raa'])
-
-    # Compute IOP and normalize by iterating
-    ds['nrrs'] = ds['Rw'] / np.pi
-
-    ds['convergeFlag'] = (0 * ds['sza']).astype(bool)
-    ds['C_brdf'] = 0 * ds['nrrs'] + 1
-
-    for iter_brdf in range(int(BRDF_model.niter)):
-
-        # M02: Initialise chl_iter
-        if brdf_model in ['M02', 'M02SeaDAS'] and (iter_brdf == 0):
-            chl_iter = {}
-            ds['log10_chl'] = 0 * ds['sza'] + float(np.log10(BRDF_model.OC4MEchl0))
-            chl_iter[-1]    = 0 * ds['sza'] + float(BRDF_model.OC4MEchl0)
-
-        ds = BRDF_model.backward(ds, iter_brdf)
-
-        # M02: Check convergence (dummy for M02SeaDAS for the moment... epsilon set to 0)
-        if brdf_model in ['M02', 'M02SeaDAS']:
-            chl_iter[iter_brdf] = 10 ** ds['log10_chl']
-            #  Check if convergence is reached |chl_old-chl_new| < epsilon * chl_new
-            ds['convergeFlag'] = (ds['convergeFlag']) | (
-                (np.abs(chl_iter[iter_brdf - 1] - chl_iter[iter_brdf]) < float(BRDF_model.OC4MEepsilon) * chl_iter[
-                    iter_brdf]))
-
-        # Apply forward model in both geometries
-        # forward_mod = BRDF_model.forward(ds).transpose('n', 'bands')
-        # forward_mod0 = BRDF_model.forward(ds, normalized=True).transpose('n', 'bands')
-        forward_mod = BRDF_model.forward(ds)
-        forward_mod0 = BRDF_model.forward(ds, normalized=True)
-
-        ratio = forward_mod0 / forward_mod
-
-        # Drop remnant coordinates to avoid ambiguities in the update of the BRDF factor.
-        for coord in ratio.coords:
-            if coord not in ds['C_brdf'].coords:
-                ratio = ratio.drop(coord)
-
-        # Normalize reflectance
-        ds['C_brdf'] = xr.where(ds['convergeFlag'], ds['C_brdf'], ratio)
-        ds['nrrs'] = ds['Rw'] / np.pi * ds['C_brdf']
-
-    # Flag BRDF where NaN and set to 1 (no correction applied).
-    ds['C_brdf_fail'] = np.isnan(ds['C_brdf'])
-    ds['C_brdf'] = xr.where(ds['C_brdf_fail'], 1, ds['C_brdf'])
-    ds['nrrs'] = xr.where(ds['C_brdf_fail'], ds['Rw'] / np.pi, ds['nrrs'])
-
-    # If QAA_fail is raised, raise C_brdf_fail (but still apply C_brdf).
-    if 'QAA_fail' in ds:
-        ds['C_brdf_fail'] = (ds['C_brdf_fail']) | (ds['QAA_fail'])
-
-    # Compute uncertainty
-    ds = brdf_uncertainty(ds)
-
-    # Compute flag
-    ds['flags_level2'] = ds['Rw'] * 0  # TODO
-
-    # Convert to reflectance unit
-    ds['rho_ex_w'] = ds['nrrs'] * np.pi
-
-    # Expand squeezed trivial dimensions
-    for dim,d0 in squeezedDims.items():
-        ds = ds.expand_dims(dim,axis=d0)
-
-    return ds
+    return BRDFEngine(brdf_model, adf).correct(ds)
 
 def brdf_uncertainty(ds, adf=None):
     ''' Compute uncertainty of BRDF factor and propagate to nrrs '''
@@ -136,7 +194,7 @@ def brdf_uncertainty(ds, adf=None):
     if adf is None:
         adf = ADF_OCP
     # LUT = xr.open_dataset(adf,group='BRDF').unc
-    LUT = xr.open_dataset(adf % 'UNC', engine='netcdf4')
+    LUT = open_lut(adf, 'UNC')
 
     # Interpolate relative uncertainty
     unc = LUT['unc'].interp(lambda_unc=ds.bands, theta_s_unc=ds.sza, theta_v_unc=ds.vza,
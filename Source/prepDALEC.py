@@ -13,105 +13,103 @@
 """
 
 import argparse
+import numpy as np
 import pandas as pd
 
 
-def find_line_number(file_path):
+def find_line_number(lines):
     """
-    Reads a text file and returns the line number of the first occurrence of the data in order to skip the header.
+    Returns the line number of the first occurrence of the data in order to skip the header.
 
     Args:
-        file_path (str): The path to the text file.
+        lines (list): The lines of the text file.
 
     Returns:
         int: The line number (starting from 1) if the text is found, otherwise None.
         str: The header text at the beginning of the raw data files.
     """
-    try:
-        header = ""
-        with open(file_path, 'r', encoding="utf-8") as file:
-            for line_number, line in enumerate(file, 1):
-                header += line
-                if "---------OUTPUT FORMAT---------" in line:
-                    return line_number, header
-        return None  # Target text not found
-    except FileNotFoundError:
-        return None
+    for line_number, line in enumerate(lines, 1):
+        if "---------OUTPUT FORMAT---------" in line:
+            return line_number, "".join(lines[:line_number])
+    return None, None  # Target text not found
 
 
-def split_csv_hourly(input_file, output_prefix):
+def group_hourly(input_file):
     """
-    Splits a large TXT file into hourly TXT files based on a timestamp column. 
-    NOTE: TimeStamp needs to be the 4th value in each row in the data file. 
+    Reads a TXT file once and groups its data rows by hour, in memory.
+    NOTE: TimeStamp needs to be the 4th value in each row in the data file.
 
     Args:
         input_file (str): Path to the input TXT file.
-        output_prefix (str): Path to output file directory 
-    """
 
-    #step 0: Initialization
-    print("---- Initializing Data...")
-    output_prefix += f"/{input_file.split('/')[-1][0:8]}"
-    csv_data_line_number, header = find_line_number(input_file)
+    Returns:
+        str: The header text at the beginning of the raw data file.
+        list: The data rows (stripped lines).
+        list: (hour, row indices) for each hour, in time order. Rows keep their file order within an hour.
+    """
+    with open(input_file, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    csv_data_line_number, header = find_line_number(lines)
     if csv_data_line_number is None:
-        return
+        return None, [], []
+
+    # Skip the header and the line after it; skip over empty rows
+    first = csv_data_line_number + 1
+    rows = [(counter, line.strip()) for counter, line in enumerate(lines[first:], first) if line.count(",") > 0]
+    counters = np.array([counter for counter, _ in rows], dtype=np.int64)
+    rows = [line for _, line in rows]
+
+    # ISO timestamps are parsed together; anything else one by one as before
+    stamps = pd.Series([line.split(",", 4)[3] for line in rows], dtype=object)
+    timestamps = pd.to_datetime(stamps, format="ISO8601", utc=True, errors="coerce")
+    good = timestamps.notna().to_numpy()
+    for i in np.flatnonzero(~good):
+        try:
+            timestamp = pd.to_datetime(stamps[i])
+            if timestamp.tz is None:
+                print(f'Timezone naive timestamp found at {timestamp}. Converting to UTC.')
+                timestamp = timestamp.tz_localize(tz='UTC')
+            timestamps[i] = timestamp.tz_convert('UTC')
+            good[i] = True
+        except ValueError as err:
+            print(f'Bad datetime data in raw file row {counters[i]}: {err}')
+
+    # Round down to the hour; stable sort so that each hour is one range of row indices
+    index = np.flatnonzero(good)
+    hours = timestamps[index].dt.floor('h').dt.tz_localize(None).to_numpy()
+    order = np.argsort(hours, kind="stable")
+    hours, index = hours[order], index[order]
+    starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+    ends = np.r_[starts[1:], len(hours)]
+    groups = [(pd.Timestamp(hours[start], tz='UTC'), index[start:end]) for start, end in zip(starts, ends)]
+
+    return header, rows, groups
 
 
-    # Step 1: Read original file as raw text lines
-    print("---- Reading Input File...")
-    with open(input_file, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+def split_csv_hourly(input_file, output_prefix):
+    """
+    Splits a large TXT file into hourly TXT files based on a timestamp column.
+    NOTE: TimeStamp needs to be the 4th value in each row in the data file.
+
+    Args:
+        input_file (str): Path to the input TXT file.
+        output_prefix (str): Path to output file directory
+    """
 
+    print("---- Reading Input File...")
+    output_prefix += f"/{input_file.split('/')[-1][0:8]}"
+    header, rows, groups = group_hourly(input_file)
+    if header is None:
+        return
 
-    # Step 2: Parse each line and extract timestamp for grouping
-    print("---- Processing Data...")
-    data=[]
-    counter = 0
-    percent = 0
-    total_lines = len(lines) // 20
-
-    for line in lines:
-        if counter > csv_data_line_number:
-
-            ##Progress Bar
-            if counter % total_lines == 0:
-                print(f"... {percent}%")
-                percent += 5
-            ##
-
-            parts = line.split(",")
-            if len(parts) > 1: #Skips over empty rows
-                try:
-                    timestamp = pd.to_datetime(parts[3])
-                    hour_group = timestamp.floor('h')  # round down to the hour
-                    if hour_group.tz is None:
-                        print(f'Timezone naive timestamp found at {timestamp}. Converting to UTC.')
-                        hour_group = timestamp.floor('h').tz_localize(tz='UTC')
-                    date_group = timestamp.date()
-                    data.append((date_group, hour_group, line.strip()))
-                except ValueError as err:
-                    print(f'Bad datetime data in raw file row {counter}: {err}')
-
-        #Using the counter to skip over header/Configuration Info
-        counter+=1
-
-    print("Procesing: 100%") ##Progress Bar
-
-    # Step 3: Load into DataFrame for grouping
-    df = pd.DataFrame(data, columns=["date_group", "hour_group", "original_line"])
-
-    # Step 4: Group by date and hour, and write to separate CSV files
     print("---- Writing Data to new files...")
-    for (_, hour), group in df.groupby(["date_group", "hour_group"]):
-        # Format filenames: one for date and one for hour
-        # date_str = date.strftime("%Y-%m-%d")
+    for hour, index in groups:
         hour_str = hour.strftime("%Y-%m-%d_%H00")
         filename = f"{output_prefix}_{hour_str}.TXT"
 
         with open(filename, "w", encoding="utf-8") as f:
             f.write(header)
-            for line in group["original_line"]:
-                f.write(line + "\n")
+            f.writelines(rows[i] + "\n" for i in index)
 
         print(f"Created: {filename}")
 
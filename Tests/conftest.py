@@ -0,0 +1,9 @@
+''' Puts the repository on the path of the unit tests, so that they import Source directly '''
+import os
+import sys
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.insert(0, root)
+
+# No dialogs from the processing modules
+os.environ.setdefault("HYPERINSPACE_CMD", "TRUE")
@@ -0,0 +1,116 @@
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from Source.AnomalyAnalysis import AnomalyAnalysis
+from Source.ConfigFile import ConfigFile
+from Source.HDFRoot import HDFRoot
+from Source.Utilities import Utilities
+
+WAVEBANDS = np.arange(340.0, 880.0, 30.0)
+
+
+def makeRoot(n=150, seed=0):
+    ''' L1AQC root with ES darks and lights and LI lights, with spikes '''
+    rng = np.random.default_rng(seed)
+    node = HDFRoot()
+    node.attributes['PROCESSING_LEVEL'] = '1aqc'
+    for groupID, frameType, sensors in [('ES_DARK', 'ShutterDark', ['ES']), ('ES_LIGHT', 'ShutterLight', ['ES']),
+                                        ('LI_LIGHT', 'ShutterLight', ['LI'])]:
+        gp = node.addGroup(groupID)
+        gp.attributes['FrameType'] = frameType
+        for sensor in sensors:
+            ds = gp.addDataset(sensor)
+            data = rng.normal(10, 1, (n, len(WAVEBANDS)))*np.linspace(1, 20, len(WAVEBANDS))
+            spikes = rng.integers(0, n, n//10)
+            data[spikes, rng.integers(0, len(WAVEBANDS), len(spikes))] += rng.normal(0, 100, len(spikes))
+            for i, wl in enumerate(WAVEBANDS):
+                ds.columns[f'{wl:03.2f}'] = data[:, i].tolist()
+            ds.columnsToDataset()
+        for name, values in [('DATETAG', [2021123.0]*n),
+                             ('TIMETAG2', [120000000.0 + (i//60)*100000 + (i % 60)*1000 for i in range(n)])]:
+            ds = gp.addDataset(name)
+            ds.columns['NONE'] = values
+            ds.columnsToDataset()
+    return node
+
+
+class TestAnomalyAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.threshold = ConfigFile.settings.get('bL1aqcThreshold')
+        self.tmpDir = tempfile.mkdtemp()
+        self.root = makeRoot()
+        self.analysis = AnomalyAnalysis(self.root, 'Station_L1AQC')
+
+    def tearDown(self):
+        ConfigFile.settings['bL1aqcThreshold'] = self.threshold
+        shutil.rmtree(self.tmpDir)
+
+    def test_flags(self):
+        self.assertEqual(sorted(self.analysis.frames), [('ES', 'Dark'), ('ES', 'Light'), ('LI', 'Light')])
+        ConfigFile.settings['bL1aqcThreshold'] = 1
+        minMaxBand = WAVEBANDS[4]
+        for sensor, lightDark in self.analysis.frames:
+            names, bands, data, _ = self.analysis.frames[(sensor, lightDark)]
+            for window, sigma in [(5, 2.3), (11, 3.2), (13, 2.7)]:
+                flags = self.analysis.flags(sensor, lightDark, window, sigma, 50, 120, minMaxBand, 1)
+                for i, band in enumerate(bands):
+                    expected = Utilities.deglitchBand(band, data[:, i].tolist(), window, sigma, lightDark, 50, 120, minMaxBand)
+                    for badIndex, badIndexBand in zip(flags, expected):
+                        np.testing.assert_array_equal(badIndex[:, i], badIndexBand, f'{sensor} {lightDark} {band}')
+                    self.assertTrue(flags[0][:, i].any())
+                self.assertTrue(flags[2].any())
+
+        avg = self.analysis.passes('ES', 'Light', 5, 2.3)[0]
+        np.testing.assert_allclose(avg[:, 2], Utilities.movingAverage(self.analysis.frames[('ES', 'Light')][2][:, 2], 5))
+
+        # Computed once per window and sigma, thresholds only when those change
+        self.assertIs(self.analysis.passes('ES', 'Dark', 11, 3.2), self.analysis.passes('ES', 'Dark', 11.0, 3.2))
+        self.assertIs(self.analysis.flags('ES', 'Dark', 11, 3.2)[0], self.analysis.flags('ES', 'Dark', 11, 3.2, 0, 1, minMaxBand, 1)[0])
+        self.assertFalse(self.analysis.flags('ES', 'Dark', 11, 3.2, 50, 120, minMaxBand, 0)[2].any())
+        with self.assertRaises(ValueError):
+            self.analysis.passes('ES', 'Dark', 4, 3.2)
+
+    def test_badRecords(self):
+        columns = (WAVEBANDS > ConfigFile.minDeglitchBand) & (WAVEBANDS < ConfigFile.maxDeglitchBand)
+        flags = self.analysis.flags('ES', 'Light', 5, 2.3, None, 100, WAVEBANDS[4], 1)
+        expected = np.any([badIndex[:, i] for i in np.flatnonzero(columns) for badIndex in flags], 0)
+        np.testing.assert_array_equal(self.analysis.badRecords('ES', 'Light', 5, 2.3, None, 100, WAVEBANDS[4], 1), expected)
+
+    def test_sweep(self):
+        fps = [os.path.join(self.tmpDir, f'Station_{i}_L1AQC.hdf') for i in range(2)]
+        for i, fp in enumerate(fps):
+            makeRoot(seed=i).writeHDF5(fp)
+        l1a = makeRoot()
+        l1a.attributes['PROCESSING_LEVEL'] = '1a'
+        l1a.writeHDF5(os.path.join(self.tmpDir, 'Station_L1A.hdf'))
+
+        parameterSets = AnomalyAnalysis.parameterGrid([5, 11], [2.3, 3.0], sensors=['ES', 'LI'])
+        self.assertEqual(len(parameterSets), 16)
+        csvPath = os.path.join(self.tmpDir, 'sweep.csv')
+        nFiles = AnomalyAnalysis.sweepFiles(fps + [os.path.join(self.tmpDir, 'Station_L1A.hdf')], parameterSets, csvPath)
+        self.assertEqual(nFiles, 2)
+
+        with open(csvPath, 'r', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        # No LI darks: 12 parameter sets per file, a row per band and one for all bands
+        self.assertEqual(len(rows), 2*12*(len(WAVEBANDS) + 1))
+        self.assertEqual({row['filename'] for row in rows}, {'Station_0_L1AQC', 'Station_1_L1AQC'})
+
+        analysis = AnomalyAnalysis.fromFile(fps[1])
+        flags = analysis.flags('LI', 'Light', 11, 3.0)
+        row = [row for row in rows if row['filename'] == 'Station_1_L1AQC' and row['sensor'] == 'LI'
+               and row['window'] == '11' and row['sigma'] == '3.0' and row['band'] == '400.00'][0]
+        self.assertAlmostEqual(float(row['firstPass']), flags[0][:, 2].mean())
+        self.assertAlmostEqual(float(row['flagged']), np.any(flags, 0)[:, 2].mean())
+        row = [row for row in rows if row['filename'] == 'Station_1_L1AQC' and row['sensor'] == 'LI'
+               and row['window'] == '11' and row['sigma'] == '3.0' and row['band'] == 'all'][0]
+        self.assertAlmostEqual(float(row['flagged']), analysis.badRecords('LI', 'Light', 11, 3.0).mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
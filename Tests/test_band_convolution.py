@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.interpolate import InterpolatedUnivariateSpline
+
+from Source import PATH_TO_DATA
+from Source.BandConvolution import BandConvolution
+from Source.Weight_RSR import Weight_RSR
+
+
+def calculateBand(spectralDataset, wavelength, response):
+    ''' RSR-weighted mean of each record, as Weight_RSR.calculateBand computed it per band '''
+    # In the case of a dictionary of float values rather than lists (e.g. rhoVec), convert to lists
+    if isinstance(list(spectralDataset.values())[0], float):
+        spectralDataset = {key: [value] for key, value in spectralDataset.items()}
+
+    n = len(list(spectralDataset.values())[0])
+    result = []
+    for i in range(n):
+        srf_sum = 0
+        c_sum = 0.0
+        for j in np.arange(0, len(wavelength)):
+            ld = str(wavelength[j])
+            if ld in spectralDataset:
+                srf_sum += spectralDataset[ld][i]*response[j]
+                c_sum += response[j]
+        # Satellite bands (like 1240 nm) with all 0 RSR over the hyperspectral bands
+        c = 0 if c_sum == 0 else 1/c_sum
+        result.append(c * srf_sum)
+    return result
+
+
+def weightModisBands(hyperspecData):
+    ''' Band weighting of Weight_RSR.processMODISBands before it used BandConvolution '''
+    wvInterp = [float(key) for key in hyperspecData.keys()]
+    data = np.loadtxt(os.path.join(PATH_TO_DATA, 'HMODISA_RSRs.txt'), skiprows=7)
+    fields = Weight_RSR.MODISBands()
+    gudBands = [min(wvInterp) <= field <= max(wvInterp) for field in fields]
+    rsr = data[:, [False] + gudBands]
+
+    result = {}
+    for i, field in enumerate(f for f, gud in zip(fields, gudBands) if gud):
+        fn = InterpolatedUnivariateSpline(data[:, 0], rsr[:, i].tolist(), k=1)
+        result[str(field)] = calculateBand(hyperspecData, wvInterp, fn(wvInterp))
+    return result
+
+
+class TestBandConvolution(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = BandConvolution.cacheDir
+        self.tmpDir = tempfile.mkdtemp()
+        BandConvolution.cacheDir = os.path.join(self.tmpDir, 'RSR_Operators')
+        BandConvolution._operators.clear()
+
+    def tearDown(self):
+        BandConvolution.cacheDir = self.cacheDir
+        BandConvolution._operators.clear()
+        shutil.rmtree(self.tmpDir)
+
+    def test_weight_rsr(self):
+        rng = np.random.default_rng(0)
+        wavelengths = np.arange(350.0, 900.0, 3.3)
+        hyperspecData = {str(wl): (0.01 + 0.005*rng.random(4)).tolist() for wl in wavelengths}
+
+        expected = weightModisBands(hyperspecData)
+        result = Weight_RSR.processMODISBands(hyperspecData, sensor='A')
+        self.assertEqual(list(result), list(expected))
+        self.assertNotIn('1240', result)
+        for band, values in expected.items():
+            np.testing.assert_allclose(result[band], values, rtol=1e-12, err_msg=band)
+
+        # Single values, as for rhoVec
+        single = {key: values[0] for key, values in hyperspecData.items()}
+        result = Weight_RSR.processMODISBands(single, sensor='A')
+        for band, values in expected.items():
+            np.testing.assert_allclose(result[band], values[:1], rtol=1e-12, err_msg=band)
+
+    def test_cache(self):
+        wavelengths = np.arange(350.0, 900.0, 3.3)
+        bands, op = BandConvolution.getOperator('MODISA', wavelengths)
+        self.assertEqual(op.shape, (len(bands), len(wavelengths)))
+        self.assertEqual(len(os.listdir(BandConvolution.cacheDir)), 1)
+
+        # From the cached operator in a new session
+        BandConvolution._operators.clear()
+        bandsRead, opRead = BandConvolution.getOperator('MODISA', wavelengths)
+        self.assertEqual(bandsRead, bands)
+        np.testing.assert_array_equal(opRead.toarray(), op.toarray())
+        self.assertEqual(len(os.listdir(BandConvolution.cacheDir)), 1)
+
+        # A different grid makes a new operator, in memory and on disk
+        shifted = wavelengths + 0.5
+        bandsShifted, opShifted = BandConvolution.getOperator('MODISA', shifted)
+        self.assertEqual(len(os.listdir(BandConvolution.cacheDir)), 2)
+        np.testing.assert_allclose(opShifted.toarray(), BandConvolution._build('MODISA', shifted).toarray())
+        self.assertFalse(np.array_equal(opShifted.toarray(), op.toarray()))
+
+        # So does a shorter grid, which drops bands
+        bandsShort, opShort = BandConvolution.getOperator('MODISA', wavelengths[:100])
+        self.assertEqual(len(os.listdir(BandConvolution.cacheDir)), 3)
+        self.assertLess(len(bandsShort), len(bands))
+        self.assertEqual(opShort.shape, (len(bandsShort), 100))
+
+        # An unreadable cache file is rebuilt
+        BandConvolution._operators.clear()
+        for name in os.listdir(BandConvolution.cacheDir):
+            with open(os.path.join(BandConvolution.cacheDir, name), 'wb') as f:
+                f.write(b'not an npz')
+        with self.assertLogs(level='WARNING'):
+            _, opRebuilt = BandConvolution.getOperator('MODISA', wavelengths)
+        np.testing.assert_array_equal(opRebuilt.toarray(), op.toarray())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import copy
+import glob
+import pickle
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+import numpy as np
+
+from Source import PATH_TO_CONFIG, PATH_TO_DATA
+from Source.BatchContext import BatchContext
+from Source.BandConvolution import BandConvolution
+from Source.CalibrationFileReader import CalibrationFileReader
+from Source.ConfigFile import ConfigFile
+from Source.FidRadDB import FidRadDB
+from Source.HDFGroup import HDFGroup
+from Source.HDFRoot import HDFRoot
+from Source.Utilities import Utilities
+
+CONFIG = os.path.join(PATH_TO_CONFIG, 'sample_SEABIRD_pySAS.cfg')
+CLASS_BASED = os.path.join(PATH_TO_DATA, 'Class_Based_Characterizations', 'SeaBird_initial')
+
+
+def workerState():
+    ''' What a worker process sees of the batch context '''
+    context = BatchContext.current
+    f = sorted(glob.glob(os.path.join(CLASS_BASED, 'CP_*')))[0]
+    gp = HDFGroup()
+    FidRadDB.read_char(f, gp)
+    return (context.configFP, float(BatchContext.reference('TSIS-1')['F0_raw'].sum()),
+            len(FidRadDB._parsed), sorted(BandConvolution._rsrTables), sorted(gp.datasets))
+
+
+class TestBatchContext(unittest.TestCase):
+    def setUp(self):
+        self.config = (ConfigFile.filename, copy.deepcopy(ConfigFile.settings), copy.deepcopy(ConfigFile.products))
+        self.cacheDirs = FidRadDB.cacheDir, CalibrationFileReader.cacheDir
+        self.tmpDir = tempfile.mkdtemp()
+        FidRadDB.cacheDir = os.path.join(self.tmpDir, 'FidRadDB_Cache')
+        CalibrationFileReader.cacheDir = os.path.join(self.tmpDir, 'Calibration_Cache')
+        for cache in [FidRadDB._indexes, FidRadDB._parsed, CalibrationFileReader._models, BatchContext._loaded]:
+            cache.clear()
+
+    def tearDown(self):
+        if BatchContext.current is not None:
+            BatchContext.current.close()
+        ConfigFile.filename, ConfigFile.settings, ConfigFile.products = self.config
+        FidRadDB.cacheDir, CalibrationFileReader.cacheDir = self.cacheDirs
+        for cache in [FidRadDB._indexes, FidRadDB._parsed, CalibrationFileReader._models, BatchContext._loaded]:
+            cache.clear()
+        shutil.rmtree(self.tmpDir)
+
+    def test_build(self):
+        context = BatchContext.build(CONFIG, ['L1A', 'L1B', 'L2'])
+        self.assertEqual(context.configFP, CONFIG)
+        self.assertEqual(context.settings['SensorType'], 'SeaBird')
+        self.assertEqual(len(context.models), 1)
+        # No Zhang database with this configuration
+        self.assertEqual(sorted(context.references), ['Characterizations', 'M99', 'RSR', 'TSIS-1'])
+        self.assertEqual(len(context.characterizations),
+                         len(glob.glob(os.path.join(CLASS_BASED, 'CP_*'))) +
+                         len(glob.glob(os.path.join(PATH_TO_DATA, 'FidRadDB', 'SeaBird', 'CP_*'))))
+        for arrays in context.references.values():
+            for array in arrays.values():
+                self.assertFalse(array.flags.writeable)
+
+        lut = HDFRoot.readHDF5(os.path.join(PATH_TO_DATA, 'rhoTable_AO1999.hdf')).groups[0].datasets['LUT'].data
+        np.testing.assert_array_equal(context.references['M99']['LUT'], np.array(lut.tolist()))
+
+        # L1A only
+        context = BatchContext.build(CONFIG, ['L1A'])
+        self.assertEqual(context.references, {})
+
+        # Calibration map for any level reading it, not only L1A
+        CalibrationFileReader._models.clear()
+        context = BatchContext.build(CONFIG, ['L2'])
+        self.assertEqual(len(context.models), 1)
+        CalibrationFileReader._models.clear()
+        context = BatchContext.build(CONFIG, ['L1BQC'])
+        self.assertEqual(context.models, {})
+
+    def test_install(self):
+        context = BatchContext.build(CONFIG, ['L1A', 'L1B', 'L2'])
+        FidRadDB._parsed.clear()
+        BatchContext._loaded.clear()
+
+        context.install()
+        self.assertIs(BatchContext.current, context)
+        self.assertIs(BatchContext.reference('M99'), context.references['M99'])
+        self.assertEqual(BatchContext._loaded, {})
+        self.assertEqual(set(FidRadDB._parsed), set(context.characterizations))
+        for f in glob.glob(os.path.join(CLASS_BASED, 'CP_*')):
+            gp, expected = HDFGroup(), HDFGroup()
+            FidRadDB.read_char(f, gp)
+            Utilities.read_char(f, expected)
+            for name, ds in expected.datasets.items():
+                np.testing.assert_array_equal(gp.datasets[name].data, ds.data)
+                self.assertTrue(gp.datasets[name].data.flags.writeable)
+
+        # Configuration of the batch, whatever was loaded since
+        ConfigFile.settings['SensorType'] = 'TriOS'
+        context.restoreConfig()
+        self.assertEqual(ConfigFile.settings, context.settings)
+        self.assertIsNot(ConfigFile.settings, context.settings)
+
+        context.close()
+        self.assertIsNone(BatchContext.current)
+        self.assertEqual(FidRadDB._parsed, {})
+
+        # Outside of a batch, read once per process
+        lut = BatchContext.reference('M99')
+        self.assertIs(BatchContext.reference('M99'), lut)
+        self.assertFalse(lut['LUT'].flags.writeable)
+
+    def test_share(self):
+        with BatchContext.build(CONFIG, ['L1A', 'L1B', 'L2']) as context:
+            F0 = context.references['TSIS-1']['F0_raw'].copy()
+            context.share()
+            np.testing.assert_array_equal(context.references['TSIS-1']['F0_raw'], F0)
+
+            # Shared arrays are pickled as the names of their memory blocks
+            data = pickle.dumps(context)
+            self.assertLess(len(data), F0.nbytes)
+            attached = pickle.loads(data)
+            np.testing.assert_array_equal(attached.references['TSIS-1']['F0_raw'], F0)
+            self.assertFalse(attached.references['TSIS-1']['F0_raw'].flags.writeable)
+            attached.close()
+
+            with multiprocessing.get_context('spawn').Pool(1, initializer=context.install) as pool:
+                configFP, F0sum, nParsed, sensors, datasets = pool.apply(workerState)
+            self.assertEqual(configFP, CONFIG)
+            self.assertEqual(F0sum, float(F0.sum()))
+            self.assertEqual(nParsed, len(context.characterizations))
+            self.assertEqual(sensors, sorted(context.references['RSR']))
+            self.assertTrue(datasets)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from Source.ocbrdf.brdf_utils import interp_linear
+from Source.ocbrdf.ocbrdf_main import BRDFEngine
+
+OUTPUTS = ['nrrs', 'C_brdf', 'C_brdf_fail', 'convergeFlag', 'brdf_unc', 'nrrs_unc', 'rho_ex_w']
+
+
+class RecordingEngine(BRDFEngine):
+    ''' Engine noting the number of records passed to each backward step '''
+    def __init__(self, brdf_model):
+        super().__init__(brdf_model)
+        self.iterated = []
+
+    def init_model(self, ds):
+        model = super().init_model(ds)
+        backward = model.backward
+
+        def recordBackward(dsIter, iter_brdf):
+            self.iterated.append(dsIter.sizes.get('n', 1))
+            return backward(dsIter, iter_brdf)
+        model.backward = recordBackward
+        return model
+
+
+def makeRrs(wavelengths):
+    ''' Six records like the input built by ProcessL2BRDF. Record 2 (negative Rrs) never converges;
+        records 0 and 5, near nadir, converge after the second iteration. '''
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    shape = np.exp(-((wavelengths - 480)/120)**2)
+    rrs = np.array([0.004*shape*(1 + 0.3*i*(wavelengths - 560)/300) for i in range(6)])
+    rrs[2] = -rrs[2]
+    return xr.Dataset({
+        'Rw': xr.DataArray(rrs*np.pi, dims=['n', 'bands'], coords={'n': range(6), 'bands': wavelengths}),
+        'sza': xr.DataArray([10.0, 30.0, 40.0, 50.0, 60.0, 20.0], dims=['n']),
+        'raa': xr.DataArray(np.full(6, 135.0), dims=['n']),
+        'vza': xr.DataArray([5.0, 40.0, 40.0, 40.0, 40.0, 10.0], dims=['n']),
+        'wind': xr.DataArray(np.linspace(1, 12, 6), dims=['n']),
+        'aot': xr.DataArray(np.full(6, 0.1), dims=['n']),
+    })
+
+
+class TestBRDF(unittest.TestCase):
+    def test_interp_linear(self):
+        rng = np.random.default_rng(0)
+        grid = np.array([-4.6, -2.3, -1.2, 0.0, 0.7, 2.3, 4.6])
+        da = xr.DataArray(rng.random((3, len(grid))), dims=['wavelengths_FOQ', 'log_chl_foq'],
+                          coords={'wavelengths_FOQ': [412.5, 442.5, 490.0], 'log_chl_foq': grid})
+        # Between and on the (non-uniform) grid nodes, at both ends and outside
+        x = xr.DataArray([-4.6, -3.0, -1.2, 0.1, 0.69, 3.9, 4.6, -5.0, 4.7, np.nan], dims=['n'])
+
+        result = interp_linear(da, 'log_chl_foq', x)
+        expected = da.interp(log_chl_foq=x)
+        self.assertEqual(set(result.dims), {'wavelengths_FOQ', 'n'})
+        np.testing.assert_allclose(result.transpose(*expected.dims).values, expected.values, rtol=1e-12)
+        self.assertTrue(np.isnan(result.isel(n=[7, 8, 9])).all())
+
+        # A single value
+        np.testing.assert_allclose(interp_linear(da, 'log_chl_foq', 1.5).values,
+                                   da.interp(log_chl_foq=1.5).values, rtol=1e-12)
+
+    def test_m02_batched(self):
+        hyper = makeRrs(np.arange(400.0, 701.0, 10.0))
+        multi = makeRrs([412.0, 443.0, 490.0, 510.0, 560.0, 665.0])
+
+        engine = RecordingEngine('M02')
+        hyperOut = engine.correct(hyper.copy())
+        # Converged records drop out of the last iteration
+        self.assertEqual(engine.iterated, [6, 6, 4])
+        np.testing.assert_array_equal(hyperOut['convergeFlag'], [True, True, False, True, True, True])
+        # The second dataset reuses the geometry coefficients of the first
+        coeffs = engine.coeffs
+        multiOut = engine.correct(multi.copy())
+        self.assertIs(engine.coeffs, coeffs)
+
+        # Each record corrected on its own, by a new engine (no reuse, every iteration)
+        for ds, out in [(hyper, hyperOut), (multi, multiOut)]:
+            for i in range(6):
+                single = BRDFEngine('M02').correct(ds.isel(n=[i]).copy())
+                for name in OUTPUTS:
+                    np.testing.assert_allclose(out[name].isel(n=[i]).transpose(*single[name].dims).values,
+                                               single[name].values, rtol=1e-8, err_msg=f'{name} {i}')
+                # Records that converged keep the chl of their last iteration, within the convergence criterion
+                np.testing.assert_allclose(10**out['log10_chl'].isel(n=[i]).values, 10**single['log10_chl'].values,
+                                           rtol=0.01 if i in [0, 5] else 1e-8, err_msg=f'chl {i}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from Source import PATH_TO_CONFIG
+from Source.CalibrationFileReader import CalibrationFileReader
+from Source.CalibrationFile import CalibrationFile
+from Source.HDFGroup import HDFGroup
+
+CAL_DIR = os.path.join(PATH_TO_CONFIG, 'sample_SEABIRD_SOLARTRACKER_Calibration')
+
+
+def frameMessage(frame):
+    ''' One message with each binary field holding its position in the frame '''
+    parts = []
+    for i, (_, fieldLength, _, _, _, cd) in enumerate(frame):
+        if cd.dataType == 'AS':
+            parts.append(cd.id.encode())
+        elif cd.dataType in ('AI', 'AF'):
+            parts.append(b'1'.rjust(fieldLength, b'0'))
+        elif fieldLength > 0:
+            parts.append((i % 256).to_bytes(fieldLength, 'big'))
+    return b''.join(parts) + (2021123).to_bytes(3, 'big') + (120000000).to_bytes(4, 'big')
+
+
+class TestCalibrationModel(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = CalibrationFileReader.cacheDir
+        self.tmpDir = tempfile.mkdtemp()
+        CalibrationFileReader.cacheDir = os.path.join(self.tmpDir, 'cache')
+        CalibrationFileReader._models.clear()
+        self.calDir = os.path.join(self.tmpDir, 'sample_Calibration')
+        shutil.copytree(CAL_DIR, self.calDir)
+
+    def tearDown(self):
+        CalibrationFileReader.cacheDir = self.cacheDir
+        CalibrationFileReader._models.clear()
+        shutil.rmtree(self.tmpDir)
+
+    def assertSameModel(self, calibrationMap, reference):
+        self.assertEqual(list(calibrationMap), list(reference))
+        for key, cf in reference.items():
+            self.assertEqual(calibrationMap[key].id, cf.id)
+            self.assertEqual([(cd.type, cd.id, cd.coefficients) for cd in calibrationMap[key].data],
+                             [(cd.type, cd.id, cd.coefficients) for cd in cf.data])
+            self.assertEqual(calibrationMap[key].frame[1], cf.frame[1])
+            for dsType, groups in cf.compiled.items():
+                for group, expected in zip(calibrationMap[key].compiled[dsType], groups):
+                    self.assertEqual(group['ids'], expected['ids'])
+                    for name in ['a0', 'a1', 'im', 'cint', 'coefficients']:
+                        if name in expected:
+                            np.testing.assert_array_equal(group[name], expected[name])
+
+    def test_model(self):
+        reference = CalibrationFileReader.parse(self.calDir)
+        calibrationMap = CalibrationFileReader.read(self.calDir)
+        self.assertSameModel(calibrationMap, reference)
+        self.assertEqual(len(calibrationMap), 12)
+        self.assertEqual(len(os.listdir(CalibrationFileReader.cacheDir)), 1)
+
+        # In memory, the calibration files are shared but the map is new
+        again = CalibrationFileReader.read(self.calDir)
+        self.assertIsNot(again, calibrationMap)
+        self.assertIs(again['HSE488B.cal'], calibrationMap['HSE488B.cal'])
+        del again['HSE488B.cal']
+        self.assertIn('HSE488B.cal', CalibrationFileReader.read(self.calDir))
+
+        # From the pickled model in a new session
+        CalibrationFileReader._models.clear()
+        self.assertSameModel(CalibrationFileReader.read(self.calDir), reference)
+
+        # A changed calibration file makes a new model
+        with open(os.path.join(self.calDir, 'HSE488B.cal'), 'a', encoding='utf-8') as f:
+            f.write('\n# Comment\n')
+        self.assertIsNot(CalibrationFileReader.read(self.calDir)['HSE488B.cal'], calibrationMap['HSE488B.cal'])
+        self.assertEqual(len(os.listdir(CalibrationFileReader.cacheDir)), 2)
+
+    def test_frame(self):
+        cf = CalibrationFileReader.read(self.calDir)['HSE488B.cal']
+        frame, timeTags = cf.frame
+        self.assertTrue(timeTags)
+        self.assertEqual(len(frame), len(cf.data))
+        self.assertEqual(sum(fieldLength for _, fieldLength, _, _, _, _ in frame), 554 - 7)
+
+        msg = frameMessage(frame)
+        gp = HDFGroup()
+        self.assertEqual(cf.convertRaw(msg, gp), len(msg))
+        self.assertEqual(dict(gp.attributes), {'SN': '0488'})
+        self.assertEqual(gp.datasets['DATETAG'].columns['NONE'], [2021123])
+        self.assertEqual(gp.datasets['TIMETAG2'].columns['NONE'], [120000000])
+        esIndex = [i for i, cd in enumerate(cf.data) if cd.type == 'ES']
+        self.assertEqual(list(gp.datasets['ES'].columns.values()), [[i % 256] for i in esIndex])
+        self.assertEqual(gp.datasets['SPECTEMP'].columns['NONE'], [1.0])
+
+        # Messages that cannot be decoded are reported to RawFileReader as -1, with nothing stored
+        class UnreadableFile(CalibrationFile):
+            def decodeRaw(self, msg):
+                raise KeyError(msg[:6])
+        unreadable = UnreadableFile()
+        unreadable.frame = cf.frame
+        gp = HDFGroup()
+        self.assertEqual(unreadable.convertRaw(msg, gp), -1)
+        self.assertEqual(gp.datasets, {})
+
+    def test_fresh_file(self):
+        # Files read outside the reader are compiled on first use, or on demand
+        cf = CalibrationFile()
+        with open(os.path.join(CAL_DIR, 'HSE488B.cal'), 'rb') as f:
+            cf.read(f)
+        self.assertIsNone(cf.frame)
+        msg = frameMessage(CalibrationFileReader.read(self.calDir)['HSE488B.cal'].frame[0])
+        values, nRead = cf.decodeRaw(msg)
+        self.assertEqual(nRead, 554 - 7)
+        self.assertEqual(len(values), len(cf.data))
+        self.assertIsNotNone(cf.frame)
+        self.assertIsNone(cf.compiled)
+        cf.compile()
+        self.assertIsNotNone(cf.compiled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+import contextlib
+import io
+
+import numpy as np
+
+from Source.ProcessL1aDALEC import ProcessL1aDALEC
+from Source import prepDALEC
+
+HEADER = ['DALEC raw data\n',
+          '---------CONFIGURATION---------\n',
+          'Serial=0012\n',
+          'Gain=2\n',
+          '---------END CONFIGURATION---------\n',
+          '---------OUTPUT FORMAT---------\n',
+          'DeviceID,SerialNumber,ChannelType,UTCtimestamp,...\n']
+
+
+def dataLine(i, channel='Ed', stamp=None, **fields):
+    values = ['DALEC', '0012', channel, stamp or f'2024-05-07T{10 + i // 4:02d}:{i % 60:02d}:00.{i:03d}Z']
+    values += [f'{i + k/10:.1f}' for k in range(18)] + [str(i + k) for k in range(190)]
+    for k, v in fields.items():
+        values[int(k[1:])] = v
+    return ','.join(values) + '\n'
+
+
+class TestDALECIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def write(self, lines):
+        fp = os.path.join(self.tmpDir, '20240507_DALEC.TXT')
+        with open(fp, 'w', encoding='utf-8') as f:
+            f.writelines(HEADER + lines)
+        return fp
+
+    def readData(self, lines):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            metadata, data = ProcessL1aDALEC.read_data(self.write(lines))
+        return metadata, data, out.getvalue()
+
+    def test_read_data(self):
+        lines = [dataLine(i, ['Ed', 'Lu', 'Lsky'][i % 3]) for i in range(12)]
+        metadata, data, out = self.readData(lines)
+        self.assertEqual(out, '')
+        self.assertEqual(metadata[0].tolist(), ['Serial', 'Gain'])
+        self.assertEqual(data.shape, (12, 212))
+        self.assertEqual(data['ChannelType'].tolist(), ['Ed', 'Lu', 'Lsky']*4)
+        self.assertEqual(data['UTCtimestamp'][0], '2024-05-07T10:00:00.000Z')
+        self.assertEqual(data['Lat'].dtype, np.float64)
+        np.testing.assert_array_equal(data['spec0'], np.arange(12))
+
+    def test_bad_lines(self):
+        bad = [dataLine(1).rsplit(',', 1)[0] + '\n',    # Missing field
+               dataLine(2).replace('DALEC', 'DALEX'),
+               dataLine(3, stamp='2024-05-07 12:00:00.000Z'),
+               dataLine(4, f10=''),
+               dataLine(5, f30='abc'),
+               '\n']
+        good = [dataLine(6, f4='nan'), dataLine(7, f4='-NaN'), dataLine(8)]
+        lines = bad[:3] + good[:1] + bad[3:] + good[1:]
+        metadata, data, out = self.readData(lines)
+        badIndex = [len(HEADER) + lines.index(line) for line in bad]
+        self.assertEqual([int(line.split(': ')[1]) for line in out.splitlines() if line.startswith('Bad data line')], badIndex)
+        self.assertEqual(len(data), 3)
+        self.assertTrue(np.isnan(data['Lat'][:2]).all())
+        np.testing.assert_array_equal(data['Lon'], [6.1, 7.1, 8.1])
+        np.testing.assert_array_equal(data['spec0'], [6, 7, 8])
+
+    def test_group_hourly(self):
+        # Hours out of order, a naive time stamp and a bad one
+        lines = [dataLine(i) for i in [8, 0, 1, 9, 4, 2]]
+        lines.insert(2, dataLine(5, stamp='2024-05-07T11:30:00'))
+        lines.insert(3, dataLine(6, stamp='garbage'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            header, rows, groups = prepDALEC.group_hourly(self.write(lines))
+        self.assertEqual(header, ''.join(HEADER[:-1]))
+        self.assertEqual(rows, [line.strip() for line in lines])
+        self.assertEqual([hour.strftime('%Y-%m-%d_%H00') for hour, _ in groups],
+                         ['2024-05-07_1000', '2024-05-07_1100', '2024-05-07_1200'])
+        self.assertEqual([index.tolist() for _, index in groups], [[1, 4, 7], [2, 6], [0, 5]])
+
+
+if __name__ == '__main__':
+    unittest.main()
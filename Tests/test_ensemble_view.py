@@ -0,0 +1,104 @@
+import datetime
+import unittest
+import collections
+
+import numpy as np
+from scipy.interpolate import interp1d
+
+from Source.EnsembleView import EnsembleView, EnsembleSlice
+from Source.HDFDataset import HDFDataset
+
+T0 = datetime.datetime(2021, 5, 3, 12, tzinfo=datetime.timezone.utc)
+
+
+def loopBoundaries(timeStamp, interval):
+    ''' Ensemble (start, end) as given by the record by record loop before EnsembleView.boundaries '''
+    bounds = []
+    if interval == 0:
+        return [(i, i+1) for i in range(len(timeStamp)-1)]
+    start = 0
+    endTime = timeStamp[0] + datetime.timedelta(0, interval)
+    endFileTime = timeStamp[-1]
+    EndOfFileFlag = False
+    if endTime > endFileTime:
+        endTime = endFileTime
+        EndOfFileFlag = True
+    for i, timei in enumerate(timeStamp):
+        if (timei > endTime) or EndOfFileFlag:
+            if EndOfFileFlag:
+                bounds.append((start, len(timeStamp)-1))
+                break
+            endTime = timei + datetime.timedelta(0, interval)
+            end = i
+            if endTime > endFileTime:
+                endTime = endFileTime
+                EndOfFileFlag = True
+            bounds.append((start, end))
+            start = i
+            if EndOfFileFlag:
+                break
+    if not EndOfFileFlag:
+        bounds.append((start, i+1))
+    return bounds
+
+
+def makeDataset(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    ds = HDFDataset()
+    ds.columns['Datetime'] = [T0 + datetime.timedelta(seconds=float(s)) for s in np.cumsum(rng.uniform(0.5, 3, n))]
+    ds.columns['Datetag'] = [2021123.0]*n
+    ds.columns['Timetag2'] = [120000000.0]*n
+    for wl in np.arange(350.0, 900.0, 3.3):
+        ds.columns[f'{wl:.1f}'] = rng.uniform(0, 100, n).tolist()
+    ds.columnsToDataset()
+    return ds
+
+
+class TestEnsembleView(unittest.TestCase):
+    def setUp(self):
+        self.ds = makeDataset()
+        self.view = EnsembleView.fromDataset(self.ds)
+
+    def test_boundaries(self):
+        timeStamp = self.ds.columns['Datetime']
+        for interval in [0, 1, 5, 30, 60, 120, 300, 599, 1000]:
+            self.assertEqual(EnsembleView.boundaries(self.view.micros, interval),
+                             loopBoundaries(timeStamp, interval), f'interval {interval}')
+
+        # End of record reached at, but not exceeding, the ensemble end
+        timeStamp = [T0 + datetime.timedelta(seconds=s) for s in [0, 4, 11, 15, 21]]
+        micros = EnsembleView(collections.OrderedDict(Datetime=timeStamp)).micros
+        self.assertEqual(EnsembleView.boundaries(micros, 10), loopBoundaries(timeStamp, 10))
+        self.assertEqual(EnsembleView.boundaries(micros, 10), [(0, 2), (2, 5)])
+
+    def test_slice(self):
+        esSlice = self.view.slice(10, 20)
+        self.assertIsInstance(esSlice, EnsembleSlice)
+        self.assertEqual(list(esSlice), [k for k in self.ds.columns if k not in EnsembleView.dateColumns])
+        self.assertTrue(np.shares_memory(esSlice['350.0'], self.view.block))
+        np.testing.assert_array_equal(esSlice['350.0'], self.ds.columns['350.0'][10:20])
+        self.assertEqual(len(self.view.slice(5, 5).block), 1)
+        self.assertEqual(list(self.view.column('Datetime', 10, 20)), self.ds.columns['Datetime'][10:20])
+
+    def test_mean_datetime(self):
+        timeStamp = self.ds.columns['Datetime'][10:20]
+        epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+        meanSec = np.mean([(dt-epoch).total_seconds() for dt in timeStamp])
+        self.assertEqual(self.view.meanDateTime(10, 20),
+                         datetime.datetime.utcfromtimestamp(meanSec).replace(tzinfo=datetime.timezone.utc))
+
+    def test_interpolate(self):
+        block = self.view.slice(0, 50).block
+        wavelength = np.asarray(self.view.names, dtype=float)
+        for wl in [350.0, 780.0, 781.2, 896.0]:
+            expected = interp1d(wavelength, block, kind='linear', axis=1)(wl)
+            np.testing.assert_allclose(EnsembleView.interpolate(block, wavelength, wl), expected, rtol=1e-12)
+        with self.assertRaises(ValueError):
+            EnsembleView.interpolate(block, wavelength, 950.0)
+
+        lt780 = interp1d(wavelength, block, kind='linear', axis=1)(780.0)
+        np.testing.assert_array_equal(self.view.lowest(0, 50, 780.0, 10), np.argsort(lt780)[0:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
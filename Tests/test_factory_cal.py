@@ -0,0 +1,120 @@
+import os
+import copy
+import unittest
+
+import numpy as np
+
+from Source import PATH_TO_CONFIG
+from Source.CalibrationData import CalibrationData
+from Source.CalibrationFile import CalibrationFile
+from Source.HDFGroup import HDFGroup
+
+CAL_DIR = os.path.join(PATH_TO_CONFIG, 'sample_SEABIRD_SOLARTRACKER_Calibration')
+
+
+def scalarCalibration(gp, cf):
+    ''' Element by element calibration, as applied before the calibration was compiled '''
+    def apply(ds, cd, inttime):
+        c = [float(a) for a in cd.coefficients]
+        k = cd.id
+        for x in range(ds.data.shape[0]):
+            v = ds.data[k][x]
+            if cd.fitType == 'OPTIC2':
+                ds.data[k][x] = 1.0 * c[1] * (v - c[0])
+            elif cd.fitType == 'OPTIC3':
+                ds.data[k][x] = 1.0 * c[1] * (v) * (c[3]/inttime.data[cd.type][x])
+            elif cd.fitType == 'OPTIC4':
+                ds.data[k][x] = 1.0 * c[1] * (v - c[0]) * (c[3]/1)
+            elif cd.fitType == 'POW10':
+                ds.data[k][x] = 1.0 * pow(10, ((v - c[0])/c[1]))
+            elif cd.fitType == 'POLYU':
+                num = 0
+                for i, a in enumerate(c):
+                    num += a * pow(v, i)
+                ds.data[k][x] = num
+            elif cd.fitType == 'POLYF':
+                num = c[0]
+                for a in c[1:]:
+                    num *= (v - a)
+                ds.data[k][x] = num
+
+    inttime = None
+    for cd in cf.data:
+        if cd.type == 'INTTIME':
+            inttime = gp.getDataset('INTTIME')
+            apply(inttime, cd, None)
+    for cd in cf.data:
+        if gp.getDataset(cd.type) and cd.type != 'INTTIME':
+            apply(gp.getDataset(cd.type), cd, inttime)
+
+
+def makeGroup(cf, n=50, seed=0):
+    ''' Group with a dataset for each type in cf, random counts in each column '''
+    rng = np.random.default_rng(seed)
+    gp = HDFGroup()
+    gp.id = 'ES_LIGHT'
+    for cd in cf.data:
+        if cd.fitType in ['COUNT', 'NONE'] or cd.type in ['INSTRUMENT', 'SN']:
+            continue
+        ds = gp.getDataset(cd.type) or gp.addDataset(cd.type)
+        if cd.type == 'INTTIME':
+            ds.columns[cd.id] = rng.integers(8, 512, n).astype(np.float64)
+        else:
+            ds.columns[cd.id] = rng.uniform(1, 4000, n)
+    for ds in gp.datasets.values():
+        ds.columnsToDataset()
+    return gp
+
+
+def calFromLines(lines):
+    cf = CalibrationFile()
+    for definition, coefficients in lines:
+        cd = CalibrationData()
+        cd.read(definition)
+        cd.readCoefficients(coefficients)
+        cf.data.append(cd)
+    return cf
+
+
+class TestFactoryCal(unittest.TestCase):
+    def assertSameCalibration(self, cf):
+        # Imported here as ProcessL1b_FactoryCal requires j6s
+        from Source.ProcessL1b_FactoryCal import ProcessL1b_FactoryCal
+        gp = makeGroup(cf)
+        reference = copy.deepcopy(gp)
+        scalarCalibration(reference, cf)
+        ProcessL1b_FactoryCal.processGroup(gp, cf)
+        for name, ds in gp.datasets.items():
+            for k in ds.data.dtype.names:
+                np.testing.assert_allclose(ds.data[k], reference.datasets[name].data[k], rtol=1e-14, err_msg=f'{name} {k}')
+
+    def test_seabird_cal_file(self):
+        cf = CalibrationFile()
+        with open(os.path.join(CAL_DIR, 'HSE488B.cal'), 'rb') as f:
+            cf.read(f)
+        self.assertSameCalibration(cf)
+
+        # One OPTIC3 group holding all of the Es pixels
+        groups = cf.compiled['ES']
+        self.assertEqual([group['fitType'] for group in groups], ['OPTIC3'])
+        self.assertEqual(len(groups[0]['ids']), 255)
+        self.assertEqual(groups[0]['cint'].shape, (255,))
+
+    def test_fit_types(self):
+        cf = calFromLines([
+            ("INTTIME ES 'sec' 2 BU 1 POLYU", '0 0.001'),
+            ("ES 400.0 'uW/cm^2/nm' 2 BU 1 OPTIC3", '857.1 5.458e-003 1.000 0.256'),
+            ("ES 401.0 'uW/cm^2/nm' 2 BU 1 OPTIC3", '857.1 5.312e-003 1.000 0.256'),
+            ("LT 400.0 'uW/cm^2/nm/sr' 2 BU 1 OPTIC2", '100.0 2.5e-003 1.36'),
+            ("LT 401.0 'uW/cm^2/nm/sr' 2 BU 1 OPTIC4", '100.0 2.5e-003 1.36 0.512'),
+            ("PAR NONE 'uE/cm^2/s' 4 BF 1 POW10", '1000.0 400.0 1.0'),
+            ("TEMP PCB 'C' 2 BU 1 POLYU", '-10.0 0.01 1.5e-06'),
+            ("TEMP CASE 'C' 2 BU 1 POLYU", '-10.0 0.02'),
+            ("PRES NONE 'dbar' 2 BU 1 POLYF", '0.5 100.0 -20.0'),
+        ])
+        self.assertSameCalibration(cf)
+        self.assertEqual([group['coefficients'].shape for group in cf.compiled['TEMP']], [(1, 3), (1, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from Source import PATH_TO_DATA
+from Source.FidRadDB import FidRadDB
+from Source.HDFGroup import HDFGroup
+from Source.Utilities import Utilities
+
+FIDRADDB = os.path.join(PATH_TO_DATA, 'FidRadDB')
+
+
+def fileTime(path):
+    return datetime.strptime(os.path.basename(path).split('_')[-1].split('.')[0], '%Y%m%d%H%M%S').timestamp()
+
+
+class TestFidRadDB(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = FidRadDB.cacheDir
+        self.tmpDir = tempfile.mkdtemp()
+        FidRadDB.cacheDir = os.path.join(self.tmpDir, 'cache')
+        FidRadDB._indexes.clear()
+        FidRadDB._parsed.clear()
+
+    def tearDown(self):
+        FidRadDB.cacheDir = self.cacheDir
+        FidRadDB._indexes.clear()
+        FidRadDB._parsed.clear()
+        shutil.rmtree(self.tmpDir)
+
+    def assertGroupsEqual(self, gp, expected):
+        self.assertEqual(dict(gp.attributes), dict(expected.attributes))
+        self.assertEqual(list(gp.datasets), list(expected.datasets))
+        for name, ds in expected.datasets.items():
+            self.assertEqual(dict(gp.datasets[name].attributes), dict(ds.attributes))
+            self.assertEqual(gp.datasets[name].data.dtype, ds.data.dtype)
+            np.testing.assert_array_equal(gp.datasets[name].data, ds.data)
+            self.assertEqual(gp.datasets[name].columns, ds.columns)
+
+    def test_choose(self):
+        for sensorType in ['SeaBird', 'TriOS']:
+            folder = os.path.join(FIDRADDB, sensorType)
+            tags, _ = FidRadDB.index(folder)
+            self.assertEqual(sum(len(paths) for _, paths in tags.values()), len(glob.glob(os.path.join(folder, 'CP_*'))))
+            for tag in tags:
+                files = glob.glob(os.path.join(folder, f'CP_{tag}_*'))
+                times = np.array([fileTime(f) for f in files])
+                self.assertEqual(FidRadDB.choose(folder, tag, 0, rule='most_recent'), files[np.argmax(times)])
+                for acqTime in np.concatenate([times, times - 1, times + 1, [0, 2e9]]):
+                    prior = times <= acqTime
+                    if prior.any():
+                        expected = np.array(files)[prior][np.argmax(times[prior])]
+                    else:
+                        expected = files[np.argmin(np.abs(times - acqTime))]
+                    self.assertEqual(FidRadDB.choose(folder, tag, acqTime), expected)
+        self.assertIsNone(FidRadDB.choose(folder, 'SAM_0000_RADCAL', 0))
+
+    def test_index_refresh(self):
+        folder = os.path.join(self.tmpDir, 'TriOS')
+        shutil.copytree(os.path.join(FIDRADDB, 'TriOS'), folder)
+        tag = 'SAM_8166_RADCAL'
+        self.assertEqual(len(FidRadDB.candidates(folder, tag)[1]), 2)
+
+        # A new file is picked up, also from a fresh process
+        newFile = os.path.join(folder, f'CP_{tag}_20300101000000.TXT')
+        shutil.copy(FidRadDB.candidates(folder, tag)[1][-1], newFile)
+        os.utime(folder, ns=(0, os.stat(folder).st_mtime_ns + 10**9))
+        FidRadDB._indexes.clear()
+        self.assertEqual(FidRadDB.choose(folder, tag, 2e9), newFile)
+        self.assertEqual(FidRadDB.candidates(folder, tag)[1][-1], newFile)
+
+        # A file edited in place leaves the folder modification time unchanged, within the session too
+        folderTime = os.stat(folder).st_mtime_ns
+        digest = FidRadDB.index(folder)[1][os.path.basename(newFile)]
+        with open(newFile, 'a', encoding='utf-8') as f:
+            f.write('\n')
+        os.utime(folder, ns=(0, folderTime))
+        newDigest = FidRadDB.index(folder)[1][os.path.basename(newFile)]
+        self.assertNotEqual(newDigest, digest)
+        self.assertEqual(newDigest, FidRadDB._sha1(newFile))
+
+    def test_read_char(self):
+        files = sorted(glob.glob(os.path.join(FIDRADDB, '*', 'CP_*')))
+        for f in files:
+            expected = HDFGroup()
+            Utilities.read_char(f, expected)
+            # Parsed, then from memory, then from the npz cache
+            for reset in [False, False, True]:
+                if reset:
+                    FidRadDB._parsed.clear()
+                gp = HDFGroup()
+                FidRadDB.read_char(f, gp)
+                self.assertGroupsEqual(gp, expected)
+        self.assertEqual(len(glob.glob(os.path.join(FidRadDB.cacheDir, '*.npz'))), len(files))
+
+        # Cached data are not shared between groups
+        gp1, gp2 = HDFGroup(), HDFGroup()
+        FidRadDB.read_char(files[0], gp1)
+        FidRadDB.read_char(files[0], gp2)
+        ds = next(iter(gp1.datasets.values()))
+        ds.data[ds.data.dtype.names[0]] += 1
+        self.assertFalse(np.array_equal(ds.data, next(iter(gp2.datasets.values())).data))
+
+        # Reading into a group that already has the datasets falls back to the direct read
+        with self.assertRaises(KeyError):
+            FidRadDB.read_char(files[0], gp1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import io
+import copy
+import contextlib
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from Source.ConfigFile import ConfigFile
+from Source.HDFRoot import HDFRoot
+from Source.ProcessL1bqc import ProcessL1bqc
+from Source.Utilities import Utilities
+
+N_RECORDS = 40
+START = datetime(2021, 5, 3, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def timeStamps(n, step=10):
+    return [START + timedelta(seconds=step*i) for i in range(n)]
+
+
+def addDataset(gp, name, dateTime, columns):
+    ds = gp.addDataset(name)
+    ds.columns['Datetime'] = list(dateTime)
+    ds.columns['Datetag'] = [2021123.0]*len(dateTime)
+    ds.columns['Timetag2'] = [float(Utilities.datetime2TimeTag2(dt)) for dt in dateTime]
+    for column, values in columns.items():
+        ds.columns[column] = list(values)
+    ds.columnsToDataset()
+
+
+def makeL1B(rng):
+    ''' L1B groups on a shared time axis, and a TriOS L1AQC group on a finer one '''
+    node = HDFRoot()
+    dateTime = timeStamps(N_RECORDS)
+    bands = {f'{wl:.1f}': rng.random(N_RECORDS) for wl in [400.0, 500.0, 600.0]}
+
+    gp = node.addGroup('ANCILLARY')
+    addDataset(gp, 'LATITUDE', dateTime, {'LATITUDE': 30 + rng.random(N_RECORDS)})
+    addDataset(gp, 'WINDSPEED', dateTime, {'WINDSPEED': 10*rng.random(N_RECORDS)})
+    gp = node.addGroup('IRRADIANCE')
+    addDataset(gp, 'ES', dateTime, bands)
+    gp = node.addGroup('RADIANCE')
+    addDataset(gp, 'LI', dateTime, bands)
+    addDataset(gp, 'LT', dateTime, bands)
+    gp = node.addGroup('SIXS_MODEL')
+    addDataset(gp, 'solar_zenith', dateTime, {'solar_zenith': 40 + rng.random(N_RECORDS)})
+    addDataset(gp, 'direct_ratio', dateTime, bands)
+
+    gp = node.addGroup('ES_L1AQC')
+    l1aqcTime = timeStamps(3*N_RECORDS, step=10/3)
+    addDataset(gp, 'Timestamp', l1aqcTime, {})
+    addDataset(gp, 'ES', l1aqcTime, {'400.0': rng.random(3*N_RECORDS)})
+    for name in ['CAL_ES', 'BACK_ES']:
+        ds = gp.addDataset(name)
+        ds.columns['0'] = rng.random(255).tolist()
+        ds.columns['1'] = rng.random(255).tolist()
+        ds.columnsToDataset()
+        ds.attributes['SN'] = '82D5'
+    return node
+
+
+def sequentialFilter(group, badTimes, timeStamp):
+    ''' Records kept by removing each badTimes range in turn, as filterData did before the single mask '''
+    for start, stop in badTimes:
+        rowsToDelete = [i for i, t in enumerate(timeStamp) if start <= t <= stop]
+        group.datasetDeleteRow(rowsToDelete)
+        timeStamp = [t for t in timeStamp if not start <= t <= stop]
+    return timeStamp
+
+
+class TestFilterData(unittest.TestCase):
+    def setUp(self):
+        self.settings = ConfigFile.settings
+        ConfigFile.settings = copy.deepcopy(ConfigFile.settings)
+        ConfigFile.settings['SensorType'] = 'SeaBird'
+        self.dateTime = timeStamps(N_RECORDS)
+        t = self.dateTime
+        # Unsorted and overlapping ranges, one touching the first record and one the last, one between
+        # records and one outside the file
+        self.badTimes = [[t[30], t[34]], [t[0], t[0]], [t[5], t[9]], [t[7], t[12]],
+                         [t[39], t[39] + timedelta(hours=1)], [t[20] + timedelta(seconds=1), t[20] + timedelta(seconds=2)],
+                         [t[8], t[8]], [START - timedelta(hours=2), START - timedelta(hours=1)]]
+
+    def tearDown(self):
+        ConfigFile.settings = self.settings
+
+    def assertSameGroup(self, group, expected):
+        self.assertEqual(list(group.datasets), list(expected.datasets))
+        for name, ds in expected.datasets.items():
+            self.assertEqual(group.datasets[name].data.dtype, ds.data.dtype, name)
+            for field in ds.data.dtype.names:
+                np.testing.assert_array_equal(group.datasets[name].data[field], ds.data[field], err_msg=f'{name} {field}')
+            self.assertEqual(list(group.datasets[name].columns), list(ds.data.dtype.names))
+            self.assertEqual(dict(group.datasets[name].attributes), dict(ds.attributes))
+
+    def test_bad_times_mask(self):
+        t = self.dateTime
+        mask = Utilities.badTimesMask(t, self.badTimes)
+        expected = [any(start <= ti <= stop for start, stop in self.badTimes) for ti in t]
+        np.testing.assert_array_equal(mask, expected)
+        self.assertEqual(np.flatnonzero(mask).tolist(), [0, 5, 6, 7, 8, 9, 10, 11, 12, 30, 31, 32, 33, 34, 39])
+
+        # Unsorted records, and badTimes as the (n, 2) object array of specQualityCheck
+        order = np.random.default_rng(1).permutation(N_RECORDS)
+        shuffled = [t[i] for i in order]
+        np.testing.assert_array_equal(Utilities.badTimesMask(shuffled, np.array(self.badTimes, dtype=object)),
+                                      np.array(expected)[order])
+
+        self.assertFalse(Utilities.badTimesMask(t, []).any())
+        self.assertEqual(len(Utilities.badTimesMask([], self.badTimes)), 0)
+
+    def test_l1b_groups(self):
+        node = makeL1B(np.random.default_rng(0))
+        reference = copy.deepcopy(node)
+        for gpName, dsName in [('ANCILLARY', 'LATITUDE'), ('IRRADIANCE', 'ES'), ('RADIANCE', 'LI'),
+                               ('SIXS_MODEL', 'solar_zenith')]:
+            expected = reference.getGroup(gpName)
+            kept = sequentialFilter(expected, self.badTimes, list(expected.getDataset(dsName).data['Datetime']))
+            fraction = Utilities.filterData(node.getGroup(gpName), self.badTimes)
+            self.assertAlmostEqual(fraction, 15/N_RECORDS)
+            self.assertEqual(len(kept), N_RECORDS - 15)
+            self.assertSameGroup(node.getGroup(gpName), expected)
+
+        # No badTimes keeps every record
+        fraction = Utilities.filterData(node.getGroup('IRRADIANCE'), [])
+        self.assertEqual(fraction, 0)
+        self.assertSameGroup(node.getGroup('IRRADIANCE'), reference.getGroup('IRRADIANCE'))
+
+    def test_l1aqc_trios(self):
+        ConfigFile.settings['SensorType'] = 'TriOS'
+        node = makeL1B(np.random.default_rng(0))
+        group = node.getGroup('ES_L1AQC')
+        cal = group.getDataset('CAL_ES').data.copy()
+        back = group.getDataset('BACK_ES').data.copy()
+
+        expected = copy.deepcopy(group)
+        for name in ['CAL_ES', 'BACK_ES']:
+            # filterData restores these after the other datasets
+            expected.datasets[name] = expected.datasets.pop(name)
+        kept = sequentialFilter(expected, self.badTimes, list(expected.getDataset('Timestamp').data['Datetime']))
+
+        fraction = Utilities.filterData(group, self.badTimes, 'L1AQC')
+        self.assertAlmostEqual(fraction, 1 - len(kept)/(3*N_RECORDS))
+        self.assertSameGroup(group, expected)
+        # CAL_ and BACK_ are not on the time axis and come back whole, with their attributes
+        np.testing.assert_array_equal(group.getDataset('CAL_ES').data, cal)
+        np.testing.assert_array_equal(group.getDataset('BACK_ES').data, back)
+        self.assertEqual(group.getDataset('CAL_ES').attributes['SN'], '82D5')
+
+    def test_limit_percentage(self):
+        t = self.dateTime[:10]
+        values = np.arange(10.0)
+        bad = values >= 6
+        kept = np.ones(10, dtype=bool)
+        kept[:5] = False
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            badTimes = ProcessL1bqc.limitQuality(values, t, bad, 'Wind', 'High Wind', kept)
+        self.assertEqual(badTimes, [[t[6], t[9]]])
+        # 4 of the 5 records left by the earlier criteria
+        self.assertIn('Percentage of data out of Wind limits: 80 %', out.getvalue())
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ProcessL1bqc.limitQuality(values, t, bad, 'Wind', 'High Wind')
+        self.assertIn('Percentage of data out of Wind limits: 40 %', out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import functools
+import http.server
+
+import h5py
+import numpy as np
+
+import Source.GetAnc
+from Source.GetAnc import GetAnc
+from Source.HDFRoot import HDFRoot
+from Source.Utilities import Utilities
+
+# MERRA2 grid of the OBPG ancillary files
+LAT = np.arange(-90, 90.1, 0.5)
+LON = np.arange(-180, 180, 0.625)
+STAMPS = ['20210503T120000', '20210503T130000']
+
+
+def writeMERRA2(fp, fileType, rng):
+    ''' Synthetic MERRA2 file with the layout of the OBPG ones '''
+    with h5py.File(fp, 'w') as f:
+        f['lat'] = LAT.astype(np.float32)
+        f['lon'] = LON.astype(np.float32)
+        for name in GetAnc.fileTypes[fileType]:
+            f[name] = (rng.random((len(LAT), len(LON)))*10 + (280 if name == 'T10M' else 0)).astype(np.float32)
+            f[name].attrs['units'] = np.bytes_('K' if name == 'T10M' else 'm s-1' if name.endswith('10M') else '1')
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class TestGetAnc(unittest.TestCase):
+    ''' Fetch logic against a local stand-in for the OBPG server '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.served = tempfile.mkdtemp()
+        getfile = os.path.join(cls.served, 'ob', 'getfile')
+        os.makedirs(getfile)
+        rng = np.random.default_rng(0)
+        for stamp in STAMPS:
+            for fileType in GetAnc.fileTypes:
+                writeMERRA2(os.path.join(getfile, GetAnc.fileName(stamp, fileType)), fileType, rng)
+
+        cls.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=cls.served))
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+        cls.server, cls.protocol = GetAnc.server, GetAnc.protocol
+        GetAnc.server, GetAnc.protocol = f'127.0.0.1:{cls.httpd.server_address[1]}', 'http'
+
+    @classmethod
+    def tearDownClass(cls):
+        GetAnc.server, GetAnc.protocol = cls.server, cls.protocol
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        shutil.rmtree(cls.served)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pathToData = Source.GetAnc.PATH_TO_DATA
+        Source.GetAnc.PATH_TO_DATA = self.tmp.name
+
+    def tearDown(self):
+        Source.GetAnc.PATH_TO_DATA = self.pathToData
+        self.tmp.cleanup()
+
+    def makeTrack(self, n=50):
+        ''' Ancillary group of a track crossing the hour, with records at both ends of the longitude grid '''
+        rng = np.random.default_rng(1)
+        node = HDFRoot()
+        gp = node.addGroup('ANCILLARY_METADATA')
+        # 12:55:00 onwards every 10 s, HHMMSSmmm
+        seconds = [12*3600 + 55*60 + i*10 for i in range(n)]
+        timeTag2 = [float((t//3600)*10000000 + (t % 3600//60)*100000 + (t % 60)*1000) for t in seconds]
+        lat = list(rng.uniform(40, 42, n))
+        lon = list(rng.uniform(-70, -68, n))
+        lon[3], lon[4] = 179.9, -179.9
+        for name, values in [('LATITUDE', lat), ('LONGITUDE', lon)]:
+            ds = gp.addDataset(name)
+            ds.columns['Datetag'] = [2021123.0]*n
+            ds.columns['Timetag2'] = timeTag2
+            ds.columns['NONE'] = values
+            ds.columnsToDataset()
+        return gp
+
+    def test_plan_files(self):
+        gp = self.makeTrack()
+        stamps, recordFile = GetAnc.planFiles(gp.getDataset('LATITUDE').data['Datetag'],
+                                              gp.getDataset('LATITUDE').data['Timetag2'])
+        self.assertEqual(stamps, STAMPS)
+        self.assertEqual(recordFile[0], 0)
+        self.assertEqual(recordFile[-1], 1)
+
+    def test_fetch_files(self):
+        ancPath = os.path.join(self.tmp.name, 'Anc')
+        fileNames = [GetAnc.fileName(stamp, fileType) for stamp in STAMPS for fileType in GetAnc.fileTypes]
+        status = GetAnc.fetchFiles(fileNames + ['GMAO_MERRA2.20210503T140000.MET.nc'], ancPath)
+        self.assertEqual([status[f] for f in fileNames], [0]*len(fileNames))
+        self.assertEqual(status['GMAO_MERRA2.20210503T140000.MET.nc'], 404)
+        for fileName in fileNames:
+            with open(os.path.join(ancPath, fileName), 'rb') as f, \
+                    open(os.path.join(self.served, 'ob', 'getfile', fileName), 'rb') as g:
+                self.assertEqual(f.read(), g.read())
+
+        # Second pass finds them locally
+        status = GetAnc.fetchFiles(fileNames, ancPath)
+        self.assertEqual(list(status.values()), [200]*len(fileNames))
+
+    def test_get_anc(self):
+        gp = self.makeTrack()
+        modData = GetAnc.getAnc(gp)
+        mod = modData.getGroup('MERRA2_model')
+        self.assertEqual(mod.attributes['Wind units'], 'm s-1')
+
+        # Nearest cell of each record, looked up in the whole global files
+        lat = gp.getDataset('LATITUDE').data['NONE']
+        lon = gp.getDataset('LONGITUDE').data['NONE']
+        stamps, recordFile = GetAnc.planFiles(gp.getDataset('LATITUDE').data['Datetag'],
+                                              gp.getDataset('LATITUDE').data['Timetag2'])
+        for index in range(len(lat)):
+            met = HDFRoot.readHDF5(os.path.join(self.tmp.name, 'Anc', GetAnc.fileName(stamps[recordFile[index]], 'MET')))
+            aer = HDFRoot.readHDF5(os.path.join(self.tmp.name, 'Anc', GetAnc.fileName(stamps[recordFile[index]], 'AER')))
+            data = {ds.id: ds.data for ds in met.datasets + aer.datasets}
+            latInd = Utilities.find_nearest(data['lat'], lat[index])
+            lonInd = Utilities.find_nearest(data['lon'], lon[index])
+            u, v = float(data['U10M'][latInd][lonInd]), float(data['V10M'][latInd][lonInd])
+            self.assertAlmostEqual(mod.datasets['Wind'][index], np.sqrt(u*u + v*v), places=10)
+            self.assertAlmostEqual(mod.datasets['AirTemp'][index], float(data['T10M'][latInd][lonInd]) - 273.15, places=10)
+            self.assertAlmostEqual(mod.datasets['AOD'][index], float(data['TOTEXTTAU'][latInd][lonInd]), places=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+
+import Source.GetAnc_ecmwf
+from Source.GetAnc_ecmwf import GetAnc_ecmwf
+from Source.HDFRoot import HDFRoot
+from Source.Utilities import Utilities
+
+VARIABLES = {'u10': 'm s**-1', 'v10': 'm s**-1', 'aod550': '~', 't2m': 'K'}
+
+
+def requestName(lat, lon, date, time, leadtime):
+    return f'{lat:.2f}_{lon:.2f}_{date}_{time}_{leadtime}.nc'
+
+
+class DirectoryRetriever:
+    ''' Stand-in for CDSRetriever serving single point CAMS files from a local directory '''
+
+    def __init__(self, sourceDir):
+        self.sourceDir = sourceDir
+        self.requests = []
+
+    def retrieve(self, dataset, request, pathOut):
+        self.requests.append(request)
+        lat, lon = request['area'][:2]
+        date = request['date'].split('/')[0]
+        shutil.copy(os.path.join(self.sourceDir, requestName(lat, lon, date, request['time'], request['leadtime_hour'])), pathOut)
+
+
+class TestGetAncECMWF(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sourceDir = os.path.join(self.tmp.name, 'source')
+        os.makedirs(self.sourceDir)
+        self.pathToData = Source.GetAnc_ecmwf.PATH_TO_DATA
+        Source.GetAnc_ecmwf.PATH_TO_DATA = self.tmp.name
+        self.retriever = GetAnc_ecmwf.retriever
+        GetAnc_ecmwf.retriever = DirectoryRetriever(self.sourceDir)
+
+        # Track over two CAMS cells and across the hour
+        n = 40
+        rng = np.random.default_rng(0)
+        self.lat = np.where(np.arange(n) % 2 == 0, 40.01, 40.41) + rng.uniform(-0.1, 0.1, n)
+        self.lon = -70.0 + rng.uniform(-0.1, 0.1, n)
+        seconds = [12*3600 + 58*60 + i*5 for i in range(n)]
+        self.timeTag2 = [float((t//3600)*10000000 + (t % 3600//60)*100000 + (t % 60)*1000) for t in seconds]
+
+        node = HDFRoot()
+        self.gp = node.addGroup('ANCILLARY_METADATA')
+        for name, values in [('LATITUDE', self.lat), ('LONGITUDE', self.lon)]:
+            ds = self.gp.addDataset(name)
+            ds.columns['Datetag'] = [2021123.0]*n
+            ds.columns['Timetag2'] = self.timeTag2
+            ds.columns['NONE'] = values.tolist()
+            ds.columnsToDataset()
+
+        # One source file per cell and time step, with values identifying it
+        self.keys = set()
+        for lat, lon, timeTag2 in zip(self.lat, self.lon, self.timeTag2):
+            timeStamp = Utilities.timeTag2ToDateTime(Utilities.dateTagToDateTime(2021123.0), timeTag2)
+            latEff, lonEff, _, date, time = GetAnc_ecmwf.ECMWF_latLonTimeTags(lat, lon, timeStamp, 0.4, 0.4, 1)
+            hour = int(time.split(':')[0])
+            key = requestName(latEff, lonEff, date, '%02d:00' % ((hour // 12) * 12), str(hour % 12))
+            if key in self.keys:
+                continue
+            self.keys.add(key)
+            seed = len(self.keys)
+            data = {}
+            for k, (name, units) in enumerate(VARIABLES.items()):
+                value = np.full((1, 1, 1, 1), seed + k/10 + (273 if name == 't2m' else 0), dtype=np.float32)
+                data[name] = (['forecast_period', 'forecast_reference_time', 'latitude', 'longitude'], value,
+                              {'units': units, 'long_name': name})
+            xr.Dataset(data).to_netcdf(os.path.join(self.sourceDir, key))
+
+    def tearDown(self):
+        GetAnc_ecmwf.retriever = self.retriever
+        Source.GetAnc_ecmwf.PATH_TO_DATA = self.pathToData
+        self.tmp.cleanup()
+
+    def test_batched_extraction(self):
+        modData = GetAnc_ecmwf.getAnc_ecmwf(self.gp)
+        mod = modData.getGroup('ECMWF')
+        self.assertEqual(len(self.keys), 4)
+        # One request per cell and time step
+        self.assertEqual(len(GetAnc_ecmwf.retriever.requests), len(self.keys))
+
+        # Same values as extracting each record on its own
+        ancPath = os.path.join(self.tmp.name, 'Anc')
+        for index, timeTag2 in enumerate(self.timeTag2):
+            timeStamp = Utilities.timeTag2ToDateTime(Utilities.dateTagToDateTime(2021123.0), timeTag2)
+            ancillary = GetAnc_ecmwf.get_ancillary_main(self.lat[index], self.lon[index], timeStamp, ancPath)
+            u = ancillary['10m_u_component_of_wind']['value']
+            v = ancillary['10m_v_component_of_wind']['value']
+            self.assertAlmostEqual(mod.datasets['Wind'][index], np.sqrt(u*u + v*v), places=5)
+            self.assertAlmostEqual(mod.datasets['AOD'][index], ancillary['total_aerosol_optical_depth_550nm']['value'], places=5)
+            self.assertAlmostEqual(mod.datasets['AirTemp'][index], ancillary['2m_temperature']['value'] - 273.15, places=4)
+        self.assertEqual(len(set(mod.datasets['AOD'])), len(self.keys))
+
+        # Files already retrieved are not requested again
+        GetAnc_ecmwf.retriever.requests.clear()
+        again = GetAnc_ecmwf.getAnc_ecmwf(self.gp).getGroup('ECMWF')
+        self.assertEqual(GetAnc_ecmwf.retriever.requests, [])
+        self.assertEqual(again.datasets['Wind'], mod.datasets['Wind'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import collections
+import unittest
+
+import numpy as np
+from scipy.interpolate import interp1d
+
+from Source.HDFDataset import HDFDataset
+from Source.L1bqcKernel import L1bqcKernel
+
+
+class TestL1bqcKernel(unittest.TestCase):
+    def test_to_array(self):
+        columns = collections.OrderedDict([('Datetag', [2021123.0]*2), ('Timetag2', [120000000.0, 120001000.0]),
+                                           ('350.5', [1.0, 2.0]), ('400.0', [3.0, 4.0]), ('900.2', [5.0, 6.0])])
+        wavelengths, array = L1bqcKernel.toArray(columns)
+        np.testing.assert_array_equal(wavelengths, [350.5, 400.0, 900.2])
+        np.testing.assert_array_equal(array, [[1, 3, 5], [2, 4, 6]])
+
+        ds = HDFDataset()
+        ds.columns = columns
+        ds.columnsToDataset()
+        wavelengths, array = L1bqcKernel.toArray(ds, waveRange=[350.5, 400])
+        np.testing.assert_array_equal(wavelengths, [350.5, 400.0])
+        np.testing.assert_array_equal(array, [[1, 3], [2, 4]])
+
+    def test_interpolate(self):
+        rng = np.random.default_rng(0)
+        wavelengths = np.array([402.1, 350.3, 376.9, 455.0, 430.6])
+        array = rng.random((6, len(wavelengths)))
+        order = np.argsort(wavelengths)
+        for wl in [350.3, 360.0, 380.0, 402.1, 441.7, 455.0]:
+            expected = interp1d(wavelengths[order], array[:, order])(wl)
+            np.testing.assert_allclose(L1bqcKernel.interpolate(wavelengths, array, wl), expected, rtol=1e-12)
+        for wl in [350.0, 455.1]:
+            with self.assertRaises(ValueError):
+                L1bqcKernel.interpolate(wavelengths, array, wl)
+
+        # A NaN band only spoils the intervals next to it
+        array[2, 0] = np.nan
+        self.assertTrue(np.isnan(L1bqcKernel.interpolate(wavelengths, array, 420.0)[2]))
+        self.assertTrue(np.isfinite(L1bqcKernel.interpolate(wavelengths, array, 360.0)[2]))
+
+    def test_spec_outliers(self):
+        base = np.array([1.0, 0.5, 0.25, 0.1])
+        array = np.vstack([2*base, 3*base, 4*base, 5*base, 2*np.array([1.0, 0.9, 0.25, 0.1])])
+        # Negative in the last band, which is not tested
+        array[3, -1] = -0.5
+        mask, normSpec, aveSpec, stdSpec = L1bqcKernel.specOutliers(array, 1.5)
+
+        np.testing.assert_allclose(normSpec[:4, :3], np.tile(base[:3], (4, 1)))
+        np.testing.assert_allclose(aveSpec[:3], base[:3])
+        # Band 2: four spectra at 0.5 and one at 0.9
+        np.testing.assert_allclose(stdSpec[1], 0.16)
+        # 0.9 > 0.5 + 1.5*0.16; the equal bands with std 0 pass
+        np.testing.assert_array_equal(mask, [False, False, False, False, True])
+
+        # Negative in a tested band
+        array[3, 2] = -1.0
+        mask = L1bqcKernel.specOutliers(array, 100)[0]
+        np.testing.assert_array_equal(mask, [False, False, False, True, False])
+
+    def test_lt_uv_nir(self):
+        wavelengths = [355.0, 380.0, 400.0, 790.0, 820.0, 850.0]
+        lt = np.array([[2, 2, 0, 1, 1, 9],
+                       [1, 1, 5, 2, 2, 0],
+                       [np.nan, 1, 5, 3, np.nan, 0],
+                       [np.nan, np.nan, 1, np.nan, np.nan, 1]], dtype=float)
+        mask, ltUVA, ltNIR = L1bqcKernel.ltUVNIR(wavelengths, lt)
+        # 400 and 850 nm are outside the (exclusive) UVA and NIR ranges; all-NaN records pass
+        np.testing.assert_array_equal(mask, [False, True, True, False])
+        np.testing.assert_array_equal(ltUVA, [2, 1, 1, np.nan])
+        np.testing.assert_array_equal(ltNIR, [1, 2, 3, np.nan])
+
+    def test_met_flags(self):
+        # Es linear in wavelength (Es = wl/100), flat, and missing; none of the flag bands are sampled
+        esWavelengths = np.array([360.0, 380.0, 460.0, 475.0, 490.0, 670.0, 690.0, 710.0, 730.0, 740.0, 760.0])
+        es = np.vstack([esWavelengths/100, np.ones(len(esWavelengths)), np.full(len(esWavelengths), np.nan)])
+        liWavelengths = np.array([740.0, 760.0])
+        li = np.array([[0.3, 0.3], [0.05, 0.05], [0.1, 0.1]])
+
+        flags = L1bqcKernel.metFlags(esWavelengths, es, liWavelengths, li,
+                                     esFlag=2.0, dawnDuskFlag=0.8, humidityFlag=1.5, cloudFlag=0.05)
+        self.assertEqual(list(flags), ['Flag1', 'Flag2', 'Flag3', 'Flag4', 'Flag5'])
+        # Li/Es(750): 0.3/7.5 = 0.04, 0.05/1 = 0.05 (>= cloudFlag)
+        np.testing.assert_array_equal(flags['Flag2'], [False, True, False])
+        np.testing.assert_array_equal(flags['Flag1'], [False, False, False])
+        # Es(480): 4.8, 1
+        np.testing.assert_array_equal(flags['Flag3'], [False, True, False])
+        # Es(470)/Es(680): 0.69, 1
+        np.testing.assert_array_equal(flags['Flag4'], [True, False, False])
+        # Es(720)/Es(370): 1.95, 1
+        np.testing.assert_array_equal(flags['Flag5'], [False, True, False])
+
+        flags = L1bqcKernel.metFlags(esWavelengths, es, liWavelengths, li, 2.0, 0.8, 1.5, 0.05, sixS=True)
+        np.testing.assert_array_equal(flags['Flag1'], flags['Flag2'])
+
+    def test_runs(self):
+        starts, stops = L1bqcKernel.runs([True, True, False, False, True, False, True, True, True])
+        self.assertEqual(starts.tolist(), [0, 4, 6])
+        self.assertEqual(stops.tolist(), [1, 4, 8])
+        starts, stops = L1bqcKernel.runs(np.array([False, True, True, False]))
+        self.assertEqual((starts.tolist(), stops.tolist()), ([1], [2]))
+        starts, stops = L1bqcKernel.runs(np.ones(5, dtype=bool))
+        self.assertEqual((starts.tolist(), stops.tolist()), ([0], [4]))
+        for mask in [np.zeros(5, dtype=bool), []]:
+            starts, stops = L1bqcKernel.runs(mask)
+            self.assertEqual((starts.tolist(), stops.tolist()), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
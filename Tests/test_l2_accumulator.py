@@ -0,0 +1,70 @@
+import datetime
+import unittest
+
+import numpy as np
+
+from Source.L2Accumulator import L2Accumulator
+from Source.HDFRoot import HDFRoot
+
+WAVEBANDS = ['400.0', '403.3', '406.6']
+
+
+def timeObj(i):
+    dateTime = datetime.datetime(2021, 5, 3, 12, i, tzinfo=datetime.timezone.utc)
+    return {'dateTime': dateTime, 'dateTag': 2021123, 'timeTag': 120000000 + i*100000}
+
+
+def makeNode():
+    node = HDFRoot()
+    for groupID in ['REFLECTANCE', 'IRRADIANCE', 'RADIANCE']:
+        node.addGroup(groupID)
+    return node
+
+
+class TestL2Accumulator(unittest.TestCase):
+    def test_rows(self):
+        output = L2Accumulator(2)
+        rrs = output.rows('REFLECTANCE', 'Rrs_HYPER', WAVEBANDS)
+        self.assertIs(output.rows('REFLECTANCE', 'Rrs_HYPER', WAVEBANDS), rrs)
+        for i in range(5):
+            rrs.newRow(timeObj(i))[:] = [i, 10*i, 100*i]
+        self.assertEqual(rrs.n, 5)
+        self.assertGreaterEqual(len(rrs.values), 5)
+        np.testing.assert_array_equal(rrs['403.3'], [0, 10, 20, 30, 40])
+
+        # The current ensemble is corrected in place through the column views
+        for k in rrs:
+            rrs[k][-1] -= 1
+        np.testing.assert_array_equal(rrs.row(), [3, 39, 399])
+
+        # Columns not set for an ensemble are NaN
+        nir = output.rows('REFLECTANCE', 'nir_HYPER', ['NIR_offset'])
+        nir.newRow(timeObj(0))
+        self.assertTrue(np.isnan(nir['NIR_offset'][-1]))
+
+    def test_write(self):
+        output = L2Accumulator(4)
+        for i in range(3):
+            output.rows('REFLECTANCE', 'Ensemble_N', ['N'], dated=False).newRow()[0] = 10 + i
+            output.rows('IRRADIANCE', 'ES_HYPER', WAVEBANDS).newRow(timeObj(i))[:] = np.arange(3) + i
+            output.rows('REFLECTANCE', 'Rrs_HYPER', WAVEBANDS).newRow(timeObj(i))[:] = np.arange(3) / (i+1)
+        output.get('IRRADIANCE', 'ES_HYPER').attributes['ES_UNITS'] = 'uW/cm^2/nm'
+        output.rows('RADIANCE', 'LW_HYPER', WAVEBANDS) # No ensemble reached this dataset
+
+        node = makeNode()
+        output.write(node)
+        self.assertEqual(output.datasets, {})
+        self.assertEqual(list(node.getGroup('REFLECTANCE').datasets), ['Ensemble_N', 'Rrs_HYPER'])
+        self.assertEqual(list(node.getGroup('RADIANCE').datasets), [])
+
+        es = node.getGroup('IRRADIANCE').getDataset('ES_HYPER')
+        self.assertEqual(list(es.columns), ['Datetime', 'Datetag', 'Timetag2'] + WAVEBANDS)
+        self.assertEqual(es.columns['Datetime'], [timeObj(i)['dateTime'] for i in range(3)])
+        np.testing.assert_array_equal(es.data['406.6'], [2, 3, 4])
+        self.assertEqual(es.attributes['ES_UNITS'], 'uW/cm^2/nm')
+        self.assertEqual(list(node.getGroup('REFLECTANCE').getDataset('Ensemble_N').columns), ['N'])
+        np.testing.assert_array_equal(node.getGroup('REFLECTANCE').getDataset('Ensemble_N').data['N'], [10, 11, 12])
+
+
+if __name__ == '__main__':
+    unittest.main()
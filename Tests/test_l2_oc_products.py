@@ -0,0 +1,105 @@
+import copy
+import unittest
+
+import numpy as np
+
+from Source.ConfigFile import ConfigFile
+from Source.HDFRoot import HDFRoot
+from Source.ProcessL2OCproducts import ProcessL2OCproducts
+
+N_RECORDS = 4
+
+
+def addDataset(gp, name, columns):
+    ds = gp.addDataset(name)
+    ds.columns['Datetime'] = [f'2021-05-03 12:00:0{i}' for i in range(N_RECORDS)]
+    ds.columns['Datetag'] = [2021123.0]*N_RECORDS
+    ds.columns['Timetag2'] = [120000000.0 + 1000*i for i in range(N_RECORDS)]
+    ds.columns.update(columns)
+    ds.columnsToDataset()
+    return ds
+
+
+def makeL2():
+    ''' L2 with hyperspectral Rrs and SST, but no MODIS Rrs, Es or salinity '''
+    node = HDFRoot()
+    wavelengths = np.arange(400.0, 701.0, 5.0)
+    shape = np.exp(-((wavelengths - 490)/100)**2)
+    gp = node.addGroup('REFLECTANCE')
+    addDataset(gp, 'Rrs_HYPER', {f'{wl}': (0.004*shape[j]*(1 + 0.1*np.arange(N_RECORDS))).tolist()
+                                 for j, wl in enumerate(wavelengths)})
+    gp = node.addGroup('ANCILLARY')
+    addDataset(gp, 'SST', {'SST': [20.0, 20.5, 21.0, 21.5]})
+    return node
+
+
+class TestL2OCproducts(unittest.TestCase):
+    def setUp(self):
+        self.registry = ProcessL2OCproducts.registry
+        ProcessL2OCproducts.registry = copy.deepcopy(self.registry)
+        self.products = ConfigFile.products
+        ConfigFile.products = {product['switch']: 0 for product in self.registry.values()}
+
+    def tearDown(self):
+        ProcessL2OCproducts.registry = self.registry
+        ConfigFile.products = self.products
+
+    def addProduct(self, name, depends):
+        ProcessL2OCproducts.registry[name] = {'switch': f'bL2Prod{name}', 'message': f'Processing {name}',
+                                              'inputs': [], 'depends': depends, 'kernel': name,
+                                              'outputs': {name: (None, {})}}
+
+    def test_resolve_order(self):
+        self.assertEqual(ProcessL2OCproducts.resolveOrder(['qwip', 'chlor_a']), ['avw', 'qwip', 'chlor_a'])
+        self.assertEqual(ProcessL2OCproducts.resolveOrder(['avw', 'qwip']), ['avw', 'qwip'])
+
+        # Products using chlor_a follow it, whatever the selection order
+        self.addProduct('chl_ratio', ['chlor_a'])
+        self.addProduct('chl_avw', ['chl_ratio', 'avw'])
+        self.assertEqual(ProcessL2OCproducts.resolveOrder(['chl_avw', 'qwip']),
+                         ['chlor_a', 'chl_ratio', 'avw', 'chl_avw', 'qwip'])
+        self.assertEqual(ProcessL2OCproducts.resolveOrder(['chl_ratio', 'chlor_a']), ['chlor_a', 'chl_ratio'])
+
+    def test_resolve_errors(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown product: nope$'):
+            ProcessL2OCproducts.resolveOrder(['chlor_a', 'nope'])
+        self.addProduct('chl_ratio', ['chl'])
+        with self.assertRaisesRegex(ValueError, r'Unknown product: chl \(required by chl_ratio\)'):
+            ProcessL2OCproducts.resolveOrder(['chl_ratio'])
+
+        self.addProduct('a', ['b'])
+        self.addProduct('b', ['c'])
+        self.addProduct('c', ['a'])
+        with self.assertRaisesRegex(ValueError, 'Circular product dependency: a -> b -> c -> a'):
+            ProcessL2OCproducts.resolveOrder(['a'])
+        self.addProduct('d', ['d'])
+        with self.assertRaisesRegex(ValueError, 'Circular product dependency: d -> d'):
+            ProcessL2OCproducts.resolveOrder(['chlor_a', 'd'])
+
+    def test_load_inputs(self):
+        node = makeL2()
+        inputs = ProcessL2OCproducts.loadInputs(node, ['MODISA', 'HYPER', 'ES_HYPER', 'SST', 'SALINITY'])
+        self.assertEqual(list(inputs), ['root', 'HYPER', 'SST'])
+        wavelength, rrs = inputs['HYPER']
+        np.testing.assert_array_equal(wavelength, np.arange(400.0, 701.0, 5.0))
+        self.assertEqual(rrs.shape, (len(wavelength), N_RECORDS))
+        np.testing.assert_array_equal(inputs['SST'], [20.0, 20.5, 21.0, 21.5])
+
+        with self.assertRaisesRegex(ValueError, 'Unknown product input: CHL'):
+            ProcessL2OCproducts.loadInputs(node, ['CHL'])
+
+    def test_missing_inputs_skipped(self):
+        node = makeL2()
+        # chlor_a needs MODIS Rrs; qwip pulls in avw, which is not written
+        for name in ['chlor_a', 'qwip']:
+            ConfigFile.products[ProcessL2OCproducts.registry[name]['switch']] = 1
+        ProcessL2OCproducts.procProds(node)
+
+        derived = node.getGroup('DERIVED_PRODUCTS')
+        self.assertEqual(list(derived.datasets), ['qwip'])
+        self.assertEqual(len(derived.datasets['qwip'].columns['qwip']), N_RECORDS)
+        self.assertEqual(derived.attributes['qwip_UNITS'], 'sr^-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
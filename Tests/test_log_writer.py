@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+from Source.LogWriter import LogWriter
+
+
+def writeLines(logDir, fileName, prefix, n):
+    ''' Log lines written from a child process, which exits without flushing '''
+    LogWriter.logDir = logDir
+    os.environ['LOGFILE'] = fileName
+    for i in range(n):
+        LogWriter.write(f'{prefix}{i}')
+
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        LogWriter.close()
+        self.logDir = LogWriter.logDir
+        self.logFile = os.environ.get('LOGFILE')
+        self.tmpDir = tempfile.mkdtemp()
+        LogWriter.logDir = os.path.join(self.tmpDir, 'Logs')
+
+    def tearDown(self):
+        LogWriter.close()
+        LogWriter.logDir = self.logDir
+        if self.logFile is None:
+            os.environ.pop('LOGFILE', None)
+        else:
+            os.environ['LOGFILE'] = self.logFile
+        shutil.rmtree(self.tmpDir)
+
+    def lines(self, fileName):
+        with open(os.path.join(LogWriter.logDir, fileName), 'r', encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_flush(self):
+        os.environ['LOGFILE'] = 'A_L1A_L1AQC.log'
+        LogWriter.write('Header', mode='w')
+        for i in range(1000):
+            LogWriter.write(f'line {i}')
+        LogWriter.flush()
+        # On disk with the file still open
+        self.assertIsNotNone(LogWriter._listener)
+        self.assertEqual(self.lines('A_L1A_L1AQC.log'), ['Header'] + [f'line {i}' for i in range(1000)])
+
+        # Mode 'w' starts the file over
+        LogWriter.write('Restarted', mode='w')
+        LogWriter.flush()
+        self.assertEqual(self.lines('A_L1A_L1AQC.log'), ['Restarted'])
+
+    def test_switch_files(self):
+        for fileName, text in [('A.log', 'a1'), ('B.log', 'b1'), ('A.log', 'a2'), ('B.log', 'b2'), ('C.log', 'c1')]:
+            os.environ['LOGFILE'] = fileName
+            LogWriter.write(text)
+        LogWriter.flush()
+        self.assertEqual(self.lines('A.log'), ['a1', 'a2'])
+        self.assertEqual(self.lines('B.log'), ['b1', 'b2'])
+        self.assertEqual(self.lines('C.log'), ['c1'])
+
+    def test_child_processes(self):
+        methods = [method for method in ['fork', 'spawn'] if method in multiprocessing.get_all_start_methods()]
+        for method in methods:
+            fileName = f'{method}.log'
+            os.environ['LOGFILE'] = fileName
+            # Lines still queued in the parent when the child starts
+            for i in range(200):
+                LogWriter.write(f'parent{i}')
+            child = multiprocessing.get_context(method).Process(target=writeLines,
+                                                                args=(LogWriter.logDir, fileName, 'child', 200))
+            child.start()
+            child.join()
+            self.assertEqual(child.exitcode, 0)
+            LogWriter.write('parent done')
+            LogWriter.flush()
+
+            lines = self.lines(fileName)
+            self.assertEqual([line for line in lines if line.startswith('child')], [f'child{i}' for i in range(200)], method)
+            self.assertEqual([line for line in lines if line.startswith('parent')],
+                             [f'parent{i}' for i in range(200)] + ['parent done'], method)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+import collections
+
+import numpy as np
+from PIL import Image
+
+from Source.PDFreport import PDF, ReportBuilder, ReportImages
+from Source.PlotJobs import PlotSpec, PlotJobs
+from Source.HDFRoot import HDFRoot
+from Source.ConfigFile import ConfigFile
+from Source.MainConfig import MainConfig
+from Source.SeaBASSHeader import SeaBASSHeader
+
+
+def writeL1B(fp, n=2000):
+    ''' L1B-like file: report attributes plus a large dataset the report does not need '''
+    node = HDFRoot()
+    node.attributes['TIME-STAMP'] = 'Mon May 03 12:00:00 2021'
+    node.attributes['CAL_TYPE'] = 'Factory'
+    node.attributes['WAVE_INTERP'] = '3.3 nm'
+    gp = node.addGroup('IRRADIANCE')
+    gp.attributes['FrameType'] = 'ShutterLight'
+    ds = gp.addDataset('ES')
+    ds.columns['Datetag'] = [2021123.0]*n
+    ds.columns['Timetag2'] = [120000000.0]*n
+    for wl in np.arange(350, 900, 3.3):
+        ds.columns[f'{wl:.1f}'] = np.random.default_rng(0).random(n).tolist()
+    ds.columnsToDataset()
+    node.writeHDF5(fp)
+
+
+def interpSpec(fp, seed):
+    ''' Spec like those of Utilities.plotTimeInterp '''
+    spec = PlotSpec(fp, figsize=(12, 4))
+    spec.plot(np.arange(200), np.random.default_rng(seed).random(200), 'bo', label='Raw')
+    spec.legend()
+    return spec
+
+
+class TestPDFReport(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = (ReportBuilder.logDir, ConfigFile.settings, MainConfig.settings,
+                      SeaBASSHeader.settings, ReportBuilder.maxWorkers, PlotJobs.maxWorkers)
+        ReportBuilder.logDir = os.path.join(self.tmp.name, 'Logs')
+        ConfigFile.settings = collections.OrderedDict(seaBASSHeaderFileName='NotAHeader.hdr', bL2Stations=0, fL1bCal=1)
+        MainConfig.settings = collections.OrderedDict(version='test', popQuery=1)
+        SeaBASSHeader.settings = collections.OrderedDict(comments='', other_comments='')
+        PlotJobs.maxWorkers = 1
+
+        self.pathOut = os.path.join(self.tmp.name, 'Data')
+        self.plotDir = os.path.join(self.pathOut, 'Plots', 'L1B_Interp')
+        os.makedirs(os.path.join(self.pathOut, 'L1B'))
+        os.makedirs(os.path.join(self.tmp.name, 'Logs'))
+
+    def tearDown(self):
+        (ReportBuilder.logDir, ConfigFile.settings, MainConfig.settings,
+         SeaBASSHeader.settings, ReportBuilder.maxWorkers, PlotJobs.maxWorkers) = self.saved
+        ReportBuilder.batch = None
+        self.tmp.cleanup()
+
+    def processed(self, fileName):
+        ''' Outputs of a file processed to L1B: HDF, log and interpolation plots '''
+        fp = os.path.join(self.pathOut, 'L1B', f'{fileName}_L1B.hdf')
+        writeL1B(fp)
+        with open(os.path.join(self.tmp.name, 'Logs', f'{fileName}_L1AQC_L1B.log'), 'w', encoding='utf-8') as f:
+            f.write(f'Processing {fileName}\n')
+        for i, name in enumerate(['GPS_LATITUDE', 'SATTHS_PITCH']):
+            PlotJobs.add(interpSpec(os.path.join(self.plotDir, f'{fileName}_L1B_{name}.png'), i))
+        PlotJobs.render()
+        return fp
+
+    def test_attributes_only(self):
+        fp = os.path.join(self.tmp.name, 'file.hdf')
+        writeL1B(fp)
+        full = HDFRoot.readHDF5(fp)
+        attributes = HDFRoot.readHDF5(fp, attributesOnly=True)
+        self.assertEqual(attributes.attributes, full.attributes)
+        self.assertEqual([gp.attributes for gp in attributes.groups], [gp.attributes for gp in full.groups])
+        self.assertEqual([len(gp.datasets) for gp in attributes.groups], [0])
+
+    def test_plot_files_from_manifest(self):
+        self.processed('A')
+        self.processed('B')
+        # Not drawn by PlotJobs, so not in the manifest
+        Image.new('RGB', (10, 10)).save(os.path.join(self.plotDir, 'A_L1B_stale.png'))
+
+        pdf = PDF()
+        self.assertEqual([os.path.basename(fp) for fp in pdf.plotFiles(self.plotDir, 'A_*.png')],
+                         ['A_L1B_GPS_LATITUDE.png', 'A_L1B_SATTHS_PITCH.png'])
+        os.remove(os.path.join(self.plotDir, PlotJobs.manifestName))
+        self.assertEqual(len(pdf.plotFiles(self.plotDir, 'A_*.png')), 3)
+
+    def test_report_images(self):
+        self.processed('A')
+        plot = os.path.join(self.plotDir, 'A_L1B_GPS_LATITUDE.png')
+        images = ReportImages(maxWidth=600)
+        copy = images.get(plot)
+        with Image.open(copy) as im:
+            self.assertEqual(im.size, (600, 200))
+        self.assertLess(os.path.getsize(copy), os.path.getsize(plot))
+
+        # Reused until the plot is redrawn with different inputs
+        self.assertEqual(images.get(plot), copy)
+        PlotJobs.add(interpSpec(plot, 5))
+        PlotJobs.render()
+        self.assertNotEqual(images.get(plot), copy)
+
+    def test_batch(self):
+        ReportBuilder.maxWorkers = 2
+        names = ['A', 'B', 'C']
+        files = [self.processed(name) for name in names]
+        ReportBuilder.startBatch()
+        for name, fp in zip(names, files):
+            ReportBuilder.write(name, self.pathOut, fp, 'L1B', fp)
+        self.assertEqual(len(ReportBuilder.batch), 3)
+        self.assertFalse(os.path.isdir(os.path.join(self.pathOut, 'Reports')))
+        ReportBuilder.finishBatch()
+
+        self.assertIsNone(ReportBuilder.batch)
+        for name in names:
+            self.assertTrue(os.path.isfile(os.path.join(self.pathOut, 'Reports', f'{name}_L1B.pdf')))
+        # Embedded plots were downsampled once each
+        self.assertEqual(len(os.listdir(os.path.join(self.plotDir, ReportImages.dirName))), 2*len(names))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import glob
+import tempfile
+import multiprocessing
+import unittest
+import datetime
+
+import numpy as np
+import matplotlib.dates as mdates
+from PIL import Image
+
+from Source.PlotJobs import PlotSpec, PlotJobs
+
+FONT = {'family': 'serif', 'color': 'darkred', 'weight': 'normal', 'size': 16}
+
+
+def deglitchSpec(fp, seed=0):
+    ''' Spec with the calls made by Utilities.saveDeglitchPlots '''
+    rng = np.random.default_rng(seed)
+    x = np.array([datetime.datetime(2021, 5, 3, 12) + datetime.timedelta(seconds=10*i) for i in range(100)])
+    y = rng.random(100)
+    spec = PlotSpec(fp)
+    spec.call('fig.autofmt_xdate')
+    spec.plot(x, y, marker='o', color='k', linestyle='', fillstyle='none')
+    spec.plot(x[::7], y[::7], marker='x', color='red', markersize=12, linestyle='')
+    spec.call('xaxis.set_major_formatter', mdates.DateFormatter('%y-%m-%d %H:%M'))
+    spec.call('fig.text', 0, 0.95, 'Marked for exclusions in ALL bands', transform=PlotSpec.FIGURE)
+    spec.set_ylabel('ES(412.5) Light', fontdict=FONT)
+    spec.set_title('WindowSize = 11 Sigma Factor = 3', fontdict=FONT)
+    return spec
+
+
+def spectraSpec(fp, seed=0):
+    ''' Spec with the calls made by Utilities.plotRadiometry '''
+    rng = np.random.default_rng(seed)
+    wave = np.arange(350, 900, 3.3)
+    spec = PlotSpec(fp)
+    for i in range(5):
+        spec.plot(wave, rng.random(len(wave)), c=(i/5, 0, 1-i/5, 1), zorder=-1, label=str(i))
+    spec.text(0.2, -0.1, 'Interval: 300 s', verticalalignment='top', horizontalalignment='right',
+              transform=PlotSpec.AXES, color='black', fontdict=FONT)
+    spec.set_ylim([0, 1.2])
+    spec.legend()
+    spec.call('fig.subplots_adjust', left=0.15)
+    spec.call('fig.subplots_adjust', bottom=0.25)
+    spec.grid()
+    return spec
+
+
+def addEntries(plotDir, worker, nCalls):
+    ''' Manifest entries of one worker, one render call at a time '''
+    for i in range(nCalls):
+        PlotJobs.updateManifests({os.path.join(plotDir, f'w{worker}_{i}.png'): f'{worker}{i}'})
+
+
+def pixels(fp):
+    with Image.open(fp) as im:
+        return np.asarray(im)
+
+
+class TestPlotJobs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings = PlotJobs.maxWorkers, PlotJobs.minPoolJobs
+        PlotJobs.pending = []
+
+    def tearDown(self):
+        PlotJobs.maxWorkers, PlotJobs.minPoolJobs = self.settings
+        PlotJobs.pending = []
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, 'Plots', name)
+
+    def test_reused_template(self):
+        # A figure drawn on a template used by a different plot before is identical to one drawn fresh
+        PlotJobs.maxWorkers = 1
+        for name, spec in [('first.png', deglitchSpec), ('other.png', spectraSpec), ('again.png', deglitchSpec)]:
+            PlotJobs.add(spec(self.path(name)))
+            PlotJobs.render()
+        np.testing.assert_array_equal(pixels(self.path('first.png')), pixels(self.path('again.png')))
+        self.assertFalse(np.array_equal(pixels(self.path('first.png')), pixels(self.path('other.png'))))
+
+    def test_unchanged_plots_skipped(self):
+        PlotJobs.maxWorkers = 1
+        PlotJobs.add(deglitchSpec(self.path('a.png')))
+        PlotJobs.add(spectraSpec(self.path('b.png')))
+        self.assertEqual(len(PlotJobs.render()), 2)
+        self.assertEqual(PlotJobs.storedKey(self.path('a.png')), deglitchSpec(None).key())
+
+        # Same inputs: nothing drawn. New inputs: only that plot drawn
+        PlotJobs.add(deglitchSpec(self.path('a.png')))
+        PlotJobs.add(spectraSpec(self.path('b.png'), seed=1))
+        self.assertEqual(PlotJobs.render(), [self.path('b.png')])
+        self.assertEqual(PlotJobs.pending, [])
+
+    def test_process_pool(self):
+        PlotJobs.maxWorkers, PlotJobs.minPoolJobs = 1, 1
+        for i in range(3):
+            PlotJobs.add(spectraSpec(self.path(f'serial_{i}.png'), seed=i))
+        PlotJobs.render()
+
+        PlotJobs.maxWorkers = 2
+        for i in range(3):
+            PlotJobs.add(spectraSpec(self.path(f'pool_{i}.png'), seed=i))
+        self.assertEqual(len(PlotJobs.render()), 3)
+        for i in range(3):
+            np.testing.assert_array_equal(pixels(self.path(f'serial_{i}.png')), pixels(self.path(f'pool_{i}.png')))
+
+    def test_manifest_concurrent_updates(self):
+        plotDir = self.path('')
+        os.makedirs(plotDir)
+        nWorkers, nCalls = 4, 25
+        with multiprocessing.get_context('spawn').Pool(nWorkers) as pool:
+            pool.starmap(addEntries, [(plotDir, worker, nCalls) for worker in range(nWorkers)])
+
+        # No entry lost or duplicated, whether still in fragments or folded into the manifest
+        expected = {f'w{worker}_{i}.png': f'{worker}{i}' for worker in range(nWorkers) for i in range(nCalls)}
+        self.assertEqual(PlotJobs.readManifest(plotDir), expected)
+        PlotJobs.compactManifest(plotDir)
+        self.assertEqual(glob.glob(os.path.join(plotDir, PlotJobs.fragmentPattern)), [])
+        self.assertFalse(os.path.exists(os.path.join(plotDir, PlotJobs.lockName)))
+        self.assertEqual(PlotJobs.readManifest(plotDir), expected)
+        # Each worker's entries in the order they were drawn
+        names = list(PlotJobs.readManifest(plotDir))
+        self.assertEqual([name for name in names if name.startswith('w0_')], [f'w0_{i}.png' for i in range(nCalls)])
+
+    def test_manifest_locked(self):
+        plotDir = self.path('')
+        os.makedirs(plotDir)
+        PlotJobs.updateManifests({os.path.join(plotDir, 'a.png'): '1', os.path.join(plotDir, 'b.png'): '2'})
+
+        # While another process folds the fragments, entries stay readable from their own fragment
+        lockPath = os.path.join(plotDir, PlotJobs.lockName)
+        open(lockPath, 'w', encoding='utf-8').close()
+        PlotJobs.updateManifests({os.path.join(plotDir, 'a.png'): '3'})
+        self.assertEqual(len(glob.glob(os.path.join(plotDir, PlotJobs.fragmentPattern))), 1)
+        # Redrawn plots move to the end
+        self.assertEqual(list(PlotJobs.readManifest(plotDir).items()), [('b.png', '2'), ('a.png', '3')])
+
+        # A lock left by a dead process is cleared, and the fragments folded by the next call
+        os.utime(lockPath, (0, 0))
+        self.assertFalse(PlotJobs.compactManifest(plotDir))
+        self.assertTrue(PlotJobs.compactManifest(plotDir))
+        self.assertEqual(glob.glob(os.path.join(plotDir, PlotJobs.fragmentPattern)), [])
+        self.assertEqual(list(PlotJobs.readManifest(plotDir).items()), [('b.png', '2'), ('a.png', '3')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import tracemalloc
+
+from Source.Profiler import Profiler
+
+
+@Profiler.timed('Inner')
+def allocate(nBytes):
+    return bytearray(nBytes)
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.settings = Profiler.enabled, Profiler.traceMemory
+        Profiler.enabled, Profiler.traceMemory = True, True
+        Profiler.reset()
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        Profiler.enabled, Profiler.traceMemory = self.settings
+        Profiler.reset()
+        shutil.rmtree(self.tmpDir)
+
+    def test_stages(self):
+        with Profiler.stage('L2'):
+            allocate(8*2**20)
+            with Profiler.stage('Plotting'):
+                allocate(2**20)
+            allocate(2*2**20)
+        stages = Profiler.report('L2')['stages']
+        self.assertEqual(list(stages), ['L2/Inner', 'L2/Plotting/Inner', 'L2/Plotting', 'L2'])
+        self.assertEqual(stages['L2/Inner']['calls'], 2)
+        self.assertEqual(stages['L2/Plotting']['calls'], 1)
+        self.assertGreaterEqual(stages['L2']['seconds'], stages['L2/Inner']['seconds'] + stages['L2/Plotting']['seconds'])
+
+        # Each peak is that of the stage's own allocations, the outer stages see the inner ones
+        self.assertAlmostEqual(stages['L2/Inner']['peakMB'], 8, delta=0.1)
+        self.assertAlmostEqual(stages['L2/Plotting']['peakMB'], 1, delta=0.1)
+        self.assertAlmostEqual(stages['L2']['peakMB'], 8, delta=0.1)
+
+    def test_reports(self):
+        outputs = [os.path.join(self.tmpDir, f'Station_{i}_L2.hdf') for i in range(2)]
+        with Profiler.stage('L2'):
+            Profiler.addOutput(outputs[0])
+        Profiler.addOutput(outputs)
+        written = Profiler.writeReports('L2', 'in_L1BQC.hdf')
+        self.assertEqual(written, [os.path.join(self.tmpDir, f'Station_{i}_L2_profile.json') for i in range(2)])
+        with open(written[1], 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual((report['level'], report['input'], report['output']), ('L2', 'in_L1BQC.hdf', outputs[1]))
+        self.assertEqual(list(report['stages']), ['L2'])
+        self.assertFalse(tracemalloc.is_tracing())
+
+        # Started over
+        self.assertEqual(Profiler.writeReports('L2'), [])
+        self.assertEqual(Profiler.report('L2')['stages'], {})
+
+    def test_disabled(self):
+        Profiler.enabled = False
+        with Profiler.stage('L2'):
+            allocate(10)
+        Profiler.addOutput(os.path.join(self.tmpDir, 'out_L2.hdf'))
+        self.assertEqual(Profiler.writeReports('L2'), [])
+        self.assertEqual(os.listdir(self.tmpDir), [])
+
+    def test_compare(self):
+        baseline = {'stages': {'L2': {'seconds': 10.0}, 'L2/ZhangRho': {'seconds': 0.01}, 'L2/BRDF': {'seconds': 1.0}}}
+        report = {'stages': {'L2': {'seconds': 13.0}, 'L2/ZhangRho': {'seconds': 0.04},
+                             'L2/BRDF': {'seconds': 1.2}, 'L2/Plotting': {'seconds': 5.0}}}
+        self.assertEqual(Profiler.compare(report, baseline), [('L2', 10.0, 13.0)])
+        self.assertEqual(Profiler.compare(report, baseline, tolerance=0.1), [('L2', 10.0, 13.0), ('L2/BRDF', 1.0, 1.2)])
+
+        merged = Profiler.merge([{'stages': {'L2': {'calls': 1, 'seconds': 2.0, 'peakMB': 5.0}}},
+                                 {'stages': {'L2': {'calls': 2, 'seconds': 3.0, 'peakMB': 4.0}}}])
+        self.assertEqual(merged, {'stages': {'L2': {'calls': 3, 'seconds': 5.0, 'peakMB': 5.0}}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import glob
+import tempfile
+import unittest
+
+import numpy as np
+
+from Source import PATH_TO_DATA
+from Source.HDFRoot import HDFRoot
+from Source.HDFDataset import HDFDataset
+
+N_BANDS = 180
+N_ENSEMBLES = 200
+
+
+def makeL2(rng):
+    ''' Synthetic L2 with the radiometry, median, sd and unc datasets of one sensor '''
+    node = HDFRoot()
+    node.attributes['PROCESSING_LEVEL'] = '2'
+    gp = node.addGroup('IRRADIANCE')
+    bands = [f'{wl:.1f}' for wl in np.linspace(350, 900, N_BANDS)]
+    # Es spanning three decades over the file, with 1-5% uncertainties
+    es = 10**rng.uniform(0, 3, (N_ENSEMBLES, 1)) * (1 + 0.5*rng.random((N_ENSEMBLES, N_BANDS)))
+    for name, values in [('ES_HYPER', es), ('ES_HYPER_median', es*1.01),
+                         ('ES_HYPER_sd', es*0.02*rng.random((N_ENSEMBLES, N_BANDS))),
+                         ('ES_HYPER_unc', es*(0.01 + 0.04*rng.random((N_ENSEMBLES, N_BANDS))))]:
+        ds = gp.addDataset(name)
+        ds.columns['Datetag'] = [2021123.0]*N_ENSEMBLES
+        ds.columns['Timetag2'] = [120000000.0 + i*1000 for i in range(N_ENSEMBLES)]
+        for i, band in enumerate(bands):
+            ds.columns[band] = values[:, i].tolist()
+        ds.columnsToDataset()
+    gp.datasets['ES_HYPER_unc'].data[bands[3]][5] = np.nan
+    return node
+
+
+def sampleL2Files():
+    return sorted(glob.glob(os.path.join(PATH_TO_DATA, 'Sample_Data', '**', 'L2', '*.hdf'), recursive=True))
+
+
+class TestReducedStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def roundTrip(self, node, storage):
+        ''' Write node with storage for its uncertainty datasets and read it back. Returns (read node, file size) '''
+        fp = os.path.join(self.tmp.name, f'L2_{storage}.hdf')
+        node.setUncertaintyStorage(storage)
+        node.writeHDF5(fp)
+        return HDFRoot.readHDF5(fp), os.path.getsize(fp)
+
+    def assertDecoded(self, original, decoded, storage):
+        for gp in original.groups:
+            for name, ds in gp.datasets.items():
+                if ds.data is None or ds.data.dtype.names is None:
+                    continue
+                dsRead = decoded.getGroup(gp.id).datasets[name]
+                self.assertEqual(dsRead.data.dtype, ds.data.dtype, name)
+                for field in ds.data.dtype.names:
+                    expected, actual = ds.data[field], dsRead.data[field]
+                    if ds.data.dtype[field].kind != 'f' or field in HDFDataset.fullPrecisionFields \
+                            or ds.storage in [None, 'float64']:
+                        np.testing.assert_array_equal(actual, expected, err_msg=f'{name} {field}')
+                        continue
+                    np.testing.assert_array_equal(np.isnan(actual), ~np.isfinite(expected), err_msg=f'{name} {field}')
+                    finite = np.isfinite(expected)
+                    if ds.storage == 'float32':
+                        np.testing.assert_allclose(actual[finite], expected[finite], rtol=1e-7, err_msg=f'{name} {field}')
+                    else:
+                        # Half a quantization step of the field's range, relative to the reference
+                        # field for datasets stored relative to one
+                        reference = ds.relativeReference([field])
+                        scale = reference.data[field] if reference is not None else np.ones(len(expected))
+                        relative = expected/scale
+                        spread = np.ptp(relative[finite]) if finite.any() else 0
+                        np.testing.assert_array_less(np.abs(actual[finite]/scale[finite] - relative[finite]),
+                                                     spread/(2*HDFDataset.int16Max)*0.5001 + 1e-12,
+                                                     err_msg=f'{name} {field}')
+
+    def test_synthetic_round_trip_and_size(self):
+        sizes = {}
+        for storage in HDFDataset.storageOptions:
+            node = makeL2(np.random.default_rng(0))
+            decoded, sizes[storage] = self.roundTrip(node, storage)
+            self.assertDecoded(node, decoded, storage)
+            # Rewriting a file keeps the precision it was read with
+            self.assertEqual(decoded.getGroup('IRRADIANCE').datasets['ES_HYPER_unc'].storage,
+                             None if storage == 'float64' else storage)
+            self.assertIsNone(decoded.getGroup('IRRADIANCE').datasets['ES_HYPER'].storage)
+
+            if storage == 'int16':
+                # Uncertainties keep their relative precision across the three decades of Es
+                irradiance = decoded.getGroup('IRRADIANCE')
+                self.assertIs(irradiance.datasets['ES_HYPER_unc'].reference, irradiance.datasets['ES_HYPER'])
+                expected = node.getGroup('IRRADIANCE').datasets['ES_HYPER_unc'].data
+                actual = irradiance.datasets['ES_HYPER_unc'].data
+                for field in expected.dtype.names[2:]:
+                    finite = np.isfinite(expected[field])
+                    np.testing.assert_allclose(actual[field][finite], expected[field][finite], rtol=1e-4,
+                                               err_msg=field)
+
+        # Three of four datasets shrink to half (float32) or to half and quarter (int16)
+        self.assertLess(sizes['float32'], 0.70*sizes['float64'])
+        self.assertLess(sizes['int16'], 0.60*sizes['float64'])
+
+    def test_sample_l2_outputs(self):
+        files = sampleL2Files()
+        if not files:
+            self.skipTest('No L2 outputs under Data/Sample_Data. Run test_sample_data first.')
+        for fp in files:
+            _, fullSize = self.roundTrip(HDFRoot.readHDF5(fp), 'float64')
+            for storage in ['float32', 'int16']:
+                node = HDFRoot.readHDF5(fp)
+                decoded, size = self.roundTrip(node, storage)
+                self.assertDecoded(node, decoded, storage)
+                self.assertLess(size, fullSize, f'{os.path.basename(fp)} {storage}')
+
+    def test_unknown_storage(self):
+        with self.assertRaises(ValueError):
+            HDFDataset().setStorage('float16')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+from scipy.interpolate import interp1d
+
+from Source.ReflectanceCorrections import ReflectanceCorrections
+
+WAVELENGTH = [round(wl, 1) for wl in np.arange(350, 900, 3.3)]
+
+
+def simSpecSpectrum(rrs, F0):
+    ''' Similarity spectrum offsets of one Rrs spectrum, band by band as in ProcessL2 before the array version '''
+    def window(lo, hi, wl, values):
+        x = [w for w in WAVELENGTH if lo <= w <= hi]
+        y = [v for w, v in zip(WAVELENGTH, values) if lo <= w <= hi]
+        return interp1d(x, y)(wl)
+    ρ = np.pi*rrs
+    ρ1, ρ2, ρ3 = window(700, 750, 720, ρ), window(760, 800, 780, ρ), window(850, 890, 870, ρ)
+    F01, F02, F03 = [interp1d(WAVELENGTH, F0)(wl) for wl in [720, 780, 870]]
+    if ρ1 < 0.03:
+        ε, εnLw = (2.35*ρ2 - ρ1)/1.35, (2.35*ρ2*F02 - ρ1*F01)/1.35
+    else:
+        ε, εnLw = (1.91*ρ3 - ρ2)/0.91, (1.91*ρ3*F03 - ρ2*F02)/0.91
+    if ε < 0:
+        return 0, 0
+    return ε/np.pi, εnLw/np.pi
+
+
+class TestReflectanceCorrections(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Clear water (below the 720 threshold), turbid water and spectra with a negative NIR
+        self.rrs = np.vstack([rng.uniform(0, 0.005, (4, len(WAVELENGTH))),
+                              rng.uniform(0.02, 0.1, (4, len(WAVELENGTH))),
+                              rng.uniform(-0.01, 0.001, (2, len(WAVELENGTH)))])
+        self.F0 = rng.uniform(1500, 2000, len(WAVELENGTH))
+
+    def test_simple(self):
+        nLw = self.rrs*self.F0
+        rrsNIRCorr, nLwNIRCorr, bad = ReflectanceCorrections.simpleNIR(self.rrs, nLw, WAVELENGTH)
+        for i, row in enumerate(self.rrs):
+            nir = [v for w, v in zip(WAVELENGTH, row) if 700 <= w <= 800]
+            self.assertEqual(rrsNIRCorr[i], max(min(nir), 0))
+            self.assertEqual(bad[i], min(nir) < 0)
+            self.assertEqual(nLwNIRCorr[i], min(v for w, v in zip(WAVELENGTH, nLw[i]) if 700 <= w <= 800))
+
+        ReflectanceCorrections.subtract(nLw, nLwNIRCorr)
+        np.testing.assert_allclose(nLw.min(axis=1), (self.rrs*self.F0).min(axis=1) - nLwNIRCorr)
+
+    def test_simspec(self):
+        rrsNIRCorr, nLwNIRCorr, tripped, bad = ReflectanceCorrections.simSpecNIR(self.rrs, WAVELENGTH, self.F0, WAVELENGTH)
+        self.assertTrue(tripped[4:8].all() and not tripped[:4].any())
+        self.assertTrue(bad.any())
+        for i, row in enumerate(self.rrs):
+            np.testing.assert_allclose([rrsNIRCorr[i], nLwNIRCorr[i]], simSpecSpectrum(row, self.F0), rtol=1e-12)
+
+        # One F0 per row
+        F0 = np.vstack([self.F0*(1 + 0.01*i) for i in range(len(self.rrs))])
+        rows = ReflectanceCorrections.simSpecNIR(self.rrs, WAVELENGTH, F0, WAVELENGTH)[1]
+        for i, row in enumerate(self.rrs):
+            np.testing.assert_allclose(rows[i], simSpecSpectrum(row, F0[i])[1], rtol=1e-12)
+
+    def test_negative(self):
+        refl = self.rrs.copy()
+        bad = ReflectanceCorrections.negative(refl, WAVELENGTH, [400, 680])
+        w = np.asarray(WAVELENGTH)
+        vis = (w > 400) & (w < 680)
+        np.testing.assert_array_equal(bad, [np.any(row[vis] < 0) for row in self.rrs])
+        outside = (w < 399) | (w >= 681)
+        self.assertTrue((refl[:, outside] >= 0).all())
+        np.testing.assert_array_equal(refl[:, ~outside], self.rrs[:, ~outside])
+        np.testing.assert_array_equal(refl[:, outside], np.maximum(self.rrs[:, outside], 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
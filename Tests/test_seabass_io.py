@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+import collections
+
+import numpy as np
+
+from Source.HDFDataset import HDFDataset
+from Source.ConfigFile import ConfigFile
+from Source.SeaBASSHeader import SeaBASSHeader
+from Source.SeaBASSWriter import SeaBASSWriter
+from Source.SB_support import readSB
+
+BANDS = ['400.0', '402.5', '405.0', '407.5']
+ANCILLARY = ['LATITUDE', 'LONGITUDE', 'AOD', 'CLOUD', 'SZA', 'REL_AZ', 'HEADING', 'SOLAR_AZ', 'WIND', 'BINCOUNT']
+
+
+def makeDataset(n, rng):
+    ds = HDFDataset()
+    ds.columns['Datetag'] = [2021123.0] * n
+    # HHMMSSmmm
+    ds.columns['Timetag2'] = [float(120000000 + (i % 24)*100000 + (i % 60)*1000 + 250) for i in range(n)]
+    for band in BANDS:
+        ds.columns[band] = list(rng.random(n) * 0.01)
+    for name in ANCILLARY:
+        ds.columns[name] = list(rng.random(n) * 90)
+    ds.columns['BINCOUNT'] = list(rng.integers(1, 100, n).astype(float))
+    ds.columns['400.0'][1] = np.nan
+    ds.columns['CLOUD'][2] = np.nan
+    ds.columnsToDataset()
+    return ds
+
+
+def makeDelta(n, rng):
+    ds = HDFDataset()
+    ds.columns['Datetag'] = [2021123.0] * n
+    ds.columns['Timetag2'] = [0.0] * n
+    for band in BANDS:
+        ds.columns[band] = list(rng.random(n) * 0.001)
+    ds.columnsToDataset()
+    ds.datasetToColumns()
+    return ds
+
+
+class TestSeaBASSRoundTrip(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        ConfigFile.settings['bL2Stations'] = 0
+        SeaBASSHeader.settings['version'] = 'R1'
+        self.header = collections.OrderedDict([
+            ('investigators', 'A_Person'), ('experiment', 'TEST'), ('cruise', 'TEST01'),
+            ('platform', 'RV'), ('instrument_model', 'HyperOCR'), ('station', 'NA'),
+            ('missing', -9999), ('delimiter', 'comma'),
+            ('comments', '! A comment'), ('other_comments', '!'), ('version', 'R1'),
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        n = 25
+        rng = np.random.default_rng(1)
+        ds, delta = makeDataset(n, rng), makeDelta(n, rng)
+        data, fields, units = SeaBASSWriter.formatData2(ds, delta, 'rrs', '1/sr')
+        self.assertEqual(data.shape, (n, 6 + 8 + 2*len(BANDS)))
+
+        fp = os.path.join(self.tmp.name, 'TEST_L2.hdf')
+        SeaBASSWriter.writeSeaBASS('Rrs', fp, self.header, data, fields, units)
+        outFile = os.path.join(self.tmp.name, 'SeaBASS', self.header['data_file_name'])
+        self.assertEqual(self.header['data_file_name'], 'TEST_TEST01_RV_HyperOCR_20210503_120000_L2_Rrs_R1.sb')
+
+        sb = readSB(outFile, no_warn=True)
+        self.assertEqual(sb.length, n)
+        self.assertEqual(list(sb.data.keys()), fields.lower().split(','))
+        self.assertEqual(sb.data['date'][0], 20210503)
+        self.assertEqual(sb.data['time'][3], '12:03:03')
+        self.assertIsInstance(sb.data['bincount'][0], int)
+        np.testing.assert_array_equal(sb.data['bincount'], ds.data['BINCOUNT'])
+
+        # Values survive at the precision they were written with and NaNs come back as NaN
+        np.testing.assert_allclose(sb.data['lat'], ds.data['LATITUDE'], atol=5e-5)
+        np.testing.assert_allclose(sb.data['sza'], ds.data['SZA'], atol=5e-2)
+        self.assertTrue(np.isnan(sb.data['cloud'][2]))
+        for band in BANDS:
+            np.testing.assert_allclose(sb.data[f'rrs{band}'], ds.data[band], atol=5e-7)
+            np.testing.assert_allclose(sb.data[f'rrs{band}_unc'], delta.data[band], atol=5e-7)
+        self.assertTrue(np.isnan(sb.data['rrs400.0'][1]))
+
+    def test_read_matches_field_types(self):
+        fp = os.path.join(self.tmp.name, 'mixed.sb')
+        with open(fp, 'w', encoding='utf-8') as f:
+            f.write('/begin_header\n/missing=-999\n/delimiter=space\n/fields=wavelength,time,value,flag\n'
+                    '/units=nm,hh:mm:ss,none,none\n/end_header\n'
+                    '380 12:00:00 0.5 1\n380.5 12:00:01 -999 2\n381 12:00:02 1.0 ok\n')
+        sb = readSB(fp, no_warn=True)
+        self.assertEqual(sb.length, 3)
+        self.assertEqual([type(x) for x in sb.data['wavelength']], [int, float, int])
+        self.assertEqual(sb.data['time'], ['12:00:00', '12:00:01', '12:00:02'])
+        self.assertTrue(np.isnan(sb.data['value'][1]))
+        self.assertIsInstance(sb.data['value'][2], float)
+        self.assertEqual(sb.data['flag'], [1, 2, 'ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
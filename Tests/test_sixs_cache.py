@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from Source.SixSCache import SixSCache, SixSRunner, SIXS_OUTPUTS, earthSunFactor
+
+
+class FakeSixS:
+    ''' Stand-in for the 6S executable wrapper with analytical, deterministic outputs '''
+    def geometry(self, sun_zen, sun_azi, view_zen, view_azi, month, day):
+        self.sza, self.month, self.day = sun_zen, month, day
+
+    def gas(self):
+        pass
+
+    def aerosol(self, aot_550):
+        self.aod = aot_550
+
+    def target_altitude(self):
+        pass
+
+    def sensor_altitude(self):
+        pass
+
+    def to_be_implemented(self):
+        pass
+
+    def wavelength(self, wavelength):
+        self.wl = wavelength
+
+    def run(self):
+        with open(os.environ['FAKE_SIXS_LOG'], 'a', encoding='utf-8') as f:
+            f.write(f'{self.sza} {self.aod} {self.wl}\n')
+        doy = SixSRunner.dayOfYear(self.month, self.day)
+        direct = np.cos(np.radians(self.sza)) * np.exp(-self.aod * 550 / self.wl)
+        irr = 1000 * earthSunFactor(doy)
+        return {
+            SIXS_OUTPUTS[0]: direct,
+            SIXS_OUTPUTS[1]: 1 - direct,
+            SIXS_OUTPUTS[2]: irr * direct,
+            SIXS_OUTPUTS[3]: irr * (1 - direct),
+            SIXS_OUTPUTS[4]: 0.0,
+        }
+
+
+class TestSixSCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tmp.name, 'runs.log')
+        os.environ['FAKE_SIXS_LOG'] = self.log
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def nRuns(self):
+        if not os.path.isfile(self.log):
+            return 0
+        with open(self.log, encoding='utf-8') as f:
+            return len(f.readlines())
+
+    def test_quantize(self):
+        cache = SixSCache(self.tmp.name, binSZA=0.5, binAOD=0.01)
+        self.assertEqual(cache.quantize(30.1, 0.104, None, None, 400), cache.quantize(29.9, 0.096, None, None, 400))
+        self.assertNotEqual(cache.quantize(30.1, 0.1, None, None, 400), cache.quantize(31.0, 0.1, None, None, 400))
+        self.assertEqual(cache.binCentre(cache.quantize(30.1, 0.1, None, None, 400))[:2], (30.0, 0.1))
+
+    def test_runner_runs_only_misses(self):
+        wavelengths = SixSRunner.sparseWavelengths([352.1, 401.7, 798.3], 50)
+        self.assertEqual(wavelengths[0], 350)
+        self.assertEqual(wavelengths[-1], 800)
+
+        runner = SixSRunner(SixSCache(self.tmp.name), FakeSixS, maxWorkers=2)
+        atmospheres = [(30.0, 0.1, None, None), (30.1, 0.1, None, None), (45.0, 0.2, None, None)]
+        first = runner.run(atmospheres, wavelengths, 1, 4)
+        self.assertEqual(first.shape, (3, len(wavelengths), len(SIXS_OUTPUTS)))
+        # The first two atmospheres share a bin
+        self.assertEqual(self.nRuns(), 2 * len(wavelengths))
+        np.testing.assert_array_equal(first[0], first[1])
+
+        # A new cache on the same directory reads the persisted results and runs nothing
+        runner = SixSRunner(SixSCache(self.tmp.name), FakeSixS, maxWorkers=2)
+        second = runner.run(atmospheres, wavelengths, 1, 4)
+        self.assertEqual(self.nRuns(), 2 * len(wavelengths))
+        np.testing.assert_allclose(first, second)
+
+        # Irradiances are rescaled for another date, ratios are not
+        july = runner.run(atmospheres, wavelengths, 7, 4)
+        self.assertEqual(self.nRuns(), 2 * len(wavelengths))
+        np.testing.assert_allclose(july[..., 0], first[..., 0])
+        ratio = earthSunFactor(SixSRunner.dayOfYear(7, 4)) / earthSunFactor(SixSRunner.dayOfYear(1, 4))
+        np.testing.assert_allclose(july[..., 2], first[..., 2] * ratio)
+
+    def test_bin_width_change_invalidates(self):
+        runner = SixSRunner(SixSCache(self.tmp.name), FakeSixS, maxWorkers=1)
+        runner.run([(30.0, 0.1, None, None)], [400.0], 1, 4)
+        runner = SixSRunner(SixSCache(self.tmp.name, binSZA=1.0), FakeSixS, maxWorkers=1)
+        runner.run([(30.0, 0.1, None, None)], [400.0], 1, 4)
+        self.assertEqual(self.nRuns(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import datetime
+import unittest
+import warnings
+
+import numpy as np
+
+from Source.SolarGeometry import SolarGeometry
+
+
+class TestSolarGeometry(unittest.TestCase):
+    def test_against_pysolar(self):
+        try:
+            from pysolar.solar import get_azimuth, get_altitude
+        except ImportError:
+            self.skipTest('pysolar not installed')
+
+        rng = np.random.default_rng(1)
+        n = 500
+        lat = rng.uniform(-70, 70, n)
+        lon = rng.uniform(-180, 180, n)
+        # Within the range of pysolar's Delta T table
+        base = datetime.datetime(1995, 1, 1, tzinfo=datetime.timezone.utc)
+        times = [base + datetime.timedelta(seconds=float(s)) for s in rng.uniform(0, 20.5*365*86400, n)]
+
+        azimuth, zenith = SolarGeometry.solarPosition(lat, lon, times)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=UserWarning)
+            pyAzimuth = np.array([get_azimuth(la, lo, t, 0) for la, lo, t in zip(lat, lon, times)])
+            pyZenith = np.array([90 - get_altitude(la, lo, t, 0) for la, lo, t in zip(lat, lon, times)])
+
+        # Compare zenith directly and position as the angle between the two sun vectors
+        # (azimuth alone is ill-conditioned with the sun near the zenith)
+        def unit(az, zen):
+            az, zen = np.radians(az), np.radians(zen)
+            return np.stack([np.sin(zen)*np.sin(az), np.sin(zen)*np.cos(az), np.cos(zen)])
+        separation = np.degrees(np.arccos(np.clip(np.sum(unit(azimuth, zenith)*unit(pyAzimuth, pyZenith), axis=0), -1, 1)))
+
+        self.assertLess(np.max(np.abs(zenith - pyZenith)), 0.01)
+        self.assertLess(np.max(separation), 0.01)
+
+    def test_dmToDd(self):
+        dd = SolarGeometry.dmToDd([4530.5, 12245.25], [b'S', b'W'])
+        np.testing.assert_allclose(dd, [-45.508333, -122.754167])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import glob
+import unittest
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from Source import PATH_TO_DATA
+from Source.ProcessL1aTriOS import ProcessL1aTriOS
+from Source.HDFRoot import HDFRoot
+from Source.Utilities import Utilities
+
+RAW = os.path.join(PATH_TO_DATA, 'Sample_Data', 'Manual_TriOS', 'RAW')
+
+
+def lineScanMLB(inputfile):
+    ''' .mlb parsing as done line by line before the single scan '''
+    with open(inputfile, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(f, 1):
+            if 'DateTime' in line:
+                break
+    data_temp = pd.read_csv(inputfile, skiprows=index+1, header=None, sep=r'\s+')
+    meta = data_temp[[0, 1, 2, 3]]
+    data_temp = data_temp.drop(columns=[0, 1, 2, 3])
+    return meta, data_temp.iloc[:, :-2], data_temp.iloc[:, -1]
+
+
+def sortedChronology(gp):
+    ''' Record order given by sorting (datetime, record) pairs '''
+    dateTime = [Utilities.timeTag2ToDateTime(Utilities.dateTagToDateTime(d[0]), t[0])
+                for d, t in zip(gp.datasets['DATETAG'].data, gp.datasets['TIMETAG2'].data)]
+    return {ds: np.array([x for _, x in sorted(zip(dateTime, gp.datasets[ds].data))]) for ds in gp.datasets}
+
+
+class TestTriOSL1A(unittest.TestCase):
+    def setUp(self):
+        self.files = sorted(glob.glob(os.path.join(RAW, '*.mlb')))
+
+    def test_read_mlb(self):
+        self.assertEqual(len(self.files), 6)
+        for fp in self.files:
+            meta, data, time = ProcessL1aTriOS.read_mlb(fp)
+            refMeta, refData, refTime = lineScanMLB(fp)
+            self.assertEqual(data.shape, (len(refData), 255))
+            np.testing.assert_array_equal(meta, refMeta.to_numpy(dtype=np.float64))
+            np.testing.assert_array_equal(data, refData.to_numpy(dtype=np.float64))
+            self.assertEqual(time.tolist(), refTime.tolist())
+
+    def test_tags(self):
+        _, _, time = ProcessL1aTriOS.read_mlb(self.files[0])
+        datetag, timetag = ProcessL1aTriOS.tags_from_iddata(time)
+        for idData, d, t in zip(time, datetag, timetag):
+            year, month, day = [int(x) for x in idData.split('_')[1].split('-')]
+            self.assertEqual(d, float(f'{year}{date(year, month, day).timetuple().tm_yday}'))
+            self.assertEqual(t, float(idData.split('_')[2].replace('-', '') + '000'))
+
+        # Date first, and days of year zero padded
+        datetag, timetag = ProcessL1aTriOS.tags_from_iddata(['%2023-01-05_23-59-58_000_001'])
+        self.assertEqual((datetag[0], timetag[0]), (2023005.0, 235958000.0))
+
+    def test_fix_chronology(self):
+        _, data, time = ProcessL1aTriOS.read_mlb(self.files[0])
+        datetag, timetag = ProcessL1aTriOS.tags_from_iddata(time)
+        node = HDFRoot()
+        gp = node.addGroup('SAM_8166.ini')
+        for name, values in [('DATETAG', datetag), ('TIMETAG2', timetag)]:
+            gp.addDataset(name).data = np.array(values, dtype=[('NONE', '<f8')])
+        gp.addDataset('ES').data = np.rec.fromarrays(data.T, names=[f'{i}' for i in range(255)])
+        gp.addDataset('CAL_ES').data = np.array(np.arange(255.), dtype=[('0', '<f8')])
+        reference = sortedChronology(gp)
+
+        ProcessL1aTriOS.fixChronology(node)
+        self.assertTrue(np.all(np.diff(gp.datasets['TIMETAG2'].data['NONE']) > 0))
+        for ds in ['DATETAG', 'TIMETAG2', 'ES']:
+            np.testing.assert_array_equal(gp.datasets[ds].data, reference[ds])
+        np.testing.assert_array_equal(gp.datasets['CAL_ES'].data['0'], np.arange(255.))
+
+        # A record exported twice is kept once
+        for ds in ['DATETAG', 'TIMETAG2', 'ES']:
+            gp.datasets[ds].data = np.concatenate([gp.datasets[ds].data[::-1], gp.datasets[ds].data[3:4]])
+        ProcessL1aTriOS.fixChronology(node)
+        for ds in ['DATETAG', 'TIMETAG2', 'ES']:
+            np.testing.assert_array_equal(gp.datasets[ds].data, reference[ds])
+
+
+if __name__ == '__main__':
+    unittest.main()
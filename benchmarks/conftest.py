@@ -0,0 +1,102 @@
+''' Benchmarks of the processing levels on the bundled sample data (see README.md). They need
+    pytest-benchmark and the full HyperCP environment, and are not part of the Tests suite. '''
+import os
+import sys
+import glob
+import json
+
+import pytest
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.insert(0, root)
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+# Timers only by default; read by the Profiler when it is first imported
+os.environ.setdefault("HYPERCP_PROFILE", "TIME")
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    collect_ignore_glob = ['test_*.py']
+
+from Source.Profiler import Profiler  # noqa: E402
+
+LEVELS = ['L1A', 'L1AQC', 'L1B', 'L1BQC', 'L2']
+SAMPLE_DATA = os.path.join(root, 'Data', 'Sample_Data')
+# Platform: (configuration, ancillary file, RAW file pattern)
+PLATFORMS = {
+    'Manual_TriOS': ('sample_TRIOS_NOTRACKER.cfg', 'FICE22_TriOS_Ancillary.sb', '*.mlb'),
+    'pySAS': ('sample_SEABIRD_pySAS.cfg', 'FICE22_pySAS_Ancillary.sb', '*.raw'),
+    'SolarTracker': ('sample_SEABIRD_SOLARTRACKER.cfg', 'KORUS_SOLARTRACKER_Ancillary.sb', '*.RAW'),
+}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('hypercp', 'HyperCP benchmarks')
+    group.addoption('--profile-baseline', default=os.path.join(os.path.dirname(__file__), 'baseline.json'),
+                    help='Stage timings the runs are checked against (JSON)')
+    group.addoption('--profile-tolerance', type=float, default=0.25,
+                    help='Slow-down of a stage, as a fraction of its baseline time, flagged as a regression')
+    group.addoption('--update-baseline', action='store_true',
+                    help='Store the stage timings of this run as the baseline instead of checking them')
+    group.addoption('--level-rounds', type=int, default=3, help='Runs of each level')
+
+
+class SampleRun:
+    ''' Outputs of one platform's sample data, level by level, in a temporary directory '''
+
+    def __init__(self, platform, dataDirectory):
+        self.platform = platform
+        config, anc, pattern = PLATFORMS[platform]
+        self.configFP = os.path.join(root, 'Config', config)
+        self.ancFP = os.path.join(SAMPLE_DATA, platform, anc)
+        self.rawFiles = sorted(glob.glob(os.path.join(SAMPLE_DATA, platform, 'RAW', pattern)))
+        self.dataDirectory = dataDirectory
+
+    def inputs(self, level):
+        ''' Arguments of each Command call processing the sample data to level '''
+        if level == 'L1A':
+            if self.platform == 'Manual_TriOS':
+                # TriOS RAW files are processed together
+                return [('RAW', self.rawFiles)]
+            return [('RAW', fp) for fp in self.rawFiles]
+        fromLevel = LEVELS[LEVELS.index(level) - 1]
+        return [(fromLevel, fp) for fp in sorted(glob.glob(os.path.join(self.dataDirectory, fromLevel, '*.hdf')))]
+
+    def process(self, level, processMultiLevel=False):
+        from Main import Command
+        # Paths in the configuration files are relative to the repository
+        os.chdir(root)
+        for fromLevel, iFile in self.inputs(level):
+            Command(self.configFP, fromLevel, iFile, self.dataDirectory, level, self.ancFP,
+                    processMultiLevel=processMultiLevel)
+
+    def report(self, level):
+        ''' Stages of the last run of level, added up over its output files '''
+        reports = []
+        for fp in sorted(glob.glob(os.path.join(self.dataDirectory, level, f'*{Profiler.reportSuffix}'))):
+            with open(fp, 'r', encoding='utf-8') as f:
+                reports.append(json.load(f))
+        return Profiler.merge(reports)
+
+
+@pytest.fixture(scope='session', params=list(PLATFORMS))
+def sampleRun(request, tmp_path_factory):
+    ''' Sample data processed from RAW to L2 once, as the inputs of the level benchmarks '''
+    run = SampleRun(request.param, str(tmp_path_factory.mktemp(request.param)))
+    run.process('L1A', processMultiLevel=True)
+    return run
+
+
+@pytest.fixture(scope='session')
+def baseline(request):
+    ''' {platform: {level: report}} of the stored baseline, updated at the end of the session if asked '''
+    fp = request.config.getoption('--profile-baseline')
+    stored = {}
+    if os.path.isfile(fp):
+        with open(fp, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+    yield stored
+    if request.config.getoption('--update-baseline'):
+        with open(fp, 'w', encoding='utf-8') as f:
+            json.dump(stored, f, indent=1, sort_keys=True)
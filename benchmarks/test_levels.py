@@ -0,0 +1,29 @@
+import pytest
+
+from conftest import LEVELS
+from Source.Profiler import Profiler
+
+
+@pytest.mark.parametrize('level', LEVELS)
+def test_level(benchmark, sampleRun, baseline, level, request):
+    if not sampleRun.inputs(level):
+        pytest.skip(f'No {level} inputs in the {sampleRun.platform} sample data')
+
+    benchmark.group = sampleRun.platform
+    benchmark.pedantic(sampleRun.process, args=(level,), rounds=request.config.getoption('--level-rounds'),
+                       iterations=1)
+
+    report = sampleRun.report(level)
+    assert report['stages'], f'No profile reports were written at {level}'
+    benchmark.extra_info['stages'] = report['stages']
+
+    if request.config.getoption('--update-baseline'):
+        baseline.setdefault(sampleRun.platform, {})[level] = report
+        return
+    reference = baseline.get(sampleRun.platform, {}).get(level)
+    if reference is None:
+        pytest.skip(f'No baseline for {sampleRun.platform} {level}; store one with --update-baseline')
+
+    regressions = Profiler.compare(report, reference, tolerance=request.config.getoption('--profile-tolerance'))
+    assert not regressions, 'Slower than the baseline:\n' + '\n'.join(
+        f'  {stage}: {refSeconds:.3f} s -> {seconds:.3f} s' for stage, refSeconds, seconds in regressions)
@@ -7,6 +7,7 @@ import glob
 import time
 
 from Main import Command
+from Source.BatchContext import BatchContext
 
 # Run scripted call to single-level or multi-level (L0 - L2) command line calls to HyperCP
 # from terminal. Recommend making a copy for your own purposes. This file is tracked with
@@ -235,11 +236,13 @@ if __name__ == "__main__":
         print(f"Using configuration {PATH_CFG}")
         print(f"with ancillary data {PATH_ANC}")
 
+        # Configuration and reference data (F0, rho tables, Z17 database, characterizations) are read
+        #   once here. Workers use them from shared memory rather than each loading their own copy.
+        context = BatchContext.build(PATH_CFG, TO_LEVELS)
+
         if MULTI_TASK:
-            # If Z17 correction is enabled in L2, a significant amount of
-            #   memory is used (~3GB) for each process so you may not be able to
-            #   use all cores of the system with problems.
-            with multiprocessing.Pool(4) as pool:
+            # If Z17 correction is enabled in L2, the ~3GB database is shared by all processes
+            with context.share(), multiprocessing.Pool(4, initializer=context.install) as pool:
                 if INST_TYPE.lower() == 'trios' and FROM_LEVELS[0] == 'RAW':
                     # Here we need a list of three files for each raw collection, or maybe a list of list triplets
                     fpf_input_triplets = []
@@ -257,7 +260,9 @@ if __name__ == "__main__":
                     pool.map(worker, fpf_input)
         else:
             # List of one or more files
-            worker(fpf_input)
+            with context:
+                context.install()
+                worker(fpf_input)
 
         t1Single = time.time()
         print(f"Overall time elapsed: {str(round((t1Single-t0Single)/60))} minutes")